@@ -1,13 +1,31 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session
+from flask import Flask, Response, render_template, jsonify, request, redirect, url_for, session
 import paho.mqtt.client as mqtt
 import json
-from threading import Thread, Lock
-from ml_service import predict_machine_fault
+from threading import Thread
+from ml_service import ml_service, predict_machine_fault_batch
+from ingest_pipeline import IngestPipeline
+from streaming_features import StreamingFeatures
+from history_writer import HistoryWriter
+from reading_spool import ReadingSpool
+from history_retention import HistoryRetention
+from auth_service import AuthService, AuthServiceBusy
+from history_rollup import RollupAggregator, SENSOR_COLUMNS, init_rollup_tables, rebuild_rollups, query_rollup
+from machine_registry import MachineRegistry, DEFAULT_MACHINE_ID, default_machine_data
+from state_store import StateStore, StatePublisher
+from async_ingest import AsyncMqttIngestor
+from fault_events import (EVENT_COLUMNS, FaultEventDetector, FaultEventDispatcher, build_sinks,
+                          init_fault_events_table)
+from metrics import Counter, Histogram, MetricsRegistry, RateLimitedLog
 import sqlite3
-import bcrypt
 from datetime import datetime
 import time
 import logging
+import atexit
+import os
+import zlib
+import signal
+import sys
+import hmac
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
@@ -16,44 +34,201 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = "supersecretkey123"  # Changez en production
 
-# Lock pour la synchronisation des threads
-data_lock = Lock()
-
-# Store latest machine data avec des valeurs par défaut
-latest_data = {
-    "parametres_machine": [0, 0, 0, 0, 0],
-    "timestamp": time.time(),
-    "ml_prediction": {
-        "fault_probability": 0.0, 
-        "is_fault": False, 
-        "model_status": "En attente des données"
-    },
-    "connection_status": "Déconnecté",
-    "last_update": None
-}
-
-# Stockage des dernières données reçues (buffer circulaire)
-data_buffer = []
+# Stockage des dernières données reçues (buffer circulaire NumPy par machine)
+# et fenêtres des statistiques glissantes servies par /buffer_stats
 MAX_BUFFER_SIZE = 100
+BUFFER_STATS_WINDOWS = (10, 100)
+
+# Registre des machines: état et buffer par machine, verrous par shard et par machine
+REGISTRY_SHARDS = 16
+machine_registry = MachineRegistry(
+    n_shards=REGISTRY_SHARDS,
+    buffer_size=MAX_BUFFER_SIZE,
+    stats_windows=BUFFER_STATS_WINDOWS
+)
 
 # MQTT configuration
-MQTT_BROKER = "d736909d58a34fa6930bc5f9398c1c1b.s1.eu.hivemq.cloud"
-MQTT_PORT = 8883
+MQTT_BROKER = os.environ.get("MQTT_BROKER", "d736909d58a34fa6930bc5f9398c1c1b.s1.eu.hivemq.cloud")
+MQTT_PORT = int(os.environ.get("MQTT_PORT", 8883))
+MQTT_TLS = os.environ.get("MQTT_TLS", "1") != "0"
 MQTT_TOPIC = "diagnostic_machine"
+# Une machine publie sur diagnostic_machine/<machine_id>; le topic nu
+# correspond à la machine par défaut
+MQTT_TOPIC_WILDCARD = f"{MQTT_TOPIC}/+"
 MQTT_USER = "habib"
 MQTT_PASSWORD = "Password2"
 
+# Cœur d'ingestion MQTT: "thread" (paho loop_forever, QoS 0, IngestPipeline)
+# ou "asyncio" (paho piloté par une boucle asyncio, QoS 1 acquitté après
+# traitement, au plus MQTT_MAX_INFLIGHT messages en cours, session persistante
+# MQTT_CLIENT_ID et reconnexion avec délai exponentiel)
+MQTT_CORE = os.environ.get("MQTT_CORE", "thread")
+MQTT_CLIENT_ID = os.environ.get("MQTT_CLIENT_ID", "diagnostic-ingest")
+MQTT_MAX_INFLIGHT = int(os.environ.get("MQTT_MAX_INFLIGHT", 1000))
+
+# Rôle du processus: "all" (ingestion et web dans un seul processus, développement),
+# "ingest" (MQTT, inférence, historique; publie l'état dans STATE_DB) ou
+# "web" (worker sans état qui lit STATE_DB, lancé par serve.py sous gunicorn)
+APP_ROLE = os.environ.get("APP_ROLE", "all")
+WEB_ONLY = APP_ROLE == "web"
+
 # SQLite database files
-HISTORY_DB = "history.db"
-USERS_DB = "users.db"
+HISTORY_DB = os.environ.get("HISTORY_DB", "history.db")
+USERS_DB = os.environ.get("USERS_DB", "users.db")
+# État en direct partagé entre le processus d'ingestion et les workers web
+STATE_DB = os.environ.get("STATE_DB", "live_state.db")
+STATE_PUBLISH_INTERVAL = 0.05
+# Workers web: pas de flux SSE (chaque flux occuperait un thread gthread pour
+# toute la durée de la connexion), le tableau de bord interroge /data (ETag)
+# toutes les DASHBOARD_POLL_INTERVAL secondes
+DASHBOARD_POLL_INTERVAL = float(os.environ.get("DASHBOARD_POLL_INTERVAL", 1))
+state_store = StateStore(STATE_DB)
+
+def build_replay_rows(records):
+    """Lignes d'historique des lectures rejouées depuis le journal (inférence par lot)"""
+    if not ml_service.is_ready():
+        return None
+    if ml_service.feature_config:
+        # Fenêtres glissantes recalculées sur les seules lectures rejouées
+        features = StreamingFeatures(ml_service.feature_config)
+        X = [features.update(machine_id, params) for machine_id, params, _, _ in records]
+    else:
+        X = [params for _, params, _, _ in records]
+    predictions = ml_service.predict_batch(X)
+    return [
+        (timestamp, *params, prediction["fault_probability"], prediction["is_fault"],
+         prediction["model_status"], machine_id, seq)
+        for (machine_id, params, timestamp, seq), prediction in zip(records, predictions)
+    ]
+
+# Journal local des lectures validées (mmap, ajout seul), écrit avant
+# l'inférence et rejoué dans l'historique après un échec d'écriture ou un
+# arrêt brutal; READING_SPOOL vide le désactive
+READING_SPOOL = os.environ.get("READING_SPOOL", "readings.spool")
+READING_SPOOL_SYNC_INTERVAL = float(os.environ.get("READING_SPOOL_SYNC_INTERVAL", 0.1))
+reading_spool = None
+if READING_SPOOL and not WEB_ONLY:
+    reading_spool = ReadingSpool(READING_SPOOL, build_rows=build_replay_rows,
+                                 sync_interval=READING_SPOOL_SYNC_INTERVAL)
+
+# Écriture de l'historique par lots (thread dédié, connexion SQLite unique en WAL)
+HISTORY_BATCH_SIZE = 500
+HISTORY_FLUSH_INTERVAL = 0.5
+HISTORY_QUEUE_SIZE = 10000
+history_writer = HistoryWriter(
+    HISTORY_DB,
+    batch_size=HISTORY_BATCH_SIZE,
+    flush_interval=HISTORY_FLUSH_INTERVAL,
+    max_queue_size=HISTORY_QUEUE_SIZE,
+    # Agrégats 1m/1h/1d mis à jour à chaque lot (historique longue durée)
+    rollups=RollupAggregator(),
+    spool=reading_spool
+)
+
+# Rétention: lignes brutes conservées HISTORY_RETENTION_DAYS jours (0 = illimité),
+# puis archivées par jour dans HISTORY_ARCHIVE_DIR et supprimées par petits lots
+HISTORY_RETENTION_DAYS = float(os.environ.get("HISTORY_RETENTION_DAYS", 0))
+HISTORY_ARCHIVE_DIR = os.environ.get("HISTORY_ARCHIVE_DIR", "archive")
+HISTORY_ARCHIVE_FORMAT = os.environ.get("HISTORY_ARCHIVE_FORMAT", "csv")
+history_retention = None
+if HISTORY_RETENTION_DAYS > 0:
+    history_retention = HistoryRetention(
+        HISTORY_DB,
+        HISTORY_RETENTION_DAYS,
+        archive_dir=HISTORY_ARCHIVE_DIR,
+        archive_format=HISTORY_ARCHIVE_FORMAT
+    )
+
+# Événements de panne: une panne commence après FAULT_EVENT_MIN_READINGS lectures
+# en panne consécutives (couvrant au moins FAULT_EVENT_MIN_SECONDS s) et se
+# termine après FAULT_EVENT_CLEAR_READINGS lectures saines (au moins
+# FAULT_EVENT_CLEAR_SECONDS s). Sans FAULT_EVENT_THRESHOLD, une lecture est en
+# panne selon is_fault; sinon selon sa probabilité, avec hystérésis jusqu'à
+# FAULT_EVENT_CLEAR_THRESHOLD. Les événements sont enregistrés dans la table
+# fault_events et envoyés aux destinations FAULT_EVENT_SINKS
+# ("log", "file:<chemin>", "webhook:<url>", séparées par des virgules)
+FAULT_EVENT_MIN_READINGS = int(os.environ.get("FAULT_EVENT_MIN_READINGS", 3))
+FAULT_EVENT_MIN_SECONDS = float(os.environ.get("FAULT_EVENT_MIN_SECONDS", 0))
+FAULT_EVENT_CLEAR_READINGS = int(os.environ.get("FAULT_EVENT_CLEAR_READINGS", 3))
+FAULT_EVENT_CLEAR_SECONDS = float(os.environ.get("FAULT_EVENT_CLEAR_SECONDS", 0))
+FAULT_EVENT_THRESHOLD = float(os.environ["FAULT_EVENT_THRESHOLD"]) if os.environ.get("FAULT_EVENT_THRESHOLD") else None
+FAULT_EVENT_CLEAR_THRESHOLD = (float(os.environ["FAULT_EVENT_CLEAR_THRESHOLD"])
+                               if os.environ.get("FAULT_EVENT_CLEAR_THRESHOLD") else None)
+FAULT_EVENT_SINKS = os.environ.get("FAULT_EVENT_SINKS", "log")
+fault_event_dispatcher = None
+fault_detector = None
+if not WEB_ONLY:
+    fault_event_dispatcher = FaultEventDispatcher(HISTORY_DB, build_sinks(FAULT_EVENT_SINKS))
+    fault_detector = FaultEventDetector(
+        fault_event_dispatcher.emit,
+        min_readings=FAULT_EVENT_MIN_READINGS,
+        min_seconds=FAULT_EVENT_MIN_SECONDS,
+        clear_readings=FAULT_EVENT_CLEAR_READINGS,
+        clear_seconds=FAULT_EVENT_CLEAR_SECONDS,
+        fault_threshold=FAULT_EVENT_THRESHOLD,
+        clear_threshold=FAULT_EVENT_CLEAR_THRESHOLD
+    )
+
+# Authentification: connexions users.db réutilisées, cache des utilisateurs et
+# vérifications bcrypt dans un pool borné (les routes de données restent réactives)
+AUTH_MAX_CONCURRENT = int(os.environ.get("AUTH_MAX_CONCURRENT", 2))
+AUTH_MAX_PENDING = int(os.environ.get("AUTH_MAX_PENDING", 64))
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", 60))
+auth_service = AuthService(
+    USERS_DB,
+    max_concurrent=AUTH_MAX_CONCURRENT,
+    max_pending=AUTH_MAX_PENDING,
+    cache_ttl=AUTH_CACHE_TTL
+)
+
+# Pagination de l'historique
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_LIMIT = 1000
+# /history_data: lignes lues et envoyées par paquets depuis le curseur SQLite,
+# compression gzip des réponses si le client l'accepte (niveau 1: l'essentiel du
+# gain de taille sur du JSON pour une fraction du CPU du niveau 6)
+HISTORY_STREAM_CHUNK = 200
+HISTORY_GZIP_LEVEL = 1
+
+# Séries longue durée: nombre de points par défaut et maximum
+HISTORY_SERIES_POINTS = 500
+HISTORY_SERIES_MAX_POINTS = 5000
 
-# Variable pour suivre l'état de connexion MQTT
+# Variables pour suivre l'état de connexion MQTT
 mqtt_connected = False
+mqtt_status = "Déconnecté"
+
+# Pipeline d'ingestion: inférence ML par micro-lots (flush à 64 lignes ou
+# après 5 ms) dans un pool de workers ("thread" ou "process"), hors du thread MQTT
+INFERENCE_BATCH_SIZE = 64
+INFERENCE_MAX_DELAY = 0.005
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 2))
+INGEST_EXECUTOR = os.environ.get("INGEST_EXECUTOR", "thread")
+INGEST_QUEUE_SIZE = 10000
+
+# Instrumentation (/metrics): les métriques sont lues dans les composants à
+# l'export; le thread MQTT ne tient que le compteur des messages rejetés et la
+# latence de décodage, chronométrée sur un message sur DECODE_TIMING_SAMPLE.
+# METRICS_TOKEN (facultatif) exige "Authorization: Bearer <jeton>" sur /metrics
+DECODE_TIMING_SAMPLE = 32
+mqtt_invalid_messages = Counter()
+decode_time = Histogram()
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Journal des prédictions et des messages rejetés: au plus une ligne par clé
+# (machine, type d'erreur) et par intervalle, au lieu d'une ligne par message
+LOG_INTERVAL = float(os.environ.get("LOG_INTERVAL", 60))
+sampled_log = RateLimitedLog(logger, interval=LOG_INTERVAL)
 
 def init_history_db():
     """Initialise la base de données d'historique"""
     try:
         conn = sqlite3.connect(HISTORY_DB)
+        # Nouvelle base: l'espace libéré par la rétention est récupérable par
+        # incremental_vacuum (sans effet sur une base existante)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # Mode WAL: les lectures de l'historique ne bloquent pas l'écriture
+        conn.execute("PRAGMA journal_mode=WAL")
         cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS machine_history (
@@ -67,9 +242,42 @@ def init_history_db():
                 fault_probability REAL,
                 is_fault BOOLEAN,
                 model_status TEXT,
+                machine_id TEXT DEFAULT 'default',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        
+        # Migration: identifiant de machine (les lignes existantes sont
+        # rattachées à la machine par défaut)
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(machine_history)")]
+        if "machine_id" not in columns:
+            cursor.execute(f"ALTER TABLE machine_history ADD COLUMN machine_id TEXT DEFAULT '{DEFAULT_MACHINE_ID}'")
+        # Migration: version du modèle des lignes re-scorées (rescore_history.py),
+        # NULL pour les lignes scorées à l'ingestion
+        if "model_version" not in columns:
+            cursor.execute("ALTER TABLE machine_history ADD COLUMN model_version TEXT")
+        
+        # Migration: index pour les requêtes triées par timestamp (pagination
+        # par curseur) et pour le filtre des pannes
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_machine_history_timestamp
+            ON machine_history (timestamp)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_machine_history_fault_timestamp
+            ON machine_history (is_fault, timestamp)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_machine_history_machine_timestamp
+            ON machine_history (machine_id, timestamp)
+        ''')
+        
+        # Migration: événements de panne (début et fin, par machine)
+        init_fault_events_table(conn)
+        
+        # Migration: tables d'agrégats, calculées une fois depuis l'historique existant
+        if init_rollup_tables(conn):
+            rebuild_rollups(conn)
         conn.commit()
         logger.info("Base de données d'historique initialisée")
     except Exception as e:
@@ -80,159 +288,203 @@ def init_history_db():
 def init_users_db():
     """Initialise la base de données des utilisateurs"""
     try:
-        conn = sqlite3.connect(USERS_DB)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
         # Utilisateurs pré-créés
         pre_created_users = [
             ("admin", "password123"),
             ("user", "test123"),
             ("operateur", "op123")
         ]
-        
-        for username, plain_password in pre_created_users:
-            cursor.execute("SELECT username FROM users WHERE username = ?", (username,))
-            if not cursor.fetchone():
-                hashed_password = bcrypt.hashpw(plain_password.encode('utf-8'), bcrypt.gensalt())
-                cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", 
-                             (username, hashed_password))
-                logger.info(f"Utilisateur {username} créé")
-        
-        conn.commit()
+        auth_service.init_db(pre_created_users)
         logger.info("Base de données des utilisateurs initialisée")
     except Exception as e:
         logger.error(f"Erreur lors de l'initialisation des utilisateurs: {e}")
-    finally:
-        conn.close()
 
-def insert_history(data, prediction):
-    """Insère les données dans l'historique"""
-    try:
-        conn = sqlite3.connect(HISTORY_DB)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO machine_history (
-                timestamp, vibration, temperature, pressure, rms, mean_temp,
-                fault_probability, is_fault, model_status
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data["timestamp"],
-            data["parametres_machine"][0],
-            data["parametres_machine"][1],
-            data["parametres_machine"][2],
-            data["parametres_machine"][3],
-            data["parametres_machine"][4],
-            prediction["fault_probability"],
-            prediction["is_fault"],
-            prediction["model_status"]
-        ))
-        conn.commit()
-        logger.debug("Données insérées dans l'historique")
-    except Exception as e:
-        logger.error(f"Erreur lors de l'insertion en base: {e}")
-    finally:
-        conn.close()
+def insert_history(machine_id, data, prediction, spool_seq=None):
+    """Met les données en file pour insertion par lots dans l'historique"""
+    history_writer.write((
+        data["timestamp"],
+        data["parametres_machine"][0],
+        data["parametres_machine"][1],
+        data["parametres_machine"][2],
+        data["parametres_machine"][3],
+        data["parametres_machine"][4],
+        prediction["fault_probability"],
+        prediction["is_fault"],
+        prediction["model_status"],
+        machine_id,
+        # Séquence de la lecture dans le journal (None si non journalisée)
+        spool_seq
+    ))
 
-def update_data_buffer(data):
-    """Met à jour le buffer circulaire des données"""
-    global data_buffer
-    data_buffer.append({
-        "timestamp": data["timestamp"],
-        "parametres_machine": data["parametres_machine"].copy(),
-        "ml_prediction": data["ml_prediction"].copy()
-    })
-    
-    # Maintenir la taille du buffer
-    if len(data_buffer) > MAX_BUFFER_SIZE:
-        data_buffer.pop(0)
+def machine_id_from_topic(topic):
+    """Extrait l'identifiant de machine du topic MQTT"""
+    if topic.startswith(MQTT_TOPIC + "/"):
+        return topic[len(MQTT_TOPIC) + 1:] or DEFAULT_MACHINE_ID
+    return DEFAULT_MACHINE_ID
+
+def set_connection_status(status):
+    """Met à jour l'état de connexion MQTT de toutes les machines"""
+    global mqtt_status
+    mqtt_status = status
+    for state in machine_registry.states():
+        state.set_connection_status(status)
+        state.broadcaster.publish(state.payload()[0])
 
 # MQTT callback when connected
 def on_connect(client, userdata, flags, rc):
-    global mqtt_connected, latest_data
+    global mqtt_connected
     
     if rc == 0:
         mqtt_connected = True
-        with data_lock:
-            latest_data["connection_status"] = "Connecté"
+        set_connection_status("Connecté")
         logger.info("Connexion MQTT réussie")
-        client.subscribe(MQTT_TOPIC)
-        logger.info(f"Abonnement au topic: {MQTT_TOPIC}")
+        client.subscribe([(MQTT_TOPIC, 0), (MQTT_TOPIC_WILDCARD, 0)])
+        logger.info(f"Abonnement aux topics: {MQTT_TOPIC}, {MQTT_TOPIC_WILDCARD}")
     else:
         mqtt_connected = False
-        with data_lock:
-            latest_data["connection_status"] = f"Échec de connexion (Code: {rc})"
+        set_connection_status(f"Échec de connexion (Code: {rc})")
         logger.error(f"Échec de connexion MQTT: {rc}")
 
 def on_disconnect(client, userdata, rc):
-    global mqtt_connected, latest_data
+    global mqtt_connected
     mqtt_connected = False
-    with data_lock:
-        latest_data["connection_status"] = "Déconnecté"
+    set_connection_status("Déconnecté")
     logger.warning("Connexion MQTT perdue")
 
-# MQTT callback when message received
-def on_message(client, userdata, msg):
-    global latest_data
-    
+def mqtt_connection_changed(connected, status):
+    """État de connexion signalé par le cœur d'ingestion asyncio"""
+    global mqtt_connected
+    mqtt_connected = connected
+    set_connection_status(status)
+
+def decode_message(msg):
+    """Décode et valide un message MQTT: (machine_id, paramètres, timestamp, séquence du journal), ou None s'il est rejeté"""
     try:
-        # Décoder le message JSON
+        # Décoder le message JSON (formatage du log différé: rien n'est fait hors DEBUG)
         data = json.loads(msg.payload.decode())
-        logger.debug(f"Message MQTT reçu: {data}")
+        logger.debug("Message MQTT reçu: %s", data)
         
         # Vérifier la structure des données
         params = data.get("parametres_machine", [])
         if len(params) != 5:
-            logger.warning(f"Données incomplètes reçues: {params}")
-            return
+            mqtt_invalid_messages.inc()
+            sampled_log.log("incomplete", logging.WARNING, "Données incomplètes reçues: %s", params)
+            return None
         
         # Valider que tous les paramètres sont des nombres
         try:
             params = [float(p) for p in params]
         except (ValueError, TypeError):
-            logger.error(f"Paramètres non numériques: {params}")
-            return
-        
-        # Faire la prédiction ML
-        prediction = predict_machine_fault(params)
+            mqtt_invalid_messages.inc()
+            sampled_log.log("non_numeric", logging.ERROR, "Paramètres non numériques: %s", params)
+            return None
         
         # Traiter le timestamp
         timestamp = data.get("timestamp_epoch", data.get("timestamp", time.time()))
         if isinstance(timestamp, str):
             # Si c'est une chaîne, utiliser l'heure actuelle
             timestamp = time.time()
+        machine_id = machine_id_from_topic(msg.topic)
         
-        # Mise à jour thread-safe des données
-        with data_lock:
-            latest_data.update({
-                "parametres_machine": params,
-                "timestamp": timestamp,
-                "ml_prediction": prediction,
-                "connection_status": "Connecté - Données reçues",
-                "last_update": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
+        # Journalisée avant l'inférence: rejouée si sa ligne d'historique n'est pas commitée
+        spool_seq = reading_spool.append(machine_id, params, timestamp) if reading_spool is not None else None
+        return machine_id, params, timestamp, spool_seq
         
-        # Mettre à jour le buffer
-        update_data_buffer(latest_data)
+    except json.JSONDecodeError as e:
+        mqtt_invalid_messages.inc()
+        sampled_log.log("json", logging.ERROR, "Erreur de décodage JSON: %s", e)
+    except Exception as e:
+        mqtt_invalid_messages.inc()
+        logger.error(f"Erreur lors du traitement du message MQTT: {e}")
+    return None
+
+# MQTT callback when message received (cœur "thread")
+def on_message(client, userdata, msg):
+    started = time.perf_counter() if not ingest_pipeline.submitted % DECODE_TIMING_SAMPLE else None
+    decoded = decode_message(msg)
+    if decoded is None:
+        return
+    if started is not None:
+        decode_time.observe(time.perf_counter() - started)
+    
+    # Mettre la lecture en file d'inférence; l'état et l'historique sont
+    # mis à jour par le pipeline à la réception du résultat
+    try:
+        ingest_pipeline.submit(*decoded)
+    except Exception as e:
+        logger.error(f"Erreur lors du traitement du message MQTT: {e}")
+
+def handle_prediction(machine_id, params, timestamp, prediction, spool_seq=None):
+    """Applique le résultat d'une prédiction ML (appelé par le pipeline, dans l'ordre par machine)"""
+    try:
+        # Mise à jour de l'état et du buffer de la machine (verrou propre à la machine)
+        state = machine_registry.get_or_create(machine_id)
+        snapshot = state.update(params, timestamp, prediction, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        
+        # Pousser le nouvel instantané aux tableaux de bord connectés (sérialisé
+        # une seule fois: /data sert ensuite les mêmes octets)
+        state.broadcaster.publish(state.payload()[0])
         
         # Sauvegarder en base de données
-        insert_history(latest_data, prediction)
+        insert_history(machine_id, snapshot, prediction, spool_seq)
         
-        # Log des informations importantes
-        fault_status = "PANNE DÉTECTÉE" if prediction['is_fault'] else "FONCTIONNEMENT NORMAL"
-        logger.info(f"Données mises à jour - {fault_status} - Probabilité: {prediction['fault_probability']:.2%}")
+        # Détection des débuts et fins de panne (modèle chargé uniquement:
+        # les prédictions par défaut du chargement ne clôturent pas une panne)
+        if fault_detector is not None and prediction["model_status"] == "Active":
+            fault_detector.update(machine_id, timestamp, prediction["fault_probability"], prediction["is_fault"])
+        
+        # Journal limité: une ligne par machine et par état (panne ou non) par
+        # intervalle; une machine n'est traitée que par un worker du pipeline
+        if prediction['is_fault']:
+            sampled_log.log(("fault", machine_id), logging.WARNING, "Machine %s - PANNE DÉTECTÉE - Probabilité: %.2f%%",
+                            machine_id, prediction['fault_probability'] * 100)
+        else:
+            sampled_log.log(("normal", machine_id), logging.INFO, "Machine %s - FONCTIONNEMENT NORMAL - Probabilité: %.2f%%",
+                            machine_id, prediction['fault_probability'] * 100)
         
-    except json.JSONDecodeError as e:
-        logger.error(f"Erreur de décodage JSON: {e}")
     except Exception as e:
-        logger.error(f"Erreur lors du traitement du message MQTT: {e}")
+        logger.error(f"Erreur lors du traitement de la prédiction: {e}")
+
+# Pipeline d'ingestion (créé après handle_prediction, son étape finale);
+# les workers web n'ingèrent rien
+ingest_pipeline = None if WEB_ONLY or MQTT_CORE == "asyncio" else IngestPipeline(
+    predict_machine_fault_batch,
+    handle_prediction,
+    workers=INGEST_WORKERS,
+    executor=INGEST_EXECUTOR,
+    max_batch_size=INFERENCE_BATCH_SIZE,
+    max_delay=INFERENCE_MAX_DELAY,
+    max_queue_size=INGEST_QUEUE_SIZE,
+    # Modèle étendu (fichier .features.json à côté du modèle): caractéristiques
+    # glissantes calculées par machine avant l'inférence
+    features=StreamingFeatures(ml_service.feature_config) if ml_service.feature_config else None
+)
+
+# Cœur asyncio: ses propres étapes décodage -> inférence -> application
+mqtt_ingestor = None if WEB_ONLY or MQTT_CORE != "asyncio" else AsyncMqttIngestor(
+    MQTT_BROKER,
+    MQTT_PORT,
+    [MQTT_TOPIC, MQTT_TOPIC_WILDCARD],
+    decode_message,
+    predict_machine_fault_batch,
+    handle_prediction,
+    client_id=MQTT_CLIENT_ID,
+    username=MQTT_USER,
+    password=MQTT_PASSWORD,
+    tls=MQTT_TLS,
+    max_inflight=MQTT_MAX_INFLIGHT,
+    max_batch_size=INFERENCE_BATCH_SIZE,
+    max_delay=INFERENCE_MAX_DELAY,
+    features=StreamingFeatures(ml_service.feature_config) if ml_service.feature_config else None,
+    on_connection_change=mqtt_connection_changed,
+    # Lectures journalisées acquittées une fois sur disque: rejouées par le
+    # journal, jamais aussi redélivrées par le broker
+    journal=reading_spool
+)
+
+# Cœur actif: mêmes compteurs et latences (submitted, completed, dropped,
+# sink_time, end_to_end, metrics()) quel que soit MQTT_CORE
+ingest_core = mqtt_ingestor or ingest_pipeline
 
 # Setup MQTT client avec reconnexion automatique
 def setup_mqtt():
@@ -247,7 +499,8 @@ def setup_mqtt():
             client.on_disconnect = on_disconnect
             
             # Configuration SSL
-            client.tls_set()
+            if MQTT_TLS:
+                client.tls_set()
             
             logger.info(f"Tentative de connexion à {MQTT_BROKER}:{MQTT_PORT}")
             client.connect(MQTT_BROKER, MQTT_PORT, 60)
@@ -257,8 +510,7 @@ def setup_mqtt():
             
         except Exception as e:
             mqtt_connected = False
-            with data_lock:
-                latest_data["connection_status"] = f"Erreur: {str(e)}"
+            set_connection_status(f"Erreur: {str(e)}")
             logger.error(f"Erreur MQTT: {e}")
             logger.info("Reconnexion dans 10 secondes...")
             time.sleep(10)
@@ -295,12 +547,7 @@ def login():
             return render_template('login.html', error="Veuillez remplir tous les champs")
         
         try:
-            conn = sqlite3.connect(USERS_DB)
-            cursor = conn.cursor()
-            cursor.execute("SELECT password FROM users WHERE username = ?", (username,))
-            user = cursor.fetchone()
-            
-            if user and bcrypt.checkpw(password.encode('utf-8'), user[0]):
+            if auth_service.verify(username, password):
                 session['username'] = username
                 logger.info(f"Connexion réussie pour l'utilisateur: {username}")
                 return redirect(url_for('index'))
@@ -308,11 +555,12 @@ def login():
                 logger.warning(f"Tentative de connexion échouée pour: {username}")
                 return render_template('login.html', error="Nom d'utilisateur ou mot de passe incorrect")
                 
+        except AuthServiceBusy:
+            logger.warning(f"Trop de connexions simultanées, tentative refusée pour: {username}")
+            return render_template('login.html', error="Serveur occupé, veuillez réessayer"), 503
         except Exception as e:
             logger.error(f"Erreur lors de la connexion: {e}")
             return render_template('login.html', error="Erreur du serveur")
-        finally:
-            conn.close()
             
     return render_template('login.html', error=None)
 
@@ -324,59 +572,290 @@ def logout():
     logger.info(f"Déconnexion de l'utilisateur: {username}")
     return redirect(url_for('login'))
 
+def get_requested_machine_id():
+    """Identifiant de machine demandé (?machine_id=), machine par défaut sinon"""
+    return request.args.get('machine_id') or DEFAULT_MACHINE_ID
+
+def service_status():
+    """État du service d'ingestion: local, ou publié dans STATE_DB pour un worker web"""
+    return state_store.status() if WEB_ONLY else ingestion_status()
+
+def get_machine_snapshot(machine_id):
+    """Copie des dernières données d'une machine (valeurs par défaut si inconnue)"""
+    if WEB_ONLY:
+        data = state_store.snapshot(machine_id)
+    else:
+        state = machine_registry.get(machine_id)
+        data = state.snapshot() if state is not None else None
+    if data is None:
+        data = default_machine_data(service_status().get("mqtt_status", "Déconnecté") if WEB_ONLY else mqtt_status)
+        data["machine_id"] = machine_id
+    model_ready = service_status().get("model_ready", False) if WEB_ONLY else ml_service.is_ready()
+    if data["last_update"] is None and not model_ready:
+        # Le modèle est encore en cours de chargement
+        data["ml_prediction"] = dict(data["ml_prediction"], model_status="Loading")
+    return data
+
 # Route for main page
 @app.route('/')
 @login_required
 def index():
-    with data_lock:
-        data_copy = latest_data.copy()
-    return render_template('index.html', data=data_copy)
+    machine_id = get_requested_machine_id()
+    return render_template('index.html', data=get_machine_snapshot(machine_id), machine_id=machine_id,
+                           live_stream=not WEB_ONLY, poll_interval=DASHBOARD_POLL_INTERVAL)
 
 # Route for latest data (API)
 @app.route('/data')
 @login_required
 def get_data():
-    with data_lock:
-        data_copy = latest_data.copy()
-    return jsonify(data_copy)
+    machine_id = get_requested_machine_id()
+    if WEB_ONLY:
+        # Publié par le processus d'ingestion, donc après inférence
+        cached = state_store.payload(machine_id)
+    else:
+        state = machine_registry.get(machine_id)
+        cached = state.payload() if state is not None and ml_service.is_ready() else None
+    if cached is None:
+        # Machine inconnue ou modèle en cours de chargement: instantané par défaut
+        return jsonify(get_machine_snapshot(machine_id))
+    # Octets sérialisés une fois par lecture; 304 si le client a déjà cette version
+    body, etag = cached
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+# Route for live data (Server-Sent Events)
+@app.route('/stream')
+@login_required
+def stream_data():
+    if WEB_ONLY:
+        # Worker web: pas de flux (un thread par tableau de bord connecté
+        # épuiserait les workers × threads de gunicorn); 204 indique à
+        # EventSource de ne pas se reconnecter, le client interroge /data
+        return Response(status=204)
+    # Machine inconnue: 404 plutôt qu'une entrée fantôme dans le registre
+    # (sauf la machine par défaut, celle du tableau de bord initial)
+    machine_id = get_requested_machine_id()
+    state = machine_registry.get(machine_id)
+    if state is None:
+        if machine_id != DEFAULT_MACHINE_ID:
+            return jsonify({"error": "Machine inconnue"}), 404
+        state = machine_registry.get_or_create(machine_id)
+    return Response(
+        state.broadcaster.stream(state.broadcaster.subscribe()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 # Route pour les statistiques du buffer
 @app.route('/buffer_stats')
 @login_required
 def get_buffer_stats():
-    with data_lock:
-        buffer_copy = data_buffer.copy()
+    machine_id = get_requested_machine_id()
+    if WEB_ONLY:
+        buffer_stats = state_store.buffer_stats(machine_id)
+        connected = service_status().get("mqtt_connected", False)
+    else:
+        state = machine_registry.get(machine_id)
+        buffer_stats = state.buffer_stats() if state is not None else None
+        connected = mqtt_connected
+    if buffer_stats is None:
+        return jsonify({"error": "Aucune donnée disponible"})
     
-    if not buffer_copy:
+    # Statistiques glissantes maintenues à chaque lecture (temps constant)
+    total_records, window_stats = buffer_stats
+    if not total_records:
         return jsonify({"error": "Aucune donnée disponible"})
+    recent = window_stats[min(window_stats)]
     
-    # Calculer des statistiques simples
-    recent_faults = sum(1 for d in buffer_copy[-10:] if d["ml_prediction"]["is_fault"])
-    avg_fault_prob = sum(d["ml_prediction"]["fault_probability"] for d in buffer_copy[-10:]) / min(10, len(buffer_copy))
+    return jsonify({
+        "total_records": total_records,
+        "recent_faults": recent["fault_count"],
+        "avg_fault_probability": recent["avg_fault_probability"],
+        "mqtt_connected": connected,
+        "windows": {str(window): stats for window, stats in window_stats.items()}
+    })
+
+# Route de synthèse de la flotte de machines
+@app.route('/fleet')
+@login_required
+def fleet_summary():
+    if WEB_ONLY:
+        snapshots = state_store.snapshots()
+        connected = service_status().get("mqtt_connected", False)
+    else:
+        snapshots = [state.snapshot() for state in machine_registry.states()]
+        connected = mqtt_connected
+    machines = []
+    for data in snapshots:
+        machines.append({
+            "machine_id": data["machine_id"],
+            "last_update": data["last_update"],
+            "timestamp": data["timestamp"],
+            "fault_probability": data["ml_prediction"]["fault_probability"],
+            "is_fault": data["ml_prediction"]["is_fault"],
+            "connection_status": data["connection_status"]
+        })
+    machines.sort(key=lambda m: m["machine_id"])
     
     return jsonify({
-        "total_records": len(buffer_copy),
-        "recent_faults": recent_faults,
-        "avg_fault_probability": avg_fault_prob,
-        "mqtt_connected": mqtt_connected
+        "mqtt_connected": connected,
+        "machine_count": len(machines),
+        "faulty_machines": sum(1 for m in machines if m["is_fault"]),
+        "machines": machines
     })
 
+def parse_time_arg(value):
+    """Convertit un paramètre de temps (epoch ou date ISO 8601) en timestamp"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def parse_history_cursor(value):
+    """Décode un curseur de pagination 'timestamp,id'"""
+    if not value:
+        return None
+    timestamp, row_id = value.rsplit(',', 1)
+    try:
+        timestamp = float(timestamp)
+    except ValueError:
+        # Anciennes lignes dont le timestamp est stocké sous forme de texte
+        pass
+    return timestamp, int(row_id)
+
+def make_history_cursor(row):
+    """Construit le curseur 'timestamp,id' désignant une ligne d'historique"""
+    timestamp = repr(row[1]) if isinstance(row[1], float) else row[1]
+    return f"{timestamp},{row[0]}"
+
+def get_history_filters():
+    """Lit les filtres de l'historique depuis les paramètres de la requête"""
+    min_probability = request.args.get('min_probability', type=float)
+    return {
+        "before": parse_history_cursor(request.args.get('before')),
+        "start": parse_time_arg(request.args.get('start')),
+        "end": parse_time_arg(request.args.get('end')),
+        "fault_only": request.args.get('fault_only', '').lower() in ('1', 'true', 'on'),
+        "min_probability": min_probability,
+        "machine_id": request.args.get('machine_id') or None
+    }
+
+HISTORY_COLUMNS = ("id", "timestamp", "vibration", "temperature", "pressure", "rms", "mean_temp",
+                   "fault_probability", "is_fault", "model_status", "machine_id")
+
+def execute_history_query(cursor, limit, before=None, start=None, end=None, fault_only=False,
+                          min_probability=None, machine_id=None, columns=HISTORY_COLUMNS, offset=0):
+    """Exécute la requête d'une page d'historique, du plus récent au plus ancien (pagination par curseur)"""
+    clauses = []
+    params = []
+    if machine_id is not None:
+        clauses.append("machine_id = ?")
+        params.append(machine_id)
+    if fault_only:
+        clauses.append("is_fault = 1")
+    if before is not None:
+        clauses.append("(timestamp, id) < (?, ?)")
+        params.extend(before)
+    if start is not None:
+        clauses.append("timestamp >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("timestamp <= ?")
+        params.append(end)
+    if min_probability is not None:
+        clauses.append("fault_probability >= ?")
+        params.append(min_probability)
+    
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cursor.execute(f"""
+        SELECT {', '.join(columns)}
+        FROM machine_history
+        {where}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ? OFFSET ?
+    """, (*params, limit, offset))
+    return cursor
+
+def query_history(cursor, limit, **filters):
+    """Lit une page d'historique, du plus récent au plus ancien (pagination par curseur)"""
+    return execute_history_query(cursor, limit, **filters).fetchall()
+
+def next_history_cursor(cursor, limit, **filters):
+    """Curseur de la page suivante si la page est complète, sans lire la page elle-même"""
+    row = execute_history_query(cursor, 1, columns=("id", "timestamp"), offset=limit - 1, **filters).fetchone()
+    return make_history_cursor(row) if row else None
+
+# Encodeur compact partagé par les réponses d'historique
+history_encoder = json.JSONEncoder(separators=(',', ':'))
+
+def history_row_objects(rows):
+    """Lignes d'historique au format objet de /history_data"""
+    return [{
+        "id": row[0],
+        "machine_id": row[10],
+        "timestamp": row[1],
+        "parametres_machine": [row[2], row[3], row[4], row[5], row[6]],
+        "ml_prediction": {
+            "fault_probability": row[7],
+            "is_fault": row[8],
+            "model_status": row[9]
+        }
+    } for row in rows]
+
+def stream_history_rows(conn, cursor):
+    """Tableau JSON produit par paquets au fil du curseur (jamais matérialisé en entier)"""
+    try:
+        separator = b"["
+        while True:
+            rows = cursor.fetchmany(HISTORY_STREAM_CHUNK)
+            if not rows:
+                break
+            yield separator + history_encoder.encode(history_row_objects(rows))[1:-1].encode("utf-8")
+            separator = b","
+        yield b"]" if separator == b"," else b"[]"
+    except Exception as e:
+        # Les en-têtes sont déjà partis: la réponse est tronquée
+        logger.error(f"Erreur API historique pendant l'envoi: {e}")
+    finally:
+        conn.close()
+
+def gzip_stream(chunks, level=HISTORY_GZIP_LEVEL):
+    """Compresse un flux de réponse au fil de l'eau (format gzip)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        chunks.close()
+
 # Route for history page
 @app.route('/history')
 @login_required
 def history():
+    conn = None
+    try:
+        filters = get_history_filters()
+    except ValueError:
+        return render_template('history.html', history=[], error="Paramètres de filtre invalides")
+    
     try:
         conn = sqlite3.connect(HISTORY_DB)
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM machine_history 
-            ORDER BY timestamp DESC 
-            LIMIT 1000
-        """)
-        history_data = cursor.fetchall()
+        history_data = query_history(cursor, HISTORY_PAGE_SIZE, **filters)
         
         history_list = [
             {
+                "machine_id": row[10],
                 "timestamp": row[1],
                 "parametres_machine": [row[2], row[3], row[4], row[5], row[6]],
                 "ml_prediction": {
@@ -387,74 +866,448 @@ def history():
             } for row in history_data
         ]
         
-        return render_template('history.html', history=history_list)
+        # Curseur de la page suivante si la page est complète
+        next_before = None
+        if len(history_data) == HISTORY_PAGE_SIZE:
+            next_before = make_history_cursor(history_data[-1])
+        
+        return render_template('history.html', history=history_list, next_before=next_before,
+                               filters=request.args)
         
     except Exception as e:
         logger.error(f"Erreur lors de la récupération de l'historique: {e}")
         return render_template('history.html', history=[], error="Erreur de base de données")
     finally:
-        conn.close()
+        if conn:
+            conn.close()
 
 # API route for history data
+# ?format=columns: un tableau par champ au lieu d'un objet par ligne (plus compact);
+# réponse compressée en gzip si le client envoie Accept-Encoding: gzip
 @app.route('/history_data')
 @login_required
 def get_history_data():
     limit = request.args.get('limit', 100, type=int)
-    limit = min(limit, 1000)  # Limite maximale de sécurité
+    limit = min(limit, HISTORY_MAX_LIMIT)  # Limite maximale de sécurité
+    columnar = request.args.get('format') == 'columns'
+    use_gzip = request.accept_encodings['gzip'] > 0
+    
+    try:
+        filters = get_history_filters()
+    except ValueError:
+        return jsonify({"error": "Paramètres de filtre invalides"}), 400
     
+    conn = None
     try:
         conn = sqlite3.connect(HISTORY_DB)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM machine_history 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        """, (limit,))
-        history_data = cursor.fetchall()
+        # Curseur à passer dans ?before= pour obtenir la page suivante
+        next_before = next_history_cursor(conn.cursor(), limit, **filters) if limit > 0 else None
+        cursor = execute_history_query(conn.cursor(), limit, **filters)
         
-        return jsonify([{
-            "id": row[0],
-            "timestamp": row[1],
-            "parametres_machine": [row[2], row[3], row[4], row[5], row[6]],
-            "ml_prediction": {
-                "fault_probability": row[7],
-                "is_fault": row[8],
-                "model_status": row[9]
-            }
-        } for row in history_data])
+        if columnar:
+            # Les colonnes ont besoin de toutes les lignes: transposition de la page
+            rows = cursor.fetchall()
+            conn.close()
+            conn = None
+            columns = list(zip(*rows)) if rows else [()] * len(HISTORY_COLUMNS)
+            body = history_encoder.encode({
+                "count": len(rows),
+                "columns": {name: list(values) for name, values in zip(HISTORY_COLUMNS, columns)}
+            }).encode("utf-8")
+            if use_gzip:
+                body = zlib.compress(body, HISTORY_GZIP_LEVEL, wbits=31)
+            response = app.response_class(body, mimetype='application/json')
+        else:
+            # La connexion est fermée par le générateur, à la fin de l'envoi
+            chunks = stream_history_rows(conn, cursor)
+            conn = None
+            response = app.response_class(gzip_stream(chunks) if use_gzip else chunks, mimetype='application/json')
+        
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        if next_before:
+            response.headers['X-Next-Before'] = next_before
+        return response
         
     except Exception as e:
         logger.error(f"Erreur API historique: {e}")
         return jsonify({"error": "Erreur de base de données"}), 500
     finally:
-        conn.close()
+        if conn:
+            conn.close()
+
+# API des séries agrégées (graphiques sur une semaine, un mois...)
+@app.route('/history_series')
+@login_required
+def get_history_series():
+    try:
+        start = parse_time_arg(request.args.get('start'))
+        end = parse_time_arg(request.args.get('end'))
+    except ValueError:
+        return jsonify({"error": "Paramètres de filtre invalides"}), 400
+    max_points = request.args.get('max_points', HISTORY_SERIES_POINTS, type=int)
+    max_points = max(1, min(max_points, HISTORY_SERIES_MAX_POINTS))
+    end = time.time() if end is None else end
+    start = end - 86400 if start is None else start
+    machine_id = get_requested_machine_id()
+    
+    conn = None
+    try:
+        conn = sqlite3.connect(HISTORY_DB)
+        resolution, step, points = query_rollup(conn.cursor(), machine_id, start, end, max_points)
+        return jsonify({
+            "machine_id": machine_id,
+            "start": start,
+            "end": end,
+            "resolution": resolution,
+            "bucket_seconds": step,
+            "sensors": list(SENSOR_COLUMNS),
+            "points": points
+        })
+    except Exception as e:
+        logger.error(f"Erreur API séries: {e}")
+        return jsonify({"error": "Erreur de base de données"}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# Événements de panne, du plus récent au plus ancien
+@app.route('/fault_events')
+@login_required
+def get_fault_events():
+    limit = max(0, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), HISTORY_MAX_LIMIT))
+    try:
+        start = parse_time_arg(request.args.get('start'))
+        end = parse_time_arg(request.args.get('end'))
+    except ValueError:
+        return jsonify({"error": "Paramètres de filtre invalides"}), 400
+    clauses = []
+    params = []
+    machine_id = request.args.get('machine_id')
+    if machine_id:
+        clauses.append("machine_id = ?")
+        params.append(machine_id)
+    if request.args.get('event'):
+        clauses.append("event = ?")
+        params.append(request.args['event'])
+    if start is not None:
+        clauses.append("timestamp >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("timestamp <= ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    
+    conn = None
+    try:
+        conn = sqlite3.connect(HISTORY_DB)
+        rows = conn.execute(f"""
+            SELECT {', '.join(EVENT_COLUMNS)} FROM fault_events
+            {where}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        """, (*params, limit)).fetchall()
+        return jsonify([dict(zip(EVENT_COLUMNS, row)) for row in rows])
+    except Exception as e:
+        logger.error(f"Erreur API événements de panne: {e}")
+        return jsonify({"error": "Erreur de base de données"}), 500
+    finally:
+        if conn:
+            conn.close()
+
+# Modèle servi, versions du registre et accord du modèle en mode shadow
+@app.route('/model')
+@login_required
+def model_status():
+    info = dict(service_status().get("model") or {}) if WEB_ONLY else ml_service.model_info()
+    info["versions"] = ml_service.registry.versions() if ml_service.registry else []
+    return jsonify(info)
+
+def promote_shadow_model():
+    """Sert le modèle en mode shadow et l'active dans le registre; None s'il n'y en a pas"""
+    candidate = ml_service.promote_shadow()
+    if candidate is not None:
+        if candidate.version and ml_service.registry:
+            ml_service.registry.activate(candidate.version)
+        logger.info(f"Modèle shadow promu: {candidate.version or candidate.path}")
+    return candidate
+
+def run_control_command(command, args):
+    """Commandes d'administration transmises par les workers web (processus d'ingestion)"""
+    if command == "reload_model":
+        ml_service.reload_async(version=args.get("version"), shadow=args.get("shadow", False))
+    elif command == "promote_model":
+        if promote_shadow_model() is None:
+            logger.warning("Promotion demandée sans modèle en mode shadow")
+    else:
+        logger.warning(f"Commande inconnue: {command}")
+
+# Rechargement à chaud: chargement et préchauffage en arrière-plan, puis bascule atomique
+@app.route('/model/reload', methods=['POST'])
+@login_required
+def model_reload():
+    version = request.values.get('version') or None
+    shadow = request.values.get('shadow', '').lower() in ('1', 'true', 'on')
+    if version:
+        if ml_service.registry is None:
+            return jsonify({"error": "Aucun registre de modèles configuré"}), 400
+        try:
+            ml_service.registry.metadata(version)
+        except KeyError:
+            return jsonify({"error": f"Version inconnue: {version}"}), 404
+        if not shadow:
+            # Les autres processus suivent le fichier ACTIVE du registre
+            ml_service.registry.activate(version)
+    if WEB_ONLY:
+        # Le modèle est chargé par le processus d'ingestion
+        state_store.push_command("reload_model", version=version, shadow=shadow)
+    else:
+        ml_service.reload_async(version=version, shadow=shadow)
+    logger.info(f"Rechargement du modèle demandé (version={version or 'courante'}, shadow={shadow})")
+    return jsonify({"status": "reloading", "version": version, "shadow": shadow}), 202
+
+# Le modèle en mode shadow devient le modèle servi
+@app.route('/model/promote', methods=['POST'])
+@login_required
+def model_promote():
+    if WEB_ONLY:
+        state_store.push_command("promote_model")
+        return jsonify({"status": "promoting"}), 202
+    if promote_shadow_model() is None:
+        return jsonify({"error": "Aucun modèle en mode shadow"}), 409
+    return jsonify(ml_service.model_info())
+
+def ingestion_status():
+    """État du processus d'ingestion (servi par /status, publié dans STATE_DB en mode ingest)"""
+    return {
+        "mqtt_connected": mqtt_connected,
+        "mqtt_status": mqtt_status,
+        "model_ready": ml_service.is_ready(),
+        "model_loading_status": ml_service.status,
+        "model": ml_service.model_info(),
+        "machine_count": len(machine_registry),
+        "pipeline": ingest_core.metrics(),
+        "spool": reading_spool.stats() if reading_spool is not None else None,
+        "history_writer": {
+            "queue_depth": history_writer.queue_size(),
+            "written": history_writer.written,
+            "dropped": history_writer.dropped,
+            "failed": history_writer.failed,
+            "replayed": history_writer.replayed,
+            "batch_time": history_writer.batch_time.summary()
+        },
+        "retention": history_retention.stats() if history_retention else None,
+        "fault_events": dict(fault_event_dispatcher.stats(), active_faults=fault_detector.active_count()),
+        "prediction_cache": ml_service.cache.stats() if ml_service.cache else None
+    }
+
+# Métriques exportées par /metrics (format texte Prometheus)
+metrics_registry = MetricsRegistry("diagnostic")
+
+def register_ingestion_metrics(registry):
+    """Métriques du processus d'ingestion: lues dans les composants au moment de l'export"""
+    def per_partition(read):
+        return lambda: [({"partition": str(i)}, read(partition))
+                        for i, partition in enumerate(ingest_pipeline.partitions)]
+    
+    registry.counter("mqtt_messages_total", "Messages MQTT reçus",
+                     lambda: ingest_core.submitted + ingest_core.dropped + mqtt_invalid_messages.value)
+    registry.counter("mqtt_messages_invalid_total", "Messages MQTT rejetés (JSON invalide, paramètres incomplets)",
+                     mqtt_invalid_messages)
+    registry.gauge("mqtt_connected", "Connexion au broker MQTT active", lambda: mqtt_connected)
+    
+    registry.counter("ingest_submitted_total", "Lectures mises en file d'inférence", lambda: ingest_core.submitted)
+    registry.counter("ingest_completed_total", "Lectures traitées de bout en bout", lambda: ingest_core.completed)
+    registry.counter("ingest_dropped_total", "Lectures abandonnées (file d'inférence pleine)",
+                     lambda: ingest_core.dropped)
+    registry.histogram("ingest_sink_seconds", "Application d'une prédiction (état, flux, file d'historique)",
+                       ingest_core.sink_time)
+    registry.histogram("ingest_end_to_end_seconds", "De la réception du message à l'application de la prédiction",
+                       ingest_core.end_to_end)
+    if ingest_pipeline is not None:
+        registry.histogram("mqtt_decode_seconds",
+                           f"Décodage et validation d'un message MQTT (1 message sur {DECODE_TIMING_SAMPLE})",
+                           decode_time)
+        registry.gauge("ingest_queue_depth", "Lectures en attente d'inférence",
+                       per_partition(lambda p: p.queue_size()))
+        registry.histogram("ingest_queue_wait_seconds", "Attente en file du plus ancien élément de chaque lot",
+                           per_partition(lambda p: p.queue_wait))
+        registry.histogram("inference_seconds", "Inférence d'un lot", per_partition(lambda p: p.inference_time))
+        registry.counter("inference_batches_total", "Lots d'inférence traités",
+                         per_partition(lambda p: p.batches_processed))
+        registry.counter("inference_rows_total", "Lignes évaluées par le modèle",
+                         per_partition(lambda p: p.rows_processed))
+    if mqtt_ingestor is not None:
+        registry.gauge("ingest_queue_depth", "Messages en attente par étape du cœur asyncio",
+                       lambda: [({"stage": stage}, depth)
+                                for stage, depth in mqtt_ingestor.metrics()["queue_depth"].items()])
+        registry.histogram("inference_seconds", "Inférence d'un lot", mqtt_ingestor.inference_time)
+        registry.gauge("mqtt_inflight", "Messages QoS 1 reçus et pas encore acquittés", lambda: mqtt_ingestor.inflight)
+        registry.counter("mqtt_acked_total", "Messages acquittés après traitement", lambda: mqtt_ingestor.acked)
+        registry.counter("mqtt_read_pauses_total", "Suspensions de lecture (limite de messages en cours atteinte)",
+                         lambda: mqtt_ingestor.read_pauses)
+        registry.counter("mqtt_reconnects_total", "Reconnexions au broker", lambda: mqtt_ingestor.reconnects)
+        registry.counter("mqtt_inference_failed_total",
+                         "Messages non acquittés après échec de l'inférence (redélivrés par le broker)",
+                         lambda: mqtt_ingestor.failed)
+        registry.counter("mqtt_redelivery_reconnects_total", "Reconnexions pour redélivrance après échec d'inférence",
+                         lambda: mqtt_ingestor.redelivery_reconnects)
+        registry.gauge("mqtt_last_recovery_seconds", "Durée de la dernière coupure (déconnexion -> reconnexion)",
+                       lambda: mqtt_ingestor.last_recovery_seconds)
+    
+    registry.counter("history_rows_written_total", "Lignes écrites dans l'historique", lambda: history_writer.written)
+    registry.counter("history_rows_dropped_total", "Lignes abandonnées (file d'historique pleine)",
+                     lambda: history_writer.dropped)
+    registry.counter("history_rows_failed_total", "Lignes en échec d'écriture", lambda: history_writer.failed)
+    registry.gauge("history_queue_depth", "Lignes en attente d'écriture", history_writer.queue_size)
+    registry.histogram("history_write_seconds", "Transaction d'écriture d'un lot d'historique",
+                       history_writer.batch_time)
+    registry.counter("history_rows_replayed_total", "Lignes rejouées depuis le journal de lectures",
+                     lambda: history_writer.replayed)
+    if reading_spool is not None:
+        registry.gauge("spool_pending", "Lectures journalisées sans ligne d'historique commitée",
+                       reading_spool.pending)
+        registry.counter("spool_appended_total", "Lectures écrites dans le journal", lambda: reading_spool.appended)
+        registry.counter("spool_overflow_total", "Lectures non journalisées (journal plein)",
+                         lambda: reading_spool.overflow)
+        registry.histogram("spool_sync_seconds", "Synchronisation du journal sur disque (fsync)",
+                           reading_spool.sync_time)
+    
+    registry.counter("fault_events_total", "Événements de panne détectés",
+                     lambda: [({"event": kind}, count) for kind, count in fault_detector.events.items()])
+    registry.gauge("fault_events_active", "Machines en panne (début émis, fin non encore émise)",
+                   fault_detector.active_count)
+    registry.gauge("fault_event_queue_depth", "Événements en attente d'enregistrement et d'envoi",
+                   fault_event_dispatcher.queue_size)
+    registry.counter("fault_events_dropped_total", "Événements abandonnés (file pleine)",
+                     lambda: fault_event_dispatcher.dropped)
+    registry.counter("fault_event_sink_errors_total", "Échecs d'envoi par destination",
+                     lambda: [({"sink": name}, count) for name, count in fault_event_dispatcher.sink_errors.items()])
+    registry.counter("fault_event_sink_dropped_total", "Événements abandonnés par destination (file pleine)",
+                     lambda: [({"sink": name}, count) for name, count in fault_event_dispatcher.sink_dropped.items()])
+    registry.gauge("fault_event_sink_queue_depth", "Lots en attente d'envoi par destination",
+                   lambda: [({"sink": name}, depth) for name, depth in fault_event_dispatcher.sink_queue_sizes().items()])
+    registry.histogram("fault_event_dispatch_seconds", "Enregistrement d'un lot d'événements",
+                       fault_event_dispatcher.dispatch_time)
+    
+    registry.gauge("machines", "Machines connues", lambda: len(machine_registry))
+    registry.gauge("model_ready", "Modèle chargé et prêt", ml_service.is_ready)
+    if ml_service.cache is not None:
+        registry.counter("prediction_cache_hits_total", "Prédictions servies par le cache",
+                         lambda: ml_service.cache.hits)
+        registry.counter("prediction_cache_misses_total", "Prédictions calculées par le modèle",
+                         lambda: ml_service.cache.misses)
+
+if not WEB_ONLY:
+    register_ingestion_metrics(metrics_registry)
+
+# Publication de l'état en direct pour les workers web (mode ingest)
+state_publisher = StatePublisher(
+    state_store,
+    machine_registry,
+    status_fn=ingestion_status,
+    metrics_fn=metrics_registry.render,
+    command_fn=run_control_command,
+    interval=STATE_PUBLISH_INTERVAL
+)
+
+# Métriques au format texte Prometheus (publiées par le processus d'ingestion en mode web)
+@app.route('/metrics')
+def metrics_endpoint():
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get("Authorization", ""),
+                                                 f"Bearer {METRICS_TOKEN}"):
+        return Response("Non autorisé\n", status=401, content_type="text/plain; charset=utf-8")
+    body = state_store.metrics() if WEB_ONLY else metrics_registry.render()
+    return Response(body, content_type="text/plain; version=0.0.4; charset=utf-8")
 
 # Route de status pour le monitoring
 @app.route('/status')
 @login_required
 def system_status():
-    with data_lock:
-        status = {
-            "mqtt_connected": mqtt_connected,
-            "last_data_time": latest_data.get("last_update"),
-            "connection_status": latest_data.get("connection_status"),
-            "buffer_size": len(data_buffer),
-            "ml_model_status": latest_data["ml_prediction"]["model_status"]
-        }
+    machine_id = get_requested_machine_id()
+    data = get_machine_snapshot(machine_id)
+    if WEB_ONLY:
+        buffer_stats = state_store.buffer_stats(machine_id)
+    else:
+        state = machine_registry.get(machine_id)
+        buffer_stats = state.buffer_stats() if state is not None else None
+    status = {
+        "role": APP_ROLE,
+        "machine_id": machine_id,
+        "last_data_time": data.get("last_update"),
+        "connection_status": data.get("connection_status"),
+        "buffer_size": buffer_stats[0] if buffer_stats else 0,
+        "ml_model_status": data["ml_prediction"]["model_status"]
+    }
+    status.update(service_status())
+    status["auth"] = auth_service.stats()
     return jsonify(status)
 
-if __name__ == '__main__':
+def start_ingestion():
+    """Démarre l'ingestion: bases, modèle, écriture de l'historique, rétention et MQTT"""
     # Initialisation des bases de données
     logger.info("Initialisation des bases de données...")
     init_history_db()
     init_users_db()
     
-    # Démarrage du thread MQTT
-    logger.info("Démarrage du service MQTT...")
+    # Chargement du modèle en arrière-plan: Flask répond pendant ce temps
+    ml_service.warm_up()
+    
+    # Journal des lectures (reprise des lectures non commitées au dernier arrêt)
+    # puis écriture de l'historique (vidée proprement à l'arrêt, avant le journal)
+    if reading_spool is not None:
+        reading_spool.start()
+        atexit.register(reading_spool.stop)
+    history_writer.start()
+    atexit.register(history_writer.stop)
+    
+    # Événements de panne: pannes en cours au dernier arrêt reprises, puis
+    # enregistrement et envoi (arrêté avant l'historique, après le cœur MQTT)
+    fault_detector.restore(HISTORY_DB)
+    fault_event_dispatcher.start()
+    atexit.register(fault_event_dispatcher.stop)
+    
+    # Rétention de l'historique (archivage puis suppression progressive)
+    if history_retention:
+        history_retention.start()
+        atexit.register(history_retention.stop)
+    
+    start_mqtt()
+
+def start_mqtt():
+    """Démarre le cœur d'ingestion MQTT choisi par MQTT_CORE"""
+    logger.info(f"Démarrage du service MQTT (cœur {MQTT_CORE})...")
+    if mqtt_ingestor is not None:
+        mqtt_ingestor.start()
+        # Enregistré après history_writer.stop: exécuté avant (ordre inverse),
+        # les derniers messages sont traités et acquittés avant la fin de l'écriture
+        atexit.register(mqtt_ingestor.stop)
+        return
+    # Enregistré après history_writer.stop: exécuté avant, les lectures déjà
+    # en file d'inférence sont appliquées avant la fin de l'écriture
+    atexit.register(ingest_pipeline.stop)
     mqtt_thread = Thread(target=setup_mqtt)
     mqtt_thread.daemon = True
     mqtt_thread.start()
+
+if __name__ == '__main__':
+    if WEB_ONLY:
+        sys.exit("APP_ROLE=web est destiné aux workers gunicorn: utilisez python serve.py")
+    
+    start_ingestion()
+    
+    if APP_ROLE == "ingest":
+        # Processus d'ingestion seul: l'état est publié pour les workers web
+        state_store.init_db()
+        state_publisher.start()
+        atexit.register(state_publisher.stop)
+        # SIGTERM (arrêt par serve.py): sortie normale pour vider l'historique
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        logger.info("Processus d'ingestion démarré")
+        while True:
+            time.sleep(3600)
     
     # Démarrage de l'application Flask
     logger.info("Démarrage de l'application Flask...")
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
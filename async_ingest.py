@@ -0,0 +1,514 @@
+import asyncio
+import logging
+import random
+import ssl
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+from batch_inference import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncMqttIngestor:
+    """Cœur d'ingestion MQTT asyncio: paho piloté par une boucle d'événements.
+
+    La boucle (thread dédié) surveille la socket du client paho (add_reader /
+    add_writer) au lieu de loop_forever. Les messages traversent trois étapes
+    reliées par des files asyncio bornées: décodage -> inférence par lots
+    (``predict_fn`` dans un thread) -> application du résultat (``sink``, dans
+    un thread unique, dans l'ordre de réception). ``decode`` retourne
+    (machine, paramètres, horodatage, séquence du journal), passés à ``sink``
+    avec la prédiction.
+
+    Abonnement en QoS 1 avec acquittement manuel: un message n'est acquitté
+    qu'une fois son résultat appliqué. Au-delà de ``max_inflight`` messages
+    reçus non acquittés, la socket n'est plus lue: le broker cesse d'envoyer
+    (fenêtre QoS 1, puis TCP) au lieu de laisser les files grossir. Les
+    reconnexions réutilisent le même client (session persistante,
+    clean_session=False) avec un délai exponentiel; les messages non acquittés
+    sont redélivrés par le broker (au moins une fois).
+
+    Un lot dont l'inférence échoue est réessayé après chacun des délais de
+    ``retry_delays``; s'il échoue encore, ses messages ne sont pas acquittés
+    et le client se reconnecte pour que le broker les redélivre.
+
+    Avec un ``journal`` (ReadingSpool), une lecture journalisée par ``decode``
+    est acquittée dès que le journal est synchronisé sur disque, sans
+    attendre son résultat: le journal devient la source de vérité et la
+    rejoue si sa ligne d'historique n'est pas commitée (échec d'inférence,
+    arrêt). Elle n'est donc jamais aussi redélivrée par le broker, sauf si la
+    connexion tombe ou le processus s'arrête brutalement entre l'écriture et
+    la synchronisation (au plus ``sync_interval`` secondes de lectures
+    doublées). Les messages d'une connexion précédente encore à décoder sont
+    ignorés: le broker les redélivre.
+    """
+
+    def __init__(self, host, port, topics, decode, predict_fn, sink, client_id, username=None, password=None,
+                 tls=False, keepalive=60, max_inflight=1000, queue_size=1000, max_batch_size=64,
+                 max_delay=0.005, min_reconnect_delay=0.5, max_reconnect_delay=30.0, features=None,
+                 on_connection_change=None, retry_delays=(0.1, 0.5, 2.0), journal=None):
+        if not hasattr(mqtt, "CallbackAPIVersion"):
+            raise RuntimeError("Le cœur asyncio nécessite paho-mqtt >= 2.0 (acquittement manuel)")
+        self.host = host
+        self.port = port
+        self.topics = topics
+        self.decode = decode
+        self.predict_fn = predict_fn
+        self.sink = sink
+        self.keepalive = keepalive
+        self.max_inflight = max_inflight
+        self.queue_size = queue_size
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.min_reconnect_delay = min_reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.features = features
+        self.on_connection_change = on_connection_change
+        self.retry_delays = retry_delays
+        self.journal = journal
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id,
+                                  clean_session=False, manual_ack=True)
+        if username:
+            self.client.username_pw_set(username, password)
+        if tls:
+            self.client.tls_set()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        self._loop = None
+        self._loop_thread = None
+        self._thread = None
+        self._started = threading.Event()
+        self._sock = None
+        self._reading = True
+        self._inflight = 0
+        # Incrémentée à chaque connexion: un message d'une connexion précédente
+        # n'est pas acquitté (le broker le redélivre dans la nouvelle)
+        self._generation = 0
+        # Connexion déjà coupée pour faire redélivrer les messages d'un lot en échec
+        self._redeliver_generation = None
+        # Lectures journalisées en attente de synchronisation: (séquence, génération, message)
+        self._journal_acks = deque()
+        self._stopping = False
+        self.connected = False
+
+        # Métriques
+        self.received = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.acked = 0
+        self.dropped = 0
+        # Lectures dont l'inférence a échoué après tous les essais (non acquittées,
+        # redélivrées), distinctes des messages invalides (rejected)
+        self.failed = 0
+        # Messages d'une connexion précédente, ignorés avant décodage (redélivrés)
+        self.stale = 0
+        self.inference_retries = 0
+        self.redelivery_reconnects = 0
+        self.read_pauses = 0
+        self.reconnects = 0
+        self.last_recovery_seconds = None
+        self._disconnected_at = None
+        self.inference_time = LatencyStats()
+        self.sink_time = LatencyStats()
+        self.end_to_end = LatencyStats()
+
+    # Cycle de vie (appelé depuis les autres threads)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), name="mqtt-asyncio",
+                                            daemon=True)
+            self._thread.start()
+            self._started.wait(10)
+        return self
+
+    def stop(self, timeout=10):
+        """Cesse de lire, traite et acquitte les messages en cours puis se déconnecte"""
+        if self._thread is None or self._loop is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(timeout), self._loop)
+        try:
+            future.result(timeout + 5)
+        except Exception as e:
+            logger.error(f"Arrêt du cœur MQTT asyncio: {e}")
+        self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def completed(self):
+        return self.end_to_end.count
+
+    @property
+    def inflight(self):
+        """Messages reçus et pas encore traités (ou abandonnés)"""
+        return self._inflight
+
+    def queue_depth(self):
+        if self._loop is None:
+            return 0
+        return self._decode_queue.qsize() + self._inference_queue.qsize() + self._persist_queue.qsize()
+
+    def metrics(self):
+        return {
+            "core": "asyncio",
+            "connected": self.connected,
+            "received": self.received,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "stale": self.stale,
+            "inference_retries": self.inference_retries,
+            "redelivery_reconnects": self.redelivery_reconnects,
+            "acked": self.acked,
+            "journal_acks_pending": len(self._journal_acks),
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "read_pauses": self.read_pauses,
+            "reconnects": self.reconnects,
+            "last_recovery_seconds": self.last_recovery_seconds,
+            "queue_depth": {
+                "decode": self._decode_queue.qsize() if self._loop else 0,
+                "inference": self._inference_queue.qsize() if self._loop else 0,
+                "persist": self._persist_queue.qsize() if self._loop else 0,
+            },
+            "stages": {
+                "inference": self.inference_time.summary(),
+                "sink": self.sink_time.summary(),
+                "end_to_end": self.end_to_end.summary()
+            }
+        }
+
+    # Boucle d'événements
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        # Décodage: jamais plein (lecture suspendue à max_inflight messages en cours)
+        self._decode_queue = asyncio.Queue(maxsize=self.max_inflight + 1)
+        self._inference_queue = asyncio.Queue(maxsize=self.queue_size)
+        self._persist_queue = asyncio.Queue(maxsize=4)
+        self._disconnected = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._connack = None
+        self._inference_executor = ThreadPoolExecutor(1, thread_name_prefix="mqtt-inference")
+        self._sink_executor = ThreadPoolExecutor(1, thread_name_prefix="mqtt-persist")
+        coroutines = [self._connection_loop(), self._keepalive_loop(),
+                      self._decode_stage(), self._inference_stage(), self._persist_stage()]
+        if self.journal is not None:
+            coroutines.append(self._journal_ack_loop())
+        tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+        self._started.set()
+        await self._stopped.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._inference_executor.shutdown(wait=False)
+        self._sink_executor.shutdown(wait=True)
+
+    async def _shutdown(self, timeout):
+        self._stopping = True
+        self._pause_reading(count=False)
+        deadline = self._loop.time() + timeout
+        while self._inflight > 0 and self._loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        if self._inflight:
+            logger.warning(f"Arrêt avec {self._inflight} messages non traités (redélivrés par le broker "
+                           f"ou rejoués depuis le journal)")
+        if self.journal is not None:
+            # Lectures journalisées (même non traitées): acquittées avant la déconnexion
+            await self._ack_journaled()
+        if self.connected:
+            self.client.disconnect()
+            # Laisse partir le paquet DISCONNECT
+            await asyncio.sleep(0.1)
+        self._disconnected.set()
+        self._stopped.set()
+
+    async def _connection_loop(self):
+        attempt = 0
+        first = True
+        while not self._stopping:
+            self._disconnected.clear()
+            self._connack = self._loop.create_future()
+            try:
+                # connect()/reconnect() ouvrent la socket de façon bloquante: hors de la boucle
+                if first:
+                    first = False
+                    await self._loop.run_in_executor(None, self.client.connect, self.host, self.port,
+                                                     self.keepalive)
+                else:
+                    await self._loop.run_in_executor(None, self.client.reconnect)
+                connected = await asyncio.wait_for(asyncio.shield(self._connack), timeout=10)
+            except (OSError, ssl.SSLError, asyncio.TimeoutError, mqtt.WebsocketConnectionError) as e:
+                logger.warning(f"Connexion MQTT à {self.host}:{self.port} impossible: {e}")
+                self._connection_changed(False, f"Erreur: {e}")
+                connected = False
+            if connected:
+                attempt = 0
+                await self._disconnected.wait()
+                if self._stopping:
+                    break
+            delay = min(self.max_reconnect_delay, self.min_reconnect_delay * 2 ** attempt)
+            # Gigue: les clients d'une même flotte ne se reconnectent pas tous ensemble
+            delay *= random.uniform(0.5, 1.0)
+            attempt += 1
+            logger.info(f"Reconnexion MQTT dans {delay:.1f} s")
+            await asyncio.sleep(delay)
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(1)
+            if self.connected:
+                self.client.loop_misc()
+
+    # Socket du client paho (callbacks appelés depuis la boucle ou depuis connect())
+
+    def _in_loop(self, callback, *args):
+        # Depuis la boucle, immédiatement: paho ferme la socket juste après
+        # on_socket_close (un appel différé trouverait un descripteur invalide)
+        if self._loop_thread == threading.get_ident():
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._in_loop(self._watch_socket, sock)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._in_loop(self._unwatch_socket, sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._in_loop(self._loop.add_writer, sock, self.client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._in_loop(self._loop.remove_writer, sock)
+
+    def _watch_socket(self, sock):
+        self._sock = sock
+        if self._reading:
+            self._loop.add_reader(sock, self._read)
+
+    def _unwatch_socket(self, sock):
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+        if self._sock is sock:
+            self._sock = None
+
+    def _read(self):
+        self.client.loop_read()
+        # TLS: des octets déjà déchiffrés ne réveillent pas le sélecteur
+        sock = self._sock
+        while self._reading and isinstance(sock, ssl.SSLSocket) and sock.pending():
+            self.client.loop_read()
+
+    def _pause_reading(self, count=True):
+        if self._reading:
+            self._reading = False
+            if count:
+                self.read_pauses += 1
+            if self._sock is not None:
+                self._loop.remove_reader(self._sock)
+
+    def _resume_reading(self):
+        if not self._reading and not self._stopping:
+            self._reading = True
+            if self._sock is not None:
+                self._loop.add_reader(self._sock, self._read)
+
+    # Callbacks paho (appelés dans la boucle, depuis loop_read/loop_misc)
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            self._connection_changed(False, f"Échec de connexion (Code: {reason_code})")
+            logger.error(f"Échec de connexion MQTT: {reason_code}")
+            result = False
+        else:
+            self.connected = True
+            self._generation += 1
+            if self._disconnected_at is not None:
+                self.reconnects += 1
+                self.last_recovery_seconds = time.monotonic() - self._disconnected_at
+                self._disconnected_at = None
+            client.subscribe([(topic, 1) for topic in self.topics])
+            self._connection_changed(True, "Connecté")
+            logger.info(f"Connexion MQTT réussie (session reprise: {bool(flags.session_present)})")
+            result = True
+        if self._connack is not None and not self._connack.done():
+            self._connack.set_result(result)
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        if self.connected:
+            self._disconnected_at = time.monotonic()
+        self.connected = False
+        if not self._stopping:
+            self._connection_changed(False, "Déconnecté")
+            logger.warning(f"Connexion MQTT perdue: {reason_code}")
+        if self._connack is not None and not self._connack.done():
+            self._connack.set_result(False)
+        self._loop.call_soon_threadsafe(self._disconnected.set)
+
+    def _on_message(self, client, userdata, msg):
+        self.received += 1
+        self._inflight += 1
+        self._decode_queue.put_nowait((self._generation, msg, time.perf_counter()))
+        if self._inflight >= self.max_inflight:
+            # Plus rien n'est lu: le broker garde les messages suivants
+            self._pause_reading()
+
+    def _connection_changed(self, connected, status):
+        if self.on_connection_change is not None:
+            try:
+                self.on_connection_change(connected, status)
+            except Exception as e:
+                logger.error(f"Erreur lors du changement d'état de connexion: {e}")
+
+    def _ack(self, generation, msg):
+        if msg.qos and generation == self._generation and self.connected:
+            self.client.ack(msg.mid, msg.qos)
+            self.acked += 1
+
+    def _journaled(self, msg, spool_seq):
+        return self.journal is not None and spool_seq is not None and msg.qos
+
+    def _done(self, generation, msg, ack=True):
+        """Fin du traitement d'un message: acquittement et reprise éventuelle de la lecture"""
+        self._inflight -= 1
+        if ack:
+            self._ack(generation, msg)
+        if not self._reading and self._inflight <= self.max_inflight // 2:
+            self._resume_reading()
+
+    # Étapes
+
+    async def _decode_stage(self):
+        while True:
+            generation, msg, received = await self._decode_queue.get()
+            if msg.qos and generation != self._generation:
+                # Connexion précédente: le broker le redélivre, rien n'est journalisé
+                self.stale += 1
+                self._done(generation, msg, ack=False)
+                continue
+            try:
+                decoded = self.decode(msg)
+            except Exception as e:
+                logger.error(f"Erreur lors du traitement du message MQTT: {e}")
+                decoded = None
+            if decoded is None:
+                # Message invalide: acquitté pour ne pas être redélivré indéfiniment
+                self.rejected += 1
+                self._done(generation, msg)
+                continue
+            machine_id, params, timestamp, spool_seq = decoded
+            if self._journaled(msg, spool_seq):
+                self._journal_acks.append((spool_seq, generation, msg))
+            model_input = params if self.features is None else self.features.update(machine_id, params)
+            await self._inference_queue.put((generation, msg, received, machine_id, params, timestamp, model_input,
+                                             spool_seq))
+            self.submitted += 1
+
+    async def _next_batch(self):
+        batch = [await self._inference_queue.get()]
+        while len(batch) < self.max_batch_size:
+            if self._inference_queue.empty():
+                # Courte attente pour remplir le lot (comme BatchInferenceEngine)
+                await asyncio.sleep(self.max_delay)
+                if self._inference_queue.empty():
+                    break
+            batch.append(self._inference_queue.get_nowait())
+        return batch
+
+    async def _inference_stage(self):
+        while True:
+            batch = await self._next_batch()
+            started = time.perf_counter()
+            X = np.array([item[6] for item in batch], dtype=float)
+            predictions = await self._predict_with_retry(X)
+            if predictions is None:
+                self._redeliver(batch)
+                continue
+            self.inference_time.record(time.perf_counter() - started)
+            await self._persist_queue.put((batch, predictions))
+
+    async def _predict_with_retry(self, X):
+        for attempt in range(len(self.retry_delays) + 1):
+            try:
+                return await self._loop.run_in_executor(self._inference_executor, self.predict_fn, X)
+            except Exception as e:
+                logger.error(f"Erreur lors de l'inférence par lot (essai {attempt + 1}): {e}")
+            if attempt == len(self.retry_delays) or self._stopping:
+                return None
+            self.inference_retries += 1
+            await asyncio.sleep(self.retry_delays[attempt])
+
+    def _redeliver(self, batch):
+        # Lot en échec: pas d'acquittement. Une reconnexion (session persistante)
+        # fait redélivrer les messages non acquittés; les messages suivants de
+        # la même connexion ne seront pas acquittés non plus (génération périmée).
+        # Les lectures journalisées sont rejouées depuis le journal
+        self.failed += len(batch)
+        for item_generation, msg, *_ in batch:
+            self._done(item_generation, msg, ack=False)
+        redeliver = [item for item in batch if not self._journaled(item[1], item[7])]
+        if not redeliver:
+            logger.warning(f"Inférence en échec: {len(batch)} lectures journalisées, rejouées depuis le journal")
+            return
+        generation = redeliver[0][0]
+        if generation == self._generation and self.connected and self._redeliver_generation != generation:
+            self._redeliver_generation = generation
+            self.redelivery_reconnects += 1
+            logger.warning(f"Inférence en échec: {len(redeliver)} messages non acquittés, reconnexion pour redélivrance")
+            self._generation += 1
+            self.client.disconnect()
+
+    def _apply(self, batch, predictions):
+        # Thread unique d'application: ordre de réception conservé
+        for (_, _, received, machine_id, params, timestamp, _, spool_seq), prediction in zip(batch, predictions):
+            started = time.perf_counter()
+            try:
+                self.sink(machine_id, params, timestamp, prediction, spool_seq)
+            except Exception as e:
+                logger.error(f"Erreur lors du traitement de la prédiction: {e}")
+            finished = time.perf_counter()
+            self.sink_time.record(finished - started)
+            self.end_to_end.record(finished - received)
+
+    async def _persist_stage(self):
+        while True:
+            batch, predictions = await self._persist_queue.get()
+            await self._loop.run_in_executor(self._sink_executor, self._apply, batch, predictions)
+            for generation, msg, *_, spool_seq in batch:
+                self._done(generation, msg, ack=not self._journaled(msg, spool_seq))
+
+    async def _journal_ack_loop(self):
+        interval = self.journal.sync_interval or 0.1
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._ack_journaled()
+            except OSError as e:
+                logger.error(f"Synchronisation du journal pour acquittement: {e}")
+
+    async def _ack_journaled(self):
+        # Acquitte les lectures journalisées une fois sur disque (fsync hors de la boucle)
+        if not self._journal_acks:
+            return
+        synced = await self._loop.run_in_executor(None, self.journal.sync)
+        acks = self._journal_acks
+        while acks and acks[0][0] < synced:
+            _, generation, msg = acks.popleft()
+            self._ack(generation, msg)
@@ -0,0 +1,195 @@
+import hashlib
+import hmac
+import logging
+import os
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Lock, BoundedSemaphore
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+
+class AuthServiceBusy(Exception):
+    """Trop de vérifications de mot de passe en attente"""
+
+
+class ConnectionPool:
+    """Petit pool de connexions SQLite réutilisées entre les requêtes"""
+
+    def __init__(self, db_path, size=4):
+        self.db_path = db_path
+        self._pool = queue.LifoQueue(maxsize=size)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            yield conn
+        except Exception:
+            # Connexion dans un état incertain: ne pas la remettre dans le pool
+            conn.close()
+            raise
+        else:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class AuthService:
+    """Authentification des utilisateurs de users.db.
+
+    bcrypt.checkpw s'exécute dans un pool de ``max_concurrent`` threads: au plus
+    ``max_pending`` vérifications peuvent attendre, au-delà verify() lève
+    AuthServiceBusy, si bien qu'une vague de connexions ne monopolise pas le CPU
+    des routes de données. Une vérification réussie est mémorisée pendant
+    ``cache_ttl`` secondes sous forme de HMAC (clé aléatoire propre au
+    processus) pour que les reconnexions ne repassent pas par bcrypt.
+
+    Le hachage de l'utilisateur est relu à chaque vérification (requête indexée
+    sur une connexion du pool): une entrée en cache n'est utilisée que si elle
+    porte le hachage actuel, si bien qu'un mot de passe modifié ou un
+    utilisateur supprimé hors de ce processus (autre worker, outil
+    d'administration, sqlite3) invalide aussitôt la vérification mémorisée.
+    """
+
+    def __init__(self, db_path, max_concurrent=2, max_pending=64, cache_ttl=60, pool_size=4):
+        self.pool = ConnectionPool(db_path, pool_size)
+        self.cache_ttl = cache_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="bcrypt")
+        self._slots = BoundedSemaphore(max_concurrent + max_pending)
+        self._lock = Lock()
+        # username -> (hachage bcrypt, HMAC du dernier mot de passe vérifié, expiration)
+        self._cache = {}
+        self._secret = os.urandom(32)
+
+        # Compteurs exposés pour le monitoring
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.verifications = 0
+        self.rejected = 0
+
+    @property
+    def db_path(self):
+        return self.pool.db_path
+
+    @db_path.setter
+    def db_path(self, value):
+        self.pool.close()
+        self.pool.db_path = value
+        self.invalidate()
+
+    def init_db(self, users):
+        """Crée la table users et les utilisateurs manquants ((nom, mot de passe) ...)"""
+        with self.pool.connection() as conn:
+            with conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS users (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        username TEXT UNIQUE NOT NULL,
+                        password TEXT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                existing = {row[0] for row in conn.execute("SELECT username FROM users")}
+                # bcrypt.hashpw n'est exécuté que pour les utilisateurs absents
+                for username, plain_password in users:
+                    if username not in existing:
+                        conn.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                                     (username, bcrypt.hashpw(plain_password.encode('utf-8'), bcrypt.gensalt())))
+                        logger.info(f"Utilisateur {username} créé")
+
+    def set_password(self, username, plain_password):
+        """Crée ou modifie un utilisateur et invalide son entrée en cache"""
+        hashed_password = bcrypt.hashpw(plain_password.encode('utf-8'), bcrypt.gensalt())
+        with self.pool.connection() as conn:
+            with conn:
+                conn.execute('''
+                    INSERT INTO users (username, password) VALUES (?, ?)
+                    ON CONFLICT (username) DO UPDATE SET password = excluded.password
+                ''', (username, hashed_password))
+        self.invalidate(username)
+
+    def invalidate(self, username=None):
+        with self._lock:
+            if username is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(username, None)
+
+    def _password_hash(self, username):
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        return row[0].encode('utf-8') if isinstance(row[0], str) else row[0]
+
+    def _verified_digest(self, username, hashed_password):
+        # Vérification mémorisée, seulement si elle porte le hachage actuel
+        with self._lock:
+            entry = self._cache.get(username)
+            if entry is not None and (entry[0] != hashed_password or entry[2] <= time.monotonic()):
+                del self._cache[username]
+                entry = None
+        if entry is None:
+            self.cache_misses += 1
+            return None
+        self.cache_hits += 1
+        return entry[1]
+
+    def _remember(self, username, hashed_password, digest):
+        if self.cache_ttl > 0:
+            with self._lock:
+                self._cache[username] = (hashed_password, digest, time.monotonic() + self.cache_ttl)
+
+    def verify(self, username, password, timeout=30):
+        """Vérifie le couple identifiant / mot de passe"""
+        hashed_password = self._password_hash(username)
+        if hashed_password is None:
+            self.invalidate(username)
+            return False
+        password = password.encode('utf-8')
+        digest = hmac.new(self._secret, hashed_password + b"\0" + password, hashlib.sha256).digest()
+        verified_digest = self._verified_digest(username, hashed_password)
+        if verified_digest is not None and hmac.compare_digest(digest, verified_digest):
+            return True
+
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise AuthServiceBusy()
+        try:
+            future = self._executor.submit(bcrypt.checkpw, password, hashed_password)
+        except Exception:
+            self._slots.release()
+            raise
+        # La place est libérée quand bcrypt a fini, même si l'appelant abandonne
+        future.add_done_callback(lambda _: self._slots.release())
+        self.verifications += 1
+        valid = future.result(timeout)
+        if valid:
+            self._remember(username, hashed_password, digest)
+        return valid
+
+    def stats(self):
+        return {
+            "cached_users": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "verifications": self.verifications,
+            "rejected": self.rejected
+        }
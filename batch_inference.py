@@ -0,0 +1,183 @@
+import logging
+import queue
+import time
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import Future
+from threading import Thread
+
+import numpy as np
+
+from metrics import DEFAULT_BUCKETS, Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats(Histogram):
+    """Statistiques de latence d'une étape (compteur, moyenne, max, p50/p99 récents).
+
+    C'est aussi un histogramme Prometheus: /metrics l'exporte tel quel.
+    """
+
+    def __init__(self, sample_size=1024, buckets=DEFAULT_BUCKETS):
+        super().__init__(buckets)
+        self._samples = deque(maxlen=sample_size)
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._samples.append(seconds)
+            self._bucket_counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    observe = record
+
+    @classmethod
+    def combined(cls, stats_list):
+        """Fusionne les statistiques de plusieurs étapes parallèles"""
+        merged = cls(sample_size=sum(stats._samples.maxlen for stats in stats_list) or 1,
+                     buckets=stats_list[0].buckets if stats_list else DEFAULT_BUCKETS)
+        for stats in stats_list:
+            with stats._lock:
+                merged._samples.extend(stats._samples)
+                stats._merge_into(merged)
+                merged.max = max(merged.max, stats.max)
+        return merged
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total, maximum = self.count, self.total, self.max
+        if not samples:
+            return {"count": 0}
+        return {
+            "count": count,
+            "avg_ms": total / count * 1000,
+            "p50_ms": samples[len(samples) // 2] * 1000,
+            "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+            "max_ms": maximum * 1000
+        }
+
+
+class BatchInferenceEngine:
+    """Micro-batching de l'inférence ML.
+
+    Les vecteurs de paramètres soumis sont regroupés dans une file bornée puis
+    évalués en un seul appel à ``predict_fn`` dès que ``max_batch_size`` lignes
+    sont disponibles ou que ``max_delay`` secondes se sont écoulées depuis la
+    première ligne du lot. Chaque appelant récupère son résultat via un Future.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=64, max_delay=0.005, max_queue_size=10000,
+                 name="batch-inference"):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._running = True
+
+        # Statistiques simples sur les lots traités
+        self.batches_processed = 0
+        self.rows_processed = 0
+        self.queue_wait = LatencyStats()
+        self.inference_time = LatencyStats()
+
+        self._worker = Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, params, timeout=None, callback=None):
+        """Soumet un vecteur de paramètres et retourne un Future de la prédiction.
+
+        ``callback`` est attaché avant la mise en file: il est donc toujours
+        exécuté par le worker, dans l'ordre de soumission.
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        item = (params, future, time.perf_counter())
+        if timeout == 0:
+            # Jamais d'attente: queue.Full immédiatement si la file est pleine
+            self._queue.put_nowait(item)
+        else:
+            # Bloque si la file est pleine (backpressure vers l'appelant)
+            self._queue.put(item, timeout=timeout)
+        return future
+
+    def predict(self, params, timeout=None):
+        """Version bloquante de submit()"""
+        return self.submit(params).result(timeout=timeout)
+
+    def queue_size(self):
+        return self._queue.qsize()
+
+    def full(self):
+        return self._queue.full()
+
+    def stop(self, timeout=5):
+        """Arrête le worker après avoir traité les éléments déjà en file"""
+        self._running = False
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    # Délai écoulé: on ne prend que ce qui est déjà disponible
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect_batch(first)
+            self._process_batch(batch)
+
+        # Vider ce qui reste en file avant de quitter
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                remaining.append(item)
+        for start in range(0, len(remaining), self.max_batch_size):
+            self._process_batch(remaining[start:start + self.max_batch_size])
+
+    def _process_batch(self, batch):
+        futures = [future for _, future, _ in batch]
+        started = time.perf_counter()
+        # Temps d'attente en file du plus ancien élément du lot
+        self.queue_wait.record(started - batch[0][2])
+        try:
+            X = np.array([params for params, _, _ in batch], dtype=float)
+            results = self.predict_fn(X)
+            self.inference_time.record(time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'inférence par lot: {e}")
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        self.batches_processed += 1
+        self.rows_processed += len(batch)
+        for future, result in zip(futures, results):
+            future.set_result(result)
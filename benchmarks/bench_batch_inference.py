@@ -0,0 +1,98 @@
+"""Benchmark: inférence message par message vs moteur d'inférence par lots.
+
+Usage: python benchmarks/bench_batch_inference.py [--rows 1000]
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from batch_inference import BatchInferenceEngine
+from ml_service import ml_service
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+CSV_PATH = "industrial_fault_detection_data_1000.csv"
+
+
+def load_rows(n_rows):
+    with open(CSV_PATH, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        rows = [[float(v) for v in row[1:6]] for row in reader]
+    # Répéter le jeu de données jusqu'à obtenir n_rows lignes
+    return [rows[i % len(rows)] for i in range(n_rows)]
+
+
+def legacy_predict(params):
+    # Ancien chemin: predict puis predict_proba sur un tableau 1x5
+    X = np.array(params).reshape(1, -1)
+    prediction = ml_service.model.predict(X)[0]
+    probability = ml_service.model.predict_proba(X)[0][1]
+    return {"fault_probability": float(probability), "is_fault": bool(prediction), "model_status": "Active"}
+
+
+def bench(label, fn, n_rows):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {n_rows / elapsed:>12.0f} lignes/s  ({elapsed:.3f} s)")
+    return n_rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--max-delay", type=float, default=0.005)
+    args = parser.parse_args()
+
+    rows = load_rows(args.rows)
+
+    def per_message_legacy():
+        for params in rows:
+            legacy_predict(params)
+
+    def per_message():
+        for params in rows:
+            ml_service.predict_fault(params)
+
+    engine = BatchInferenceEngine(ml_service.predict_batch, max_batch_size=args.batch_size,
+                                  max_delay=args.max_delay)
+
+    def batched_engine():
+        futures = [engine.submit(params) for params in rows]
+        for future in futures:
+            future.result()
+
+    def direct_batch():
+        X = np.array(rows)
+        for start in range(0, len(X), args.batch_size):
+            ml_service.predict_batch(X[start:start + args.batch_size])
+
+    # Vérifier que les deux chemins donnent les mêmes résultats
+    sample = rows[:200]
+    expected = [legacy_predict(p) for p in sample]
+    got = ml_service.predict_batch(np.array(sample))
+    assert all(e["is_fault"] == g["is_fault"] and abs(e["fault_probability"] - g["fault_probability"]) < 1e-12
+               for e, g in zip(expected, got)), "Résultats divergents entre les chemins"
+
+    baseline = bench("par message (predict + predict_proba)", per_message_legacy, len(rows))
+    bench("par message (predict_proba seul)", per_message, len(rows))
+    batched = bench(f"moteur par lots ({args.batch_size} / {args.max_delay * 1000:.0f} ms)", batched_engine, len(rows))
+    bench(f"predict_batch direct ({args.batch_size})", direct_batch, len(rows))
+    print(f"Lots traités: {engine.batches_processed}, taille moyenne: "
+          f"{engine.rows_processed / max(engine.batches_processed, 1):.1f}")
+    print(f"Accélération moteur par lots: x{batched / baseline:.1f}")
+    engine.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Benchmark et vérification d'équivalence: pipeline joblib vs forêt compilée.
+
+Usage: python benchmarks/bench_compiled_model.py [--messages 500]
+
+Le script compile diagnostic_model.pkl dans un fichier temporaire, vérifie que
+les probabilités sont identiques à celles du pipeline sklearn (jeu CSV et
+entrées aléatoires), puis mesure la latence par message (p50/p99), le débit
+par lots et la RSS d'un worker qui charge chacun des deux artefacts.
+"""
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import joblib
+import numpy as np
+
+from compiled_model import CompiledForest, compile_pipeline
+
+warnings.filterwarnings("ignore")
+
+CSV_PATH = "industrial_fault_detection_data_1000.csv"
+MODEL_PATH = "diagnostic_model.pkl"
+
+RSS_SNIPPETS = {
+    "joblib (.pkl)": (
+        "import warnings; warnings.filterwarnings('ignore')\n"
+        "import joblib, numpy as np\n"
+        "m = joblib.load({path!r})\n"
+        "m.predict_proba(np.ones((1, 5)))\n"
+    ),
+    "compilé (.npz)": (
+        "import numpy as np\n"
+        "from compiled_model import CompiledForest\n"
+        "m = CompiledForest.load({path!r})\n"
+        "m.predict_proba(np.ones((1, 5)))\n"
+    ),
+}
+
+
+def load_csv():
+    with open(CSV_PATH, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        return np.array([[float(v) for v in row[1:6]] for row in reader])
+
+
+def check_equivalence(pipeline, compiled, X):
+    expected = pipeline.predict_proba(X)
+    got = compiled.predict_proba(X)
+    max_diff = np.abs(expected - got).max()
+    same_class = (pipeline.predict(X) == compiled.predict(X)).mean()
+    assert max_diff < 1e-9, f"Probabilités divergentes: {max_diff}"
+    assert same_class == 1.0, f"Classes divergentes: {same_class:.4f}"
+    return max_diff
+
+
+def latency(predict, X, n_messages):
+    timings = []
+    for i in range(n_messages):
+        row = X[i % len(X)].reshape(1, -1)
+        start = time.perf_counter()
+        predict(row)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def throughput(predict, X, batch_size=64, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for i in range(0, len(X), batch_size):
+            predict(X[i:i + batch_size])
+    return repeat * len(X) / (time.perf_counter() - start)
+
+
+def worker_rss(snippet, path):
+    code = snippet.format(path=path) + (
+        "for line in open('/proc/self/status'):\n"
+        "    if line.startswith('VmRSS'):\n"
+        "        print(int(line.split()[1]) / 1024)\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500)
+    args = parser.parse_args()
+
+    pipeline = joblib.load(MODEL_PATH)
+    with tempfile.TemporaryDirectory() as tmp:
+        compiled_path = os.path.join(tmp, "diagnostic_model.npz")
+        compile_pipeline(pipeline).save(compiled_path)
+        compiled = CompiledForest.load(compiled_path)
+
+        X_csv = load_csv()
+        X_random = np.random.default_rng(42).uniform(0, 100, size=(5000, 5))
+        print(f"Équivalence CSV:       écart max {check_equivalence(pipeline, compiled, X_csv):.2e}")
+        print(f"Équivalence aléatoire: écart max {check_equivalence(pipeline, compiled, X_random):.2e}")
+
+        print(f"\nTaille: pkl {os.path.getsize(MODEL_PATH) / 1e6:.1f} MB, npz {os.path.getsize(compiled_path) / 1e6:.1f} MB")
+
+        print("\nLatence par message (1 ligne):")
+        for label, predict in (("joblib (.pkl)", pipeline.predict_proba), ("compilé (.npz)", compiled.predict_proba)):
+            p50, p99 = latency(predict, X_csv, args.messages)
+            print(f"  {label:<16} p50 {p50:8.3f} ms   p99 {p99:8.3f} ms")
+
+        print("\nDébit par lots de 64:")
+        print(f"  joblib (.pkl)    {throughput(pipeline.predict_proba, X_csv, repeat=2):10.0f} lignes/s")
+        print(f"  compilé (.npz)   {throughput(compiled.predict_proba, X_csv):10.0f} lignes/s")
+
+        print("\nRSS par worker (modèle chargé + une prédiction):")
+        for label, snippet in RSS_SNIPPETS.items():
+            path = MODEL_PATH if label.startswith("joblib") else compiled_path
+            print(f"  {label:<16} {worker_rss(snippet, os.path.abspath(path)):8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Détection des événements de panne: exactitude et coût par message à 10 000 msg/s.
+
+Usage: python benchmarks/bench_fault_events.py [--rate 10000] [--duration 5] [--rounds 4] [--machines 100]
+
+Un flux synthétique par machine alterne des périodes saines et des pannes,
+avec des lectures isolées aberrantes (une lecture en panne pendant une
+période saine, une lecture saine pendant une panne) que l'anti-rebond doit
+ignorer. handle_prediction (état machine, flux SSE, file d'historique, puis
+détection) est appelé au débit --rate en alternant à chaque tour détection
+active et inactive; on compare la durée de l'appel (p50, p99, moyenne). Le
+coût isolé de FaultEventDetector.update est mesuré en boucle. Enfin, le
+script vérifie que chaque panne du flux produit exactement un début et une
+fin, enregistrés dans fault_events et écrits par la destination fichier
+(code de sortie 1 sinon).
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import load_csv_rows, percentile, prepare_app
+
+BASE_TIMESTAMP = 1_700_000_000.0
+
+
+def synthetic_stream(n_messages, machines, seed=1):
+    """(machine, horodatage, prédiction) et nombre de pannes attendues par machine"""
+    rng = random.Random(seed)
+    per_machine = n_messages // machines
+    streams = []
+    expected = {}
+    for m in range(machines):
+        machine_id = f"machine-{m:03d}"
+        readings = []
+        episodes = 0
+        faulty = False
+        while len(readings) < per_machine:
+            length = rng.randint(20, 200)
+            if len(readings) + length > per_machine - 20:
+                # Dernière période saine (au moins 20 lectures): toutes les pannes sont closes
+                length = per_machine - len(readings)
+                faulty = False
+            for i in range(length):
+                # Lecture aberrante isolée au milieu de la période (ignorée par l'anti-rebond)
+                glitch = i == length // 2 and length > 10
+                is_fault = faulty != glitch
+                probability = rng.uniform(0.8, 1.0) if is_fault else rng.uniform(0.0, 0.4)
+                readings.append(prediction(probability, is_fault))
+            episodes += faulty
+            faulty = not faulty
+        expected[machine_id] = episodes
+        streams.append((machine_id, readings))
+    # Entrelacement des machines, dans l'ordre de chaque machine
+    stream = []
+    for i in range(per_machine):
+        for machine_id, readings in streams:
+            stream.append((machine_id, BASE_TIMESTAMP + i, readings[i]))
+    return stream, expected
+
+
+def prediction(probability, is_fault):
+    return {"fault_probability": probability, "is_fault": is_fault, "model_status": "Active"}
+
+
+def run_round(app, stream, params, rate, duration, offset):
+    # Appels cadencés au débit demandé, durée de chaque appel
+    n = int(rate * duration)
+    times = []
+    started = time.perf_counter()
+    for i in range(n):
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        machine_id, timestamp, predicted = stream[(offset + i) % len(stream)]
+        t0 = time.perf_counter()
+        app.handle_prediction(machine_id, params[i % len(params)], timestamp, predicted)
+        times.append(time.perf_counter() - t0)
+    lag = time.perf_counter() - started - duration
+    return times, lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=10000, help="appels de handle_prediction par seconde")
+    parser.add_argument("--duration", type=float, default=5, help="secondes par tour")
+    parser.add_argument("--rounds", type=int, default=4, help="tours par variante")
+    parser.add_argument("--machines", type=int, default=100)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+    params = load_csv_rows(1000)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = prepare_app(workdir)
+        from fault_events import FaultEventDetector, FileSink
+
+        events_path = os.path.join(workdir, "fault_events.jsonl")
+        dispatcher = app.fault_event_dispatcher
+        # Destinations lues au démarrage du dispatcher
+        dispatcher.stop()
+        dispatcher.sinks = [FileSink(events_path)]
+        dispatcher.start()
+        detector = app.fault_detector
+        n_stream = int(args.rate * args.duration)
+        stream, _ = synthetic_stream(n_stream, args.machines)
+
+        # 1. Coût par message dans handle_prediction, détection active ou non
+        results = {"détection active": [], "détection inactive": []}
+        lags = {label: [] for label in results}
+        offset = 0
+        for round_index in range(args.rounds * 2 + 1):
+            label = "détection active" if round_index % 2 else "détection inactive"
+            app.fault_detector = detector if label == "détection active" else None
+            times, lag = run_round(app, stream, params, args.rate, args.duration, offset)
+            offset += len(times)
+            app.history_writer.flush(60)
+            # Premier tour: échauffement
+            if round_index:
+                results[label].extend(times)
+                lags[label].append(lag)
+        app.fault_detector = detector
+        print(f"handle_prediction à {args.rate:.0f} appels/s, {args.machines} machines, "
+              f"{args.rounds} tours de {args.duration:.0f} s par variante, {os.cpu_count()} CPU")
+        print(f"{'variante':<20} {'p50':>9} {'p99':>9} {'moyenne':>9} {'retard':>8}")
+        for label, times in results.items():
+            print(f"{label:<20} {percentile(times, 50) * 1e6:>6.1f} µs {percentile(times, 99) * 1e6:>6.1f} µs "
+                  f"{statistics.fmean(times) * 1e6:>6.1f} µs {max(lags[label]):>6.2f} s")
+        added = statistics.fmean(results["détection active"]) - statistics.fmean(results["détection inactive"])
+        print(f"écart des moyennes: {added * 1e6:+.2f} µs/message")
+
+        # 2. Coût isolé de la détection
+        isolated = FaultEventDetector(lambda event: None)
+        calls = [(machine_id, timestamp, p["fault_probability"], p["is_fault"]) for machine_id, timestamp, p in stream]
+        started = time.perf_counter()
+        for machine_id, timestamp, probability, is_fault in calls:
+            isolated.update(machine_id, timestamp, probability, is_fault)
+        cost = (time.perf_counter() - started) / len(calls)
+        print(f"FaultEventDetector.update seul: {cost * 1e9:.0f} ns/lecture, soit {cost * args.rate * 100:.2f} % "
+              f"d'un cœur à {args.rate:.0f} msg/s")
+
+        # 3. Exactitude: flux complet sur un détecteur neuf, enregistrement et destination fichier
+        dispatcher.flush(30)
+        conn = sqlite3.connect(app.HISTORY_DB)
+        with conn:
+            conn.execute("DELETE FROM fault_events")
+        if os.path.exists(events_path):
+            os.remove(events_path)
+        stream, expected = synthetic_stream(n_stream, args.machines, seed=2)
+        checked = FaultEventDetector(dispatcher.emit)
+        for machine_id, timestamp, p in stream:
+            checked.update(machine_id, timestamp, p["fault_probability"], p["is_fault"])
+        dispatcher.flush(30)
+        stored = dict(((machine_id, kind), count) for machine_id, kind, count in conn.execute(
+            "SELECT machine_id, event, count(*) FROM fault_events GROUP BY machine_id, event"))
+        conn.close()
+        with open(events_path) as f:
+            in_file = sum(1 for line in f if json.loads(line))
+        total = sum(expected.values())
+        mismatched = [machine_id for machine_id, episodes in expected.items()
+                      if stored.get((machine_id, "fault_start"), 0) != episodes
+                      or stored.get((machine_id, "fault_end"), 0) != episodes]
+        ok = not mismatched and in_file == 2 * total and checked.active_count() == 0
+        print(f"exactitude: {total} pannes attendues, {sum(stored.values())} événements en base, "
+              f"{in_file} dans le fichier, {len(mismatched)} machines en écart, "
+              f"{dispatcher.dropped} abandonnés ({'OK' if ok else 'ERREUR'})")
+        dispatcher.stop()
+        app.history_writer.stop()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark: 1000 machines simulées publiant à 1 Hz via on_message.
+
+Usage: python benchmarks/bench_fleet_ingest.py [--machines 1000] [--rate 1] [--duration 10]
+
+Les messages sont injectés en temps réel, répartis uniformément sur chaque
+seconde. On mesure la durée de on_message (temps passé dans le thread MQTT),
+la latence jusqu'à la mise à jour de l'état de la machine et le retard
+éventuel de l'ingestion.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import FakeMessage, load_csv_rows, percentile, prepare_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--machines", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=1.0, help="messages par seconde et par machine")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.INFO)
+    rows = load_csv_rows()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = prepare_app(workdir)
+
+        topics = [f"diagnostic_machine/machine-{i:04d}" for i in range(args.machines)]
+        total_rate = args.machines * args.rate
+        n_messages = int(total_rate * args.duration)
+        on_message_times = []
+
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for i in range(n_messages):
+            # Cadencement: le message i est dû à start + i / total_rate
+            delay = start + i / total_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            msg = FakeMessage(rows[i % len(rows)], topic=topics[i % len(topics)])
+            t0 = time.perf_counter()
+            app.on_message(None, None, msg)
+            on_message_times.append(time.perf_counter() - t0)
+        feed_elapsed = time.perf_counter() - start
+
+        # Attendre la fin du traitement
+        pipeline = app.ingest_pipeline
+        while pipeline.completed + pipeline.dropped < n_messages and time.perf_counter() - start < args.duration * 3 + 30:
+            time.sleep(0.01)
+        app.history_writer.stop()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+
+        print(f"Machines: {len(app.machine_registry)}  messages: {n_messages} "
+              f"({total_rate:.0f} msg/s visés, {n_messages / feed_elapsed:.0f} msg/s injectés)")
+        stages = pipeline.metrics()["stages"]
+        print(f"Traités: {pipeline.completed}  écrits en base: {app.history_writer.written}  "
+              f"abandonnés: {app.history_writer.dropped}")
+        print(f"on_message: p50 {percentile(on_message_times, 50) * 1e6:.0f} µs  "
+              f"p99 {percentile(on_message_times, 99) * 1e6:.0f} µs")
+        print(f"Latence jusqu'à l'état machine: p50 {stages['end_to_end']['p50_ms']:.1f} ms  "
+              f"p99 {stages['end_to_end']['p99_ms']:.1f} ms")
+        print(f"Durée totale {elapsed:.1f} s, CPU {cpu / elapsed * 100:.0f}%")
+        batches = sum(p.batches_processed for p in pipeline.partitions)
+        rows_processed = sum(p.rows_processed for p in pipeline.partitions)
+        print(f"Lots d'inférence: {batches}, taille moyenne {rows_processed / max(batches, 1):.1f}")
+
+
+if __name__ == "__main__":
+    main()
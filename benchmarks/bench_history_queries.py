@@ -0,0 +1,132 @@
+"""Benchmark des requêtes d'historique sur une table synthétique.
+
+Usage: python benchmarks/bench_history_queries.py [--rows 10000000] [--db chemin.db]
+
+Compare, avant et après la migration des index, la première page triée par
+timestamp, une page profonde (OFFSET vs curseur keyset) et le filtre des
+pannes. La table est générée une seule fois si --db pointe vers un fichier
+existant.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from history_writer import INSERT_HISTORY_SQL
+
+PAGE = 100
+
+
+def populate(conn, n_rows, chunk=100000):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS machine_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp REAL,
+            vibration INTEGER,
+            temperature INTEGER,
+            pressure INTEGER,
+            rms INTEGER,
+            mean_temp INTEGER,
+            fault_probability REAL,
+            is_fault BOOLEAN,
+            model_status TEXT,
+            machine_id TEXT DEFAULT 'default',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    existing = conn.execute("SELECT COUNT(*) FROM machine_history").fetchone()[0]
+    start_ts = time.time() - n_rows
+    for offset in range(existing, n_rows, chunk):
+        rows = []
+        for i in range(offset, min(offset + chunk, n_rows)):
+            probability = random.random()
+            # Quelques timestamps en désordre, comme des capteurs en retard
+            ts = start_ts + i + random.uniform(-5, 5)
+            rows.append((ts, random.randint(1, 100), random.randint(1, 100), random.randint(1, 100),
+                         random.randint(1, 100), random.randint(1, 100), probability, probability > 0.7, "Active", f"machine-{i % 100}"))
+        conn.executemany(INSERT_HISTORY_SQL, rows)
+        conn.commit()
+        print(f"\r  {min(offset + chunk, n_rows)}/{n_rows} lignes", end="", flush=True)
+    print()
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def run_queries(conn, label, deep_pages):
+    cursor = conn.cursor()
+    print(f"\n{label}")
+
+    ms, first_page = timed(lambda: app.query_history(cursor, PAGE))
+    print(f"  première page ({PAGE} lignes):          {ms:10.2f} ms")
+
+    offset = deep_pages * PAGE
+    ms, _ = timed(lambda: cursor.execute(f"""
+        SELECT * FROM machine_history ORDER BY timestamp DESC, id DESC LIMIT {PAGE} OFFSET {offset}
+    """).fetchall(), repeat=2)
+    print(f"  page {deep_pages} par OFFSET:                {ms:10.2f} ms")
+
+    # Curseur keyset positionné sur la même page profonde
+    row = cursor.execute(f"""
+        SELECT id, timestamp FROM machine_history ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET {offset - 1}
+    """).fetchone()
+    before = (row[1], row[0])
+    ms, _ = timed(lambda: app.query_history(cursor, PAGE, before=before))
+    print(f"  page {deep_pages} par curseur keyset:        {ms:10.2f} ms")
+
+    ms, _ = timed(lambda: app.query_history(cursor, PAGE, fault_only=True))
+    print(f"  pannes uniquement:                  {ms:10.2f} ms")
+
+    end = first_page[0][1]
+    ms, _ = timed(lambda: app.query_history(cursor, PAGE, start=end - 3600, end=end, min_probability=0.5))
+    print(f"  dernière heure, probabilité >= 0.5: {ms:10.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--db", help="base synthétique à réutiliser (par défaut: fichier temporaire)")
+    parser.add_argument("--deep-pages", type=int, default=1000)
+    args = parser.parse_args()
+
+    tmp = None
+    db_path = args.db
+    if db_path is None:
+        tmp = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmp.name, "history_bench.db")
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    print(f"Génération de {args.rows} lignes dans {db_path}")
+    populate(conn, args.rows)
+
+    conn.execute("DROP INDEX IF EXISTS idx_machine_history_timestamp")
+    conn.execute("DROP INDEX IF EXISTS idx_machine_history_fault_timestamp")
+    run_queries(conn, "Sans index", args.deep_pages)
+
+    start = time.perf_counter()
+    app.HISTORY_DB = db_path
+    app.init_history_db()
+    print(f"\nMigration des index: {time.perf_counter() - start:.1f} s")
+    run_queries(conn, "Avec index", args.deep_pages)
+
+    conn.close()
+    if tmp:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark: insertion ligne par ligne vs HistoryWriter (WAL + executemany).
+
+Usage: python benchmarks/bench_history_writer.py [--rows 2000] [--duration 5]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_writer import HistoryWriter, INSERT_HISTORY_SQL
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS machine_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp REAL,
+        vibration INTEGER,
+        temperature INTEGER,
+        pressure INTEGER,
+        rms INTEGER,
+        mean_temp INTEGER,
+        fault_probability REAL,
+        is_fault BOOLEAN,
+        model_status TEXT,
+        machine_id TEXT DEFAULT 'default',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def make_row():
+    return (time.time(), *(random.randint(1, 100) for _ in range(5)), random.random(), random.random() > 0.7, "Active", "default")
+
+
+def create_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    conn.commit()
+    conn.close()
+
+
+def count_rows(path):
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM machine_history").fetchone()[0]
+    conn.close()
+    return count
+
+
+def per_row_insert(path, n_rows):
+    # Ancien chemin: connexion, INSERT, commit et fermeture pour chaque lecture
+    start = time.perf_counter()
+    for _ in range(n_rows):
+        conn = sqlite3.connect(path)
+        conn.execute(INSERT_HISTORY_SQL, make_row())
+        conn.commit()
+        conn.close()
+    return n_rows / (time.perf_counter() - start)
+
+
+def batched_writer(path, duration):
+    writer = HistoryWriter(path, max_queue_size=100000).start()
+    start = time.perf_counter()
+    submitted = 0
+    while time.perf_counter() - start < duration:
+        writer.write(make_row())
+        submitted += 1
+    writer.stop()
+    elapsed = time.perf_counter() - start
+    return writer.written / elapsed, submitted, writer.written, writer.dropped, writer.batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000, help="lignes pour le chemin ligne par ligne")
+    parser.add_argument("--duration", type=float, default=5.0, help="durée d'injection pour HistoryWriter (s)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, "legacy.db")
+        create_db(legacy_db)
+        legacy_rate = per_row_insert(legacy_db, args.rows)
+        print(f"Insertion ligne par ligne:  {legacy_rate:>10.0f} lignes/s")
+
+        writer_db = os.path.join(tmp, "writer.db")
+        create_db(writer_db)
+        rate, submitted, written, dropped, batches = batched_writer(writer_db, args.duration)
+        assert count_rows(writer_db) == written
+        print(f"HistoryWriter (soutenu):    {rate:>10.0f} lignes/s "
+              f"({written} écrites en {batches} lots, {dropped} abandonnées sur {submitted})")
+        print(f"Accélération: x{rate / legacy_rate:.1f}")
+
+
+if __name__ == "__main__":
+    main()
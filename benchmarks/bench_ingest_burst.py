@@ -0,0 +1,134 @@
+"""Test de rafale: rejoue le CSV à 10k msg/s via un substitut local du broker MQTT.
+
+Usage: python benchmarks/bench_ingest_burst.py [--rate 10000] [--duration 5]
+                                               [--workers 2] [--executor thread|process]
+
+Le substitut du broker remplace la boucle réseau de paho: un thread unique
+délivre les messages à on_message au débit demandé. Tout le temps passé dans
+on_message est du temps pendant lequel paho ne lirait plus la socket (ni les
+keepalives); on mesure donc la durée des callbacks et le retard accumulé par
+ce thread, ainsi que les pertes, la profondeur des files et les latences par
+étape du pipeline.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import FakeMessage, load_csv_rows, percentile, prepare_app
+
+from ingest_pipeline import IngestPipeline
+
+
+class LocalBrokerStandIn:
+    """Substitut du broker et de la boucle réseau paho (un seul thread de livraison)"""
+
+    def __init__(self, on_message, messages, rate):
+        self.on_message = on_message
+        self.messages = messages
+        self.rate = rate
+        self.callback_times = []
+        self.max_lateness = 0.0
+        self.elapsed = 0.0
+
+    def run(self):
+        start = time.perf_counter()
+        for i, msg in enumerate(self.messages):
+            due = start + i / self.rate
+            now = time.perf_counter()
+            if due > now:
+                time.sleep(due - now)
+            else:
+                # Retard de la boucle réseau: messages en attente dans la socket
+                self.max_lateness = max(self.max_lateness, now - due)
+            t0 = time.perf_counter()
+            self.on_message(None, None, msg)
+            self.callback_times.append(time.perf_counter() - t0)
+        self.elapsed = time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=10000)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--machines", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--queue-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = prepare_app(workdir)
+        app.ingest_pipeline.stop()
+        pipeline = IngestPipeline(app.predict_machine_fault_batch, app.handle_prediction,
+                                  workers=args.workers, executor=args.executor,
+                                  max_batch_size=args.batch_size, max_queue_size=args.queue_size)
+        app.ingest_pipeline = pipeline
+
+        # Préchauffage (démarrage des processus du pool, chargement du modèle)
+        warmup = 2 * args.workers * args.batch_size
+        for i in range(warmup):
+            pipeline.submit(f"warmup-{i % args.workers}", [1, 2, 3, 4, 5], time.time())
+        while pipeline.completed < warmup:
+            time.sleep(0.05)
+        pipeline.sink_time = type(pipeline.sink_time)()
+        pipeline.end_to_end = type(pipeline.end_to_end)()
+        pipeline.submitted = 0
+        for partition in pipeline.partitions:
+            partition.queue_wait = type(partition.queue_wait)()
+            partition.inference_time = type(partition.inference_time)()
+
+        rows = load_csv_rows()
+        n_messages = int(args.rate * args.duration)
+        messages = [FakeMessage(rows[i % len(rows)], topic=f"diagnostic_machine/machine-{i % args.machines:03d}")
+                    for i in range(n_messages)]
+
+        # Échantillonnage de la profondeur des files
+        depths = []
+        stop = threading.Event()
+
+        def monitor():
+            while not stop.wait(0.01):
+                depths.append(pipeline.queue_depth())
+
+        threading.Thread(target=monitor, daemon=True).start()
+
+        broker = LocalBrokerStandIn(app.on_message, messages, args.rate)
+        start = time.perf_counter()
+        broker.run()
+        while pipeline.completed + pipeline.dropped < n_messages and time.perf_counter() - start < 120:
+            time.sleep(0.01)
+        drained = time.perf_counter() - start
+        stop.set()
+        app.history_writer.stop()
+        pipeline.stop()
+
+        metrics = pipeline.metrics()
+        stages = metrics["stages"]
+        print(f"Exécuteur {args.executor}, {args.workers} workers, lots de {args.batch_size}")
+        print(f"Messages: {n_messages} livrés à {n_messages / broker.elapsed:.0f} msg/s "
+              f"(visé {args.rate:.0f}), traités {pipeline.completed} en {drained:.2f} s "
+              f"-> {pipeline.completed / drained:.0f} msg/s")
+        print(f"Abandonnés: pipeline {pipeline.dropped}, historique {app.history_writer.dropped}; "
+              f"écrits en base: {app.history_writer.written}")
+        print(f"Thread réseau: callback p50 {percentile(broker.callback_times, 50) * 1e6:.0f} µs, "
+              f"p99 {percentile(broker.callback_times, 99) * 1e6:.0f} µs, "
+              f"max {max(broker.callback_times) * 1000:.1f} ms, retard max {broker.max_lateness * 1000:.0f} ms")
+        print(f"Profondeur des files: max {max(depths, default=0)}, p50 {percentile(depths, 50)}")
+        for name, summary in stages.items():
+            if summary.get("count"):
+                print(f"  {name:<11} p50 {summary['p50_ms']:8.2f} ms  p99 {summary['p99_ms']:8.2f} ms  "
+                      f"max {summary['max_ms']:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Octets transmis et CPU serveur par requête pour /data et /history_data, avant et après.
+
+Usage: python benchmarks/bench_json_payloads.py [--rows 20000] [--requests 200] [--limit 1000]
+
+Le serveur Flask tourne dans un sous-processus; son temps CPU (utilisateur +
+système) est relevé avant et après chaque série de requêtes.
+
+« avant » rejoue l'implémentation d'origine, enregistrée sur des routes /legacy/*:
+/data copie l'instantané et appelle jsonify à chaque requête; /history_data
+matérialise fetchall() puis une liste d'objets imbriqués sérialisée d'un bloc.
+
+« après »: /data sert les octets sérialisés une fois par lecture, avec ETag
+(le cas 304 simule un tableau de bord qui interroge plus vite que les mesures
+n'arrivent); /history_data diffuse les lignes depuis le curseur, en format
+objet ou colonnes, avec ou sans gzip.
+
+Octets sur le fil: ligne de statut, en-têtes et corps (compressé le cas échéant).
+"""
+import argparse
+import http.client
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, login_cookie, process_cpu_seconds
+
+from history_writer import INSERT_HISTORY_SQL
+
+
+def install_legacy_routes(app_module):
+    app = app_module.app
+    jsonify = app_module.jsonify
+
+    def legacy_data():
+        return jsonify(app_module.get_machine_snapshot(app_module.get_requested_machine_id()))
+
+    def legacy_history_data():
+        limit = min(app_module.request.args.get('limit', 100, type=int), app_module.HISTORY_MAX_LIMIT)
+        filters = app_module.get_history_filters()
+        conn = sqlite3.connect(app_module.HISTORY_DB)
+        try:
+            history_data = app_module.query_history(conn.cursor(), limit, **filters)
+            response = jsonify([{
+                "id": row[0],
+                "machine_id": row[10],
+                "timestamp": row[1],
+                "parametres_machine": [row[2], row[3], row[4], row[5], row[6]],
+                "ml_prediction": {
+                    "fault_probability": row[7],
+                    "is_fault": row[8],
+                    "model_status": row[9]
+                }
+            } for row in history_data])
+            if len(history_data) == limit:
+                response.headers['X-Next-Before'] = app_module.make_history_cursor(history_data[-1])
+            return response
+        finally:
+            conn.close()
+
+    app.add_url_rule('/legacy/data', 'legacy_data', app_module.login_required(legacy_data))
+    app.add_url_rule('/legacy/history_data', 'legacy_history_data', app_module.login_required(legacy_history_data))
+
+
+def populate(db_path, n_rows):
+    conn = sqlite3.connect(db_path)
+    start = time.time() - n_rows
+    rows = []
+    for i in range(n_rows):
+        probability = random.random()
+        rows.append((start + i, random.randint(1, 100), random.randint(1, 100), random.randint(1, 100),
+                     random.randint(1, 100), random.randint(1, 100), probability, probability > 0.7,
+                     "Active", f"machine-{i % 10}"))
+    conn.executemany(INSERT_HISTORY_SQL, rows)
+    conn.commit()
+    conn.close()
+
+
+def serve(port, workdir, n_rows):
+    from common import prepare_app
+    from werkzeug.serving import make_server
+    import logging
+
+    logging.disable(logging.WARNING)
+    random.seed(0)
+    app_module = prepare_app(workdir)
+    app_module.history_writer.stop()
+    populate(app_module.HISTORY_DB, n_rows)
+    app_module.ml_service.ensure_loaded()
+    app_module.handle_prediction("default", [42, 65, 8, 30, 70], time.time(),
+                                 {"fault_probability": 0.12, "is_fault": False, "model_status": "Active"})
+    install_legacy_routes(app_module)
+    server = make_server("127.0.0.1", port, app_module.app, threaded=True)
+    server.serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(port, url, headers):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request("GET", url, headers=headers)
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    status_line = len(f"HTTP/1.1 {response.status} {response.reason}\r\n")
+    header_bytes = sum(len(f"{name}: {value}\r\n") for name, value in response.getheaders()) + 2
+    return response, status_line + header_bytes + len(body), response.getheader("ETag")
+
+
+def measure(port, pid, url, headers, n_requests):
+    sizes = []
+    cpu_start = process_cpu_seconds(pid)
+    for _ in range(n_requests):
+        response, size, _ = get(port, url, headers)
+        sizes.append(size)
+    cpu = (process_cpu_seconds(pid) - cpu_start) / n_requests
+    return response.status, max(sizes), cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.workdir, args.rows)
+        return
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        server = subprocess.Popen([sys.executable, "-W", "ignore", __file__, "--serve", "--port", str(port),
+                                   "--workdir", workdir, "--rows", str(args.rows)],
+                                  cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(600):
+                try:
+                    cookie = login_cookie("127.0.0.1", port)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            auth = {"Cookie": cookie}
+            _, _, etag = get(port, "/data", auth)
+            gzip = dict(auth, **{"Accept-Encoding": "gzip"})
+            limit = f"limit={args.limit}"
+
+            cases = [
+                ("/data", "avant", "/legacy/data", auth),
+                ("/data", "après, 200", "/data", auth),
+                ("/data", "après, 304 (If-None-Match)", "/data", dict(auth, **{"If-None-Match": etag})),
+                ("/history_data", "avant", f"/legacy/history_data?{limit}", auth),
+                ("/history_data", "après, objets", f"/history_data?{limit}", auth),
+                ("/history_data", "après, objets + gzip", f"/history_data?{limit}", gzip),
+                ("/history_data", "après, colonnes", f"/history_data?{limit}&format=columns", auth),
+                ("/history_data", "après, colonnes + gzip", f"/history_data?{limit}&format=columns", gzip),
+            ]
+            print(f"{'route':<14} {'variante':<28} {'statut':>6} {'octets':>9} {'CPU serveur/req':>16}")
+            for route, label, url, headers in cases:
+                # Requêtes d'échauffement (imports, caches SQLite) avant la mesure
+                for _ in range(5):
+                    get(port, url, headers)
+                n_requests = args.requests if route == "/history_data" else args.requests * 10
+                status, size, cpu = measure(port, server.pid, url, headers, n_requests)
+                print(f"{route:<14} {label:<28} {status:>6} {size:>9} {cpu * 1000:>13.3f} ms")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Latence de /data pendant une vague de connexions simultanées.
+
+Usage: python benchmarks/bench_login_storm.py [--logins 50] [--duration 20] [--poll-rate 20]
+                                              [--login-rate 0]
+
+Le serveur Flask tourne dans un sous-processus. --logins clients enchaînent
+des POST /login (comptes pré-créés, une partie avec un mauvais mot de passe)
+pendant qu'un client interroge /data à --poll-rate requêtes/s. Trois
+configurations d'AuthService sont comparées:
+
+- « sans limite »: bcrypt sur autant de threads que de requêtes, sans cache
+  (équivalent de l'ancien checkpw synchrone dans la route);
+- « borné »: pool bcrypt borné (AUTH_MAX_CONCURRENT), sans cache;
+- « borné+cache »: configuration par défaut, avec le cache des vérifications.
+
+Par défaut, chaque client enchaîne ses connexions sans pause (boucle fermée):
+une configuration qui répond plus vite reçoit donc plus de connexions, et
+/data partage le CPU avec ce débit plus élevé. --login-rate fixe le débit
+total de connexions tentées, réparti entre les clients, pour comparer les
+configurations à charge égale.
+"""
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, login_cookie, percentile
+
+ACCOUNTS = [("admin", "password123"), ("user", "test123"), ("operateur", "op123")]
+
+CONFIGURATIONS = {
+    "sans limite": {"AUTH_MAX_CONCURRENT": "64", "AUTH_CACHE_TTL": "0"},
+    "borné": {"AUTH_CACHE_TTL": "0"},
+    "borné+cache": {},
+}
+
+
+def serve(port, workdir):
+    from common import prepare_app
+    from werkzeug.serving import make_server
+    import logging
+
+    logging.disable(logging.WARNING)
+    app_module = prepare_app(workdir)
+    server = make_server("127.0.0.1", port, app_module.app, threaded=True)
+    server.request_queue_size = 1024
+    server.serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def login_client(port, index, stop, results, rate=0, offset=0):
+    username, password = ACCOUNTS[index % len(ACCOUNTS)]
+    if index % 5 == 4:
+        password += "-faux"
+    body = urllib.parse.urlencode({"username": username, "password": password})
+    next_request = time.perf_counter() + offset
+    while not stop.is_set():
+        if rate:
+            # Débit fixe par client, premières requêtes des clients étalées
+            if stop.wait(max(0, next_request - time.perf_counter())):
+                break
+            next_request += 1 / rate
+        started = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            conn.request("POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            results.append((response.status, time.perf_counter() - started))
+        except OSError:
+            results.append((0, time.perf_counter() - started))
+
+
+def poll_data(port, cookie, rate, stop, latencies):
+    next_request = time.perf_counter()
+    while not stop.is_set():
+        started = time.perf_counter()
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        conn.request("GET", "/data", headers={"Cookie": cookie})
+        conn.getresponse().read()
+        conn.close()
+        latencies.append(time.perf_counter() - started)
+        next_request += 1 / rate
+        time.sleep(max(0, next_request - time.perf_counter()))
+
+
+def run(label, env_overrides, args):
+    port = free_port()
+    env = dict(os.environ, **env_overrides)
+    with tempfile.TemporaryDirectory() as workdir:
+        server = subprocess.Popen([sys.executable, "-W", "ignore", __file__, "--serve", "--port", str(port),
+                                   "--workdir", workdir],
+                                  cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(300):
+                try:
+                    cookie = login_cookie("127.0.0.1", port)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+
+            # Référence: /data sans connexions concurrentes
+            stop = threading.Event()
+            idle = []
+            poller = threading.Thread(target=poll_data, args=(port, cookie, args.poll_rate, stop, idle))
+            poller.start()
+            time.sleep(3)
+            stop.set()
+            poller.join()
+
+            stop = threading.Event()
+            latencies, logins = [], []
+            rate = args.login_rate
+            threads = [threading.Thread(target=login_client,
+                                        args=(port, i, stop, logins, rate / args.logins, i / rate if rate else 0))
+                       for i in range(args.logins)]
+            threads.append(threading.Thread(target=poll_data, args=(port, cookie, args.poll_rate, stop, latencies)))
+            for thread in threads:
+                thread.start()
+            time.sleep(args.duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    ok = [t for status, t in logins if status in (200, 302)]
+    busy = sum(1 for status, _ in logins if status == 503)
+    print(f"{label:<12} /data seul p50={percentile(idle, 50) * 1000:7.1f} ms | pendant les connexions "
+          f"p50={percentile(latencies, 50) * 1000:7.1f} ms p99={percentile(latencies, 99) * 1000:7.1f} ms "
+          f"max={max(latencies) * 1000:7.1f} ms | connexions {len(ok) / args.duration:6.1f}/s "
+          f"(p50 {percentile(ok, 50) * 1000:6.0f} ms), 503: {busy}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--poll-rate", type=float, default=20)
+    parser.add_argument("--login-rate", type=float, default=0,
+                        help="connexions tentées par seconde, tous clients confondus (0: boucle fermée)")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.workdir)
+        return
+
+    for label, env_overrides in CONFIGURATIONS.items():
+        run(label, env_overrides, args)
+
+
+if __name__ == "__main__":
+    main()
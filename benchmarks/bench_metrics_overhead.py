@@ -0,0 +1,207 @@
+"""Surcoût de l'instrumentation (/metrics) et du journal limité sur le chemin des messages.
+
+Usage: python benchmarks/bench_metrics_overhead.py [--messages 2000] [--rounds 15]
+
+on_message est appelé directement (pipeline d'ingestion réel) en alternant, à
+chaque tour, les variantes:
+- « sans instrumentation »: on_message actuel sans compteurs ni histogramme;
+- « instrumenté »: on_message actuel (histogramme de décodage échantillonné);
+- « origine »: implémentation d'origine (log DEBUG formaté à chaque message).
+
+Le temps mesuré est le temps CPU du thread appelant (time.thread_time): les
+workers du pipeline, qui tournent en parallèle, n'y sont pas comptés. Le
+pipeline est vidé entre deux tours. Sur une machine chargée les médianes sont
+bruitées (réveils des workers comptés dans le thread appelant): le surcoût est
+donc aussi mesuré isolément (instructions ajoutées exécutées en boucle) et
+rapporté au temps de on_message sans instrumentation (objectif < 2 %).
+
+handle_prediction (étape finale du pipeline) est mesuré de la même façon avec
+le log INFO d'origine à chaque message et avec le journal limité, les logs
+étant écrits dans /dev/null au niveau INFO comme en production.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import FakeMessage, load_csv_rows, prepare_app
+
+from metrics import Histogram
+
+
+def make_variants(app):
+    logger = app.logger
+
+    def uninstrumented_on_message(client, userdata, msg):
+        # on_message actuel sans échantillonnage ni Histogram
+        try:
+            data = json.loads(msg.payload.decode())
+            logger.debug("Message MQTT reçu: %s", data)
+            params = data.get("parametres_machine", [])
+            if len(params) != 5:
+                app.sampled_log.log("incomplete", logging.WARNING, "Données incomplètes reçues: %s", params)
+                return
+            try:
+                params = [float(p) for p in params]
+            except (ValueError, TypeError):
+                app.sampled_log.log("non_numeric", logging.ERROR, "Paramètres non numériques: %s", params)
+                return
+            timestamp = data.get("timestamp_epoch", data.get("timestamp", time.time()))
+            if isinstance(timestamp, str):
+                timestamp = time.time()
+            app.ingest_pipeline.submit(app.machine_id_from_topic(msg.topic), params, timestamp)
+        except json.JSONDecodeError as e:
+            app.sampled_log.log("json", logging.ERROR, "Erreur de décodage JSON: %s", e)
+        except Exception as e:
+            logger.error(f"Erreur lors du traitement du message MQTT: {e}")
+
+    def legacy_on_message(client, userdata, msg):
+        # Implémentation d'origine
+        try:
+            data = json.loads(msg.payload.decode())
+            logger.debug(f"Message MQTT reçu: {data}")
+            params = data.get("parametres_machine", [])
+            if len(params) != 5:
+                logger.warning(f"Données incomplètes reçues: {params}")
+                return
+            try:
+                params = [float(p) for p in params]
+            except (ValueError, TypeError):
+                logger.error(f"Paramètres non numériques: {params}")
+                return
+            timestamp = data.get("timestamp_epoch", data.get("timestamp", time.time()))
+            if isinstance(timestamp, str):
+                timestamp = time.time()
+            app.ingest_pipeline.submit(app.machine_id_from_topic(msg.topic), params, timestamp)
+        except json.JSONDecodeError as e:
+            logger.error(f"Erreur de décodage JSON: {e}")
+        except Exception as e:
+            logger.error(f"Erreur lors du traitement du message MQTT: {e}")
+
+    def legacy_handle_prediction(machine_id, params, timestamp, prediction, spool_seq=None):
+        # Implémentation d'origine: une ligne INFO par message
+        try:
+            state = app.machine_registry.get_or_create(machine_id)
+            snapshot = state.update(params, timestamp, prediction, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            state.broadcaster.publish(state.payload()[0])
+            app.insert_history(machine_id, snapshot, prediction)
+            fault_status = "PANNE DÉTECTÉE" if prediction['is_fault'] else "FONCTIONNEMENT NORMAL"
+            logger.info(f"Machine {machine_id} - {fault_status} - Probabilité: {prediction['fault_probability']:.2%}")
+        except Exception as e:
+            logger.error(f"Erreur lors du traitement de la prédiction: {e}")
+
+    return {
+        "on_message": [("sans instrumentation", uninstrumented_on_message),
+                       ("instrumenté", app.on_message),
+                       ("origine", legacy_on_message)],
+        "handle_prediction": [("log INFO par message (origine)", legacy_handle_prediction),
+                              ("journal limité", app.handle_prediction)],
+    }
+
+
+def drain(app):
+    while app.ingest_pipeline.completed + app.ingest_pipeline.dropped < app.ingest_pipeline.submitted:
+        time.sleep(0.005)
+    app.history_writer.flush(30)
+
+
+def time_round(fn, calls):
+    started = time.thread_time()
+    for call_args in calls:
+        fn(*call_args)
+    return (time.thread_time() - started) / len(calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000, help="messages par tour et par variante")
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--machines", type=int, default=20)
+    args = parser.parse_args()
+
+    import warnings
+    warnings.simplefilter("ignore")
+    with tempfile.TemporaryDirectory() as workdir:
+        app = prepare_app(workdir)
+        app.ml_service.ensure_loaded()
+        # Logs au niveau INFO (comme basicConfig dans app.py), écrits dans /dev/null
+        devnull = open(os.devnull, "w")
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(logging.StreamHandler(devnull))
+        root.setLevel(logging.INFO)
+
+        rows = load_csv_rows(args.messages)
+        topics = [f"{app.MQTT_TOPIC}/machine-{i}" for i in range(args.machines)]
+        messages = [(None, None, FakeMessage(row, topic=topics[i % len(topics)])) for i, row in enumerate(rows)]
+        prediction = {"fault_probability": 0.12, "is_fault": False, "model_status": "Active"}
+        now = time.time()
+        sink_calls = [(topics[i % len(topics)], row, now, prediction) for i, row in enumerate(rows)]
+
+        variants = make_variants(app)
+        results = {}
+        for stage, calls in (("on_message", messages), ("handle_prediction", sink_calls)):
+            for label, fn in variants[stage]:
+                # Échauffement
+                time_round(fn, calls[:200])
+                drain(app)
+            for round_index in range(args.rounds):
+                # Ordre des variantes décalé à chaque tour
+                order = variants[stage][round_index % len(variants[stage]):] + \
+                    variants[stage][:round_index % len(variants[stage])]
+                for label, fn in order:
+                    results.setdefault((stage, label), []).append(time_round(fn, calls))
+                    drain(app)
+
+        print(f"{args.rounds} tours de {args.messages} messages, {args.machines} machines")
+        print(f"{'étape':<18} {'variante':<32} {'médiane/msg':>12} {'min/msg':>10}")
+        for (stage, label), timings in results.items():
+            print(f"{stage:<18} {label:<32} {statistics.median(timings) * 1e6:>9.2f} µs "
+                  f"{min(timings) * 1e6:>7.2f} µs")
+
+        # Écart direct entre variantes, à lire avec le bruit des tours (médianes et minimums)
+        print()
+        base = min(results["on_message", "sans instrumentation"])
+        for label, pick in (("médianes", statistics.median), ("minimums", min)):
+            reference = pick(results["on_message", "sans instrumentation"])
+            delta = (pick(results["on_message", "instrumenté"]) - reference) / reference * 100
+            print(f"Écart instrumenté / sans instrumentation ({label}): {delta:+.2f} %")
+
+        # Coût isolé des instructions ajoutées à on_message (test d'échantillonnage à
+        # chaque message, chronométrage et histogramme un message sur DECODE_TIMING_SAMPLE)
+        histogram = Histogram()
+        sample = app.DECODE_TIMING_SAMPLE
+        pipeline = argparse.Namespace(submitted=0)
+        n = 200000
+        started = time.thread_time()
+        for i in range(n):
+            pipeline.submitted = i
+            begin = time.perf_counter() if not pipeline.submitted % sample else None
+            if begin is not None:
+                histogram.observe(time.perf_counter() - begin)
+        instrumented_loop = time.thread_time() - started
+        started = time.thread_time()
+        for i in range(n):
+            pipeline.submitted = i
+        isolated = (instrumented_loop - (time.thread_time() - started)) / n
+        overhead = isolated / base * 100
+        print(f"Coût isolé de l'instrumentation: {isolated * 1e6:.3f} µs/message, soit {overhead:.2f} % "
+              f"(objectif < 2 % {'atteint' if overhead < 2 else 'NON ATTEINT'})")
+
+        started = time.perf_counter()
+        for _ in range(100):
+            body = app.metrics_registry.render()
+        print(f"Export /metrics: {(time.perf_counter() - started) / 100 * 1000:.2f} ms, "
+              f"{len(body.encode())} octets")
+        app.history_writer.stop()
+
+
+if __name__ == "__main__":
+    main()
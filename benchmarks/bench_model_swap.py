@@ -0,0 +1,192 @@
+"""Rechargement à chaud du modèle sous charge: aucun message perdu ni bloqué.
+
+Usage: python benchmarks/bench_model_swap.py [--rate 2000] [--duration 20] [--swap-interval 2]
+                                             [--machines 50] [--workers 2]
+
+Un registre temporaire contient trois versions:
+- v1: diagnostic_model.pkl;
+- v2: le même modèle compilé (.npz), prédictions identiques;
+- v3: une forêt réentraînée sur le CSV avec une autre graine (désaccords attendus).
+
+Le flux CSV est rejoué au débit demandé dans IngestPipeline alimenté par un
+MLDiagnosticService rattaché au registre. Une première passe sans bascule sert
+de référence; pendant la seconde, toutes les --swap-interval s, une action est
+jouée en boucle: activation de v2 puis de v1 (détectées par la surveillance du
+fichier ACTIVE), chargement de v3 en mode shadow, promotion de v3, retour à v1.
+
+Critères: tous les messages soumis sont livrés, aucun n'est abandonné, et
+aucun ne dépasse --stall-threshold de bout en bout.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import CSV_PATH, ROOT, load_csv_rows, percentile
+
+import joblib
+import numpy as np
+
+from compiled_model import compile_pipeline
+from ingest_pipeline import IngestPipeline
+from ml_service import MLDiagnosticService
+from model_registry import ModelRegistry
+from train_feature_model import load_stream, train
+
+warnings.filterwarnings("ignore")
+
+
+def build_registry(root, model_path, workdir):
+    registry = ModelRegistry(root)
+    registry.register(model_path, "v1", "modèle d'origine", activate=True)
+
+    compiled_path = os.path.join(workdir, "compiled.npz")
+    compile_pipeline(joblib.load(model_path)).save(compiled_path)
+    registry.register(compiled_path, "v2", "v1 compilé")
+
+    params, labels = load_stream(CSV_PATH)
+    retrained = train(np.array(params), labels, n_estimators=100, random_state=7)
+    retrained_path = os.path.join(workdir, "retrained.pkl")
+    joblib.dump(retrained, retrained_path)
+    registry.register(retrained_path, "v3", "forêt réentraînée (graine 7)")
+    return registry
+
+
+def swap_actions(service, registry, agreements):
+    # Chaque action est ce que ferait un opérateur (fichier ACTIVE ou API /model/*)
+    def shadow_v3():
+        service.reload_async(version="v3", shadow=True)
+
+    def promote():
+        shadow = service.shadow
+        if shadow is not None:
+            agreements.append(shadow.shadow_stats.summary())
+        candidate = service.promote_shadow()
+        if candidate is not None:
+            registry.activate(candidate.version)
+
+    return [
+        ("activer v2", lambda: registry.activate("v2")),
+        ("activer v1", lambda: registry.activate("v1")),
+        ("shadow v3", shadow_v3),
+        ("promouvoir v3", promote),
+        ("activer v1", lambda: registry.activate("v1")),
+    ]
+
+
+def run(service, rows, args, actions=None):
+    latencies = []
+    done = threading.Event()
+    expected = [None]
+
+    def sink(machine_id, params, submitted_at, prediction, spool_seq=None):
+        latencies.append(time.perf_counter() - submitted_at)
+        if expected[0] is not None and len(latencies) >= expected[0]:
+            done.set()
+
+    pipeline = IngestPipeline(service.predict_batch, sink, workers=args.workers)
+
+    served = []
+    stop_monitor = threading.Event()
+
+    def monitor():
+        # Versions effectivement servies, dans l'ordre
+        while not stop_monitor.is_set():
+            active = service.active
+            version = active.version if active else None
+            if not served or served[-1] != version:
+                served.append(version)
+            time.sleep(0.005)
+
+    def swapper():
+        i = 0
+        while not stop_swaps.wait(args.swap_interval):
+            label, action = actions[i % len(actions)]
+            action()
+            performed.append(label)
+            i += 1
+
+    performed = []
+    stop_swaps = threading.Event()
+    threads = [threading.Thread(target=monitor, daemon=True)]
+    if actions:
+        threads.append(threading.Thread(target=swapper, daemon=True))
+    for thread in threads:
+        thread.start()
+
+    n_messages = int(args.rate * args.duration)
+    rejected = 0
+    start = time.perf_counter()
+    for i in range(n_messages):
+        due = start + i / args.rate
+        now = time.perf_counter()
+        if due > now:
+            time.sleep(due - now)
+        if not pipeline.submit(f"machine-{i % args.machines}", rows[i % len(rows)], time.perf_counter()):
+            rejected += 1
+    stop_swaps.set()
+    expected[0] = n_messages - rejected
+    if len(latencies) >= expected[0]:
+        done.set()
+    done.wait(30)
+    stop_monitor.set()
+    pipeline.stop()
+    return {
+        "submitted": n_messages,
+        "delivered": len(latencies),
+        "dropped": pipeline.dropped,
+        "latencies": latencies,
+        "served": served,
+        "performed": performed
+    }
+
+
+def report(label, result, threshold):
+    latencies = result["latencies"]
+    stalled = sum(1 for latency in latencies if latency > threshold)
+    print(f"{label:<14} soumis={result['submitted']:>6}  livrés={result['delivered']:>6}  "
+          f"abandonnés={result['dropped']}  bloqués(>{threshold * 1000:.0f} ms)={stalled}  "
+          f"p50={percentile(latencies, 50) * 1000:6.2f} ms  p99={percentile(latencies, 99) * 1000:6.2f} ms  "
+          f"max={max(latencies, default=0) * 1000:7.2f} ms")
+    return result["delivered"] == result["submitted"] and result["dropped"] == 0 and stalled == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=2000)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--swap-interval", type=float, default=2)
+    parser.add_argument("--machines", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--stall-threshold", type=float, default=0.25, help="latence de bout en bout maximale (s)")
+    parser.add_argument("--model", default=os.path.join(ROOT, "diagnostic_model.pkl"))
+    args = parser.parse_args()
+
+    rows = load_csv_rows()
+    with tempfile.TemporaryDirectory() as workdir:
+        registry = build_registry(os.path.join(workdir, "models"), args.model, workdir)
+        service = MLDiagnosticService(args.model, registry=registry)
+        service.predict_batch(np.array(rows[:64]))
+
+        baseline = run(service, rows, args)
+        ok = report("sans bascule", baseline, args.stall_threshold)
+        agreements = []
+        swapping = run(service, rows, args, swap_actions(service, registry, agreements))
+        ok = report("avec bascules", swapping, args.stall_threshold) and ok
+
+        print(f"actions jouées: {', '.join(swapping['performed'])}")
+        print(f"versions servies: {' -> '.join(str(version) for version in swapping['served'])}")
+        info = service.model_info()
+        print(f"rechargements: {info['reloads']}  erreur: {info['last_reload_error']}")
+        for agreement in agreements:
+            print(f"shadow v3: {agreement['rows']} lignes comparées, {agreement['skipped_rows']} sautées, désaccord={agreement['disagreement_rate'] * 100:.1f} %  "
+                  f"écart de probabilité moyen={agreement['mean_probability_delta']:.3f}")
+        print("RÉSULTAT:", "OK, aucune perte ni blocage" if ok else "ÉCHEC")
+
+
+if __name__ == "__main__":
+    main()
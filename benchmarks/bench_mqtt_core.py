@@ -0,0 +1,501 @@
+"""Cœurs d'ingestion MQTT (thread paho / asyncio): débit par cœur CPU et reprise après redémarrage du broker.
+
+Usage: python benchmarks/bench_mqtt_core.py [--cores thread asyncio] [--duration 10]
+                                            [--rate 500] [--downtime 3] [--machines 50]
+
+Aucun broker n'est requis: un substitut minimal de broker MQTT 3.1.1 (asyncio,
+sous-processus) implémente CONNECT/SUBSCRIBE/PUBLISH QoS 0 et 1/PUBACK/PING,
+les sessions persistantes (clean_session=False: messages non acquittés et
+file d'attente conservés entre deux connexions, y compris pendant un
+redémarrage, comme mosquitto avec persistence true) et une fenêtre QoS 1 de
+--broker-inflight messages par client. Les messages portent un numéro de
+séquence (timestamp_epoch) pour compter pertes et doublons.
+
+Pour chaque cœur, l'application (MQTT_CORE=thread: client paho d'origine en
+QoS 0 et session propre; MQTT_CORE=asyncio: QoS 1, acquittement après
+traitement, session persistante) tourne dans un sous-processus, puis:
+1. débit fixe de --rate msg/s, puis redémarrage du broker (--downtime s
+   d'indisponibilité, connexions coupées, sessions persistantes gardées);
+   mesure du délai entre le retour du broker et le premier message traité
+   (reprise), puis le premier message publié après ce retour (rattrapage de
+   l'arriéré), des messages perdus et de la latence p99 de cette phase
+   (publication -> traitement);
+2. saturation pendant --duration s: le broker publie aussi vite que le
+   client lit (file de --backlog messages au plus par client connecté).
+   Débit mesuré après --warmup s, rapporté au temps CPU du processus
+   (msg/s par cœur).
+L'application traite ensuite les messages restants avant le bilan.
+
+Sur une machine à un seul cœur, le broker et l'application se partagent le
+CPU: le débit absolu est sous-estimé, le débit par cœur reste comparable.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, load_csv_rows, percentile
+
+TOPIC = "diagnostic_machine"
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+# Substitut de broker
+
+def encode_length(n):
+    out = bytearray()
+    while True:
+        byte, n = n % 128, n // 128
+        out.append(byte | 0x80 if n else byte)
+        if not n:
+            return bytes(out)
+
+
+def encode_string(s):
+    data = s.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def topic_matches(pattern, topic):
+    pattern_levels, topic_levels = pattern.split("/"), topic.split("/")
+    if pattern_levels and pattern_levels[-1] == "#":
+        return topic_levels[:len(pattern_levels) - 1] == pattern_levels[:-1]
+    return len(pattern_levels) == len(topic_levels) and all(
+        p in ("+", t) for p, t in zip(pattern_levels, topic_levels))
+
+
+class Session:
+    def __init__(self, client_id, clean):
+        self.client_id = client_id
+        self.clean = clean
+        self.subscriptions = {}
+        # Numéros de séquence en attente d'envoi: (seq, qos)
+        self.queue = deque()
+        # Envoyés en QoS 1, non acquittés: mid -> seq
+        self.inflight = {}
+        self.next_mid = 1
+        self.connection = None
+
+    def qos_for(self, topic):
+        levels = [qos for pattern, qos in self.subscriptions.items() if topic_matches(pattern, topic)]
+        return max(levels) if levels else None
+
+
+class Broker:
+    def __init__(self, args):
+        self.args = args
+        self.rows = load_csv_rows()
+        self.sessions = {}
+        self.server = None
+        self.subscribed = asyncio.Event()
+        self.events = {}
+        self.publish_times = []
+
+    def payload(self, seq):
+        return json.dumps({"parametres_machine": self.rows[seq % len(self.rows)], "timestamp_epoch": seq}).encode()
+
+    def topic(self, seq):
+        return f"{TOPIC}/machine-{seq % self.args.machines}"
+
+    async def listen(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", self.args.port, reuse_address=True)
+
+    async def restart(self):
+        self.events["down"] = time.time()
+        self.server.close()
+        for session in list(self.sessions.values()):
+            if session.connection is not None:
+                session.connection.close()
+        await asyncio.sleep(self.args.downtime)
+        await self.listen()
+        self.events["up"] = time.time()
+
+    async def handle(self, reader, writer):
+        connection = Connection(self, reader, writer)
+        try:
+            await connection.run()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            connection.close()
+
+    def publish(self, seq):
+        self.publish_times.append(time.time())
+        topic = self.topic(seq)
+        for session in self.sessions.values():
+            qos = session.qos_for(topic)
+            if qos is None or (session.connection is None and qos == 0):
+                continue
+            if len(session.queue) < self.args.max_queued:
+                session.queue.append((seq, qos))
+                if session.connection is not None:
+                    session.connection.wakeup.set()
+
+    def backlog_full(self):
+        online = [s for s in self.sessions.values() if s.connection is not None and s.subscriptions]
+        return not online or any(len(s.queue) >= self.args.backlog for s in online)
+
+    async def produce(self):
+        args = self.args
+        await self.subscribed.wait()
+        # 1. Débit fixe, redémarrage au milieu
+        phase_start = self.events["start"] = time.time()
+        restart_at = phase_start + args.settle
+        end = restart_at + args.downtime + args.tail
+        restart = None
+        seq = 0
+        while time.time() < end:
+            due = int((time.time() - phase_start) * args.rate)
+            while seq < due:
+                self.publish(seq)
+                seq += 1
+            if restart is None and time.time() >= restart_at:
+                restart = asyncio.create_task(self.restart())
+            await asyncio.sleep(0.002)
+        await restart
+        # 2. Saturation
+        start = self.events["saturation_start"] = time.time()
+        while time.time() < start + args.duration:
+            if self.backlog_full():
+                await asyncio.sleep(0.001)
+                continue
+            for _ in range(100):
+                self.publish(seq)
+                seq += 1
+            await asyncio.sleep(0)
+        self.events["saturation_end"] = time.time()
+        # Vidange des sessions (au plus 30 s)
+        deadline = time.time() + 30
+        while time.time() < deadline and any(s.queue or s.inflight for s in self.sessions.values()):
+            await asyncio.sleep(0.05)
+        with open(args.broker_output, "w") as f:
+            json.dump({"events": self.events, "publish_times": self.publish_times}, f)
+
+
+class Connection:
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.session = None
+        self.wakeup = asyncio.Event()
+        self.sender = None
+        self.closed = False
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.sender is not None:
+            self.sender.cancel()
+        self.writer.transport.abort()
+        session = self.session
+        if session is not None and session.connection is self:
+            session.connection = None
+            if session.clean:
+                self.broker.sessions.pop(session.client_id, None)
+
+    async def read_packet(self):
+        header = await self.reader.readexactly(1)
+        length, multiplier = 0, 1
+        while True:
+            byte = (await self.reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        body = await self.reader.readexactly(length) if length else b""
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def send(self, packet_type, flags, body):
+        self.writer.write(bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body)
+
+    async def run(self):
+        packet_type, _, body = await self.read_packet()
+        if packet_type != CONNECT:
+            return
+        self.on_connect(body)
+        while True:
+            packet_type, flags, body = await self.read_packet()
+            if packet_type == PUBACK:
+                self.session.inflight.pop(struct.unpack("!H", body[:2])[0], None)
+                self.wakeup.set()
+            elif packet_type == SUBSCRIBE:
+                self.on_subscribe(body)
+            elif packet_type == UNSUBSCRIBE:
+                self.send(UNSUBACK, 0, body[:2])
+            elif packet_type == PINGREQ:
+                self.send(PINGRESP, 0, b"")
+            elif packet_type == DISCONNECT:
+                return
+
+    def on_connect(self, body):
+        offset = 2 + struct.unpack("!H", body[:2])[0] + 1
+        connect_flags = body[offset]
+        offset += 3
+        length = struct.unpack("!H", body[offset:offset + 2])[0]
+        client_id = body[offset + 2:offset + 2 + length].decode()
+        clean = bool(connect_flags & 0x02)
+        sessions = self.broker.sessions
+        existing = sessions.get(client_id)
+        if existing is not None and existing.connection is not None:
+            existing.connection.close()
+        session_present = existing is not None and not clean
+        if not session_present:
+            existing = sessions[client_id] = Session(client_id, clean)
+        else:
+            # Non acquittés redélivrés en tête (DUP), dans l'ordre d'envoi
+            existing.queue.extendleft(reversed([(seq, 1) for seq in existing.inflight.values()]))
+            existing.inflight.clear()
+        self.session = existing
+        existing.connection = self
+        self.send(CONNACK, 0, bytes([1 if session_present else 0, 0]))
+        self.sender = asyncio.create_task(self.send_loop())
+
+    def on_subscribe(self, body):
+        mid = body[:2]
+        offset, granted = 2, []
+        while offset < len(body):
+            length = struct.unpack("!H", body[offset:offset + 2])[0]
+            pattern = body[offset + 2:offset + 2 + length].decode()
+            qos = min(body[offset + 2 + length], 1)
+            offset += 3 + length
+            self.session.subscriptions[pattern] = qos
+            granted.append(qos)
+        self.send(SUBACK, 0, mid + bytes(granted))
+        self.broker.subscribed.set()
+
+    async def send_loop(self):
+        session, broker, window = self.session, self.broker, self.broker.args.broker_inflight
+        while True:
+            sent = 0
+            while session.queue and sent < 256:
+                seq, qos = session.queue[0]
+                if qos and len(session.inflight) >= window:
+                    break
+                session.queue.popleft()
+                topic = encode_string(broker.topic(seq))
+                if qos:
+                    mid = session.next_mid
+                    session.next_mid = mid % 65535 + 1
+                    session.inflight[mid] = seq
+                    self.send(PUBLISH, 0x02, topic + struct.pack("!H", mid) + broker.payload(seq))
+                else:
+                    self.send(PUBLISH, 0, topic + broker.payload(seq))
+                sent += 1
+            # Contre-pression TCP: attend que le client lise
+            await self.writer.drain()
+            if not sent:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+
+
+async def run_broker(args):
+    broker = Broker(args)
+    await broker.listen()
+    print("READY", flush=True)
+    await broker.produce()
+    print("DONE", flush=True)
+    # Reste joignable jusqu'à l'arrêt par le processus parent
+    await asyncio.Event().wait()
+
+
+# Application
+
+def run_app(args):
+    import logging
+    import warnings
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+    from common import prepare_app
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = prepare_app(workdir)
+        app.ml_service.ensure_loaded()
+        core = app.ingest_core
+        sink = core.sink
+        seqs, times = [], []
+
+        def recording_sink(machine_id, params, timestamp, prediction, spool_seq=None):
+            sink(machine_id, params, timestamp, prediction, spool_seq)
+            seqs.append(timestamp)
+            times.append(time.time())
+
+        core.sink = recording_sink
+        cpu_samples = []
+        stop = threading.Event()
+
+        def sample_cpu():
+            while not stop.wait(0.1):
+                cpu_samples.append((time.time(), time.process_time()))
+
+        threading.Thread(target=sample_cpu, daemon=True).start()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        app.start_mqtt()
+        stop.wait()
+        # Vidange: plus aucun message traité pendant 1 s (au plus 60 s)
+        deadline = time.time() + 60
+        while time.time() < deadline and (not times or time.time() - times[-1] < 1):
+            time.sleep(0.2)
+        if app.mqtt_ingestor is not None:
+            app.mqtt_ingestor.stop()
+        else:
+            app.ingest_pipeline.stop()
+        app.history_writer.stop()
+        with open(args.app_output, "w") as f:
+            json.dump({"seqs": seqs, "times": times, "cpu": cpu_samples,
+                       "dropped": core.dropped, "metrics": core.metrics()}, f, default=str)
+
+
+# Orchestration
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cpu_at(samples, t):
+    """Temps CPU interpolé à l'instant t"""
+    for (t0, c0), (t1, c1) in zip(samples, samples[1:]):
+        if t0 <= t <= t1:
+            return c0 + (c1 - c0) * (t - t0) / (t1 - t0)
+    return samples[-1][1] if t > samples[-1][0] else samples[0][1]
+
+
+def measure(core, args, workdir):
+    port = free_port()
+    broker_output = os.path.join(workdir, f"broker-{core}.json")
+    app_output = os.path.join(workdir, f"app-{core}.json")
+    common_args = ["--port", str(port), "--duration", str(args.duration), "--rate", str(args.rate),
+                   "--downtime", str(args.downtime), "--settle", str(args.settle), "--tail", str(args.tail),
+                   "--machines", str(args.machines), "--backlog", str(args.backlog),
+                   "--max-queued", str(args.max_queued), "--broker-inflight", str(args.broker_inflight)]
+    broker = subprocess.Popen([sys.executable, __file__, "--broker", "--broker-output", broker_output] + common_args,
+                              cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    assert broker.stdout.readline().strip() == "READY"
+    env = dict(os.environ, MQTT_CORE=core, MQTT_BROKER="127.0.0.1", MQTT_PORT=str(port), MQTT_TLS="0",
+               MQTT_CLIENT_ID=f"bench-{core}", MQTT_MAX_INFLIGHT=str(args.max_inflight))
+    application = subprocess.Popen([sys.executable, "-W", "ignore", __file__, "--app", "--app-output", app_output]
+                                   + common_args, cwd=ROOT, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        broker.stdout.readline()
+        application.send_signal(signal.SIGTERM)
+        application.wait(90)
+    finally:
+        if application.poll() is None:
+            application.kill()
+        broker.terminate()
+        broker.wait()
+    with open(broker_output) as f:
+        broker_result = json.load(f)
+    with open(app_output) as f:
+        app_result = json.load(f)
+    return summarize(broker_result, app_result, args)
+
+
+def summarize(broker_result, app_result, args):
+    events, publish_times = broker_result["events"], broker_result["publish_times"]
+    seqs = [int(seq) for seq in app_result["seqs"]]
+    times = app_result["times"]
+    start = events["saturation_start"] + args.warmup
+    end = events["saturation_end"]
+    in_window = sum(1 for t in times if start <= t < end)
+    cpu = cpu_at(app_result["cpu"], end) - cpu_at(app_result["cpu"], start)
+
+    unique = set(seqs)
+    outage = [seq for seq, t in enumerate(publish_times) if events["down"] <= t < events["up"]]
+    up = events["up"]
+    after_up = [(t, seq) for t, seq in zip(times, seqs) if t >= up]
+    first_after = after_up[0][0] - up if after_up else None
+    caught_up = next((t - up for t, seq in after_up if publish_times[seq] >= up), None)
+    fixed_latencies = [t - publish_times[seq] for t, seq in zip(times, seqs)
+                       if publish_times[seq] < events["saturation_start"]]
+    return {
+        "msg_s": in_window / (end - start),
+        "msg_s_per_core": in_window / cpu if cpu > 0 else float("nan"),
+        "cpu": cpu / (end - start),
+        "published": len(publish_times),
+        "processed": len(seqs),
+        "duplicates": len(seqs) - len(unique),
+        "lost": len(publish_times) - len(unique),
+        "dropped": app_result["dropped"],
+        "outage_published": len(outage),
+        "outage_lost": sum(1 for seq in outage if seq not in unique),
+        "resume_s": first_after,
+        "caught_up_s": caught_up,
+        "latency_p99_ms": percentile(fixed_latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cores", nargs="+", default=["thread", "asyncio"], choices=["thread", "asyncio"])
+    parser.add_argument("--duration", type=float, default=10, help="durée de la phase de saturation (s)")
+    parser.add_argument("--warmup", type=float, default=2, help="début de saturation exclu de la mesure (s)")
+    parser.add_argument("--rate", type=float, default=500, help="débit de la phase de redémarrage (msg/s)")
+    parser.add_argument("--downtime", type=float, default=3, help="indisponibilité du broker (s)")
+    parser.add_argument("--settle", type=float, default=3, help="débit fixe avant le redémarrage (s)")
+    parser.add_argument("--tail", type=float, default=8, help="débit fixe après le retour du broker (s)")
+    parser.add_argument("--machines", type=int, default=50)
+    parser.add_argument("--max-inflight", type=int, default=1000, help="MQTT_MAX_INFLIGHT du cœur asyncio")
+    parser.add_argument("--broker-inflight", type=int, default=1000, help="fenêtre QoS 1 du broker par client")
+    parser.add_argument("--backlog", type=int, default=2000, help="file max par client pendant la saturation")
+    parser.add_argument("--max-queued", type=int, default=100000, help="file max d'une session")
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--broker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--broker-output", help=argparse.SUPPRESS)
+    parser.add_argument("--app", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--app-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.broker:
+        asyncio.run(run_broker(args))
+        return
+    if args.app:
+        run_app(args)
+        return
+
+    print(f"{os.cpu_count()} cœur(s), {args.rate:g} msg/s avec broker indisponible {args.downtime:g} s, "
+          f"puis saturation {args.duration:g} s, {args.machines} machines")
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for core in args.cores:
+            results[core] = measure(core, args, workdir)
+
+    def fmt(value, spec):
+        return "-" if value is None else format(value, spec)
+
+    print(f"{'cœur':<8} {'msg/s':>7} {'msg/s/cœur':>11} {'CPU':>5} {'perdus':>7} {'doublons':>9} "
+          f"{'coupure: perdus':>16} {'reprise':>8} {'rattrapage':>11} {'p99':>8}")
+    for core, r in results.items():
+        print(f"{core:<8} {r['msg_s']:>7.0f} {r['msg_s_per_core']:>11.0f} {r['cpu'] * 100:>4.0f}% "
+              f"{r['lost']:>7} {r['duplicates']:>9} "
+              f"{'%d/%d' % (r['outage_lost'], r['outage_published']):>16} "
+              f"{fmt(r['resume_s'], '.2f'):>7}s {fmt(r['caught_up_s'], '.2f'):>10}s "
+              f"{r['latency_p99_ms']:>6.0f}ms")
+    print("perdus: publiés jamais traités (dont abandons en file pleine: "
+          + ", ".join(f"{core} {r['dropped']}" for core, r in results.items()) + ")")
+    print("reprise: retour du broker -> premier message traité; "
+          "rattrapage: -> premier message publié après le retour traité (arriéré vidé)")
+    print("p99: publication -> traitement pendant la phase à débit fixe, "
+          "attente des messages conservés pendant la coupure comprise")
+
+
+if __name__ == "__main__":
+    main()
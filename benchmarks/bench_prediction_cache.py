@@ -0,0 +1,106 @@
+"""Cache de prédictions: taux de succès et latence économisée sur des flux stables.
+
+Usage: python benchmarks/bench_prediction_cache.py [--messages 20000] [--cache-size 10000] [--model diagnostic_model.pkl]
+
+Flux rejoués (5 paramètres par message):
+- « entiers stables »: capteurs entiers autour d'un point de fonctionnement
+  (marche aléatoire de ±1, comme un simulateur à valeurs entières au repos);
+- « réels bruités »: point de fonctionnement + bruit gaussien, quantifié avec
+  --resolution (un pas par caractéristique);
+- « uniforme 1-100 »: tirages indépendants comme wokwi.py (pire cas).
+
+Pour chaque flux: latence par message (predict_fault, un message à la fois)
+sans et avec cache, taux de succès et nombre d'évictions. Le script vérifie
+aussi qu'une réécriture du fichier modèle vide le cache.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ml_service as ml_module
+from ml_service import MLDiagnosticService
+from prediction_cache import PredictionCache, parse_resolution
+
+SET_POINT = [40, 65, 8, 30, 70]
+
+
+def steady_integers(n):
+    values = list(SET_POINT)
+    for _ in range(n):
+        for i in range(len(values)):
+            values[i] = min(SET_POINT[i] + 2, max(SET_POINT[i] - 2, values[i] + random.choice((-1, 0, 0, 1))))
+        yield list(values)
+
+
+def noisy_reals(n, noise=(0.3, 0.5, 0.05, 0.2, 0.5)):
+    for _ in range(n):
+        yield [value + random.gauss(0, sigma) for value, sigma in zip(SET_POINT, noise)]
+
+
+def uniform(n):
+    for _ in range(n):
+        yield [random.randint(1, 100) for _ in range(5)]
+
+
+STREAMS = {
+    "entiers stables": (steady_integers, "1"),
+    "réels bruités": (noisy_reals, None),
+    "uniforme 1-100": (uniform, "1"),
+}
+
+
+def replay(service, messages):
+    started = time.perf_counter()
+    for params in messages:
+        service.predict_fault(params)
+    return (time.perf_counter() - started) / len(messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--cache-size", type=int, default=10000)
+    parser.add_argument("--resolution", default="0.5,1,0.1,0.5,1", help="pas de quantification des réels bruités")
+    parser.add_argument("--model", default=os.path.join(ROOT, "diagnostic_model.pkl"))
+    args = parser.parse_args()
+
+    random.seed(0)
+    plain = MLDiagnosticService(args.model)
+    # Échauffement (imports paresseux de sklearn, caches CPU) avant toute mesure
+    replay(plain, list(uniform(200)))
+    for label, (generator, resolution) in STREAMS.items():
+        messages = list(generator(args.messages))
+        cache = PredictionCache(args.cache_size, parse_resolution(resolution or args.resolution))
+        cached = MLDiagnosticService(args.model, cache=cache)
+        without = replay(plain, messages)
+        with_cache = replay(cached, messages)
+        stats = cache.stats()
+        print(f"{label:<16} succès={stats['hit_ratio'] * 100:5.1f} %  évictions={stats['evictions']:>6}  "
+              f"sans cache={without * 1e6:8.1f} µs/msg  avec cache={with_cache * 1e6:8.1f} µs/msg  "
+              f"économie={(1 - with_cache / without) * 100:5.1f} %")
+
+    # Invalidation: réécrire le fichier modèle vide le cache au contrôle suivant
+    with tempfile.TemporaryDirectory() as workdir:
+        model_path = os.path.join(workdir, "model.pkl")
+        shutil.copy(args.model, model_path)
+        cache = PredictionCache(args.cache_size)
+        service = MLDiagnosticService(model_path, cache=cache)
+        service.predict_fault(SET_POINT)
+        shutil.copy(args.model, model_path + ".new")
+        os.replace(model_path + ".new", model_path)
+        time.sleep(ml_module.MODEL_CHECK_INTERVAL)
+        service.predict_fault(SET_POINT)
+        stats = cache.stats()
+        print(f"invalidation après réécriture du modèle: {'OK' if stats['invalidations'] >= 1 else 'ÉCHEC'} "
+              f"(succès={stats['hits']}, échecs={stats['misses']})")
+
+
+if __name__ == "__main__":
+    main()
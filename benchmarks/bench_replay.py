@@ -0,0 +1,438 @@
+"""Suite de rejeu déterministe du chemin d'ingestion, avec rapport JSON comparable.
+
+Usage: python benchmarks/bench_replay.py [--scenarios csv-replay fleet-burst ...]
+                                         [--duration 10] [--rate-scale 1.0]
+                                         [--scenario-file scenarios.json]
+                                         [--output rapport.json] [--compare ancien.json]
+                                         [--tolerance 20]
+
+Chaque scénario décrit une source et une forme de charge:
+- source "csv": le CSV du dépôt rejoué sur ``machines`` machines (décalage
+  de lecture propre à chaque machine), ou "synthetic": un flux par machine
+  (niveau de base tiré au hasard, bruit, épisodes de dérive des vibrations)
+  généré avec une graine fixe;
+- forme "constant" (``rate`` msg/s), "burst" (``rate`` puis ``burst_rate``
+  pendant ``burst_length`` s toutes les ``burst_every`` s) ou "ramp" (de
+  ``rate`` à ``peak_rate``).
+
+Le calendrier des envois et le contenu des messages ne dépendent que du
+scénario et de la graine: deux exécutions rejouent exactement les mêmes
+messages. Un thread unique (substitut de la boucle réseau paho) appelle
+on_message à l'heure prévue. Chaque scénario tourne dans un sous-processus
+neuf (mémoire et état indépendants) et mesure:
+- le débit soutenu (messages rendus visibles par seconde) et le retard max
+  de l'émetteur;
+- la latence ingestion -> visible (on_message -> instantané de la machine à
+  jour, tel que servi par /data), p50/p99/max;
+- le retard d'écriture en base (on_message -> ligne commitée dans
+  l'historique) et la profondeur max des files;
+- la mémoire (RSS) avant, au pic et après la vidange des files.
+
+Les messages et les tableaux de mesure sont alloués avant le relevé mémoire
+initial.
+
+--compare signale les métriques dégradées de plus de --tolerance % par rapport
+à un rapport précédent (code de sortie 1), pour comparer deux versions.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, FakeMessage, load_csv_rows, percentile
+
+SCENARIOS = {
+    "csv-replay": {"source": "csv", "machines": 10, "shape": "constant", "rate": 1000},
+    "fleet-steady": {"source": "synthetic", "machines": 500, "shape": "constant", "rate": 2000},
+    "fleet-burst": {"source": "synthetic", "machines": 500, "shape": "burst", "rate": 1000,
+                    "burst_rate": 8000, "burst_length": 0.5, "burst_every": 2.5},
+    "fleet-ramp": {"source": "synthetic", "machines": 200, "shape": "ramp", "rate": 500, "peak_rate": 6000},
+}
+DEFAULT_SUITE = list(SCENARIOS)
+
+# Métriques comparées entre deux rapports: (chemin, sens) où +1 = plus grand est meilleur
+COMPARED_METRICS = [
+    (("throughput", "sustained_msg_s"), +1),
+    (("latency_ms", "p50"), -1),
+    (("latency_ms", "p99"), -1),
+    (("db_lag_ms", "p50"), -1),
+    (("db_lag_ms", "p99"), -1),
+    (("dropped", "pipeline"), -1),
+    (("dropped", "history"), -1),
+    (("memory_mb", "growth"), -1),
+]
+
+
+def rate_at(scenario, t):
+    """Débit visé (msg/s) à l'instant t du scénario"""
+    shape = scenario["shape"]
+    if shape == "constant":
+        return scenario["rate"]
+    if shape == "burst":
+        in_burst = t % scenario["burst_every"] < scenario["burst_length"]
+        return scenario["burst_rate"] if in_burst else scenario["rate"]
+    if shape == "ramp":
+        return scenario["rate"] + (scenario["peak_rate"] - scenario["rate"]) * t / scenario["duration"]
+    raise ValueError(f"Forme de charge inconnue: {shape}")
+
+
+def send_schedule(scenario):
+    """Instants d'envoi (s depuis le début), obtenus en intégrant le débit visé"""
+    times = []
+    t = 0.0
+    while t < scenario["duration"]:
+        times.append(t)
+        t += 1.0 / rate_at(scenario, t)
+    return times
+
+
+class SyntheticMachine:
+    """Flux déterministe d'une machine: niveau de base, bruit et épisodes de dérive"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.vibration = rng.uniform(0.2, 0.6)
+        self.temperature = rng.uniform(60, 95)
+        self.pressure = rng.uniform(7.5, 9.0)
+        self.drift = 0.0
+        self.rms = self.vibration
+        self.mean_temp = self.temperature
+
+    def next(self):
+        rng = self.rng
+        if self.drift:
+            # Dérive en cours (usure simulée), puis retour au niveau de base
+            self.drift = self.drift + 0.02 if rng.random() > 0.02 else 0.0
+        elif rng.random() < 0.005:
+            self.drift = 0.02
+        vibration = max(0.0, self.vibration + self.drift + rng.gauss(0, 0.05))
+        temperature = self.temperature + 40 * self.drift + rng.gauss(0, 2)
+        pressure = self.pressure + rng.gauss(0, 0.1)
+        self.rms = 0.95 * self.rms + 0.05 * vibration
+        self.mean_temp = 0.95 * self.mean_temp + 0.05 * temperature
+        return [round(vibration, 4), round(temperature, 3), round(pressure, 4),
+                round(self.rms, 4), round(self.mean_temp, 3)]
+
+
+def build_messages(scenario, topic_prefix, start_epoch):
+    """[(instant d'envoi, machine_id, paramètres, timestamp)] du scénario"""
+    rng = random.Random(scenario["seed"])
+    times = send_schedule(scenario)
+    n_machines = scenario["machines"]
+    machine_ids = [f"{scenario['name']}-{i:04d}" for i in range(n_machines)]
+    if scenario["source"] == "csv":
+        rows = load_csv_rows()
+        offsets = [rng.randrange(len(rows)) for _ in range(n_machines)]
+        counts = [0] * n_machines
+
+        def params_for(machine):
+            row = rows[(offsets[machine] + counts[machine]) % len(rows)]
+            counts[machine] += 1
+            return row
+    elif scenario["source"] == "synthetic":
+        machines = [SyntheticMachine(random.Random(rng.random())) for _ in range(n_machines)]
+
+        def params_for(machine):
+            return machines[machine].next()
+    else:
+        raise ValueError(f"Source inconnue: {scenario['source']}")
+
+    messages = []
+    for t in times:
+        # Machine émettrice tirée au hasard, suite fixée par la graine
+        machine = rng.randrange(n_machines)
+        messages.append((t, machine_ids[machine], params_for(machine), start_epoch + t))
+    return [(t, f"{topic_prefix}/{machine_id}", machine_id, params, timestamp)
+            for t, machine_id, params, timestamp in messages]
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def summarize(values_ms):
+    if not values_ms:
+        return {"count": 0}
+    return {
+        "count": len(values_ms),
+        "p50": percentile(values_ms, 50),
+        "p90": percentile(values_ms, 90),
+        "p99": percentile(values_ms, 99),
+        "max": max(values_ms),
+    }
+
+
+def run_scenario(scenario):
+    """Exécute un scénario dans le processus courant et retourne ses résultats"""
+    import gc
+    import logging
+    import tempfile
+    import warnings
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+    from common import prepare_app
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = prepare_app(workdir)
+        app.ml_service.ensure_loaded()
+        pipeline = app.ingest_pipeline
+        writer = app.history_writer
+
+        # Préchauffage (modèle, partitions, écriture de l'historique), hors mesure
+        for i in range(500):
+            app.on_message(None, None, FakeMessage([0.5, 80.0, 8.0, 0.5, 80.0],
+                                                   topic=f"{app.MQTT_TOPIC}/warmup-{i % 4}"))
+        while pipeline.completed + pipeline.dropped < pipeline.submitted:
+            time.sleep(0.01)
+        writer.flush(30)
+
+        start_epoch = time.time() + 1.0
+        messages = build_messages(scenario, app.MQTT_TOPIC, start_epoch)
+        n = len(messages)
+        payloads = [FakeMessage(params, topic=topic, timestamp=timestamp)
+                    for _, topic, _, params, timestamp in messages]
+        index_of = {(machine_id, timestamp): i for i, (_, _, machine_id, _, timestamp) in enumerate(messages)}
+        sent = [0.0] * n
+        visible = [0.0] * n
+        durable = [0.0] * n
+
+        sink = pipeline.sink
+
+        def timed_sink(machine_id, params, timestamp, prediction, spool_seq=None):
+            sink(machine_id, params, timestamp, prediction, spool_seq)
+            i = index_of.get((machine_id, timestamp))
+            if i is not None:
+                visible[i] = time.perf_counter()
+
+        pipeline.sink = timed_sink
+        write_batch = writer._write_batch
+
+        def timed_write_batch(conn, batch):
+            write_batch(conn, batch)
+            now = time.perf_counter()
+            for row in batch:
+                i = index_of.get((row[9], row[0]))
+                if i is not None:
+                    durable[i] = now
+
+        writer._write_batch = timed_write_batch
+
+        base = {"submitted": pipeline.submitted, "dropped": pipeline.dropped,
+                "completed": pipeline.completed, "history_dropped": writer.dropped,
+                "history_written": writer.written}
+        monitor_samples = {"rss": [], "pipeline_queue": [], "history_queue": []}
+        stop = threading.Event()
+
+        def monitor():
+            while not stop.wait(0.05):
+                monitor_samples["rss"].append(rss_mb())
+                monitor_samples["pipeline_queue"].append(pipeline.queue_depth())
+                monitor_samples["history_queue"].append(writer.queue_size())
+
+        gc.collect()
+        rss_start = rss_mb()
+        monitor_thread = threading.Thread(target=monitor, daemon=True)
+        monitor_thread.start()
+
+        # Émetteur: un seul thread, comme la boucle réseau paho
+        on_message = app.on_message
+        max_lateness = 0.0
+        started = time.perf_counter()
+        for i, (due, _, _, _, _) in enumerate(messages):
+            now = time.perf_counter()
+            delay = started + due - now
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lateness = max(max_lateness, -delay)
+            sent[i] = time.perf_counter()
+            on_message(None, None, payloads[i])
+        feed_elapsed = time.perf_counter() - started
+
+        deadline = time.perf_counter() + max(30.0, scenario["duration"] * 3)
+        while (pipeline.completed + pipeline.dropped - base["completed"] - base["dropped"] < n
+               and time.perf_counter() < deadline):
+            time.sleep(0.01)
+        writer.flush(max(0.0, deadline - time.perf_counter()))
+        stop.set()
+        monitor_thread.join()
+        rss_peak = max(monitor_samples["rss"] + [rss_mb()])
+        gc.collect()
+        rss_end = rss_mb()
+        writer.stop()
+        pipeline.stop()
+
+        latencies = [(visible[i] - sent[i]) * 1000 for i in range(n) if visible[i]]
+        lags = [(durable[i] - sent[i]) * 1000 for i in range(n) if durable[i]]
+        last_visible = max(visible) if latencies else started
+        completed = len(latencies)
+        return {
+            "config": scenario,
+            "messages": n,
+            "throughput": {
+                "target_avg_msg_s": n / scenario["duration"],
+                "delivered_msg_s": n / feed_elapsed,
+                "sustained_msg_s": completed / (last_visible - started) if completed else 0.0,
+                "feeder_max_lateness_ms": max_lateness * 1000,
+            },
+            "latency_ms": summarize(latencies),
+            "db_lag_ms": summarize(lags),
+            "completed": completed,
+            "dropped": {
+                "pipeline": pipeline.dropped - base["dropped"],
+                "history": writer.dropped - base["history_dropped"],
+            },
+            "written": writer.written - base["history_written"],
+            "queue_depth_max": {
+                "pipeline": max(monitor_samples["pipeline_queue"]),
+                "history": max(monitor_samples["history_queue"]),
+            },
+            "memory_mb": {
+                "start": rss_start,
+                "peak": rss_peak,
+                "end": rss_end,
+                "growth": rss_end - rss_start,
+            },
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def metric(result, path):
+    value = result
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(report, previous, tolerance):
+    """Affiche l'évolution des métriques et retourne la liste des régressions"""
+    regressions = []
+    print(f"\nComparaison avec {previous.get('revision')} (tolérance {tolerance:g} %)")
+    for name, result in report["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if old is None:
+            print(f"  {name}: absent du rapport précédent")
+            continue
+        if old.get("config") != result.get("config"):
+            print(f"  {name}: configuration différente, comparaison indicative")
+        for path, direction in COMPARED_METRICS:
+            before, after = metric(old, path), metric(result, path)
+            if before is None or after is None:
+                continue
+            label = ".".join(path)
+            if before == 0:
+                change = 0.0 if after == 0 else math.inf
+            else:
+                change = (after - before) / abs(before) * 100
+            worse = change * -direction > tolerance
+            # Petites valeurs absolues (quelques ms, quelques Mo): pas de régression sur le bruit
+            if path[0] in ("latency_ms", "db_lag_ms", "memory_mb") and abs(after - before) < 1:
+                worse = False
+            if worse:
+                regressions.append(f"{name} {label}")
+            print(f"  {name:<14} {label:<28} {before:>12.2f} -> {after:>12.2f} "
+                  f"({change:+.1f} %){'  RÉGRESSION' if worse else ''}")
+    return regressions
+
+
+def print_result(name, result):
+    throughput = result["throughput"]
+    latency, lag, memory = result["latency_ms"], result["db_lag_ms"], result["memory_mb"]
+    print(f"{name}: {result['messages']} messages, visés {throughput['target_avg_msg_s']:.0f} msg/s en moyenne, "
+          f"livrés {throughput['delivered_msg_s']:.0f} msg/s, soutenu {throughput['sustained_msg_s']:.0f} msg/s "
+          f"(retard émetteur max {throughput['feeder_max_lateness_ms']:.0f} ms)")
+    if latency.get("count"):
+        print(f"  ingestion -> visible: p50 {latency['p50']:.1f} ms, p99 {latency['p99']:.1f} ms, "
+              f"max {latency['max']:.1f} ms")
+    if lag.get("count"):
+        print(f"  ingestion -> base:    p50 {lag['p50']:.1f} ms, p99 {lag['p99']:.1f} ms, max {lag['max']:.1f} ms")
+    print(f"  abandonnés: pipeline {result['dropped']['pipeline']}, historique {result['dropped']['history']}; "
+          f"files max: pipeline {result['queue_depth_max']['pipeline']}, "
+          f"historique {result['queue_depth_max']['history']}")
+    print(f"  mémoire: {memory['start']:.0f} Mo -> pic {memory['peak']:.0f} Mo, "
+          f"fin {memory['end']:.0f} Mo ({memory['growth']:+.1f} Mo)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", help=f"scénarios à jouer (défaut: {' '.join(DEFAULT_SUITE)})")
+    parser.add_argument("--scenario-file", help="fichier JSON {nom: scénario} ajouté aux scénarios connus")
+    parser.add_argument("--duration", type=float, default=10.0, help="durée de chaque scénario (s)")
+    parser.add_argument("--rate-scale", type=float, default=1.0, help="multiplie tous les débits visés")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="chemin du rapport JSON")
+    parser.add_argument("--compare", help="rapport JSON précédent à comparer")
+    parser.add_argument("--tolerance", type=float, default=20.0, help="dégradation tolérée (%%)")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        result = run_scenario(json.loads(args.run_scenario))
+        print(json.dumps(result))
+        return 0
+
+    scenarios = dict(SCENARIOS)
+    if args.scenario_file:
+        with open(args.scenario_file) as f:
+            scenarios.update(json.load(f))
+    names = args.scenarios or (DEFAULT_SUITE + [name for name in scenarios if name not in SCENARIOS])
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        parser.error(f"scénarios inconnus: {', '.join(unknown)} (connus: {', '.join(scenarios)})")
+
+    report = {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "scenarios": {},
+    }
+    for name in names:
+        scenario = dict(scenarios[name], name=name, duration=args.duration, seed=args.seed)
+        for key in ("rate", "burst_rate", "peak_rate"):
+            if key in scenario:
+                scenario[key] *= args.rate_scale
+        process = subprocess.run([sys.executable, "-W", "ignore", __file__, "--run-scenario", json.dumps(scenario)],
+                                 cwd=ROOT, capture_output=True, text=True)
+        if process.returncode != 0:
+            print(f"{name}: échec\n{process.stderr[-2000:]}")
+            report["scenarios"][name] = {"config": scenario, "error": process.stderr[-2000:]}
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        report["scenarios"][name] = result
+        print_result(name, result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\nRapport écrit dans {args.output}")
+
+    failed = any("error" in result for result in report["scenarios"].values())
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        regressions = compare(report, previous, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} régression(s): {', '.join(regressions)}")
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""Re-scoring de l'historique (rescore_history.py) sur une grosse base synthétique.
+
+Usage: python benchmarks/bench_rescore.py [--rows 2000000] [--workers 1,2] [--rate 2000]
+                                          [--duration 20] [--db base.db]
+
+La base est remplie de --rows lignes réparties sur --span-days jours (générée
+une fois si --db pointe vers un fichier existant), puis:
+1. débit: re-scoring complet sans limitation (write_duty=1) pour chaque
+   nombre de processus de --workers, rollups exclus, puis durée de la
+   reconstruction des rollups jour par jour;
+2. ingestion en parallèle: un HistoryWriter reçoit --rate lignes/s; on mesure
+   la durée de ses transactions seul pendant --duration secondes, puis
+   pendant --duration secondes de re-scoring limité (write_duty=0.5, nice 10);
+3. reprise: un re-scoring interrompu (stop_event) puis relancé doit étiqueter
+   chaque ligne exactement une fois, avec les probabilités du modèle.
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import app
+from batch_inference import LatencyStats
+from history_retention import DAY
+from history_rollup import RollupAggregator, rebuild_rollups
+from history_writer import INSERT_HISTORY_SQL, HistoryWriter
+from rescore_history import rebuild_rollup_days, rescore_history
+
+CHUNK = 200000
+
+
+def random_row(timestamp, machines):
+    return (timestamp, random.randint(1, 100), random.randint(1, 100), random.randint(1, 100),
+            random.randint(1, 100), random.randint(1, 100), 0.0, False, "Active",
+            f"machine-{random.randrange(machines)}")
+
+
+def populate(db_path, n_rows, span_days, machines):
+    app.HISTORY_DB = db_path
+    app.init_history_db()
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous=OFF")
+    end = time.time()
+    spacing = span_days * DAY / n_rows
+    timestamp = end - span_days * DAY
+    rows = 0
+    while rows < n_rows:
+        chunk = []
+        for _ in range(min(CHUNK, n_rows - rows)):
+            chunk.append(random_row(timestamp, machines))
+            timestamp += spacing
+        with conn:
+            conn.executemany(INSERT_HISTORY_SQL, chunk)
+        rows += len(chunk)
+        print(f"\r  {rows} lignes", end="", flush=True)
+    print()
+    with conn:
+        rebuild_rollups(conn)
+    conn.close()
+
+
+def feed(writer, rate, machines, stop):
+    # Ingestion continue au débit demandé, par paquets de 10 ms
+    per_tick = max(1, int(rate / 100))
+    next_tick = time.perf_counter()
+    while not stop.is_set():
+        now = time.time()
+        for _ in range(per_tick):
+            writer.write(random_row(now, machines))
+        next_tick += per_tick / rate
+        time.sleep(max(0, next_tick - time.perf_counter()))
+
+
+def describe(label, stats):
+    s = stats.summary()
+    print(f"{label:<26} lots={s['count']:>6}  moyenne={s['avg_ms']:7.2f} ms  p50={s['p50_ms']:7.2f} ms  "
+          f"p99={s['p99_ms']:7.2f} ms  max={s['max_ms']:8.2f} ms")
+
+
+def throughput(db_path, model_path, workers_list, chunk_size):
+    print("1. débit (sans limitation, rollups exclus)")
+    for workers in workers_list:
+        result = rescore_history(db_path, model_path, f"bench-w{workers}", chunk_size=chunk_size, workers=workers,
+                                 write_duty=1, niceness=0, rebuild=False)
+        print(f"   {workers} processus: {result['rows']} lignes en {result['elapsed']:.1f} s "
+              f"({result['rows'] / result['elapsed']:.0f} lignes/s)")
+    conn = sqlite3.connect(db_path)
+    start = conn.execute("SELECT min(timestamp) FROM machine_history").fetchone()[0]
+    started = time.perf_counter()
+    rebuild_rollup_days(conn, start)
+    print(f"   reconstruction des rollups jour par jour: {time.perf_counter() - started:.1f} s")
+    conn.close()
+
+
+def under_ingestion(db_path, model_path, rate, duration, machines, chunk_size):
+    print(f"2. ingestion en parallèle ({rate:.0f} lignes/s)")
+    writer = HistoryWriter(db_path, rollups=RollupAggregator()).start()
+    stop = threading.Event()
+    feeder = threading.Thread(target=feed, args=(writer, rate, machines, stop), daemon=True)
+    feeder.start()
+    time.sleep(duration)
+    describe("   sans re-scoring", writer.batch_time)
+    writer.batch_time = LatencyStats()
+
+    job_stop = threading.Event()
+    timer = threading.Timer(duration, job_stop.set)
+    timer.start()
+    result = rescore_history(db_path, model_path, "bench-live", chunk_size=chunk_size, restart=True,
+                             rebuild=False, stop_event=job_stop)
+    describe("   pendant le re-scoring", writer.batch_time)
+    stop.set()
+    feeder.join()
+    writer.stop()
+    print(f"   re-scoring limité: {result['rows']} lignes en {result['elapsed']:.1f} s "
+          f"({result['rows'] / result['elapsed']:.0f} lignes/s, {result['throttled_seconds']:.1f} s de pause)")
+    print(f"   écritures: {writer.written} lignes, {writer.dropped} abandonnées, {writer.failed} en échec")
+
+
+def resume(db_path, model_path, chunk_size):
+    print("3. reprise après interruption")
+    stop = threading.Event()
+    progressed = []
+
+    def progress(done, last_id, max_id):
+        # Interruption au milieu du travail
+        progressed.append(done)
+        if done >= max_id // 2:
+            stop.set()
+
+    first = rescore_history(db_path, model_path, "bench-resume", chunk_size=chunk_size, update_batch=3333,
+                            restart=True, stop_event=stop, progress=progress, rebuild=False)
+    second = rescore_history(db_path, model_path, "bench-resume", chunk_size=chunk_size, update_batch=3333,
+                             rebuild=False)
+    conn = sqlite3.connect(db_path)
+    max_id = second["max_id"]
+    tagged = conn.execute("SELECT count(*) FROM machine_history WHERE model_version = 'bench-resume'").fetchone()[0]
+    expected = conn.execute("SELECT count(*) FROM machine_history WHERE id <= ?", (max_id,)).fetchone()[0]
+    checkpoint_rows, finished_at = conn.execute(
+        "SELECT rows, finished_at FROM history_rescore WHERE model_version = 'bench-resume'").fetchone()
+    # Probabilités écrites = scoring direct d'un échantillon
+    sample = conn.execute("SELECT vibration, temperature, pressure, rms, mean_temp, fault_probability "
+                          "FROM machine_history WHERE id <= ? ORDER BY random() LIMIT 2000", (max_id,)).fetchall()
+    conn.close()
+    from ml_service import ml_service
+    ml_service.ensure_loaded()
+    probabilities, _ = ml_service.score_batch(np.array([row[:5] for row in sample], dtype=np.float64))
+    max_delta = float(np.max(np.abs(probabilities - np.array([row[5] for row in sample]))))
+    ok = (not first["complete"] and second["complete"] and tagged == expected == checkpoint_rows
+          and first["rows"] + second["rows"] == expected and finished_at is not None and max_delta < 1e-9)
+    print(f"   1er passage: {first['rows']} lignes (interrompu), reprise depuis l'id {second['resumed_from_id']}: "
+          f"{second['rows']} lignes")
+    print(f"   vérification: {tagged} lignes étiquetées / {expected}, compteur du point de reprise "
+          f"{checkpoint_rows}, écart max de probabilité {max_delta:.1e} ({'OK' if ok else 'ERREUR'})")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--span-days", type=float, default=30)
+    parser.add_argument("--machines", type=int, default=10)
+    parser.add_argument("--workers", default="1,2", help="nombres de processus testés, séparés par des virgules")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--rate", type=float, default=2000, help="lignes/s écrites pendant le test 2")
+    parser.add_argument("--duration", type=float, default=20, help="secondes de mesure du test 2 (par phase)")
+    parser.add_argument("--model", default=os.path.join(app.__file__.rsplit(os.sep, 1)[0], "diagnostic_model.pkl"))
+    parser.add_argument("--db", help="base synthétique réutilisable (copiée avant le test)")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+    workdir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(workdir, "history.db")
+        if args.db and os.path.exists(args.db):
+            shutil.copy(args.db, db_path)
+        else:
+            print("Génération de la base synthétique...")
+            populate(db_path, args.rows, args.span_days, args.machines)
+            if args.db:
+                shutil.copy(db_path, args.db)
+        print(f"base: {os.path.getsize(db_path) / 1e6:.0f} Mo, {os.cpu_count()} CPU")
+
+        throughput(db_path, args.model, [int(w) for w in args.workers.split(",")], args.chunk_size)
+        under_ingestion(db_path, args.model, args.rate, args.duration, args.machines, args.chunk_size)
+        ok = resume(db_path, args.model, args.chunk_size)
+    finally:
+        shutil.rmtree(workdir)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
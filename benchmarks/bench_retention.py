@@ -0,0 +1,168 @@
+"""Cycle de rétention sur une grosse base synthétique pendant l'ingestion.
+
+Usage: python benchmarks/bench_retention.py [--size-gb 2] [--span-days 60] [--retention-days 30]
+                                            [--rate 2000] [--baseline 20]
+
+La base est remplie jusqu'à --size-gb Go de lignes réparties sur --span-days
+jours (générée une fois si --db pointe vers un fichier existant). Un
+HistoryWriter (avec agrégats) reçoit --rate lignes/s en continu: on mesure la
+durée de ses transactions sans rétention pendant --baseline secondes, puis
+pendant un cycle complet de HistoryRetention (archivage gzip, suppression par
+lots, incremental_vacuum). Le script vérifie ensuite qu'aucune ligne expirée
+ne reste et que les archives contiennent toutes les lignes supprimées.
+"""
+import argparse
+import csv
+import gzip
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from batch_inference import LatencyStats
+from history_retention import DAY, HistoryRetention
+from history_rollup import RollupAggregator, rebuild_rollups
+from history_writer import INSERT_HISTORY_SQL, HistoryWriter
+
+CHUNK = 200000
+
+
+def random_row(timestamp, machines):
+    probability = random.random()
+    return (timestamp, random.randint(1, 100), random.randint(1, 100), random.randint(1, 100),
+            random.randint(1, 100), random.randint(1, 100), probability, probability > 0.7, "Active",
+            f"machine-{random.randrange(machines)}")
+
+
+def populate(db_path, size_bytes, span_days, machines):
+    app.HISTORY_DB = db_path
+    app.init_history_db()
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous=OFF")
+    # Lignes dans l'ordre chronologique, comme à l'ingestion (environ 150 octets par ligne)
+    end = time.time()
+    spacing = span_days * DAY / (size_bytes / 150)
+    timestamp = end - span_days * DAY
+    rows = 0
+    while os.path.getsize(db_path) < size_bytes:
+        chunk = []
+        for _ in range(CHUNK):
+            chunk.append(random_row(timestamp, machines))
+            timestamp += spacing
+        with conn:
+            conn.executemany(INSERT_HISTORY_SQL, chunk)
+        rows += CHUNK
+        print(f"\r  {rows} lignes, {os.path.getsize(db_path) / 1e9:.2f} Go", end="", flush=True)
+    print()
+    with conn:
+        rebuild_rollups(conn)
+    conn.close()
+
+
+def feed(writer, rate, machines, stop):
+    # Ingestion continue au débit demandé, par paquets de 10 ms
+    per_tick = max(1, int(rate / 100))
+    next_tick = time.perf_counter()
+    while not stop.is_set():
+        now = time.time()
+        for _ in range(per_tick):
+            writer.write(random_row(now, machines))
+        next_tick += per_tick / rate
+        time.sleep(max(0, next_tick - time.perf_counter()))
+
+
+def describe(label, stats):
+    s = stats.summary()
+    print(f"{label:<22} lots={s['count']:>6}  moyenne={s['avg_ms']:7.2f} ms  p50={s['p50_ms']:7.2f} ms  "
+          f"p99={s['p99_ms']:7.2f} ms  max={s['max_ms']:8.2f} ms")
+
+
+def archived_rows(archive_dir):
+    total = 0
+    for root, _, files in os.walk(archive_dir):
+        for name in files:
+            with gzip.open(os.path.join(root, name), "rt", newline="") as f:
+                total += sum(1 for _ in csv.reader(f)) - 1
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-gb", type=float, default=2)
+    parser.add_argument("--span-days", type=float, default=60)
+    parser.add_argument("--retention-days", type=float, default=30)
+    parser.add_argument("--machines", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=2000, help="lignes/s écrites pendant le test")
+    parser.add_argument("--baseline", type=float, default=20, help="secondes de mesure sans rétention")
+    parser.add_argument("--delete-batch", type=int, default=2000)
+    parser.add_argument("--db", help="base synthétique réutilisable (copiée avant le test)")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+    workdir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(workdir, "history.db")
+        if args.db and os.path.exists(args.db):
+            shutil.copy(args.db, db_path)
+        else:
+            print("Génération de la base synthétique...")
+            populate(db_path, args.size_gb * 1e9, args.span_days, args.machines)
+            if args.db:
+                shutil.copy(db_path, args.db)
+
+        conn = sqlite3.connect(db_path)
+        cutoff = (time.time() - args.retention_days * DAY) // DAY * DAY
+        expired = conn.execute("SELECT count(*) FROM machine_history WHERE timestamp < ?", (cutoff,)).fetchone()[0]
+        total = conn.execute("SELECT count(*) FROM machine_history").fetchone()[0]
+        size_before = os.path.getsize(db_path)
+        print(f"base: {size_before / 1e9:.2f} Go, {total} lignes dont {expired} expirées")
+
+        writer = HistoryWriter(db_path, rollups=RollupAggregator()).start()
+        stop = threading.Event()
+        feeder = threading.Thread(target=feed, args=(writer, args.rate, args.machines, stop), daemon=True)
+        feeder.start()
+
+        time.sleep(args.baseline)
+        describe("sans rétention", writer.batch_time)
+        writer.batch_time = LatencyStats()
+
+        archive_dir = os.path.join(workdir, "archive")
+        retention = HistoryRetention(db_path, args.retention_days, archive_dir,
+                                     delete_batch_size=args.delete_batch)
+        started = time.perf_counter()
+        summary = retention.run_once()
+        duration = time.perf_counter() - started
+        describe("pendant la rétention", writer.batch_time)
+
+        stop.set()
+        feeder.join()
+        writer.stop()
+        print(f"cycle de rétention: {duration:.1f} s, {summary['days']} jours, "
+              f"{summary['archived_rows']} lignes archivées, {summary['deleted_rows']} supprimées, "
+              f"{summary['vacuumed_pages']} pages récupérées")
+        print(f"écritures: {writer.written} lignes, {writer.dropped} abandonnées, {writer.failed} en échec")
+
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        remaining = conn.execute("SELECT count(*) FROM machine_history WHERE timestamp < ?", (cutoff,)).fetchone()[0]
+        archive_size = sum(os.path.getsize(os.path.join(root, name))
+                           for root, _, files in os.walk(archive_dir) for name in files)
+        in_archives = archived_rows(archive_dir)
+        conn.close()
+        print(f"taille: {size_before / 1e9:.2f} Go -> {os.path.getsize(db_path) / 1e9:.2f} Go, "
+              f"archives {archive_size / 1e6:.1f} Mo")
+        print(f"vérification: {remaining} lignes expirées restantes, {in_archives} lignes dans les archives "
+              f"({'OK' if remaining == 0 and in_archives == expired == summary['deleted_rows'] else 'ERREUR'})")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Microbenchmark: buffer liste de dictionnaires vs RingBuffer NumPy.
+
+Usage: python benchmarks/bench_ring_buffer.py [--appends 50000]
+
+Mesure le débit d'ajout et de calcul des statistiques (fenêtre des 10
+dernières lectures, comme /buffer_stats) pour plusieurs capacités, et vérifie
+les agrégats glissants du RingBuffer contre un calcul direct.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+WINDOW = 10
+
+
+def make_readings(n):
+    return [(time.time() + i, [random.randint(1, 100) for _ in range(5)], random.random(), random.random() > 0.7)
+            for i in range(n)]
+
+
+class ListBuffer:
+    # Ancienne implémentation: dictionnaires copiés, pop(0), sommes recalculées
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = []
+
+    def append(self, timestamp, params, probability, is_fault):
+        data = {"timestamp": timestamp, "parametres_machine": params,
+                "ml_prediction": {"fault_probability": probability, "is_fault": is_fault}}
+        self.items.append({
+            "timestamp": data["timestamp"],
+            "parametres_machine": data["parametres_machine"].copy(),
+            "ml_prediction": data["ml_prediction"].copy()
+        })
+        if len(self.items) > self.capacity:
+            self.items.pop(0)
+
+    def stats(self):
+        buffer_copy = self.items.copy()
+        recent_faults = sum(1 for d in buffer_copy[-WINDOW:] if d["ml_prediction"]["is_fault"])
+        avg = sum(d["ml_prediction"]["fault_probability"] for d in buffer_copy[-WINDOW:]) / min(WINDOW, len(buffer_copy))
+        return recent_faults, avg
+
+
+def check_ring_buffer(readings):
+    buffer = RingBuffer(50, windows=(10, 50))
+    for timestamp, params, probability, is_fault in readings:
+        buffer.append(timestamp, params, probability, is_fault)
+    for window in (10, 50):
+        last = readings[-window:]
+        values = np.array([r[1] for r in last], dtype=np.float64)
+        stats = buffer.stats(window)
+        assert np.allclose(stats["mean"], values.mean(axis=0))
+        assert np.allclose(stats["variance"], values.var(axis=0), atol=1e-6)
+        assert stats["min"] == values.min(axis=0).tolist()
+        assert stats["max"] == values.max(axis=0).tolist()
+        assert stats["fault_count"] == sum(r[3] for r in last)
+        assert abs(stats["avg_fault_probability"] - np.mean([r[2] for r in last])) < 1e-6
+
+
+def measure_memory(make_buffer, readings):
+    # Mémoire retenue par un buffer rempli (tableaux NumPy compris)
+    tracemalloc.start()
+    buffer = make_buffer()
+    for reading in readings:
+        buffer.append(*reading)
+    memory = tracemalloc.get_traced_memory()[0] / 1e6
+    tracemalloc.stop()
+    return memory
+
+
+def bench(make_buffer, stats, readings, n_stats):
+    buffer = make_buffer()
+    start = time.perf_counter()
+    for reading in readings:
+        buffer.append(*reading)
+    append_rate = len(readings) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(n_stats):
+        stats(buffer)
+    stats_rate = n_stats / (time.perf_counter() - start)
+    return append_rate, stats_rate, measure_memory(make_buffer, readings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--appends", type=int, default=50000)
+    parser.add_argument("--stats", type=int, default=2000)
+    args = parser.parse_args()
+
+    readings = make_readings(args.appends)
+    check_ring_buffer(readings[:1000])
+    print("Agrégats glissants vérifiés contre un calcul direct\n")
+
+    print(f"{'capacité':>9} {'implémentation':<16} {'ajouts/s':>12} {'stats/s':>12} {'mémoire':>10}")
+    for capacity in (100, 10000, 50000):
+        windows = (WINDOW, min(1000, capacity))
+        results = {
+            "liste de dicts": bench(lambda: ListBuffer(capacity), ListBuffer.stats, readings, args.stats),
+            "RingBuffer": bench(lambda: RingBuffer(capacity, windows=windows),
+                                lambda buffer: buffer.stats(WINDOW), readings, args.stats),
+        }
+        for name, (append_rate, stats_rate, memory) in results.items():
+            print(f"{capacity:>9} {name:<16} {append_rate:>12.0f} {stats_rate:>12.0f} {memory:>8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Benchmark des agrégats 1m/1h/1d de l'historique.
+
+Usage: python benchmarks/bench_rollups.py [--rows 2000000] [--days 30] [--machines 10]
+
+1. Insère --rows lignes synthétiques par lots de 500, comme HistoryWriter,
+   avec et sans mise à jour incrémentale des agrégats (coût par lot).
+2. Vérifie que les agrégats incrémentaux sont identiques à une reconstruction
+   complète depuis les lignes brutes.
+3. Compare une série de 500 points sur toute la plage: agrégation à la volée
+   des lignes brutes vs query_rollup().
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from history_rollup import RESOLUTIONS, RollupAggregator, query_rollup, rebuild_rollups, rollup_table
+from history_writer import INSERT_HISTORY_SQL
+
+BATCH = 500
+
+
+def generate(n_rows, days, machines):
+    start_ts = time.time() - days * 86400
+    spacing = days * 86400 / n_rows
+    for i in range(n_rows):
+        probability = random.random()
+        yield (start_ts + i * spacing, random.randint(1, 100), random.randint(1, 100), random.randint(1, 100),
+               random.randint(1, 100), random.randint(1, 100), probability, probability > 0.7, "Active",
+               f"machine-{i % machines}")
+
+
+def populate(db_path, args, rollups):
+    app.HISTORY_DB = db_path
+    app.init_history_db()
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    batch_times = []
+    batch = []
+    for row in generate(args.rows, args.days, args.machines):
+        batch.append(row)
+        if len(batch) == BATCH:
+            started = time.perf_counter()
+            with conn:
+                conn.executemany(INSERT_HISTORY_SQL, batch)
+                if rollups is not None:
+                    rollups.apply(conn, batch)
+            batch_times.append(time.perf_counter() - started)
+            batch = []
+    conn.close()
+    batch_times.sort()
+    return sum(batch_times) / len(batch_times), batch_times[len(batch_times) // 2]
+
+
+def snapshot(conn):
+    return {
+        resolution: conn.execute(f"SELECT * FROM {rollup_table(resolution)} ORDER BY machine_id, bucket").fetchall()
+        for resolution, _ in RESOLUTIONS
+    }
+
+
+def same_rows(a, b):
+    if len(a) != len(b):
+        return False
+    for row_a, row_b in zip(a, b):
+        for x, y in zip(row_a, row_b):
+            if isinstance(x, float) or isinstance(y, float):
+                if not math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-6):
+                    return False
+            elif x != y:
+                return False
+    return True
+
+
+def raw_series(cursor, machine_id, start, end, step):
+    cursor.execute(f'''
+        SELECT CAST(timestamp / {step} AS INTEGER) * {step} AS point, count(*),
+               min(vibration), max(vibration), avg(vibration), sum(is_fault), max(fault_probability)
+        FROM machine_history
+        WHERE machine_id = ? AND timestamp >= ? AND timestamp <= ?
+        GROUP BY point ORDER BY point
+    ''', (machine_id, start, end))
+    return cursor.fetchall()
+
+
+def timed(fn, repeat=3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--machines", type=int, default=10)
+    parser.add_argument("--points", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        random.seed(1)
+        avg, p50 = populate(os.path.join(workdir, "plain.db"), args, None)
+        print(f"lot de {BATCH} lignes sans agrégats:  moyenne={avg * 1000:6.2f} ms  p50={p50 * 1000:6.2f} ms")
+
+        random.seed(1)
+        db_path = os.path.join(workdir, "history.db")
+        avg, p50 = populate(db_path, args, RollupAggregator())
+        print(f"lot de {BATCH} lignes avec agrégats:  moyenne={avg * 1000:6.2f} ms  p50={p50 * 1000:6.2f} ms")
+
+        conn = sqlite3.connect(db_path)
+        incremental = snapshot(conn)
+        started = time.perf_counter()
+        with conn:
+            rebuild_rollups(conn)
+        print(f"reconstruction complète: {time.perf_counter() - started:.1f} s")
+        rebuilt = snapshot(conn)
+        for resolution, _ in RESOLUTIONS:
+            status = "OK" if same_rows(incremental[resolution], rebuilt[resolution]) else "DIFFÉRENT"
+            print(f"  {resolution}: {len(rebuilt[resolution]):>8} buckets, incrémental vs reconstruit {status}")
+
+        cursor = conn.cursor()
+        end = conn.execute("SELECT max(timestamp) FROM machine_history").fetchone()[0]
+        for days in (1, 7, args.days):
+            start = end - days * 86400
+            resolution, step, _ = query_rollup(cursor, "machine-0", start, end, args.points)
+            raw_ms, raw = timed(lambda: raw_series(cursor, "machine-0", start, end, step))
+            rollup_ms, (_, _, points) = timed(lambda: query_rollup(cursor, "machine-0", start, end, args.points))
+            print(f"série {days:>4g} j ({resolution}, pas {step:>6} s, {len(points)} points): "
+                  f"lignes brutes {raw_ms:9.2f} ms ({len(raw)} points)  agrégats {rollup_ms:7.2f} ms")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
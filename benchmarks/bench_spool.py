@@ -0,0 +1,266 @@
+"""Journal de lectures (reading_spool): coût sur l'ingestion et reprise après arrêt brutal.
+
+Usage: python benchmarks/bench_spool.py [--messages 5000] [--rounds 7]
+       python benchmarks/bench_spool.py --crash-test [--messages 5000]
+
+Débit: on_message est appelé directement (pipeline d'ingestion réel, base
+d'historique dans un répertoire temporaire) en alternant à chaque tour les
+variantes « sans journal », « journal, fsync toutes les 100 ms » et
+« journal, fsync à chaque lot de 10 ms ». Sont mesurés le temps CPU du thread
+appelant par message (le thread MQTT) et le débit jusqu'à l'écriture de toutes
+les lignes en base; le coût isolé d'une écriture dans le journal et de son
+commit est mesuré en boucle.
+
+--crash-test: un sous-processus ingère --messages lectures (horodatages
+uniques) puis est tué (SIGKILL) à mi-parcours, dans trois scénarios:
+- « base verrouillée »: une transaction exclusive tenue par ce processus
+  bloque l'écriture de l'historique pendant l'ingestion (aucun commit);
+- « base disponible »: arrêt en plein flux, une partie des lignes commitées;
+- « horodatages en double »: base verrouillée, les lectures vont par paires
+  de même machine et même horodatage (deux lignes attendues par paire).
+Un second sous-processus redémarre sur les mêmes fichiers; le test vérifie
+que toutes les lectures acceptées avant l'arrêt sont en base exactement une
+fois (code de sortie 1 sinon).
+"""
+import argparse
+import json
+import os
+import signal
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, FakeMessage, load_csv_rows, prepare_app
+
+BASE_TIMESTAMP = 1_700_000_000.0
+
+
+def quiet():
+    import logging
+    import warnings
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+
+# Débit
+
+def drain(app):
+    pipeline = app.ingest_pipeline
+    while pipeline.completed + pipeline.dropped < pipeline.submitted:
+        time.sleep(0.002)
+    app.history_writer.flush(60)
+
+
+def run_round(app, messages):
+    started_cpu = time.thread_time()
+    started = time.perf_counter()
+    for msg in messages:
+        app.on_message(None, None, msg)
+    cpu = time.thread_time() - started_cpu
+    drain(app)
+    return cpu / len(messages), len(messages) / (time.perf_counter() - started)
+
+
+def throughput(args):
+    from reading_spool import ReadingSpool
+
+    quiet()
+    with tempfile.TemporaryDirectory() as workdir:
+        app = prepare_app(workdir)
+        app.ml_service.ensure_loaded()
+        rows = load_csv_rows(args.messages)
+        topics = [f"{app.MQTT_TOPIC}/machine-{i}" for i in range(args.machines)]
+        spools = {}
+        for label, interval in (("journal, fsync 100 ms", 0.1), ("journal, fsync 10 ms", 0.01)):
+            spools[label] = ReadingSpool(os.path.join(workdir, f"{interval}.spool"),
+                                         build_rows=app.build_replay_rows, sync_interval=interval).start()
+        variants = [("sans journal", None)] + list(spools.items())
+        results = {label: [] for label, _ in variants}
+        counter = [0]
+
+        def messages():
+            # Horodatages uniques: chaque ligne commitée libère sa lecture
+            batch = []
+            for i, row in enumerate(rows):
+                counter[0] += 1
+                batch.append(FakeMessage(row, topic=topics[i % len(topics)],
+                                         timestamp=BASE_TIMESTAMP + counter[0]))
+            return batch
+
+        for round_index in range(args.rounds + 1):
+            shift = round_index % len(variants)
+            for label, spool in variants[shift:] + variants[:shift]:
+                app.reading_spool = spool
+                app.history_writer.spool = spool
+                result = run_round(app, messages())
+                # Premier tour: échauffement
+                if round_index:
+                    results[label].append(result)
+
+        print(f"{args.rounds} tours de {args.messages} messages, {args.machines} machines")
+        print(f"{'variante':<24} {'CPU thread MQTT/msg':>20} {'débit jusqu en base':>22}")
+        for label, values in results.items():
+            print(f"{label:<24} {statistics.median(v[0] for v in values) * 1e6:>17.2f} µs "
+                  f"{statistics.median(v[1] for v in values):>16.0f} msg/s")
+        for label, spool in spools.items():
+            print(f"{label}: {spool.sync_time.count} fsync, médiane "
+                  f"{spool.sync_time.summary().get('p50_ms', 0):.2f} ms, en attente {spool.pending()}")
+
+        spool = spools["journal, fsync 100 ms"]
+        n = 100000
+        started = time.thread_time()
+        seqs = []
+        for i in range(n):
+            seqs.append(spool.append("machine-1", [1.0, 2.0, 3.0, 4.0, 5.0], i))
+            if i % 500 == 499:
+                spool.committed([(0, 0, 0, 0, 0, 0, 0, False, "", "machine-1", seq) for seq in seqs])
+                seqs = []
+        isolated = (time.thread_time() - started) / n
+        reference = statistics.median(v[0] for v in results["sans journal"])
+        print(f"Coût isolé écriture + commit: {isolated * 1e6:.2f} µs/lecture "
+              f"({isolated / reference * 100:.1f} % du thread MQTT sans journal)")
+        for spool in spools.values():
+            spool.stop()
+        app.history_writer.stop()
+
+
+# Reprise après arrêt brutal
+
+def crash_child(args):
+    quiet()
+    app = prepare_app(args.workdir)
+    app.ml_service.ensure_loaded()
+    rows = load_csv_rows(args.messages)
+    print("READY", flush=True)
+    sys.stdin.readline()
+    for i, row in enumerate(rows):
+        # Paires de lectures de même machine et même horodatage
+        n = i // 2 if args.same_timestamp else i
+        app.on_message(None, None, FakeMessage(row, topic=f"{app.MQTT_TOPIC}/machine-{n % args.machines}",
+                                               timestamp=BASE_TIMESTAMP + n))
+        if i % 250 == 249:
+            # Lectures 0..i journalisées
+            print(f"FED {i + 1}", flush=True)
+            time.sleep(0.02)
+    print(f"FED {len(rows)}", flush=True)
+    time.sleep(3600)
+
+
+def recover_child(args):
+    quiet()
+    app = prepare_app(args.workdir)
+    app.ml_service.ensure_loaded()
+    spool = app.reading_spool
+    recovered = spool.recovered
+    app.history_writer.replay_interval = 0.2
+    deadline = time.time() + 60
+    while spool.pending() and time.time() < deadline:
+        time.sleep(0.1)
+    app.history_writer.stop()
+    print(json.dumps({"recovered": recovered, "replayed": app.history_writer.replayed,
+                      "pending": spool.pending()}), flush=True)
+    spool.stop()
+
+
+def crash_scenario(args, lock_db, same_timestamp=False):
+    with tempfile.TemporaryDirectory() as workdir:
+        command = [sys.executable, "-W", "ignore", __file__, "--workdir", workdir,
+                   "--messages", str(args.messages), "--machines", str(args.machines)]
+        if same_timestamp:
+            command.append("--same-timestamp")
+        child = subprocess.Popen(command + ["--crash-child"], cwd=ROOT, stdin=subprocess.PIPE,
+                                 stdout=subprocess.PIPE, text=True)
+        # Les imports peuvent écrire sur la sortie standard avant READY
+        while child.stdout.readline().strip() != "READY":
+            pass
+        lock = None
+        if lock_db:
+            lock = sqlite3.connect(os.path.join(workdir, "history.db"), isolation_level=None)
+            lock.execute("BEGIN EXCLUSIVE")
+        child.stdin.write("GO\n")
+        child.stdin.flush()
+        accepted = 0
+        while accepted < args.messages // 2:
+            line = child.stdout.readline().split()
+            if line[:1] == ["FED"]:
+                accepted = int(line[1])
+        child.send_signal(signal.SIGKILL)
+        child.wait()
+        if lock is not None:
+            lock.rollback()
+            lock.close()
+        conn = sqlite3.connect(os.path.join(workdir, "history.db"))
+        before = conn.execute("SELECT COUNT(*) FROM machine_history").fetchone()[0]
+        conn.close()
+
+        started = time.perf_counter()
+        output = subprocess.run(command + ["--recover-child"], cwd=ROOT, capture_output=True, text=True,
+                                timeout=180).stdout
+        recovery_time = time.perf_counter() - started
+        result = json.loads(output.strip().splitlines()[-1])
+
+        conn = sqlite3.connect(os.path.join(workdir, "history.db"))
+        counts = dict(conn.execute("SELECT timestamp, COUNT(*) FROM machine_history GROUP BY timestamp"))
+        conn.close()
+        # Lignes attendues par horodatage pour les lectures acceptées (accepted est pair)
+        per_timestamp = 2 if same_timestamp else 1
+        missing = sum(max(0, per_timestamp - counts.get(BASE_TIMESTAMP + n, 0))
+                      for n in range(accepted // per_timestamp))
+        duplicated = sum(count - per_timestamp for count in counts.values() if count > per_timestamp)
+        return {
+            "accepted": accepted,
+            "rows_before": before,
+            "recovered": result["recovered"],
+            "replayed": result["replayed"],
+            "rows_after": sum(counts.values()),
+            "missing": missing,
+            "duplicated": duplicated,
+            "recovery_s": recovery_time,
+            "ok": missing == 0 and duplicated == 0 and result["pending"] == 0,
+        }
+
+
+def crash_test(args):
+    ok = True
+    print(f"{'scénario':<22} {'acceptées':>10} {'en base avant':>14} {'reprises':>9} {'rejouées':>9} "
+          f"{'en base après':>14} {'manquantes':>11} {'doublons':>9} {'durée':>7}")
+    for label, lock_db, same_timestamp in (("base verrouillée", True, False), ("base disponible", False, False),
+                                           ("horodatages en double", True, True)):
+        r = crash_scenario(args, lock_db, same_timestamp)
+        ok = ok and r["ok"]
+        print(f"{label:<22} {r['accepted']:>10} {r['rows_before']:>14} {r['recovered']:>9} {r['replayed']:>9} "
+              f"{r['rows_after']:>14} {r['missing']:>11} {r['duplicated']:>9} {r['recovery_s']:>6.1f}s"
+              f"{'' if r['ok'] else '  ÉCHEC'}")
+    print("durée: redémarrage complet (import, modèle, reprise du journal)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--machines", type=int, default=20)
+    parser.add_argument("--crash-test", action="store_true")
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--crash-child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--recover-child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--same-timestamp", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.crash_child:
+        crash_child(args)
+    elif args.recover_child:
+        recover_child(args)
+    elif args.crash_test:
+        sys.exit(0 if crash_test(args) else 1)
+    else:
+        throughput(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Test de charge: tableaux de bord en SSE (/stream) vs interrogation de /data.
+
+Usage: python benchmarks/bench_sse.py [--clients 500] [--duration 30] [--rate 1]
+
+Le serveur Flask tourne dans un sous-processus alimenté par de faux messages
+MQTT (--rate messages/s). On mesure le CPU consommé par le serveur et la
+latence entre la réception d'une lecture et son affichage par les clients.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import FakeMessage, ROOT, load_csv_rows, login_cookie, percentile, process_cpu_seconds
+
+POLL_INTERVAL = 3.0
+
+
+def serve(port, workdir, rate):
+    from common import prepare_app
+    from werkzeug.serving import make_server
+    import logging
+
+    logging.disable(logging.INFO)
+    app_module = prepare_app(workdir)
+    rows = load_csv_rows()
+
+    def feed():
+        i = 0
+        while True:
+            app_module.on_message(None, None, FakeMessage(rows[i % len(rows)]))
+            i += 1
+            time.sleep(1 / rate)
+
+    threading.Thread(target=feed, daemon=True).start()
+    server = make_server("127.0.0.1", port, app_module.app, threaded=True)
+    server.request_queue_size = 1024
+    server.serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def sse_client(port, cookie, latencies, stop, errors):
+    try:
+        sock = socket.create_connection(("127.0.0.1", port), timeout=60)
+        sock.sendall(f"GET /stream HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\n\r\n".encode())
+        stream = sock.makefile("rb")
+        while not stop.is_set():
+            line = stream.readline()
+            if not line:
+                break
+            if line.startswith(b"data: "):
+                data = json.loads(line[6:])
+                latencies.append(time.time() - data["timestamp"])
+        sock.close()
+    except Exception:
+        errors.append(1)
+
+
+def polling_client(port, cookie, latencies, stop, errors, offset):
+    last_timestamp = None
+    time.sleep(offset)
+    while not stop.is_set():
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            conn.request("GET", "/data", headers={"Cookie": cookie})
+            data = json.loads(conn.getresponse().read())
+            conn.close()
+            if data["timestamp"] != last_timestamp:
+                last_timestamp = data["timestamp"]
+                latencies.append(time.time() - data["timestamp"])
+        except Exception:
+            errors.append(1)
+        stop.wait(POLL_INTERVAL)
+
+
+def run_mode(mode, args):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        server = subprocess.Popen([sys.executable, "-W", "ignore", __file__, "--serve", "--port", str(port),
+                                   "--workdir", workdir, "--rate", str(args.rate)],
+                                  cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(200):
+                try:
+                    cookie = login_cookie("127.0.0.1", port)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+
+            latencies, errors = [], []
+            stop = threading.Event()
+            threads = []
+            for i in range(args.clients):
+                if mode == "sse":
+                    target, extra = sse_client, ()
+                else:
+                    target, extra = polling_client, (POLL_INTERVAL * i / args.clients,)
+                thread = threading.Thread(target=target, args=(port, cookie, latencies, stop, errors, *extra),
+                                          daemon=True)
+                thread.start()
+                threads.append(thread)
+
+            # Laisser les connexions s'établir avant de mesurer
+            time.sleep(min(5, args.duration / 3))
+            latencies.clear()
+            cpu_start = process_cpu_seconds(server.pid)
+            time.sleep(args.duration)
+            cpu = process_cpu_seconds(server.pid) - cpu_start
+            stop.set()
+        finally:
+            server.terminate()
+            server.wait()
+
+    values = list(latencies)
+    print(f"{mode:<8} clients={args.clients:<5} CPU serveur={cpu / args.duration * 100:6.1f}%  "
+          f"latence p50={percentile(values, 50) * 1000:8.1f} ms  p99={percentile(values, 99) * 1000:8.1f} ms  "
+          f"mises à jour reçues={len(values)}  erreurs={len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--rate", type=float, default=1.0, help="messages MQTT simulés par seconde")
+    parser.add_argument("--mode", choices=["sse", "polling", "both"], default="both")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.workdir, args.rate)
+        return
+
+    threading.stack_size(256 * 1024)
+    for mode in (["polling", "sse"] if args.mode == "both" else [args.mode]):
+        run_mode(mode, args)
+
+
+if __name__ == "__main__":
+    main()
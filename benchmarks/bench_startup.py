@@ -0,0 +1,162 @@
+"""Démarrage de l'application: chargement du modèle à l'import vs en arrière-plan.
+
+Usage: python benchmarks/bench_startup.py [--workers 4] [--runs 3]
+
+1. Temps avant la première requête: le serveur Flask est lancé dans un
+   sous-processus, on mesure le délai jusqu'à la première réponse de /login
+   puis jusqu'à ce que /status indique un modèle chargé. En mode « eager »
+   le modèle est chargé avant le démarrage du serveur (ancien comportement),
+   en mode « lazy » il est chargé par ml_service.warm_up().
+2. Mémoire par worker: --workers processus chargent le même modèle (.pkl ou
+   .npz compilé, avec ou sans mmap) et on relève RSS et PSS de chacun. Avec
+   mmap, les pages du modèle sont partagées entre processus (PSS plus faible).
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, login_cookie
+
+WORKER_SNIPPET = (
+    "import sys\n"
+    "from ml_service import MLDiagnosticService\n"
+    "service = MLDiagnosticService({path!r}, mmap_mode={mmap!r})\n"
+    "service.predict_fault([1, 2, 3, 4, 5])\n"
+    "print('ready', flush=True)\n"
+    "sys.stdin.read()\n"
+)
+
+
+def serve(port, workdir, eager):
+    from common import prepare_app
+    from werkzeug.serving import make_server
+    import logging
+
+    logging.disable(logging.INFO)
+    app_module = prepare_app(workdir)
+    if eager:
+        app_module.ml_service.ensure_loaded()
+    else:
+        app_module.ml_service.warm_up()
+    make_server("127.0.0.1", port, app_module.app, threaded=True).serve_forever()
+
+
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def model_ready(port, cookie):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.request("GET", "/status", headers={"Cookie": cookie})
+    status = json.loads(conn.getresponse().read())
+    conn.close()
+    return status["model_loading_status"] == "Active"
+
+
+def measure_startup(mode, model_path):
+    port = free_port()
+    env = dict(os.environ, DIAGNOSTIC_MODEL_PATH=model_path)
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        server = subprocess.Popen([sys.executable, "-W", "ignore", __file__, "--serve", "--port", str(port),
+                                   "--workdir", workdir] + (["--eager"] if mode == "eager" else []),
+                                  cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                    conn.request("GET", "/login")
+                    conn.getresponse().read()
+                    conn.close()
+                    break
+                except OSError:
+                    time.sleep(0.005)
+            first_request = time.perf_counter() - started
+            cookie = login_cookie("127.0.0.1", port)
+            while not model_ready(port, cookie):
+                time.sleep(0.005)
+            ready = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait()
+    return first_request, ready
+
+
+def memory_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        pss = next(int(line.split()[1]) for line in f if line.startswith("Pss:"))
+    return rss, pss
+
+
+def measure_workers(model_path, mmap_mode, n_workers):
+    code = WORKER_SNIPPET.format(path=model_path, mmap=mmap_mode)
+    workers = [subprocess.Popen([sys.executable, "-W", "ignore", "-c", code], cwd=ROOT,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+               for _ in range(n_workers)]
+    try:
+        for worker in workers:
+            worker.stdout.readline()
+        # Mesurer quand tous les workers sont chargés, pour que le partage apparaisse dans la PSS
+        samples = [memory_kb(worker.pid) for worker in workers]
+    finally:
+        for worker in workers:
+            worker.stdin.close()
+            worker.wait()
+    return (sum(rss for rss, _ in samples) / len(samples) / 1024,
+            sum(pss for _, pss in samples) / len(samples) / 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default=os.path.join(ROOT, "diagnostic_model.pkl"))
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--eager", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.workdir, args.eager)
+        return
+
+    import warnings
+    import joblib
+    from compiled_model import compile_pipeline
+
+    warnings.filterwarnings("ignore")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        compiled_path = os.path.join(tmp, "diagnostic_model.npz")
+        compile_pipeline(joblib.load(args.model)).save(compiled_path)
+
+        print("Temps avant la première requête (meilleur de", args.runs, "essais)")
+        for model_path in (args.model, compiled_path):
+            for mode in ("eager", "lazy"):
+                results = [measure_startup(mode, model_path) for _ in range(args.runs)]
+                first_request = min(r[0] for r in results)
+                ready = min(r[1] for r in results)
+                print(f"  {os.path.basename(model_path):<22} {mode:<6} première requête={first_request * 1000:7.0f} ms"
+                      f"  modèle prêt={ready * 1000:7.0f} ms")
+
+        print(f"Mémoire par worker ({args.workers} processus)")
+        for model_path in (args.model, compiled_path):
+            for mmap_mode in (None, "r"):
+                rss, pss = measure_workers(model_path, mmap_mode, args.workers)
+                print(f"  {os.path.basename(model_path):<22} mmap={str(mmap_mode):<5} RSS={rss:7.1f} Mo  PSS={pss:7.1f} Mo")
+
+
+if __name__ == "__main__":
+    main()
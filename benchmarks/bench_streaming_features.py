@@ -0,0 +1,111 @@
+"""Coût et exactitude des caractéristiques glissantes (streaming_features).
+
+Usage: python benchmarks/bench_streaming_features.py [--seconds 60] [--rate 1000] [--windows 10 100]
+
+1. Exactitude: les valeurs incrémentales (RMS, variance, pente, EWMA) sont
+   comparées à un recalcul NumPy complet sur chaque fenêtre.
+2. En ligne == hors ligne: les caractéristiques calculées par IngestPipeline
+   (StreamingFeatures, par machine) sont identiques à compute_features() utilisé
+   pour l'entraînement et le scoring CSV.
+3. Surcoût par échantillon pour une machine à --rate Hz pendant --seconds s
+   (flux CSV rejoué), exprimé en µs et en part d'un cœur.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import load_csv_rows, percentile
+
+from ingest_pipeline import IngestPipeline
+from streaming_features import FeatureConfig, RollingFeatures, StreamingFeatures, compute_features
+
+
+def reference_features(rows, config, index):
+    # Recalcul direct des caractéristiques de l'échantillon index
+    values = np.array(rows[:index + 1])
+    features = list(values[-1])
+    for i in range(values.shape[1]):
+        for window in config.windows:
+            y = values[-window:, i]
+            x = np.arange(len(y))
+            slope = np.polyfit(x, y, 1)[0] if len(y) > 1 else 0.0
+            features.extend((np.sqrt(np.mean(y * y)), np.var(y), slope))
+        for alpha in config.ewma_alphas:
+            ewma = values[0, i]
+            for value in values[1:, i]:
+                ewma = alpha * value + (1 - alpha) * ewma
+            features.append(ewma)
+    return features
+
+
+def check_exactness(rows, config, samples):
+    computed = compute_features(rows, config)
+    worst = 0.0
+    for index in samples:
+        expected = np.array(reference_features(rows, config, index))
+        got = np.array(computed[index])
+        worst = max(worst, float(np.max(np.abs(got - expected) / np.maximum(1.0, np.abs(expected)))))
+    return worst
+
+
+def check_online_offline(rows, config):
+    captured = []
+    done = threading.Event()
+
+    def predict_fn(X):
+        captured.extend(X.tolist())
+        return [{"fault_probability": 0.0, "is_fault": False, "model_status": "Active"}] * len(X)
+
+    def sink(*_):
+        if len(captured) == len(rows):
+            done.set()
+
+    pipeline = IngestPipeline(predict_fn, sink, workers=1, features=StreamingFeatures(config))
+    for i, params in enumerate(rows):
+        while not pipeline.submit("machine-1", params, i):
+            time.sleep(0.001)
+    done.wait(30)
+    pipeline.stop()
+    return captured == compute_features(rows, config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--rate", type=float, default=1000)
+    parser.add_argument("--windows", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--ewma", type=float, nargs="*", default=[0.1])
+    args = parser.parse_args()
+
+    config = FeatureConfig(args.windows, args.ewma)
+    n_samples = int(args.seconds * args.rate)
+    rows = load_csv_rows(n_samples)
+
+    worst = check_exactness(rows[:5000], config, range(0, 5000, 97))
+    print(f"écart relatif max incrémental vs recalcul NumPy: {worst:.2e}")
+    identical = check_online_offline(rows[:20000], config)
+    print(f"en ligne (IngestPipeline) == hors ligne (compute_features): {'OK' if identical else 'DIFFÉRENT'}")
+
+    state = RollingFeatures(config)
+    timings = []
+    clock = time.perf_counter
+    started = clock()
+    for params in rows:
+        t0 = clock()
+        state.update(params)
+        timings.append(clock() - t0)
+    total = clock() - started
+    mean_us = sum(timings) / len(timings) * 1e6
+    print(f"{len(rows)} échantillons ({len(config.feature_names())} caractéristiques): moyenne={mean_us:.1f} µs  "
+          f"p50={percentile(timings, 50) * 1e6:.1f} µs  p99={percentile(timings, 99) * 1e6:.1f} µs")
+    print(f"à {args.rate:g} Hz: {mean_us * args.rate / 1e4:.2f} % d'un cœur "
+          f"({total:.2f} s de calcul pour {args.seconds:g} s de flux)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Débit des routes du tableau de bord sous gunicorn avec 1, 4 et 8 workers web.
+
+Usage: python benchmarks/bench_web_workers.py [--workers 1 4 8] [--duration 5]
+                                              [--client-processes 4] [--connections 4]
+
+Architecture de production (serve.py): un processus d'ingestion publie l'état
+en direct dans STATE_DB, des workers gunicorn sans état (APP_ROLE=web) le
+lisent. Ici le processus d'ingestion est remplacé par un substitut qui appelle
+on_message à --ingest-rate messages/s sur --machines machines (pas de broker
+MQTT), avec un historique prérempli de --history-rows lignes.
+
+Pour chaque nombre de workers et chaque route, --client-processes processus
+de --connections connexions keep-alive chacun envoient des requêtes en boucle
+pendant --duration s. Le résultat dépend du nombre de cœurs disponibles (les
+clients tournent sur la même machine).
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, FakeMessage, load_csv_rows, login_cookie, percentile
+
+ROUTES = ["/", "/data", "/fleet", "/buffer_stats", "/history_data?limit=100"]
+
+
+def database_env(workdir, role):
+    return dict(os.environ, APP_ROLE=role,
+                HISTORY_DB=os.path.join(workdir, "history.db"),
+                USERS_DB=os.path.join(workdir, "users.db"),
+                STATE_DB=os.path.join(workdir, "live_state.db"))
+
+
+def ingest(args):
+    # Substitut du processus d'ingestion: mêmes composants que APP_ROLE=ingest, sans MQTT
+    import logging
+    import sqlite3
+
+    logging.disable(logging.WARNING)
+    import app
+    from history_writer import INSERT_HISTORY_SQL
+
+    app.init_history_db()
+    app.init_users_db()
+    app.state_store.init_db()
+    conn = sqlite3.connect(app.HISTORY_DB)
+    start = time.time() - args.history_rows
+    conn.executemany(INSERT_HISTORY_SQL, [
+        (start + i, random.randint(1, 100), random.randint(1, 100), random.randint(1, 100),
+         random.randint(1, 100), random.randint(1, 100), random.random(), False, "Active",
+         f"machine-{i % args.machines}")
+        for i in range(args.history_rows)
+    ])
+    conn.commit()
+    conn.close()
+
+    app.ml_service.ensure_loaded()
+    app.history_writer.start()
+    app.state_publisher.start()
+    rows = load_csv_rows()
+    started = time.perf_counter()
+    i = 0
+    while True:
+        due = started + i / args.ingest_rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        topic = f"{app.MQTT_TOPIC}/machine-{i % args.machines}"
+        app.on_message(None, None, FakeMessage(rows[i % len(rows)], topic=topic))
+        i += 1
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def client_process(port, cookie, url, duration, connections, results):
+    latencies = []
+    errors = [0]
+    deadline = time.perf_counter() + duration
+
+    def loop():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request("GET", url, headers={"Cookie": cookie})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors[0] += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException):
+                errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        conn.close()
+
+    threads = [threading.Thread(target=loop) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((latencies, errors[0]))
+
+
+def load(port, cookie, url, args):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client_process,
+                                         args=(port, cookie, url, args.duration, args.connections, results))
+                 for _ in range(args.client_processes)]
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        process_latencies, process_errors = results.get()
+        latencies.extend(process_latencies)
+        errors += process_errors
+    for process in processes:
+        process.join()
+    return len(latencies) / args.duration, percentile(latencies, 50), percentile(latencies, 99), errors
+
+
+def wait_for_login(port, timeout=60):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return login_cookie("127.0.0.1", port)
+        except (OSError, AttributeError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--threads", type=int, default=4, help="threads par worker gunicorn")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--client-processes", type=int, default=4)
+    parser.add_argument("--connections", type=int, default=4, help="connexions par processus client")
+    parser.add_argument("--ingest-rate", type=float, default=200)
+    parser.add_argument("--machines", type=int, default=50)
+    parser.add_argument("--history-rows", type=int, default=50000)
+    parser.add_argument("--ingest", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.ingest:
+        ingest(args)
+        return
+
+    print(f"{os.cpu_count()} cœurs, {args.client_processes}x{args.connections} connexions clientes, "
+          f"ingestion {args.ingest_rate:g} msg/s sur {args.machines} machines")
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        ingestion = subprocess.Popen([sys.executable, "-W", "ignore", __file__, "--ingest",
+                                      "--ingest-rate", str(args.ingest_rate), "--machines", str(args.machines),
+                                      "--history-rows", str(args.history_rows)],
+                                     cwd=ROOT, env=database_env(workdir, "ingest"),
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            state_db = os.path.join(workdir, "live_state.db")
+            while not os.path.exists(state_db):
+                time.sleep(0.2)
+            for n_workers in args.workers:
+                port = free_port()
+                web = subprocess.Popen([sys.executable, "-W", "ignore", "-m", "gunicorn",
+                                        "--workers", str(n_workers), "--worker-class", "gthread",
+                                        "--threads", str(args.threads), "--bind", f"127.0.0.1:{port}",
+                                        "--log-level", "warning", "app:app"],
+                                       cwd=ROOT, env=database_env(workdir, "web"),
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                try:
+                    cookie = wait_for_login(port)
+                    for url in ROUTES:
+                        # Échauffement: chaque worker importe l'application et ouvre ses connexions
+                        load(port, cookie, url, argparse.Namespace(**dict(vars(args), duration=1)))
+                        results[n_workers, url] = load(port, cookie, url, args)
+                finally:
+                    web.terminate()
+                    web.wait()
+        finally:
+            ingestion.terminate()
+            ingestion.wait()
+
+    header = f"{'route':<26}" + "".join(f"{f'{n} worker(s)':>24}" for n in args.workers)
+    print(header)
+    for url in ROUTES:
+        cells = []
+        for n_workers in args.workers:
+            rate, p50, p99, errors = results[n_workers, url]
+            cell = f"{rate:7.0f} req/s p99 {p99 * 1000:5.0f} ms"
+            cells.append(f"{cell + ('*' if errors else ''):>24}")
+        print(f"{url:<26}" + "".join(cells))
+    if any(result[3] for result in results.values()):
+        print("* réponses en erreur pendant la mesure")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Utilitaires partagés par les scripts de benchmark."""
+import csv
+import http.client
+import json
+import os
+import sys
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+CSV_PATH = os.path.join(ROOT, "industrial_fault_detection_data_1000.csv")
+
+
+class FakeMessage:
+    """Message MQTT minimal, tel que paho le passe à on_message"""
+
+    def __init__(self, params, topic="diagnostic_machine", timestamp=None):
+        self.topic = topic
+        self.payload = json.dumps({
+            "parametres_machine": params,
+            "timestamp_epoch": time.time() if timestamp is None else timestamp
+        }).encode()
+
+
+def load_csv_rows(n_rows=None):
+    """Lit les 5 paramètres capteurs du jeu CSV (répétés jusqu'à n_rows lignes)"""
+    with open(CSV_PATH, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        rows = [[float(v) for v in row[1:6]] for row in reader]
+    if n_rows is None:
+        return rows
+    return [rows[i % len(rows)] for i in range(n_rows)]
+
+
+def prepare_app(workdir):
+    """Importe app avec des bases de données isolées dans workdir"""
+    import app
+
+    app.HISTORY_DB = os.path.join(workdir, "history.db")
+    app.USERS_DB = os.path.join(workdir, "users.db")
+    app.history_writer.db_path = app.HISTORY_DB
+    app.auth_service.db_path = app.USERS_DB
+    if app.history_retention:
+        app.history_retention.db_path = app.HISTORY_DB
+    app.init_history_db()
+    app.init_users_db()
+    if app.reading_spool is not None:
+        app.reading_spool.path = os.path.join(workdir, "readings.spool")
+        app.reading_spool.start()
+    app.history_writer.start()
+    if app.fault_event_dispatcher is not None:
+        app.fault_event_dispatcher.db_path = app.HISTORY_DB
+        app.fault_event_dispatcher.start()
+    return app
+
+
+def login_cookie(host, port, username="admin", password="password123"):
+    """Se connecte à l'application et retourne le cookie de session"""
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    body = urllib.parse.urlencode({"username": username, "password": password})
+    conn.request("POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.getheader("Set-Cookie").split(";", 1)[0]
+
+
+def process_cpu_seconds(pid):
+    """Temps CPU (utilisateur + système) consommé par un processus"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
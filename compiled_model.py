@@ -0,0 +1,181 @@
+import argparse
+import os
+import struct
+import time
+import zipfile
+
+import numpy as np
+
+
+class CompiledForest:
+    """Évaluation à plat, sur tableaux, d'un pipeline StandardScaler + RandomForest.
+
+    Tous les arbres sont concaténés dans des tableaux contigus (variable,
+    seuil, fils gauche, fils droit, valeur des feuilles). Les feuilles
+    pointent sur elles-mêmes: évaluer un lot revient à ``max_depth`` étapes
+    vectorisées sur un tableau (n_lignes, n_arbres) d'indices de nœuds.
+    """
+
+    FIELDS = ("feature", "threshold", "left", "right", "value", "roots", "max_depth", "classes", "n_features")
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, classes, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+        self.n_trees = len(roots)
+        self.n_features_in_ = int(n_features)
+
+    def predict_proba(self, X):
+        # Tous les arbres pour toutes les lignes en une fois
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features_in_)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        # Moyenne des probabilités de classe de chaque arbre, comme RandomForestClassifier
+        return self.value[nodes].mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def save(self, path):
+        # Sans compression: le chargement est une simple lecture de tampons contigus
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                feature=self.feature,
+                threshold=self.threshold,
+                left=self.left,
+                right=self.right,
+                value=self.value,
+                roots=self.roots,
+                max_depth=np.array(self.max_depth),
+                classes=self.classes_,
+                n_features=np.array(self.n_features_in_)
+            )
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        # Avec mmap=True, les tableaux sont projetés en lecture seule depuis le
+        # fichier: les processus qui chargent le même artefact partagent ses pages
+        if mmap:
+            artifact = _memmap_npz(path)
+            return cls(*(artifact[name] for name in cls.FIELDS))
+        with np.load(path, allow_pickle=False) as artifact:
+            return cls(*(artifact[name] for name in cls.FIELDS))
+
+
+def _memmap_npz(path):
+    # Projette chaque membre d'une archive .npz non compressée, sur place
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} est compressé et ne peut pas être projeté en mémoire")
+            # Saute l'en-tête local du fichier pour atteindre le membre .npy
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len(".npy")] if info.filename.endswith(".npy") else info.filename
+            if not shape:
+                # Scalaires minuscules: lus plutôt que de projeter une page pour chacun
+                arrays[name] = np.frombuffer(f.read(dtype.itemsize), dtype=dtype).reshape(())
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                         order="F" if fortran_order else "C")
+    return arrays
+
+
+def compile_pipeline(pipeline):
+    # Un Pipeline(scaler, classifieur) ou une forêt seule
+    if hasattr(pipeline, "steps"):
+        scaler = pipeline.steps[0][1] if len(pipeline.steps) > 1 else None
+        forest = pipeline.steps[-1][1]
+    else:
+        scaler, forest = None, pipeline
+
+    n_features = forest.n_features_in_
+    mean = np.zeros(n_features)
+    scale = np.ones(n_features)
+    if scaler is not None:
+        if getattr(scaler, "mean_", None) is not None and scaler.with_mean:
+            mean = scaler.mean_
+        if getattr(scaler, "scale_", None) is not None and scaler.with_std:
+            scale = scaler.scale_
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        node_ids = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+
+        # Normalisation intégrée au seuil: (x - mean) / scale <= t  <=>  x <= t * scale + mean
+        feature = np.where(is_leaf, 0, tree.feature)
+        threshold = np.where(is_leaf, np.inf, tree.threshold * scale[feature] + mean[feature])
+        # Les feuilles pointent sur elles-mêmes: les étapes en trop ne changent rien
+        left = np.where(is_leaf, node_ids, tree.children_left) + offset
+        right = np.where(is_leaf, node_ids, tree.children_right) + offset
+
+        value = tree.value[:, 0, :]
+        value = value / value.sum(axis=1, keepdims=True)
+
+        features.append(feature)
+        thresholds.append(threshold)
+        lefts.append(left)
+        rights.append(right)
+        values.append(value)
+        roots.append(offset)
+        offset += tree.node_count
+
+    return CompiledForest(
+        feature=np.concatenate(features).astype(np.int32),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts).astype(np.int32),
+        right=np.concatenate(rights).astype(np.int32),
+        value=np.concatenate(values).astype(np.float64),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=max(estimator.tree_.max_depth for estimator in forest.estimators_),
+        classes=np.asarray(forest.classes_),
+        n_features=n_features
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile diagnostic_model.pkl en artefact d'inférence à plat")
+    parser.add_argument("--model", default="diagnostic_model.pkl", help="pipeline joblib à compiler")
+    parser.add_argument("--output", default="diagnostic_model.npz", help="chemin de l'artefact compilé")
+    args = parser.parse_args()
+
+    import joblib
+
+    pipeline = joblib.load(args.model)
+    start = time.perf_counter()
+    compiled = compile_pipeline(pipeline)
+    compiled.save(args.output)
+    print(f"{compiled.n_trees} arbres ({len(compiled.feature)} nœuds) compilés "
+          f"en {time.perf_counter() - start:.2f} s -> {args.output} "
+          f"({os.path.getsize(args.output) / 1e6:.1f} Mo)")
+
+    # Vérification rapide de l'équivalence sur des entrées aléatoires
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 100, size=(1000, compiled.n_features_in_))
+    expected = pipeline.predict_proba(X)
+    got = compiled.predict_proba(X)
+    print(f"Écart maximal de probabilité avec le pipeline: {np.abs(expected - got).max():.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+import json
+import logging
+import queue
+import sqlite3
+import time
+import urllib.request
+from collections import Counter
+from threading import Event, Thread
+
+from batch_inference import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+FAULT_START = "fault_start"
+FAULT_END = "fault_end"
+
+INSERT_EVENT_SQL = '''
+    INSERT INTO fault_events (
+        machine_id, event, timestamp, started_at, duration, max_fault_probability, readings
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+EVENT_COLUMNS = ("id", "machine_id", "event", "timestamp", "started_at", "duration",
+                 "max_fault_probability", "readings")
+
+
+def init_fault_events_table(conn):
+    """Crée la table des événements de panne et ses index"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fault_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            machine_id TEXT NOT NULL,
+            event TEXT NOT NULL,
+            timestamp REAL NOT NULL,
+            started_at REAL NOT NULL,
+            duration REAL,
+            max_fault_probability REAL,
+            readings INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_fault_events_machine_timestamp
+        ON fault_events (machine_id, timestamp)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_fault_events_timestamp
+        ON fault_events (timestamp)
+    ''')
+
+
+class _MachineFaultState:
+    __slots__ = ("active", "streak", "since", "started_at", "max_probability", "readings")
+
+    def __init__(self):
+        self.active = False
+        # Lectures consécutives dans l'état opposé, depuis ``since``
+        self.streak = 0
+        self.since = None
+        self.started_at = None
+        self.max_probability = 0.0
+        self.readings = 0
+
+
+class FaultEventDetector:
+    """Détection incrémentale des débuts et fins de panne, par machine.
+
+    Une panne commence après ``min_readings`` lectures en panne consécutives
+    couvrant au moins ``min_seconds`` secondes, et se termine après
+    ``clear_readings`` lectures saines consécutives couvrant au moins
+    ``clear_seconds`` secondes: une lecture isolée ne crée ni ne clôt de
+    panne. Sans seuil, une lecture est en panne selon ``is_fault``; avec
+    ``fault_threshold``, si sa probabilité l'atteint, et elle est saine sous
+    ``clear_threshold`` (hystérésis, par défaut le même seuil).
+
+    ``update`` est appelé dans l'ordre des lectures de chaque machine, une
+    machine n'étant traitée que par un thread à la fois; chaque événement est
+    passé à ``on_event`` (dict JSON-compatible), qui ne doit pas bloquer.
+    """
+
+    def __init__(self, on_event, min_readings=3, min_seconds=0.0, clear_readings=3, clear_seconds=0.0,
+                 fault_threshold=None, clear_threshold=None):
+        self.on_event = on_event
+        self.min_readings = max(1, min_readings)
+        self.min_seconds = min_seconds
+        self.clear_readings = max(1, clear_readings)
+        self.clear_seconds = clear_seconds
+        self.fault_threshold = fault_threshold
+        self.clear_threshold = fault_threshold if clear_threshold is None else clear_threshold
+        self._machines = {}
+
+        # Compteurs exposés pour le monitoring
+        self.events = Counter()
+
+    def update(self, machine_id, timestamp, fault_probability, is_fault):
+        state = self._machines.get(machine_id)
+        if state is None:
+            state = self._machines[machine_id] = _MachineFaultState()
+        threshold = self.fault_threshold
+        if not state.active:
+            faulty = is_fault if threshold is None else fault_probability >= threshold
+            if not faulty:
+                state.streak = 0
+                return
+            if not state.streak:
+                state.since = timestamp
+                state.max_probability = fault_probability
+            elif fault_probability > state.max_probability:
+                state.max_probability = fault_probability
+            state.streak += 1
+            if state.streak >= self.min_readings and timestamp - state.since >= self.min_seconds:
+                state.active = True
+                state.started_at = state.since
+                state.readings = state.streak
+                state.streak = 0
+                self._emit(FAULT_START, machine_id, state.started_at, state)
+            return
+
+        state.readings += 1
+        if fault_probability > state.max_probability:
+            state.max_probability = fault_probability
+        healthy = not is_fault if threshold is None else fault_probability < self.clear_threshold
+        if not healthy:
+            state.streak = 0
+            return
+        if not state.streak:
+            state.since = timestamp
+        state.streak += 1
+        if state.streak >= self.clear_readings and timestamp - state.since >= self.clear_seconds:
+            # Fin de panne: première lecture saine de la série
+            state.active = False
+            state.readings -= state.streak
+            state.streak = 0
+            self._emit(FAULT_END, machine_id, state.since, state)
+
+    def _emit(self, kind, machine_id, timestamp, state):
+        self.events[kind] += 1
+        event = {
+            "machine_id": machine_id,
+            "event": kind,
+            "timestamp": timestamp,
+            "started_at": state.started_at,
+            "duration": timestamp - state.started_at if kind == FAULT_END else None,
+            "max_fault_probability": state.max_probability,
+            "readings": state.readings
+        }
+        try:
+            self.on_event(event)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'émission d'un événement de panne: {e}")
+
+    def restore(self, db_path):
+        """Reprend les pannes en cours au dernier arrêt (dernier événement: un début)"""
+        conn = sqlite3.connect(db_path)
+        try:
+            # Colonnes de la ligne du max(id) de chaque machine (SQLite)
+            rows = conn.execute('''
+                SELECT machine_id, event, started_at, max_fault_probability, readings, max(id)
+                FROM fault_events GROUP BY machine_id
+            ''').fetchall()
+        finally:
+            conn.close()
+        restored = 0
+        for machine_id, kind, started_at, max_probability, readings, _ in rows:
+            if kind != FAULT_START:
+                continue
+            state = self._machines.setdefault(machine_id, _MachineFaultState())
+            state.active = True
+            state.started_at = started_at
+            state.max_probability = max_probability or 0.0
+            state.readings = readings or 0
+            restored += 1
+        if restored:
+            logger.info(f"{restored} pannes en cours reprises")
+        return restored
+
+    def active_count(self):
+        return sum(1 for state in list(self._machines.values()) if state.active)
+
+
+# Destinations des événements: un objet avec ``name`` et ``send(events)``
+# (lot d'événements), appelé par le thread propre à la destination; une
+# exception est comptée et journalisée sans affecter les autres destinations
+
+class LogSink:
+    name = "log"
+
+    def __init__(self, log=None):
+        self.log = log or logger
+
+    def send(self, events):
+        for event in events:
+            if event["event"] == FAULT_START:
+                self.log.warning("Machine %s - DÉBUT DE PANNE à %s (probabilité max %.2f%%)",
+                                 event["machine_id"], event["timestamp"], event["max_fault_probability"] * 100)
+            else:
+                self.log.warning("Machine %s - FIN DE PANNE après %.1f s (%d lectures, probabilité max %.2f%%)",
+                                 event["machine_id"], event["duration"], event["readings"],
+                                 event["max_fault_probability"] * 100)
+
+
+class FileSink:
+    """Ajoute les événements à un fichier, un objet JSON par ligne"""
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, events):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(event) + "\n" for event in events))
+
+
+class WebhookSink:
+    """POST JSON {"events": [...]} par lot, réessayé ``retries`` fois avec délai croissant"""
+    name = "webhook"
+
+    def __init__(self, url, timeout=5.0, retries=2, headers=None):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+
+    def send(self, events):
+        body = json.dumps({"events": events}).encode("utf-8")
+        for attempt in range(self.retries + 1):
+            try:
+                request = urllib.request.Request(self.url, data=body, headers=self.headers, method="POST")
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    response.read()
+                return
+            except OSError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+
+
+def build_sinks(spec):
+    """Destinations depuis une liste séparée par des virgules: log, file:<chemin>, webhook:<url>"""
+    sinks = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, target = item.partition(":")
+        if kind == "log":
+            sinks.append(LogSink())
+        elif kind == "file" and target:
+            sinks.append(FileSink(target))
+        elif kind == "webhook" and target:
+            sinks.append(WebhookSink(target))
+        else:
+            raise ValueError(f"Destination d'événements inconnue: {item}")
+    return sinks
+
+
+class _SinkWorker:
+    """File et thread propres à une destination: une destination lente ou en
+    panne ne retarde ni l'enregistrement ni les autres destinations"""
+
+    def __init__(self, sink, max_queue_size, errors, dropped):
+        self.sink = sink
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._errors = errors
+        self._dropped = dropped
+        self._thread = Thread(target=self._run, name=f"fault-events-{sink.name}", daemon=True)
+        self._thread.start()
+
+    def put(self, batch):
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            self._dropped[self.sink.name] += len(batch)
+            if self._dropped[self.sink.name] % 1000 < len(batch):
+                logger.warning(f"File de la destination {self.sink.name} pleine, "
+                               f"{self._dropped[self.sink.name]} événements abandonnés")
+
+    def pending(self):
+        return self._queue.unfinished_tasks
+
+    def stop(self, timeout):
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    return
+                self.sink.send(batch)
+            except Exception as e:
+                self._errors[self.sink.name] += 1
+                logger.error(f"Erreur de la destination d'événements {self.sink.name}: {e}")
+            finally:
+                self._queue.task_done()
+
+
+class FaultEventDispatcher:
+    """Enregistrement et diffusion des événements de panne.
+
+    ``emit`` met un événement en file sans attendre (abandonné et compté si
+    la file est pleine). Un thread enregistre les événements par lots dans
+    la table ``fault_events`` (une transaction par lot), puis remet chaque
+    lot, même si l'enregistrement a échoué, à la file de chaque destination.
+    Chaque destination a son propre thread: un webhook lent ne bloque que
+    sa file, dont les lots sont abandonnés et comptés une fois
+    ``sink_queue_size`` lots en attente.
+    """
+
+    def __init__(self, db_path, sinks=(), batch_size=200, flush_interval=0.5, max_queue_size=10000,
+                 sink_queue_size=1000):
+        self.db_path = db_path
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sink_queue_size = sink_queue_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop_event = Event()
+        self._thread = None
+        self._workers = []
+
+        # Compteurs exposés pour le monitoring
+        self.emitted = 0
+        self.dropped = 0
+        self.stored = 0
+        self.failed = 0
+        self.sink_errors = Counter()
+        self.sink_dropped = Counter()
+        self.dispatch_time = LatencyStats()
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._workers = [_SinkWorker(sink, self.sink_queue_size, self.sink_errors, self.sink_dropped)
+                             for sink in self.sinks]
+            self._thread = Thread(target=self._run, name="fault-events", daemon=True)
+            self._thread.start()
+        return self
+
+    def emit(self, event):
+        try:
+            self._queue.put_nowait(event)
+            self.emitted += 1
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"File des événements de panne pleine, {self.dropped} événements abandonnés")
+
+    def queue_size(self):
+        return self._queue.qsize()
+
+    def sink_queue_sizes(self):
+        return {worker.sink.name: worker.pending() for worker in self._workers}
+
+    def flush(self, timeout=None):
+        """Attend que tous les événements en file soient enregistrés et diffusés"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks or any(worker.pending() for worker in self._workers):
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def stop(self, timeout=10):
+        """Traite les événements restants, ferme la connexion puis attend les destinations"""
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+        for worker in self._workers:
+            worker.stop(max(0.0, deadline - time.monotonic()))
+        self._workers = []
+
+    def _next_batch(self, wait=True):
+        batch = []
+        try:
+            if wait:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _dispatch(self, conn, batch):
+        started = time.perf_counter()
+        try:
+            with conn:
+                conn.executemany(INSERT_EVENT_SQL, [
+                    (e["machine_id"], e["event"], e["timestamp"], e["started_at"], e["duration"],
+                     e["max_fault_probability"], e["readings"])
+                    for e in batch
+                ])
+            self.stored += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Erreur lors de l'enregistrement des événements de panne: {e}")
+        self.dispatch_time.record(time.perf_counter() - started)
+        for worker in self._workers:
+            worker.put(batch)
+        for _ in batch:
+            self._queue.task_done()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA busy_timeout=5000")
+        try:
+            while not self._stop_event.is_set():
+                batch = self._next_batch()
+                if batch:
+                    self._dispatch(conn, batch)
+            # Arrêt propre: vider la file
+            while True:
+                batch = self._next_batch(wait=False)
+                if not batch:
+                    break
+                self._dispatch(conn, batch)
+        finally:
+            conn.close()
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_size(),
+            "emitted": self.emitted,
+            "dropped": self.dropped,
+            "stored": self.stored,
+            "failed": self.failed,
+            "sink_errors": dict(self.sink_errors),
+            "sink_dropped": dict(self.sink_dropped),
+            "sink_queue_depth": self.sink_queue_sizes(),
+            "dispatch_time": self.dispatch_time.summary()
+        }
@@ -0,0 +1,330 @@
+import csv
+import gzip
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+from threading import Thread, Event
+
+from history_rollup import init_rollup_tables, rebuild_rollups, rollup_table
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+ARCHIVE_COLUMNS = (
+    "id", "timestamp", "vibration", "temperature", "pressure", "rms", "mean_temp",
+    "fault_probability", "is_fault", "model_status", "machine_id", "created_at"
+)
+
+
+def enable_incremental_vacuum(db_path):
+    """Passe une base existante en auto_vacuum=INCREMENTAL (VACUUM complet, à faire une fois)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+class HistoryRetention:
+    """Politique de rétention de machine_history.
+
+    Les lignes brutes plus anciennes que ``retention_days`` jours sont traitées
+    jour par jour (UTC): vérification des agrégats journaliers (compaction),
+    export dans une archive compressée par jour, puis suppression par petits
+    lots de ``delete_batch_size`` lignes, chacun dans sa propre transaction,
+    pour ne jamais bloquer HistoryWriter longtemps. L'espace libéré est rendu
+    au système par ``PRAGMA incremental_vacuum`` (base en auto_vacuum=INCREMENTAL).
+
+    La taille des lots est réduite dès qu'une transaction dépasse
+    ``max_transaction_time`` secondes (base plus grosse que le cache disque).
+
+    La table history_archive garde la trace des fichiers produits et de l'id
+    maximal exporté par jour: un cycle interrompu reprend sans perte ni doublon.
+    """
+
+    # Taille minimale d'un lot de suppression ou de pages à libérer
+    MIN_BATCH = 50
+
+    def __init__(self, db_path, retention_days, archive_dir="archive", archive_format="csv",
+                 delete_batch_size=2000, batch_pause=0.01, vacuum_pages=500, max_transaction_time=0.05,
+                 interval=3600):
+        if archive_format not in ("csv", "parquet"):
+            raise ValueError(f"Format d'archive inconnu: {archive_format}")
+        if archive_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise RuntimeError("Les archives Parquet nécessitent pyarrow (pip install pyarrow)")
+        self.db_path = db_path
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir
+        self.archive_format = archive_format
+        self.delete_batch_size = delete_batch_size
+        self.batch_pause = batch_pause
+        self.vacuum_pages = vacuum_pages
+        self.max_transaction_time = max_transaction_time
+        self.interval = interval
+        self._stop_event = Event()
+        self._thread = None
+
+        # Compteurs exposés pour le monitoring
+        self.cycles = 0
+        self.archived_rows = 0
+        self.deleted_rows = 0
+        self.vacuumed_pages = 0
+        self.last_run = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = Thread(target=self._run, name="history-retention", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=30):
+        """Interrompt le cycle en cours entre deux lots"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        return {
+            "retention_days": self.retention_days,
+            "cycles": self.cycles,
+            "archived_rows": self.archived_rows,
+            "deleted_rows": self.deleted_rows,
+            "vacuumed_pages": self.vacuumed_pages,
+            "last_run": self.last_run
+        }
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Erreur lors du cycle de rétention: {e}")
+            self._stop_event.wait(self.interval)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def run_once(self, now=None):
+        """Exécute un cycle complet; retourne le résumé du cycle"""
+        now = time.time() if now is None else now
+        cutoff = (now - self.retention_days * DAY) // DAY * DAY
+        summary = {"days": 0, "archived_rows": 0, "deleted_rows": 0, "vacuumed_pages": 0}
+        conn = self._connect()
+        try:
+            with conn:
+                init_rollup_tables(conn)
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS history_archive (
+                        day TEXT NOT NULL,
+                        part INTEGER NOT NULL,
+                        path TEXT NOT NULL,
+                        rows INTEGER NOT NULL,
+                        max_id INTEGER NOT NULL,
+                        archived_at REAL NOT NULL,
+                        PRIMARY KEY (day, part)
+                    )
+                ''')
+            day_start = self._next_expired_day(conn, None, cutoff)
+            while day_start is not None and not self._stop_event.is_set():
+                day = datetime.fromtimestamp(day_start, timezone.utc).strftime("%Y-%m-%d")
+                self._compact_day(conn, day, day_start)
+                archived, max_id = self._archive_day(conn, day, day_start)
+                deleted = self._delete_day(conn, day_start, max_id)
+                logger.info(f"Rétention {day}: {archived} lignes archivées, {deleted} supprimées")
+                summary["days"] += 1
+                summary["archived_rows"] += archived
+                summary["deleted_rows"] += deleted
+                day_start = self._next_expired_day(conn, day_start + DAY, cutoff)
+            summary["vacuumed_pages"] = self._incremental_vacuum(conn)
+        finally:
+            conn.close()
+        self.cycles += 1
+        self.last_run = now
+        return summary
+
+    def _next_expired_day(self, conn, after, cutoff):
+        # Les timestamps texte hérités sont ignorés (comparaison numérique)
+        oldest = conn.execute(
+            "SELECT min(timestamp) FROM machine_history WHERE timestamp >= ? AND timestamp < ?",
+            (-float("inf") if after is None else after, cutoff)
+        ).fetchone()[0]
+        if oldest is None:
+            return None
+        return oldest // DAY * DAY
+
+    def _day_parts(self, conn, day):
+        return conn.execute("SELECT count(*), max(max_id) FROM history_archive WHERE day = ?", (day,)).fetchone()
+
+    def _compact_day(self, conn, day, day_start):
+        """S'assure que l'agrégat journalier couvre toutes les lignes brutes du jour"""
+        parts, _ = self._day_parts(conn, day)
+        if parts:
+            # Suppression déjà commencée: les agrégats ont été vérifiés avant
+            return
+        raw = conn.execute("SELECT count(*) FROM machine_history WHERE timestamp >= ? AND timestamp < ?",
+                           (day_start, day_start + DAY)).fetchone()[0]
+        aggregated = conn.execute(f"SELECT total(count) FROM {rollup_table('1d')} WHERE bucket = ?",
+                                  (day_start,)).fetchone()[0]
+        if raw != aggregated:
+            logger.warning(f"Agrégats du {day} incomplets ({int(aggregated)}/{raw}), recalcul")
+            with conn:
+                rebuild_rollups(conn, day_start, day_start + DAY)
+
+    def _archive_path(self, day, part):
+        year, month, _ = day.split("-")
+        suffix = "" if part == 0 else f".part{part}"
+        extension = "parquet" if self.archive_format == "parquet" else "csv.gz"
+        return os.path.join(self.archive_dir, year, month, f"machine_history-{day}{suffix}.{extension}")
+
+    def _archive_day(self, conn, day, day_start):
+        """Exporte les lignes du jour pas encore archivées; retourne (lignes, id max archivé)"""
+        parts, max_id = self._day_parts(conn, day)
+        max_id = -1 if max_id is None else max_id
+        cursor = conn.execute(f'''
+            SELECT {", ".join(ARCHIVE_COLUMNS)} FROM machine_history
+            WHERE timestamp >= ? AND timestamp < ? AND id > ?
+            ORDER BY id
+        ''', (day_start, day_start + DAY, max_id))
+        path = self._archive_path(day, parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        if self.archive_format == "parquet":
+            rows, last_id = self._write_parquet(cursor, tmp_path)
+        else:
+            rows, last_id = self._write_csv(cursor, tmp_path)
+        if not rows:
+            os.remove(tmp_path)
+            return 0, max_id
+        # Fichier complet visible uniquement après écriture
+        os.replace(tmp_path, path)
+        with conn:
+            conn.execute("INSERT INTO history_archive VALUES (?, ?, ?, ?, ?, ?)",
+                         (day, parts, path, rows, last_id, time.time()))
+        self.archived_rows += rows
+        return rows, last_id
+
+    def _write_csv(self, cursor, path):
+        rows, last_id = 0, None
+        with gzip.open(path, "wt", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(ARCHIVE_COLUMNS)
+            while True:
+                chunk = cursor.fetchmany(10000)
+                if not chunk:
+                    break
+                writer.writerows(chunk)
+                rows += len(chunk)
+                last_id = chunk[-1][0]
+        return rows, last_id
+
+    def _write_parquet(self, cursor, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows, last_id, writer = 0, None, None
+        try:
+            while True:
+                chunk = cursor.fetchmany(10000)
+                if not chunk:
+                    break
+                table = pa.Table.from_pylist([dict(zip(ARCHIVE_COLUMNS, row)) for row in chunk])
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+                rows += len(chunk)
+                last_id = chunk[-1][0]
+        finally:
+            if writer is not None:
+                writer.close()
+            else:
+                open(path, "wb").close()
+        return rows, last_id
+
+    def _delete_day(self, conn, day_start, max_id):
+        """Supprime les lignes archivées du jour par petits lots (transactions courtes)"""
+        deleted = 0
+        batch_size = self.delete_batch_size
+        while not self._stop_event.is_set():
+            started = time.perf_counter()
+            with conn:
+                count = conn.execute('''
+                    DELETE FROM machine_history WHERE id IN (
+                        SELECT id FROM machine_history
+                        WHERE timestamp >= ? AND timestamp < ? AND id <= ?
+                        LIMIT ?
+                    )
+                ''', (day_start, day_start + DAY, max_id, batch_size)).rowcount
+            deleted += count
+            self.deleted_rows += count
+            if count < batch_size:
+                break
+            batch_size = self._resize(batch_size, time.perf_counter() - started, self.delete_batch_size)
+            # Laisser passer les écritures de HistoryWriter entre deux lots
+            time.sleep(self.batch_pause)
+        return deleted
+
+    def _resize(self, size, elapsed, maximum):
+        # Ajuste la taille des lots pour que chaque transaction reste sous
+        # max_transaction_time (HistoryWriter attend le verrou pendant ce temps)
+        if elapsed > self.max_transaction_time:
+            return max(self.MIN_BATCH, size // 2)
+        if elapsed < self.max_transaction_time / 2:
+            return min(maximum, size * 2)
+        return size
+
+    def _incremental_vacuum(self, conn):
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.warning("auto_vacuum n'est pas INCREMENTAL: espace non récupéré "
+                           "(python history_retention.py --enable-incremental-vacuum)")
+            return 0
+        vacuumed = 0
+        batch_pages = self.vacuum_pages
+        while not self._stop_event.is_set():
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free_pages:
+                break
+            started = time.perf_counter()
+            # executescript exécute le pragma jusqu'au bout (execute ne libère qu'une page)
+            conn.executescript(f"PRAGMA incremental_vacuum({min(free_pages, batch_pages)})")
+            pages = free_pages - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            vacuumed += pages
+            self.vacuumed_pages += pages
+            if pages <= 0:
+                break
+            batch_pages = self._resize(batch_pages, time.perf_counter() - started, self.vacuum_pages)
+            time.sleep(self.batch_pause)
+        # Reporter les pages tronquées dans le fichier principal sans attendre les lecteurs
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        return vacuumed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Cycle de rétention de l'historique")
+    parser.add_argument("--db", default="history.db")
+    parser.add_argument("--days", type=float, default=30, help="jours de lignes brutes conservés")
+    parser.add_argument("--archive-dir", default="archive")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="convertit d'abord la base en auto_vacuum=INCREMENTAL (VACUUM complet)")
+    args = parser.parse_args()
+
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum(args.db)
+    retention = HistoryRetention(args.db, args.days, args.archive_dir, args.format)
+    logger.info(f"Cycle terminé: {retention.run_once()}")
@@ -0,0 +1,261 @@
+import logging
+import math
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# Résolutions des tables d'agrégats: (nom, largeur du bucket en secondes)
+RESOLUTIONS = (("1m", 60), ("1h", 3600), ("1d", 86400))
+SENSOR_COLUMNS = ("vibration", "temperature", "pressure", "rms", "mean_temp")
+
+
+def rollup_table(resolution):
+    return f"machine_history_{resolution}"
+
+
+def _aggregate_columns():
+    columns = ["count"]
+    for sensor in SENSOR_COLUMNS:
+        columns.extend((f"{sensor}_min", f"{sensor}_max", f"{sensor}_sum"))
+    columns.extend(("fault_count", "max_fault_probability"))
+    return columns
+
+
+AGGREGATE_COLUMNS = _aggregate_columns()
+
+
+def _merge_clause():
+    # Fusion d'un bucket existant avec les nouvelles lignes (ON CONFLICT)
+    merges = []
+    for column in AGGREGATE_COLUMNS:
+        if column.endswith("_min"):
+            merges.append(f"{column} = min({column}, excluded.{column})")
+        elif column.endswith("_max") or column == "max_fault_probability":
+            merges.append(f"{column} = max({column}, excluded.{column})")
+        else:
+            merges.append(f"{column} = {column} + excluded.{column}")
+    return ", ".join(merges)
+
+
+def _upsert_sql(resolution):
+    columns = ["machine_id", "bucket"] + AGGREGATE_COLUMNS
+    return f'''
+        INSERT INTO {rollup_table(resolution)} ({", ".join(columns)})
+        VALUES ({", ".join("?" * len(columns))})
+        ON CONFLICT (machine_id, bucket) DO UPDATE SET {_merge_clause()}
+    '''
+
+
+def _backfill_sql(resolution, width, where):
+    selects = ["count(*)"]
+    for sensor in SENSOR_COLUMNS:
+        selects.extend((f"min({sensor})", f"max({sensor})", f"total({sensor})"))
+    selects.extend(("total(is_fault)", "max(fault_probability)"))
+    # "WHERE true" lève l'ambiguïté entre SELECT ... et ON CONFLICT pour SQLite
+    return f'''
+        INSERT INTO {rollup_table(resolution)} (machine_id, bucket, {", ".join(AGGREGATE_COLUMNS)})
+        SELECT machine, bucket, {", ".join(selects)}
+        FROM (
+            SELECT coalesce(machine_id, 'default') AS machine,
+                   CAST(timestamp / {width} AS INTEGER) * {width} AS bucket,
+                   {", ".join(SENSOR_COLUMNS)}, is_fault, fault_probability
+            FROM machine_history
+            WHERE typeof(timestamp) IN ('real', 'integer') {where}
+        )
+        WHERE true
+        GROUP BY machine, bucket
+        ON CONFLICT (machine_id, bucket) DO UPDATE SET {_merge_clause()}
+    '''
+
+
+def init_rollup_tables(conn):
+    """Crée les tables d'agrégats; retourne True si elles viennent d'être créées"""
+    created = False
+    for resolution, _ in RESOLUTIONS:
+        table = rollup_table(resolution)
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                              (table,)).fetchone()
+        if exists:
+            continue
+        columns = ["count INTEGER NOT NULL"]
+        for sensor in SENSOR_COLUMNS:
+            columns.extend((f"{sensor}_min REAL", f"{sensor}_max REAL", f"{sensor}_sum REAL"))
+        columns.extend(("fault_count INTEGER NOT NULL", "max_fault_probability REAL"))
+        conn.execute(f'''
+            CREATE TABLE {table} (
+                machine_id TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                {", ".join(columns)},
+                PRIMARY KEY (machine_id, bucket)
+            ) WITHOUT ROWID
+        ''')
+        created = True
+    return created
+
+
+def rebuild_rollups(conn, start=None, end=None):
+    """Recalcule les agrégats depuis les lignes brutes (migration, réparation).
+
+    Seuls les buckets entièrement compris dans [start, end[ sont recalculés;
+    sans bornes, toutes les tables sont reconstruites.
+    """
+    for resolution, width in RESOLUTIONS:
+        clauses, params = [], []
+        if start is not None:
+            first = math.ceil(start / width) * width
+            clauses.append("timestamp >= ?")
+            params.append(first)
+        if end is not None:
+            last = math.floor(end / width) * width
+            clauses.append("timestamp < ?")
+            params.append(last)
+        if start is not None and end is not None and last <= first:
+            continue
+        where = "".join(f" AND {clause}" for clause in clauses)
+        bucket_where = where.replace("timestamp", "bucket")
+        conn.execute(f"DELETE FROM {rollup_table(resolution)} WHERE true {bucket_where}", params)
+        conn.execute(_backfill_sql(resolution, width, where), params)
+
+
+def rebuild_complete_buckets(conn, start, end):
+    """Recalcule les buckets de [start, end[ dont toutes les lignes brutes sont encore présentes.
+
+    Un bucket dont le nombre de lignes brutes diffère de son agrégat (lignes
+    déjà supprimées par la rétention) garde son agrégat.
+    """
+    for resolution, width in RESOLUTIONS:
+        first = math.ceil(start / width) * width
+        last = math.floor(end / width) * width
+        if last <= first:
+            continue
+        table = rollup_table(resolution)
+        conn.execute("DROP TABLE IF EXISTS temp.complete_buckets")
+        conn.execute(f'''
+            CREATE TEMP TABLE complete_buckets AS
+            SELECT r.machine_id, r.bucket FROM {table} r
+            JOIN (
+                SELECT coalesce(machine_id, 'default') AS machine,
+                       CAST(timestamp / {width} AS INTEGER) * {width} AS bucket, count(*) AS rows
+                FROM machine_history
+                WHERE typeof(timestamp) IN ('real', 'integer') AND timestamp >= ? AND timestamp < ?
+                GROUP BY machine, bucket
+            ) h ON h.machine = r.machine_id AND h.bucket = r.bucket
+            WHERE r.bucket >= ? AND r.bucket < ? AND h.rows = r.count
+        ''', (first, last, first, last))
+        conn.execute(f'''
+            DELETE FROM {table}
+            WHERE (machine_id, bucket) IN (SELECT machine_id, bucket FROM temp.complete_buckets)
+        ''')
+        where = (f" AND timestamp >= ? AND timestamp < ? AND (coalesce(machine_id, 'default'), "
+                 f"CAST(timestamp / {width} AS INTEGER) * {width}) IN "
+                 f"(SELECT machine_id, bucket FROM temp.complete_buckets)")
+        conn.execute(_backfill_sql(resolution, width, where), (first, last))
+        conn.execute("DROP TABLE temp.complete_buckets")
+
+
+class RollupAggregator:
+    """Mise à jour incrémentale des agrégats à chaque lot inséré dans l'historique.
+
+    Les lignes d'un lot (au format INSERT_HISTORY_SQL) sont d'abord agrégées en
+    mémoire par (machine, bucket), puis fusionnées dans les tables par UPSERT,
+    dans la même transaction que l'insertion des lignes brutes.
+    """
+
+    def __init__(self, resolutions=RESOLUTIONS):
+        self.resolutions = resolutions
+        self._sql = {resolution: _upsert_sql(resolution) for resolution, _ in resolutions}
+
+    def apply(self, conn, rows):
+        for resolution, width in self.resolutions:
+            buckets = {}
+            for row in rows:
+                timestamp = row[0]
+                if not isinstance(timestamp, (int, float)):
+                    # Timestamps texte hérités: non agrégés
+                    continue
+                key = (row[9], int(timestamp // width) * width)
+                aggregate = buckets.get(key)
+                if aggregate is None:
+                    aggregate = buckets[key] = [0]
+                    for value in row[1:6]:
+                        aggregate.extend((value, value, 0.0))
+                    aggregate.extend((0, row[6]))
+                aggregate[0] += 1
+                for i, value in enumerate(row[1:6]):
+                    offset = 1 + 3 * i
+                    if value < aggregate[offset]:
+                        aggregate[offset] = value
+                    if value > aggregate[offset + 1]:
+                        aggregate[offset + 1] = value
+                    aggregate[offset + 2] += value
+                aggregate[16] += bool(row[7])
+                if row[6] > aggregate[17]:
+                    aggregate[17] = row[6]
+            if buckets:
+                conn.executemany(self._sql[resolution],
+                                 [(machine_id, bucket, *aggregate)
+                                  for (machine_id, bucket), aggregate in buckets.items()])
+
+
+def choose_resolution(start, end, max_points, resolutions=RESOLUTIONS):
+    """Choisit la table d'agrégats et la largeur des points pour une plage donnée.
+
+    On prend la résolution la plus grossière dont les buckets restent plus fins
+    que la largeur idéale, puis on regroupe k buckets par point pour ne jamais
+    dépasser max_points (un point de marge pour l'alignement des buckets).
+    """
+    ideal = max(end - start, 1) / max(max_points - 1, 1)
+    resolution, width = resolutions[0]
+    for name, candidate in resolutions:
+        if candidate <= ideal:
+            resolution, width = name, candidate
+    step = max(1, math.ceil(ideal / width)) * width
+    return resolution, step
+
+
+def query_rollup(cursor, machine_id, start, end, max_points=500):
+    """Série agrégée d'une machine sur [start, end], au plus max_points points"""
+    resolution, step = choose_resolution(start, end, max_points)
+    mins = ", ".join(f"min({sensor}_min)" for sensor in SENSOR_COLUMNS)
+    maxs = ", ".join(f"max({sensor}_max)" for sensor in SENSOR_COLUMNS)
+    sums = ", ".join(f"sum({sensor}_sum)" for sensor in SENSOR_COLUMNS)
+    cursor.execute(f'''
+        SELECT CAST(bucket / {step} AS INTEGER) * {step} AS point, sum(count), {mins}, {maxs}, {sums},
+               sum(fault_count), max(max_fault_probability)
+        FROM {rollup_table(resolution)}
+        WHERE machine_id = ? AND bucket >= ? AND bucket <= ?
+        GROUP BY point
+        ORDER BY point
+    ''', (machine_id, math.floor(start / step) * step, end))
+    n = len(SENSOR_COLUMNS)
+    points = [
+        {
+            "timestamp": row[0],
+            "count": row[1],
+            "min": list(row[2:2 + n]),
+            "max": list(row[2 + n:2 + 2 * n]),
+            "mean": [total / row[1] for total in row[2 + 2 * n:2 + 3 * n]],
+            "fault_count": row[2 + 3 * n],
+            "max_fault_probability": row[3 + 3 * n]
+        }
+        for row in cursor.fetchall()
+    ]
+    return resolution, step, points
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Reconstruit les tables d'agrégats de l'historique")
+    parser.add_argument("--db", default="history.db")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    started = time.perf_counter()
+    with conn:
+        init_rollup_tables(conn)
+        rebuild_rollups(conn)
+    logger.info(f"Agrégats reconstruits en {time.perf_counter() - started:.1f} s")
+    conn.close()
@@ -0,0 +1,235 @@
+import logging
+import queue
+import sqlite3
+import time
+from threading import Thread, Event
+
+from batch_inference import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+INSERT_HISTORY_SQL = '''
+    INSERT INTO machine_history (
+        timestamp, vibration, temperature, pressure, rms, mean_temp,
+        fault_probability, is_fault, model_status, machine_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Séquences du journal de lectures dont la ligne est commitée (même transaction
+# que la ligne): la reprise ne rejoue pas une lecture déjà en base
+SPOOL_COMMITS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS history_spool_commits (seq INTEGER PRIMARY KEY) WITHOUT ROWID
+'''
+INSERT_SPOOL_COMMIT_SQL = "INSERT OR IGNORE INTO history_spool_commits (seq) VALUES (?)"
+SPOOL_COMMIT_EXISTS_SQL = "SELECT 1 FROM history_spool_commits WHERE seq = ?"
+
+
+class HistoryWriter:
+    """Écriture de l'historique par lots dans un thread dédié.
+
+    Le thread possède une unique connexion SQLite en mode WAL. Les lignes sont
+    mises en file par write() puis insérées avec executemany, un commit par lot
+    (au plus ``batch_size`` lignes ou toutes les ``flush_interval`` secondes).
+    Quand la file est pleine, write() attend au plus ``put_timeout`` secondes
+    puis abandonne la ligne et incrémente le compteur ``dropped``. Si
+    ``rollups`` est fourni, ses agrégats sont mis à jour dans la même
+    transaction que chaque lot.
+
+    Si ``spool`` (ReadingSpool) est fourni, chaque lot commité y est signalé
+    et, toutes les ``replay_interval`` secondes, les lectures journalisées
+    restées sans ligne d'historique (échec d'insertion, ligne abandonnée,
+    arrêt brutal) sont rejouées par lots. Une ligne peut alors porter en 11e
+    élément la séquence de sa lecture, enregistrée dans
+    ``history_spool_commits`` avec la ligne: une lecture dont la séquence y
+    figure déjà, ou dont la ligne est encore en file, n'est pas rejouée.
+    """
+
+    def __init__(self, db_path, batch_size=500, flush_interval=0.5,
+                 max_queue_size=10000, put_timeout=0.05, rollups=None,
+                 spool=None, replay_interval=5.0):
+        self.db_path = db_path
+        self.rollups = rollups
+        self.spool = spool
+        self.replay_interval = replay_interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop_event = Event()
+        self._thread = None
+        self._prune_below = None
+        # Séquences des lignes en file: écrites par la file, pas par la reprise
+        self._queued_seqs = set()
+
+        # Compteurs exposés pour le monitoring
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.replayed = 0
+        # Durée de la transaction de chaque lot (sensible aux verrous en base)
+        self.batch_time = LatencyStats()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def write(self, row):
+        """Met une ligne en file; retourne False si elle a été abandonnée"""
+        seq = row[10] if len(row) > 10 else None
+        if seq is not None:
+            self._queued_seqs.add(seq)
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            self._queued_seqs.discard(seq)
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"File d'écriture de l'historique pleine, {self.dropped} lignes abandonnées")
+            return False
+
+    def queue_size(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """Attend que toutes les lignes en file soient écrites"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def stop(self, timeout=10):
+        """Écrit les lignes restantes puis ferme la connexion"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # En WAL, NORMAL évite un fsync à chaque commit tout en restant cohérent
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        if self.spool is not None:
+            with conn:
+                conn.execute(SPOOL_COMMITS_TABLE_SQL)
+        return conn
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+            # Prendre sans attendre tout ce qui est déjà disponible
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+        return batch
+
+    def _write_batch(self, conn, batch, queued=True):
+        """Insère un lot dans une transaction; retourne True s'il a été commité"""
+        started = time.perf_counter()
+        try:
+            with conn:
+                if self.spool is None:
+                    conn.executemany(INSERT_HISTORY_SQL, batch)
+                else:
+                    conn.executemany(INSERT_HISTORY_SQL, (row[:10] for row in batch))
+                    conn.executemany(INSERT_SPOOL_COMMIT_SQL,
+                                     [(row[10],) for row in batch if len(row) > 10 and row[10] is not None])
+                if self.rollups is not None:
+                    self.rollups.apply(conn, batch)
+            self.batch_time.record(time.perf_counter() - started)
+            self.written += len(batch)
+            self.batches += 1
+            logger.debug(f"{len(batch)} lignes insérées dans l'historique")
+            if self.spool is not None and queued:
+                self.spool.committed(batch)
+            return True
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Erreur lors de l'insertion en base: {e}")
+            return False
+        finally:
+            if queued:
+                # Commitées ou abandonnées: une lecture en échec est rejouée
+                for row in batch:
+                    if len(row) > 10:
+                        self._queued_seqs.discard(row[10])
+                    self._queue.task_done()
+
+    def _replay(self, conn, max_batches=10):
+        # Lots limités par passage: les lignes en file ne sont pas retardées
+        for _ in range(max_batches):
+            try:
+                rows = self.spool.replay_rows(self.batch_size)
+                # Lignes encore en file (base longtemps indisponible): écrites
+                # par la file, qui les signale au journal une fois commitées
+                rows = [row for row in (rows or []) if row[10] not in self._queued_seqs]
+                if not rows:
+                    return
+                # Lignes commitées juste avant un arrêt brutal (point de reprise
+                # non écrit)
+                fresh = [row for row in rows
+                         if conn.execute(SPOOL_COMMIT_EXISTS_SQL, (row[10],)).fetchone() is None]
+            except Exception as e:
+                logger.error(f"Erreur lors de la reprise du journal de lectures: {e}")
+                return
+            if fresh and not self._write_batch(conn, fresh, queued=False):
+                return
+            self.replayed += len(fresh)
+            self.spool.replay_done(rows)
+            logger.info(f"{len(fresh)} lectures rejouées depuis le journal ({len(rows) - len(fresh)} déjà en base)")
+
+    def _prune_spool_commits(self, conn):
+        # Séquences antérieures au point de reprise relevé au passage précédent
+        # (donc déjà synchronisé sur disque): plus jamais rejouées
+        try:
+            if self._prune_below is not None:
+                with conn:
+                    conn.execute("DELETE FROM history_spool_commits WHERE seq < ?", (self._prune_below,))
+            self._prune_below = self.spool.checkpoint_seq()
+        except Exception as e:
+            logger.error(f"Erreur lors de la purge des séquences du journal: {e}")
+
+    def _run(self):
+        conn = self._connect()
+        next_replay = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                batch = self._next_batch()
+                if batch:
+                    self._write_batch(conn, batch)
+                if self.spool is not None and time.monotonic() >= next_replay:
+                    self._replay(conn)
+                    self._prune_spool_commits(conn)
+                    next_replay = time.monotonic() + self.replay_interval
+
+            # Arrêt propre: vider la file
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    break
+                self._write_batch(conn, batch)
+        finally:
+            conn.close()
@@ -0,0 +1,148 @@
+import logging
+import multiprocessing
+import queue
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_inference import BatchInferenceEngine, LatencyStats
+
+logger = logging.getLogger(__name__)
+
+
+def _predict_in_worker(X):
+    # Exécuté dans un processus du pool: le modèle est chargé une fois par processus
+    from ml_service import predict_machine_fault_batch
+    return predict_machine_fault_batch(X)
+
+
+class IngestPipeline:
+    """Pipeline d'ingestion en étapes: décodage -> inférence -> application du résultat.
+
+    Le thread MQTT ne fait que décoder et appeler submit(). Chaque machine est
+    rattachée à une partition (hachage de son identifiant); une partition est
+    un BatchInferenceEngine avec sa propre file bornée et son worker, qui
+    applique ensuite les résultats via ``sink(machine_id, params, timestamp,
+    prediction, spool_seq)`` dans l'ordre de réception.
+    L'ordre est donc garanti par machine. Avec ``executor="process"``,
+    l'inférence des partitions est déléguée à un pool de processus.
+
+    Si ``features`` est fourni (StreamingFeatures), le modèle reçoit les
+    caractéristiques glissantes calculées à la soumission; submit() doit alors
+    être appelé dans l'ordre d'arrivée de chaque machine (thread MQTT). Une
+    lecture n'y entre que si la file de sa partition a de la place: une
+    lecture abandonnée ne fausse pas les fenêtres des suivantes.
+
+    submit() n'attend jamais (``submit_timeout=0``): quand la file d'une
+    partition est pleine, la lecture est abandonnée et comptée dans
+    ``dropped`` sans bloquer le thread réseau paho (keepalive, autres
+    partitions); le journal de lectures la rejoue ensuite dans l'historique.
+    """
+
+    def __init__(self, predict_fn, sink, workers=2, executor="thread", max_batch_size=64,
+                 max_delay=0.005, max_queue_size=10000, submit_timeout=0, features=None):
+        self.sink = sink
+        self.features = features
+        self.executor = executor
+        self.submit_timeout = submit_timeout
+        self._process_pool = None
+
+        if executor == "process":
+            # spawn: pas de fork d'un processus qui a déjà des threads actifs
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            predict_fn = self._predict_in_pool
+        elif executor != "thread":
+            raise ValueError(f"Exécuteur inconnu: {executor}")
+
+        queue_size = max(1, max_queue_size // workers)
+        self.partitions = [
+            BatchInferenceEngine(predict_fn, max_batch_size=max_batch_size, max_delay=max_delay,
+                                 max_queue_size=queue_size, name=f"ingest-worker-{i}")
+            for i in range(workers)
+        ]
+
+        # Métriques
+        self.submitted = 0
+        self.dropped = 0
+        self.sink_time = LatencyStats()
+        self.end_to_end = LatencyStats()
+
+    def _predict_in_pool(self, X):
+        return self._process_pool.submit(_predict_in_worker, X).result()
+
+    def _partition(self, machine_id):
+        return self.partitions[zlib.crc32(machine_id.encode("utf-8")) % len(self.partitions)]
+
+    def submit(self, machine_id, params, timestamp, spool_seq=None):
+        """Met une lecture en file d'inférence; retourne False si elle a été abandonnée"""
+        received = time.perf_counter()
+        partition = self._partition(machine_id)
+        if self.features is None:
+            model_input = params
+        elif partition.full():
+            # Un seul thread soumet: la place libre constatée ici le reste jusqu'à la mise en file
+            return self._drop()
+        else:
+            model_input = self.features.update(machine_id, params)
+        try:
+            partition.submit(
+                model_input,
+                timeout=self.submit_timeout,
+                callback=lambda future: self._complete(machine_id, params, timestamp, spool_seq, received, future)
+            )
+        except queue.Full:
+            return self._drop()
+        self.submitted += 1
+        return True
+
+    def _drop(self):
+        self.dropped += 1
+        if self.dropped % 1000 == 1:
+            logger.warning(f"File d'inférence pleine, {self.dropped} messages abandonnés")
+        return False
+
+    def _complete(self, machine_id, params, timestamp, spool_seq, received, future):
+        started = time.perf_counter()
+        try:
+            prediction = future.result()
+            self.sink(machine_id, params, timestamp, prediction, spool_seq)
+        except Exception as e:
+            logger.error(f"Erreur lors du traitement de la prédiction: {e}")
+        finished = time.perf_counter()
+        self.sink_time.record(finished - started)
+        self.end_to_end.record(finished - received)
+
+    @property
+    def completed(self):
+        # Compteur protégé par le verrou des statistiques de bout en bout
+        return self.end_to_end.count
+
+    def queue_depth(self):
+        return sum(partition.queue_size() for partition in self.partitions)
+
+    def metrics(self):
+        """Profondeur des files et latences par étape"""
+        return {
+            "executor": self.executor,
+            "workers": len(self.partitions),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "dropped": self.dropped,
+            "queue_depth": self.queue_depth(),
+            "queue_depth_per_worker": [partition.queue_size() for partition in self.partitions],
+            "stages": {
+                "queue_wait": LatencyStats.combined([p.queue_wait for p in self.partitions]).summary(),
+                "inference": LatencyStats.combined([p.inference_time for p in self.partitions]).summary(),
+                "sink": self.sink_time.summary(),
+                "end_to_end": self.end_to_end.summary()
+            }
+        }
+
+    def stop(self, timeout=5):
+        for partition in self.partitions:
+            partition.stop(timeout)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,86 @@
+import logging
+import queue
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Abonné SSE: une file bornée de messages déjà sérialisés"""
+
+    def __init__(self, max_queue_size):
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.closed = False
+
+
+class Broadcaster:
+    """Diffusion des instantanés de données aux clients Server-Sent Events.
+
+    Chaque publication est sérialisée une seule fois en message SSE puis
+    déposée sans bloquer dans la file de chaque abonné. Un client trop lent
+    dont la file est pleine est déconnecté plutôt que de ralentir l'appelant
+    (le thread MQTT).
+    """
+
+    def __init__(self, max_client_queue=16, heartbeat_interval=15):
+        self.max_client_queue = max_client_queue
+        self.heartbeat_interval = heartbeat_interval
+        self._lock = Lock()
+        self._subscribers = set()
+        self._last_message = None
+
+        self.published = 0
+        self.dropped_clients = 0
+
+    def subscribe(self):
+        subscription = Subscription(self.max_client_queue)
+        with self._lock:
+            self._subscribers.add(subscription)
+            # Le nouveau client reçoit immédiatement le dernier instantané
+            if self._last_message is not None:
+                subscription.queue.put_nowait(self._last_message)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, payload):
+        """Diffuse un payload JSON (str, ou bytes déjà encodés) à tous les abonnés"""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        message = b"data: " + payload + b"\n\n"
+        with self._lock:
+            self._last_message = message
+            subscribers = list(self._subscribers)
+        self.published += 1
+
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # Client trop lent: on le déconnecte
+                self.unsubscribe(subscription)
+                self.dropped_clients += 1
+                logger.warning("Client SSE trop lent déconnecté")
+
+    def stream(self, subscription):
+        """Générateur des messages SSE d'un abonné (à passer à une Response Flask)"""
+        try:
+            while not subscription.closed:
+                try:
+                    message = subscription.queue.get(timeout=self.heartbeat_interval)
+                except queue.Empty:
+                    # Commentaire SSE pour garder la connexion ouverte
+                    yield b": keepalive\n\n"
+                    continue
+                if subscription.closed:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import time
+import zlib
+from threading import Lock
+
+from live_stream import Broadcaster
+from ring_buffer import RingBuffer
+
+DEFAULT_MACHINE_ID = "default"
+
+
+def default_machine_data(connection_status="Déconnecté"):
+    """Données par défaut d'une machine qui n'a encore rien publié"""
+    return {
+        "parametres_machine": [0, 0, 0, 0, 0],
+        "timestamp": time.time(),
+        "ml_prediction": {
+            "fault_probability": 0.0,
+            "is_fault": False,
+            "model_status": "En attente des données"
+        },
+        "connection_status": connection_status,
+        "last_update": None
+    }
+
+
+class MachineState:
+    """État en mémoire d'une machine: dernières données, buffer circulaire et flux SSE"""
+
+    def __init__(self, machine_id, buffer_size=100, stats_windows=(10,)):
+        self.machine_id = machine_id
+        self.lock = Lock()
+        self.latest_data = default_machine_data()
+        self.latest_data["machine_id"] = machine_id
+        self.data_buffer = RingBuffer(buffer_size, windows=stats_windows)
+        self.broadcaster = Broadcaster()
+        # Instantané sérialisé (JSON, ETag), recalculé une seule fois par version
+        self.version = 0
+        self._payload = None
+
+    def update(self, params, timestamp, prediction, last_update):
+        """Enregistre une nouvelle lecture et retourne une copie de l'instantané"""
+        with self.lock:
+            self.latest_data.update({
+                "parametres_machine": params,
+                "timestamp": timestamp,
+                "ml_prediction": prediction,
+                "connection_status": "Connecté - Données reçues",
+                "last_update": last_update
+            })
+            self.data_buffer.append(timestamp, params, prediction["fault_probability"], prediction["is_fault"])
+            self._changed()
+            return self.latest_data.copy()
+
+    def set_connection_status(self, status):
+        with self.lock:
+            self.latest_data["connection_status"] = status
+            self._changed()
+            return self.latest_data.copy()
+
+    def _changed(self):
+        # Appelé sous le verrou à chaque modification de latest_data
+        self.version += 1
+        self._payload = None
+
+    def payload(self):
+        """Instantané en JSON (bytes) et son ETag, sérialisés une fois par nouvelle lecture"""
+        with self.lock:
+            cached = self._payload
+            if cached is not None:
+                return cached
+            snapshot = self.latest_data.copy()
+            version = self.version
+        # Sérialisation hors du verrou; le résultat n'est gardé que s'il est toujours à jour
+        body = json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+        cached = (body, hashlib.blake2b(body, digest_size=8).hexdigest())
+        with self.lock:
+            if self.version == version:
+                self._payload = cached
+        return cached
+
+    def snapshot(self):
+        with self.lock:
+            return self.latest_data.copy()
+
+    def buffer_size(self):
+        with self.lock:
+            return len(self.data_buffer)
+
+    def buffer_stats(self):
+        """Statistiques glissantes du buffer pour chaque fenêtre configurée"""
+        with self.lock:
+            return len(self.data_buffer), {
+                window: self.data_buffer.stats(window) for window in self.data_buffer.windows
+            }
+
+
+class MachineRegistry:
+    """Registre des machines, partitionné en shards protégés chacun par son verrou.
+
+    Le verrou d'un shard ne protège que la table machine_id -> MachineState;
+    les données d'une machine sont protégées par le verrou de son MachineState,
+    si bien que deux machines ne se bloquent jamais mutuellement.
+    """
+
+    def __init__(self, n_shards=16, buffer_size=100, stats_windows=(10,)):
+        self.buffer_size = buffer_size
+        self.stats_windows = stats_windows
+        self._shards = [({}, Lock()) for _ in range(n_shards)]
+
+    def _shard(self, machine_id):
+        return self._shards[zlib.crc32(machine_id.encode("utf-8")) % len(self._shards)]
+
+    def get(self, machine_id):
+        machines, _ = self._shard(machine_id)
+        return machines.get(machine_id)
+
+    def get_or_create(self, machine_id):
+        machines, lock = self._shard(machine_id)
+        state = machines.get(machine_id)
+        if state is None:
+            with lock:
+                state = machines.get(machine_id)
+                if state is None:
+                    state = MachineState(machine_id, self.buffer_size, self.stats_windows)
+                    machines[machine_id] = state
+        return state
+
+    def states(self):
+        result = []
+        for machines, lock in self._shards:
+            with lock:
+                result.extend(machines.values())
+        return result
+
+    def __len__(self):
+        return sum(len(machines) for machines, _ in self._shards)
@@ -0,0 +1,169 @@
+import logging
+import math
+import time
+from bisect import bisect_left
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes de latence (secondes), de 10 µs (décodage) à 10 s
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """Compteur monotone.
+
+    Sans verrou: à n'incrémenter que depuis un seul thread (thread MQTT), comme
+    les compteurs existants du pipeline.
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """Histogramme cumulatif au format Prometheus (compteurs par borne, somme, nombre)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._lock = Lock()
+        self.buckets = tuple(buckets)
+        self._bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        # Recherche de la borne hors du verrou
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._bucket_counts[index] += 1
+            self.count += 1
+            self.total += value
+
+    def _merge_into(self, other):
+        # Appelé sous le verrou de self
+        for i, bucket_count in enumerate(self._bucket_counts):
+            other._bucket_counts[i] += bucket_count
+        other.count += self.count
+        other.total += self.total
+
+    def cumulative(self):
+        """[(borne, nombre d'observations <= borne)], +Inf compris, puis somme et nombre"""
+        with self._lock:
+            counts = list(self._bucket_counts)
+            count, total = self.count, self.total
+        result = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            running += bucket_count
+            result.append((bound, running))
+        return result, total, count
+
+
+class MetricsRegistry:
+    """Métriques exposées par /metrics au format texte Prometheus.
+
+    Chaque famille est lue au moment de l'export par ``source``: un Counter ou
+    un Histogram, une fonction qui retourne une valeur (compteurs et jauges
+    déjà tenus par les composants, files d'attente...), ou une fonction qui
+    retourne une liste [(labels, valeur)]. Rien n'est calculé sur le chemin des
+    messages en dehors des Counter et Histogram eux-mêmes.
+    """
+
+    def __init__(self, namespace="diagnostic"):
+        self.namespace = namespace
+        self._families = []
+
+    def counter(self, name, help_text, source):
+        self._families.append((f"{self.namespace}_{name}", "counter", help_text, source))
+
+    def gauge(self, name, help_text, source):
+        self._families.append((f"{self.namespace}_{name}", "gauge", help_text, source))
+
+    def histogram(self, name, help_text, source):
+        self._families.append((f"{self.namespace}_{name}", "histogram", help_text, source))
+
+    @staticmethod
+    def _samples(source):
+        value = source() if callable(source) else source
+        if isinstance(value, list):
+            return value
+        return [({}, value)]
+
+    def render(self):
+        lines = []
+        for name, kind, help_text, source in self._families:
+            try:
+                samples = self._samples(source)
+            except Exception as e:
+                logger.error(f"Métrique {name} illisible: {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind == "histogram":
+                    buckets, total, count = value.cumulative()
+                    for bound, bucket_count in buckets:
+                        le = "+Inf" if bound == math.inf else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(labels, le=le)} {bucket_count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+                else:
+                    if isinstance(value, Counter):
+                        value = value.value
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+               for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class RateLimitedLog:
+    """Journal limité à un message par clé et par ``interval`` secondes.
+
+    Remplace la journalisation à chaque message MQTT: les messages d'une même
+    clé (machine, type d'erreur...) reçus pendant l'intervalle sont comptés et
+    ce nombre est ajouté au message suivant. Le formatage (style %) n'a lieu
+    que pour les messages effectivement écrits. Une clé donnée ne doit être
+    utilisée que depuis un seul thread.
+    """
+
+    def __init__(self, logger, interval=60.0):
+        self.logger = logger
+        self.interval = interval
+        self._entries = {}
+
+    def log(self, key, level, msg, *args):
+        """Écrit le message si l'intervalle de la clé est écoulé; retourne True s'il a été écrit"""
+        if not self.logger.isEnabledFor(level):
+            return False
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[0] < self.interval:
+            entry[1] += 1
+            return False
+        if entry is not None and entry[1]:
+            msg += " (%d messages similaires depuis %.0f s)"
+            args += (entry[1], now - entry[0])
+        self._entries[key] = [now, 0]
+        self.logger.log(level, msg, *args)
+        return True
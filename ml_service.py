@@ -1,61 +1,432 @@
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import Pipeline
-import joblib
 import os
+import queue
+import time
+import warnings
+from threading import Thread, Lock, Event
+from compiled_model import CompiledForest
+from prediction_cache import PredictionCache, parse_resolution
+from streaming_features import PARAM_NAMES, load_feature_config
+from model_registry import ModelRegistry
+
+# The pipeline was fitted on a DataFrame; inference uses plain arrays in the same column order
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+# Model artifact: a joblib pipeline (.pkl) or a compiled flat forest (.npz)
+MODEL_PATH = os.environ.get("DIAGNOSTIC_MODEL_PATH", "diagnostic_model.pkl")
+# Optional memory-mapping of the model arrays ("r") so that worker processes share its pages
+MODEL_MMAP_MODE = os.environ.get("DIAGNOSTIC_MODEL_MMAP") or None
+# How long ingestion waits for a model that is still loading
+MODEL_LOAD_TIMEOUT = 60
+# Delay before a failed model load is attempted again (the service is not ready meanwhile)
+MODEL_LOAD_RETRY_INTERVAL = 5.0
+# Optional LRU cache of predictions keyed on the input quantized to DIAGNOSTIC_CACHE_RESOLUTION
+# (one step, or one per feature); 0 disables it
+PREDICTION_CACHE_SIZE = int(os.environ.get("DIAGNOSTIC_CACHE_SIZE", 0))
+PREDICTION_CACHE_RESOLUTION = parse_resolution(os.environ.get("DIAGNOSTIC_CACHE_RESOLUTION", "1"))
+# How often the model file (or the registry's active version) is checked for changes;
+# a change clears the prediction cache and reloads the model in the background
+MODEL_CHECK_INTERVAL = 1.0
+# Optional versioned model registry (see model_registry): its active version replaces MODEL_PATH
+MODEL_REGISTRY = os.environ.get("DIAGNOSTIC_MODEL_REGISTRY") or None
+# Batches waiting to be scored by the shadow model; further batches are skipped (and counted)
+SHADOW_QUEUE_SIZE = 16
+# Recent input rows kept to warm up a newly loaded model before it is swapped in
+WARM_UP_ROWS = 64
+
+def _file_signature(path):
+    # A new file or a rewrite changes it
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+class LoadedModel:
+    """A loaded artifact and what identifies it; a reload replaces the whole object"""
+
+    def __init__(self, model, path, version=None, signature=None, feature_config=None):
+        self.model = model
+        self.path = path
+        self.version = version
+        self.signature = signature
+        self.feature_config = feature_config
+        self.loaded_at = time.time()
+        # Set when the model runs in shadow mode next to the served one
+        self.shadow_stats = None
+
+    def describe(self):
+        return {"version": self.version, "path": self.path, "loaded_at": self.loaded_at}
+
+class ShadowStats:
+    """How often a shadow model disagrees with the served one, on the same batches"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.rows = 0
+        self.skipped_rows = 0
+        self.disagreements = 0
+        self.probability_delta_sum = 0.0
+        self.max_probability_delta = 0.0
+
+    def record(self, classes, shadow_classes, probabilities, shadow_probabilities):
+        deltas = np.abs(np.asarray(probabilities) - np.asarray(shadow_probabilities))
+        disagreements = int(np.count_nonzero(np.asarray(classes) != np.asarray(shadow_classes)))
+        with self._lock:
+            self.rows += len(deltas)
+            self.disagreements += disagreements
+            self.probability_delta_sum += float(deltas.sum())
+            self.max_probability_delta = max(self.max_probability_delta, float(deltas.max(initial=0.0)))
+
+    def record_skipped(self, n_rows):
+        with self._lock:
+            self.skipped_rows += n_rows
+
+    def summary(self):
+        return {
+            "rows": self.rows,
+            "skipped_rows": self.skipped_rows,
+            "disagreements": self.disagreements,
+            "disagreement_rate": self.disagreements / self.rows if self.rows else 0.0,
+            "mean_probability_delta": self.probability_delta_sum / self.rows if self.rows else 0.0,
+            "max_probability_delta": self.max_probability_delta
+        }
 
 class MLDiagnosticService:
-    def __init__(self, model_path="diagnostic_model.pkl"):
+    def __init__(self, model_path="diagnostic_model.pkl", lazy=False, mmap_mode=None, cache=None, registry=None):
         # Initialize model path and feature names
         self.model_path = model_path
-        self.model = None
-        self.feature_names = ["Vibration", "Temperature", "Pressure", "RMS", "Mean Temp"]
+        self.mmap_mode = mmap_mode
+        self.registry = registry
+        # Served model (LoadedModel); inference reads this reference once per batch, without a lock
+        self.active = None
+        # Optional candidate scored next to the served model without serving its predictions,
+        # by a background thread so that it never delays the served batches
+        self.shadow = None
+        self._shadow_queue = queue.Queue(maxsize=SHADOW_QUEUE_SIZE)
+        self._shadow_thread = None
+        self.cache = cache
+        self._model_signature = None
+        self._next_model_check = 0.0
+        self._last_inputs = None
+        self._reload_lock = Lock()
+        self.reloads = 0
+        self.last_reload_error = None
+        # Extended models take rolling features computed upstream (see streaming_features)
+        self.feature_config = load_feature_config(self.resolve_model_path()[0])
+        self.feature_names = self.feature_config.feature_names() if self.feature_config else list(PARAM_NAMES)
         self.is_trained = False
-        # Load or create model
-        self.load_or_train_model()
+        self.status = "Not loaded"
+        self._load_lock = Lock()
+        # Set once a model is actually loaded; a failed load is retried later
+        self._loaded = Event()
+        self.load_error = None
+        self._next_load_attempt = 0.0
+        # Load or create model now, or on first use / warm_up() when lazy
+        if not lazy:
+            self.ensure_loaded()
+
+    @property
+    def model(self):
+        active = self.active
+        return active.model if active is not None else None
+
+    def ensure_loaded(self, timeout=None):
+        # Load the model if needed; wait for a background load already in progress.
+        # After a failure, callers get False without waiting until the next attempt is due
+        if self._loaded.is_set():
+            return True
+        if time.monotonic() < self._next_load_attempt:
+            return False
+        if self._load_lock.acquire(timeout=-1 if timeout is None else timeout):
+            try:
+                if not self._loaded.is_set() and time.monotonic() >= self._next_load_attempt:
+                    self.status = "Loading"
+                    try:
+                        self.load_or_train_model()
+                        self.status = "Active"
+                        self.load_error = None
+                        self._loaded.set()
+                    except Exception as e:
+                        self.status = f"Error: {e}"
+                        self.load_error = str(e)
+                        self._next_load_attempt = time.monotonic() + MODEL_LOAD_RETRY_INTERVAL
+                        print(f"Model loading failed, retrying in {MODEL_LOAD_RETRY_INTERVAL:g} s: {e}")
+            finally:
+                self._load_lock.release()
+        return self._loaded.is_set()
+
+    def is_ready(self):
+        return self._loaded.is_set()
+
+    def warm_up(self):
+        # Load the model in a background thread so that callers are not blocked;
+        # a failed load is retried there until a model is loaded
+        if not self._loaded.is_set():
+            self.status = "Loading"
+            Thread(target=self._load_until_ready, name="model-warm-up", daemon=True).start()
+
+    def _load_until_ready(self):
+        while not self.ensure_loaded():
+            time.sleep(max(self._next_load_attempt - time.monotonic(), 0.1))
+
+    def resolve_model_path(self, version=None):
+        # Artifact of the requested (or active) registry version, else the configured path
+        if self.registry is not None:
+            version = version or self.registry.active_version()
+            if version:
+                return self.registry.artifact_path(version), version
+        elif version:
+            raise ValueError("Model versions require a registry (DIAGNOSTIC_MODEL_REGISTRY)")
+        return self.model_path, None
+
+    def model_file_signature(self):
+        # Identifies the artifact on disk, and the registry's active version when there is one
+        signatures = []
+        if self.registry is not None:
+            signatures.append(_file_signature(self.registry.active_file))
+        try:
+            signatures.append(_file_signature(self.resolve_model_path()[0]))
+        except (KeyError, OSError, ValueError):
+            signatures.append(None)
+        return tuple(signatures)
+
+    def check_model_file(self):
+        # Cached predictions belong to the loaded artifact: drop them when the file changes,
+        # then load the new artifact in the background (the current one keeps serving meanwhile)
+        now = time.monotonic()
+        if now < self._next_model_check:
+            return False
+        self._next_model_check = now + MODEL_CHECK_INTERVAL
+        signature = self.model_file_signature()
+        if signature == self._model_signature:
+            return False
+        self._model_signature = signature
+        if self.cache is not None:
+            self.cache.clear()
+        print("Model file changed, reloading in the background")
+        self.reload_async()
+        return True
+
+    def _load_artifact(self, path, version=None):
+        # Taken before reading: a rewrite during the load is seen by the next check
+        signature = _file_signature(path)
+        if path.endswith(".npz"):
+            # Compiled artifacts are loaded without joblib
+            model = CompiledForest.load(path, mmap=self.mmap_mode is not None)
+        else:
+            import joblib
+            model = joblib.load(path, mmap_mode=self.mmap_mode)
+        return LoadedModel(model, path, version, signature, load_feature_config(path))
 
     def load_or_train_model(self):
+        self._model_signature = self.model_file_signature()
+        path, version = self.resolve_model_path()
         # Check if model exists
-        if os.path.exists(self.model_path):
-            # Load existing model
-            self.model = joblib.load(self.model_path)
+        if os.path.exists(path):
+            self.active = self._load_artifact(path, version)
             self.is_trained = True
-            print("Loaded model")
+            print(f"Loaded model {version}" if version else "Loaded model")
         else:
+            # Training dependencies are only imported when no model exists
+            import joblib
+            from sklearn.ensemble import RandomForestClassifier
+            from sklearn.preprocessing import StandardScaler
+            from sklearn.pipeline import Pipeline
+            from compiled_model import compile_pipeline
+
             # Create and train a simple model with dummy data
             X_dummy = np.random.rand(100, 5) * 100  # 100 samples, 5 features
             y_dummy = np.random.choice([0, 1], 100)  # Random 0 (normal) or 1 (fault)
-            self.model = Pipeline([
+            model = Pipeline([
                 ("scaler", StandardScaler()),  # Standardize data
                 ("classifier", RandomForestClassifier(n_estimators=10, random_state=42))
             ])
-            self.model.fit(X_dummy, y_dummy)
+            model.fit(X_dummy, y_dummy)
+            if self.is_compiled():
+                model = compile_pipeline(model)
+                model.save(self.model_path)  # Save compiled model
+            else:
+                joblib.dump(model, self.model_path)  # Save model
+            self.active = LoadedModel(model, self.model_path, signature=_file_signature(self.model_path))
             self.is_trained = True
-            joblib.dump(self.model, self.model_path)  # Save model
+            self._model_signature = self.model_file_signature()
             print("Trained and saved new model")
 
+    def reload(self, version=None, shadow=False):
+        """Load a model (a registry version, or the configured file), warm it up and swap it in.
+
+        With shadow=True the candidate is only scored next to the served model
+        (see promote_shadow). Returns the loaded model, or None if the load failed;
+        on failure the current model keeps serving.
+        """
+        with self._reload_lock:
+            try:
+                path, version = self.resolve_model_path(version)
+                active = self.active
+                if (not shadow and active is not None and active.path == path
+                        and active.signature == _file_signature(path)):
+                    return active  # already serving this artifact
+                candidate = self._load_artifact(path, version)
+                self._validate(candidate)
+                self._warm(candidate)
+                if shadow:
+                    candidate.shadow_stats = ShadowStats()
+                    self._start_shadow_worker()
+                    self.shadow = candidate
+                    print(f"Shadowing model {version or path}")
+                else:
+                    self._swap(candidate)
+                self.reloads += 1
+                self.last_reload_error = None
+                return candidate
+            except Exception as e:
+                self.last_reload_error = str(e)
+                print(f"Model reload failed, keeping the current model: {e}")
+                return None
+
+    def reload_async(self, version=None, shadow=False):
+        Thread(target=self.reload, kwargs={"version": version, "shadow": shadow},
+               name="model-reload", daemon=True).start()
+
+    def promote_shadow(self):
+        # Serve the shadow model; returns it, or None when there is none
+        with self._reload_lock:
+            candidate = self.shadow
+            if candidate is not None:
+                self._swap(candidate)
+            return candidate
+
+    def discard_shadow(self):
+        self.shadow = None
+
+    def _start_shadow_worker(self):
+        if self._shadow_thread is None:
+            self._shadow_thread = Thread(target=self._shadow_loop, name="model-shadow", daemon=True)
+            self._shadow_thread.start()
+
+    def _shadow_loop(self):
+        while True:
+            shadow, X, result = self._shadow_queue.get()
+            if self.shadow is shadow:
+                self._compare_shadow(shadow, X, result)
+
+    def _validate(self, candidate):
+        # The ingestion pipeline computes the inputs of the current feature set only
+        names = candidate.feature_config.feature_names() if candidate.feature_config else list(PARAM_NAMES)
+        if names != self.feature_names:
+            raise ValueError(f"{candidate.path} expects {len(names)} features instead of "
+                             f"{len(self.feature_names)}; restart the service to change the feature set")
+        n_features = getattr(candidate.model, "n_features_in_", len(names))
+        if n_features != len(names):
+            raise ValueError(f"{candidate.path} was fitted on {n_features} features, expected {len(names)}")
+
+    def _warm(self, candidate):
+        # Score recent live rows so that the first batches after the swap are not slower
+        X = self._last_inputs
+        if X is None:
+            X = np.zeros((1, len(self.feature_names)))
+        probabilities = candidate.model.predict_proba(X)
+        if probabilities.shape != (len(X), len(candidate.model.classes_)) or probabilities.shape[1] < 2:
+            raise ValueError(f"{candidate.path} returned probabilities of shape {probabilities.shape}")
+
+    def _swap(self, candidate):
+        # A single reference assignment: batches in flight finish on the previous model
+        self.active = candidate
+        if self.shadow is candidate:
+            self.shadow = None
+        if self.cache is not None:
+            self.cache.clear()
+        print(f"Serving model {candidate.version or candidate.path}")
+
+    def model_info(self):
+        active, shadow = self.active, self.shadow
+        return {
+            "active": active.describe() if active else None,
+            "shadow": dict(shadow.describe(), **shadow.shadow_stats.summary()) if shadow else None,
+            "reloads": self.reloads,
+            "last_reload_error": self.last_reload_error,
+            "load_error": self.load_error,
+            "registry": self.registry.root if self.registry else None
+        }
+
+    def is_compiled(self):
+        # Compiled flat forests are stored as .npz archives
+        return self.model_path.endswith(".npz")
+
     def predict_fault(self, params):
         # Predict fault for given parameters
+        return self.predict_batch(np.array(params).reshape(1, -1))[0]
+
+    def score_batch(self, X):
+        # Vectorized scoring: probability of class 1 (fault) and predicted class per row,
+        # served from the prediction cache when one is configured
+        self.check_model_file()
+        self._last_inputs = X[-WARM_UP_ROWS:]
+        model = self.active.model
+        if self.cache is None:
+            result = self._score(model, X)
+        else:
+            # Cached predictions of this model only, even if a reload swaps it meanwhile
+            result = self.cache.score(X, lambda rows: self._score(model, rows), model)
+        shadow = self.shadow
+        if shadow is not None:
+            try:
+                self._shadow_queue.put_nowait((shadow, X, result))
+            except queue.Full:
+                shadow.shadow_stats.record_skipped(len(X))
+        return result
+
+    @staticmethod
+    def _score(model, X):
+        # A single predict_proba pass: the predicted class is its argmax,
+        # which is exactly what Pipeline.predict would compute again
+        probabilities = model.predict_proba(X)
+        return probabilities[:, 1], model.classes_[probabilities.argmax(axis=1)]
+
+    def _compare_shadow(self, shadow, X, result):
+        # The shadow model never affects the served predictions, even if it fails
+        try:
+            shadow_probabilities, shadow_classes = self._score(shadow.model, X)
+            shadow.shadow_stats.record(result[1], shadow_classes, result[0], shadow_probabilities)
+        except Exception as e:
+            print(f"Shadow model failed, shadow mode stopped: {e}")
+            if self.shadow is shadow:
+                self.shadow = None
+
+    def predict_batch(self, X):
+        # Predict faults for a batch of parameter vectors (n_samples x 5)
+        X = np.asarray(X, dtype=float).reshape(-1, len(self.feature_names))
         if not self.is_trained:
-            return {"fault_probability": 0.0, "is_fault": False, "model_status": "Not trained"}
-        
-        # Convert parameters to numpy array
-        X = np.array(params).reshape(1, -1)
-        # Predict fault (0 or 1)
-        prediction = self.model.predict(X)[0]
-        # Get probability of fault
-        probability = self.model.predict_proba(X)[0][1]  # Probability of class 1 (fault)
-        
-        return {
-            "fault_probability": float(probability),
-            "is_fault": bool(prediction),
-            "model_status": "Active"
-        }
+            status = "Loading" if self.status == "Loading" else "Not trained"
+            return [{"fault_probability": 0.0, "is_fault": False, "model_status": status}
+                    for _ in range(len(X))]
 
-# Create global ML service instance
-ml_service = MLDiagnosticService()
+        fault_probabilities, predictions = self.score_batch(X)
+        return [
+            {
+                "fault_probability": float(probability),
+                "is_fault": bool(prediction),
+                "model_status": "Active"
+            }
+            for probability, prediction in zip(fault_probabilities, predictions)
+        ]
+
+# Global ML service instance, loaded on first use or by warm_up()
+ml_service = MLDiagnosticService(
+    MODEL_PATH,
+    lazy=True,
+    mmap_mode=MODEL_MMAP_MODE,
+    registry=ModelRegistry(MODEL_REGISTRY) if MODEL_REGISTRY else None,
+    cache=PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_RESOLUTION) if PREDICTION_CACHE_SIZE > 0 else None
+)
 
 def predict_machine_fault(params):
     # Utility function to make predictions
-    return ml_service.predict_fault(params)
\ No newline at end of file
+    ml_service.ensure_loaded(timeout=MODEL_LOAD_TIMEOUT)
+    return ml_service.predict_fault(params)
+
+def predict_machine_fault_batch(X):
+    # Utility function to make predictions for a batch of parameter vectors
+    ml_service.ensure_loaded(timeout=MODEL_LOAD_TIMEOUT)
+    return ml_service.predict_batch(X)
@@ -0,0 +1,154 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from streaming_features import feature_config_path
+
+METADATA_FILE = "metadata.json"
+ACTIVE_FILE = "ACTIVE"
+
+
+def _write_atomic(path, text):
+    # Readers (other processes watching the registry) never see a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Directory of versioned model artifacts.
+
+    Layout::
+
+        <root>/ACTIVE                   name of the active version
+        <root>/<version>/model.pkl      artifact (.pkl pipeline or compiled .npz)
+        <root>/<version>/model.features.json   optional rolling feature config
+        <root>/<version>/metadata.json  version, artifact, sha256, created_at, description
+
+    Versions are never modified once registered; activating one only rewrites
+    ACTIVE, which the ML service watches.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    @property
+    def active_file(self):
+        return os.path.join(self.root, ACTIVE_FILE)
+
+    def versions(self):
+        """Metadata of every registered version, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name, METADATA_FILE)
+            if os.path.exists(path):
+                with open(path) as f:
+                    found.append(json.load(f))
+        return sorted(found, key=lambda metadata: metadata["created_at"])
+
+    def metadata(self, version):
+        path = os.path.join(self.root, version, METADATA_FILE)
+        if not os.path.exists(path):
+            raise KeyError(f"Unknown model version: {version}")
+        with open(path) as f:
+            return json.load(f)
+
+    def artifact_path(self, version):
+        return os.path.join(self.root, version, self.metadata(version)["artifact"])
+
+    def active_version(self):
+        try:
+            with open(self.active_file) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def activate(self, version):
+        self.metadata(version)  # unknown versions are rejected before ACTIVE changes
+        _write_atomic(self.active_file, version + "\n")
+
+    def next_version(self):
+        numbers = [int(name[1:]) for name in os.listdir(self.root)
+                   if name.startswith("v") and name[1:].isdigit()] if os.path.isdir(self.root) else []
+        return f"v{max(numbers, default=0) + 1}"
+
+    def register(self, artifact, version=None, description="", activate=False):
+        """Copy an artifact (and its feature config sidecar) into a new version directory"""
+        os.makedirs(self.root, exist_ok=True)
+        version = version or self.next_version()
+        target_dir = os.path.join(self.root, version)
+        if os.path.exists(target_dir):
+            raise ValueError(f"Model version already exists: {version}")
+
+        # Build the version next to its final place, then rename it in one step
+        staging_dir = os.path.join(self.root, f".{version}.staging")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+        name = "model" + os.path.splitext(artifact)[1]
+        shutil.copyfile(artifact, os.path.join(staging_dir, name))
+        if os.path.exists(feature_config_path(artifact)):
+            shutil.copyfile(feature_config_path(artifact), feature_config_path(os.path.join(staging_dir, name)))
+        metadata = {
+            "version": version,
+            "artifact": name,
+            "sha256": _sha256(artifact),
+            "size": os.path.getsize(artifact),
+            "source": os.path.abspath(artifact),
+            "created_at": time.time(),
+            "description": description
+        }
+        _write_atomic(os.path.join(staging_dir, METADATA_FILE), json.dumps(metadata, indent=2))
+        os.rename(staging_dir, target_dir)
+        if activate:
+            self.activate(version)
+        return metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry")
+    parser.add_argument("--registry", default=os.environ.get("DIAGNOSTIC_MODEL_REGISTRY") or "models")
+    commands = parser.add_subparsers(dest="command", required=True)
+    register = commands.add_parser("register", help="add an artifact as a new version")
+    register.add_argument("artifact")
+    register.add_argument("--version")
+    register.add_argument("--description", default="")
+    register.add_argument("--activate", action="store_true")
+    activate = commands.add_parser("activate", help="make a version the active one")
+    activate.add_argument("version")
+    commands.add_parser("list", help="list registered versions")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    if args.command == "register":
+        metadata = registry.register(args.artifact, args.version, args.description, args.activate)
+        print(f"Registered {metadata['version']} ({metadata['size'] / 1e6:.1f} MB, sha256 {metadata['sha256'][:12]})"
+              + (", active" if args.activate else ""))
+    elif args.command == "activate":
+        registry.activate(args.version)
+        print(f"Active version: {args.version}")
+    else:
+        active = registry.active_version()
+        for metadata in registry.versions():
+            marker = "*" if metadata["version"] == active else " "
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(metadata["created_at"]))
+            print(f"{marker} {metadata['version']:<8} {created}  {metadata['artifact']:<10} {metadata['description']}")
+
+
+if __name__ == "__main__":
+    main()
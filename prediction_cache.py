@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+
+def parse_resolution(value):
+    """Per-feature quantization steps from "1" or "1,1,0.1,0.1,1" (environment variables)"""
+    steps = [float(step) for step in str(value).split(",") if step.strip()]
+    if not steps or any(step <= 0 for step in steps):
+        raise ValueError(f"Invalid cache resolution: {value!r}")
+    return steps[0] if len(steps) == 1 else steps
+
+
+class PredictionCache:
+    """Bounded LRU cache of (fault probability, predicted class) per quantized input.
+
+    Each row is rounded to the nearest multiple of ``resolution`` (a scalar or
+    one step per feature); rows falling on the same grid point share a cached
+    prediction. Only the misses of a batch are sent to the model, in one call.
+
+    The steps are matched to the width of X: when the model takes more features
+    than ``resolution`` lists (rolling features of an extended model after the
+    raw parameters), the extra features use ``default_resolution``, by default
+    the finest configured step.
+
+    Entries remember the model that scored them (``model`` of score()): a
+    batch only hits entries of its own model, so a batch still scored by the
+    previous model during a reload never mixes both.
+    """
+
+    def __init__(self, max_size=10000, resolution=1.0, default_resolution=None):
+        self.max_size = max_size
+        self.resolution = np.asarray(resolution, dtype=np.float64)
+        self.default_resolution = (float(self.resolution.min()) if default_resolution is None
+                                   else float(default_resolution))
+        # Steps per input width, built on first use
+        self._steps = {}
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        # Bumped by clear(): misses scored before an invalidation are not stored after it
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def steps(self, n_features):
+        steps = self._steps.get(n_features)
+        if steps is None:
+            if self.resolution.ndim == 0:
+                steps = self.resolution
+            elif len(self.resolution) > n_features:
+                raise ValueError(f"Cache resolution has {len(self.resolution)} steps for {n_features} features")
+            else:
+                extra = np.full(n_features - len(self.resolution), self.default_resolution)
+                steps = np.concatenate([self.resolution, extra])
+            self._steps[n_features] = steps
+        return steps
+
+    def keys(self, X):
+        grid = np.floor(X / self.steps(X.shape[1]) + 0.5).astype(np.int64)
+        return [row.tobytes() for row in grid]
+
+    def score(self, X, score_fn, model=None):
+        """Same contract as score_fn(X) -> (fault probabilities, predicted classes), score_fn using model"""
+        keys = self.keys(X)
+        probabilities = [None] * len(keys)
+        classes = [None] * len(keys)
+        missing = []
+        with self._lock:
+            generation = self._generation
+            entries = self._entries
+            for i, key in enumerate(keys):
+                entry = entries.get(key)
+                if entry is None or entry[2] is not model:
+                    missing.append(i)
+                else:
+                    entries.move_to_end(key)
+                    probabilities[i], classes[i], _ = entry
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            missing_probabilities, missing_classes = score_fn(X[missing])
+            with self._lock:
+                store = generation == self._generation
+                for i, probability, predicted in zip(missing, missing_probabilities, missing_classes):
+                    probabilities[i], classes[i] = probability, predicted
+                    if store:
+                        self._entries[keys[i]] = (probability, predicted, model)
+                overflow = len(self._entries) - self.max_size
+                for _ in range(max(overflow, 0)):
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return np.array(probabilities, dtype=np.float64), np.array(classes)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
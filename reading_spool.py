@@ -0,0 +1,349 @@
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from threading import Event, Lock, Thread
+
+from batch_inference import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+# En-tête: magic, position et numéro de séquence du premier enregistrement non commité
+_HEADER = struct.Struct("<8sQQ")
+_MAGIC = b"RSPOOL01"
+HEADER_SIZE = 64
+# Enregistrement: longueur et CRC32 du corps, puis corps (séquence,
+# longueur de l'identifiant, horodatage, 5 paramètres, identifiant UTF-8)
+_RECORD_HEAD = struct.Struct("<II")
+_RECORD_BODY = struct.Struct("<QI6d")
+
+
+class ReadingSpool:
+    """Journal local (write-ahead log) des lectures validées, en ajout seul.
+
+    Chaque lecture est écrite dans un fichier projeté en mémoire (mmap) avant
+    l'inférence: l'écriture est une copie séquentielle en mémoire, sans appel
+    système. Un thread synchronise le fichier sur disque (fsync) toutes les
+    ``sync_interval`` secondes au plus, par lots; un arrêt brutal du processus
+    ne perd rien (pages déjà dans le cache du noyau), une coupure de courant
+    au plus ``sync_interval`` secondes de lectures.
+    ``synced_seq`` (retourné par ``sync``) borne les séquences déjà sur
+    disque: le cœur MQTT asyncio n'acquitte une lecture qu'au-delà.
+
+    Une lecture reste en attente jusqu'au commit de sa ligne d'historique
+    (``committed``, appelé par HistoryWriter), identifiée par son numéro de
+    séquence: ``append`` le retourne et il accompagne la ligne d'historique
+    (11e élément), si bien que deux lectures d'une machine au même horodatage
+    restent distinctes. Un journal neuf numérote à partir de l'heure courante
+    (µs): un journal recréé ne réutilise pas les numéros du précédent. Après
+    chaque commit, le point de reprise (premier
+    enregistrement en attente) est écrit dans l'en-tête; quand plus rien
+    n'est en attente, le fichier repart de zéro (troncature). Les lectures en
+    attente depuis plus de ``replay_after`` secondes (base verrouillée,
+    disque plein, file d'historique pleine, arrêt brutal) sont rejouées par
+    lots via ``build_rows`` dès que la base accepte de nouveau les écritures.
+    """
+
+    def __init__(self, path, build_rows=None, initial_size=4 * 1024 * 1024, max_size=256 * 1024 * 1024,
+                 sync_interval=0.1, replay_after=30.0):
+        self.path = path
+        self.build_rows = build_rows
+        self.initial_size = initial_size
+        self.max_size = max_size
+        self.sync_interval = sync_interval
+        self.replay_after = replay_after
+        self._lock = Lock()
+        self._fd = None
+        self._mm = None
+        self._size = 0
+        self._write_offset = HEADER_SIZE
+        self._next_seq = 0
+        self._checkpoint = (HEADER_SIZE, 0)
+        # Écrits depuis le dernier commit: (position, séquence). Indexés par le
+        # thread d'écriture de l'historique, pas par le thread MQTT
+        self._recent = []
+        # Enregistrements dans l'ordre d'écriture: (position, séquence, instant)
+        self._log = deque()
+        # Séquences des lectures non commitées
+        self._pending = set()
+        self._dirty = False
+        # Séquences inférieures: synchronisées sur disque
+        self.synced_seq = 0
+        self._sync_lock = Lock()
+        self._stop_event = Event()
+        self._thread = None
+
+        # Compteurs exposés pour le monitoring
+        self.appended = 0
+        self.recovered = 0
+        self.replayed = 0
+        self.overflow = 0
+        self.truncations = 0
+        self.sync_time = LatencyStats()
+
+    # Cycle de vie
+
+    def start(self):
+        """Ouvre (ou reprend) le journal et démarre la synchronisation périodique"""
+        if self._mm is None:
+            self._open()
+        if self._thread is None and self.sync_interval:
+            self._stop_event.clear()
+            self._thread = Thread(target=self._run, name="reading-spool-sync", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join(timeout)
+            self._thread = None
+        with self._lock:
+            if self._mm is None:
+                return
+            # Plus aucune écriture: la dernière synchronisation couvre tout le journal
+            mm, self._mm = self._mm, None
+        self.sync()
+        with self._lock:
+            mm.close()
+            os.close(self._fd)
+            self._fd = None
+
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        if size < HEADER_SIZE:
+            size = self.initial_size
+            os.ftruncate(self._fd, size)
+        self._size = size
+        self._mm = mmap.mmap(self._fd, size)
+        magic, offset, seq = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            offset, seq = HEADER_SIZE, time.time_ns() // 1000
+            self._write_header(offset, seq)
+        self._recover(offset, seq)
+
+    def _recover(self, offset, seq):
+        # Relit les enregistrements après le point de reprise; s'arrête au
+        # premier enregistrement incomplet, corrompu ou d'une séquence antérieure
+        mm = self._mm
+        while offset + _RECORD_HEAD.size + _RECORD_BODY.size <= self._size:
+            length, crc = _RECORD_HEAD.unpack_from(mm, offset)
+            end = offset + _RECORD_HEAD.size + length
+            if length < _RECORD_BODY.size or end > self._size:
+                break
+            body = mm[offset + _RECORD_HEAD.size:end]
+            if zlib.crc32(body) != crc or _RECORD_BODY.unpack_from(body)[0] != seq:
+                break
+            # À rejouer dès le démarrage
+            self._log.append((offset, seq, float("-inf")))
+            self._pending.add(seq)
+            offset = end
+            seq += 1
+        self._write_offset = offset
+        self._next_seq = seq
+        self.synced_seq = seq
+        self.recovered = len(self._log)
+        if self.recovered:
+            logger.warning(f"Journal de lectures: {self.recovered} lectures non commitées à rejouer")
+        self._checkpoint_locked()
+
+    # Écriture (thread MQTT ou boucle asyncio)
+
+    def append(self, machine_id, params, timestamp):
+        """Écrit une lecture dans le journal; retourne sa séquence, ou None si elle n'a pas pu l'être"""
+        encoded_id = machine_id.encode("utf-8")
+        with self._lock:
+            if self._mm is None:
+                return None
+            seq = self._next_seq
+            try:
+                body = _RECORD_BODY.pack(seq, len(encoded_id), timestamp, *params) + encoded_id
+            except struct.error:
+                # Horodatage non numérique: lecture traitée sans être journalisée
+                return None
+            record = _RECORD_HEAD.pack(len(body), zlib.crc32(body)) + body
+            offset = self._write_offset
+            if offset + len(record) > self._size and not self._make_room(len(record)):
+                self.overflow += 1
+                if self.overflow % 1000 == 1:
+                    logger.error(f"Journal de lectures plein, {self.overflow} lectures non journalisées")
+                return None
+            self._mm[offset:offset + len(record)] = record
+            self._write_offset = offset + len(record)
+            self._next_seq = seq + 1
+            self._recent.append((offset, seq))
+            self._dirty = True
+            self.appended += 1
+        return seq
+
+    def _index_recent(self):
+        # Appelé sous le verrou: instant d'indexation, à quelques centaines de
+        # millisecondes près (seulement comparé à replay_after)
+        if not self._recent:
+            return
+        now = time.monotonic()
+        log, pending = self._log, self._pending
+        for offset, seq in self._recent:
+            log.append((offset, seq, now))
+            pending.add(seq)
+        self._recent = []
+
+    def _make_room(self, needed):
+        # Appelé sous le verrou. Compactage si les enregistrements commités en
+        # tête libèrent assez de place sans chevauchement (un arrêt pendant la
+        # copie laisse l'ancienne zone intacte), sinon agrandissement du fichier
+        checkpoint, _ = self._checkpoint
+        live = self._write_offset - checkpoint
+        if checkpoint - HEADER_SIZE >= live and HEADER_SIZE + live + needed <= self._size:
+            self._compact(checkpoint, live)
+            return True
+        size = self._size
+        while size < self._write_offset + needed:
+            size *= 2
+        if size > self.max_size:
+            return False
+        self._resize(size)
+        return True
+
+    def _compact(self, checkpoint, live):
+        self._index_recent()
+        shift = checkpoint - HEADER_SIZE
+        self._mm.move(HEADER_SIZE, checkpoint, live)
+        # Les données copiées doivent être sur disque avant le nouvel en-tête
+        self._mm.flush()
+        self._log = deque((offset - shift, seq, appended) for offset, seq, appended in self._log)
+        self._write_offset -= shift
+        self._write_header(HEADER_SIZE, self._checkpoint[1])
+
+    def _resize(self, size):
+        os.ftruncate(self._fd, size)
+        self._mm.resize(size)
+        self._size = size
+
+    # Commit et reprise (thread d'écriture de l'historique)
+
+    def committed(self, rows):
+        """Lignes d'historique commitées (colonnes d'INSERT_HISTORY_SQL, puis séquence): avance le point de reprise"""
+        with self._lock:
+            if self._mm is None:
+                return
+            self._index_recent()
+            pending = self._pending
+            for row in rows:
+                if len(row) > 10:
+                    pending.discard(row[10])
+            self._checkpoint_locked()
+
+    def _checkpoint_locked(self):
+        log, pending = self._log, self._pending
+        while log and log[0][1] not in pending:
+            log.popleft()
+        if log:
+            offset, seq, _ = log[0]
+        else:
+            # Plus rien en attente: le journal repart du début
+            offset, seq = HEADER_SIZE, self._next_seq
+            if self._write_offset > HEADER_SIZE:
+                self._write_offset = HEADER_SIZE
+                self.truncations += 1
+                if self._size > self.initial_size:
+                    self._resize(self.initial_size)
+        if (offset, seq) != self._checkpoint:
+            self._write_header(offset, seq)
+
+    def _write_header(self, offset, seq):
+        _HEADER.pack_into(self._mm, 0, _MAGIC, offset, seq)
+        self._checkpoint = (offset, seq)
+        self._dirty = True
+
+    def checkpoint_seq(self):
+        """Séquence du premier enregistrement en attente (toutes les précédentes sont commitées)"""
+        return self._checkpoint[1]
+
+    def replay_rows(self, limit=5000):
+        """Lignes d'historique reconstruites pour les lectures en attente depuis plus de replay_after s.
+
+        ``build_rows`` reçoit des lectures (machine, paramètres, horodatage,
+        séquence) et retourne leurs lignes, séquence en 11e élément. Retourne
+        None s'il ne peut pas encore les calculer (modèle en chargement).
+        """
+        deadline = time.monotonic() - self.replay_after
+        records = []
+        with self._lock:
+            if self._mm is None:
+                return []
+            self._index_recent()
+            for offset, seq, appended in self._log:
+                if appended > deadline or len(records) >= limit:
+                    break
+                if seq in self._pending:
+                    length, _ = _RECORD_HEAD.unpack_from(self._mm, offset)
+                    body = self._mm[offset + _RECORD_HEAD.size:offset + _RECORD_HEAD.size + length]
+                    records.append(self._decode(body))
+        if not records or self.build_rows is None:
+            return []
+        return self.build_rows(records)
+
+    def replay_done(self, rows):
+        """Lignes rejouées commitées (ou déjà présentes en base)"""
+        self.replayed += len(rows)
+        self.committed(rows)
+
+    @staticmethod
+    def _decode(body):
+        seq, id_length, timestamp, *params = _RECORD_BODY.unpack_from(body)
+        machine_id = body[_RECORD_BODY.size:_RECORD_BODY.size + id_length].decode("utf-8")
+        return machine_id, params, timestamp, seq
+
+    # Synchronisation sur disque
+
+    def sync(self):
+        """Synchronise le journal sur disque; retourne la première séquence qui n'y est pas forcément"""
+        # Une synchronisation à la fois: une lecture n'est déclarée sur disque
+        # qu'après le fsync qui la couvre
+        with self._sync_lock:
+            with self._lock:
+                fd, synced = self._fd, self._next_seq
+                dirty, self._dirty = self._dirty, False
+            if fd is None:
+                return self.synced_seq
+            if dirty:
+                started = time.perf_counter()
+                # fsync écrit aussi les pages modifiées via le mmap (même cache de
+                # pages) et libère le GIL, contrairement à mmap.flush
+                os.fsync(fd)
+                self.sync_time.record(time.perf_counter() - started)
+            self.synced_seq = synced
+            return synced
+
+    def _run(self):
+        while not self._stop_event.wait(self.sync_interval):
+            try:
+                self.sync()
+            except OSError as e:
+                logger.error(f"Erreur de synchronisation du journal de lectures: {e}")
+
+    def pending(self):
+        with self._lock:
+            self._index_recent()
+            return len(self._pending)
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "pending": self.pending(),
+            "appended": self.appended,
+            "recovered": self.recovered,
+            "replayed": self.replayed,
+            "overflow": self.overflow,
+            "truncations": self.truncations,
+            "bytes": self._write_offset - self._checkpoint[0],
+            "file_size": self._size,
+            "sync_time": self.sync_time.summary()
+        }
@@ -0,0 +1,296 @@
+import argparse
+import hashlib
+import logging
+import math
+import multiprocessing
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+import score_csv
+from history_rollup import rebuild_complete_buckets, rebuild_rollups
+from streaming_features import StreamingFeatures, load_feature_config
+
+logger = logging.getLogger(__name__)
+
+# Une ligne par réévaluation, commitée avec chaque lot d'UPDATE: une exécution reprend exactement
+CHECKPOINT_TABLE = "history_rescore"
+DAY = 86400
+
+SELECT_CHUNK_SQL = '''
+    SELECT id, vibration, temperature, pressure, rms, mean_temp, machine_id
+    FROM machine_history WHERE id > ? AND id <= ? ORDER BY id LIMIT ?
+'''
+UPDATE_SQL = '''
+    UPDATE machine_history SET fault_probability = ?, is_fault = ?, model_status = 'Active', model_version = ?
+    WHERE id = ?
+'''
+
+
+def _init_worker(model_path, niceness):
+    # Les processus d'évaluation laissent la priorité CPU à l'ingestion en direct
+    if niceness:
+        os.nice(niceness)
+    score_csv._init_worker(model_path)
+
+
+def model_version_of(model_path):
+    """Version d'un artefact: sa version dans le registre, sinon une empreinte du fichier"""
+    registry_root = os.environ.get("DIAGNOSTIC_MODEL_REGISTRY")
+    if registry_root:
+        from model_registry import ModelRegistry
+        registry = ModelRegistry(registry_root)
+        for metadata in registry.versions():
+            if os.path.abspath(registry.artifact_path(metadata["version"])) == os.path.abspath(model_path):
+                return metadata["version"]
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return f"sha256:{digest.hexdigest()[:12]}"
+
+
+def ensure_schema(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(machine_history)")]
+    if "model_version" not in columns:
+        conn.execute("ALTER TABLE machine_history ADD COLUMN model_version TEXT")
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+            model_version TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            max_id INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            min_timestamp REAL,
+            started_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            finished_at REAL
+        )
+    ''')
+    conn.commit()
+
+
+class Throttle:
+    """Limite le débit de lignes de la tâche et la part du temps où elle tient le verrou d'écriture SQLite.
+
+    Après une transaction d'écriture de t secondes, la tâche dort t * (1 - write_duty) / write_duty:
+    l'écriture de l'historique en direct trouve toujours le verrou libre une partie du temps.
+    """
+
+    def __init__(self, max_rows_per_second=0, write_duty=0.5):
+        self.max_rows_per_second = max_rows_per_second
+        self.write_duty = write_duty
+        self._started = time.perf_counter()
+        self._rows = 0
+        self.slept = 0.0
+
+    def after_write(self, rows, write_seconds):
+        self._rows += rows
+        delay = 0.0
+        if 0 < self.write_duty < 1:
+            delay = write_seconds * (1 - self.write_duty) / self.write_duty
+        if self.max_rows_per_second:
+            ahead = self._rows / self.max_rows_per_second - (time.perf_counter() - self._started)
+            delay = max(delay, ahead)
+        if delay > 0:
+            self.slept += delay
+            time.sleep(delay)
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def _load_checkpoint(conn, version, restart):
+    if restart:
+        conn.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE model_version = ?", (version,))
+        conn.commit()
+    row = conn.execute(f"SELECT last_id, max_id, rows, min_timestamp, finished_at FROM {CHECKPOINT_TABLE} "
+                       f"WHERE model_version = ?", (version,)).fetchone()
+    if row is not None:
+        return row
+    # Les lignes insérées après ce point sont évaluées en direct par le nouveau modèle
+    max_id = conn.execute("SELECT coalesce(max(id), 0) FROM machine_history").fetchone()[0]
+    now = time.time()
+    with conn:
+        conn.execute(f"INSERT INTO {CHECKPOINT_TABLE} (model_version, last_id, max_id, rows, started_at, updated_at) "
+                     f"VALUES (?, 0, ?, 0, ?, ?)", (version, max_id, now, now))
+    return 0, max_id, 0, None, None
+
+
+def rescore_history(db_path, model_path, model_version=None, chunk_size=50000, update_batch=5000, workers=None,
+                    max_rows_per_second=0, write_duty=0.5, niceness=10, restart=False, rebuild=True,
+                    stop_event=None, max_seconds=None, progress=None):
+    """Réévalue les lignes de machine_history avec le modèle de model_path.
+
+    Les lignes sont lues par blocs, dans l'ordre des id, jusqu'au plus grand id
+    présent au démarrage, évaluées par des processus (un predict_proba vectorisé
+    par bloc) puis réécrites par transactions d'UPDATE de ``update_batch``
+    lignes, qui avancent aussi le point de reprise. Une exécution interrompue,
+    pour quelque raison que ce soit, reprend après la dernière ligne commitée.
+    Une fois toutes les lignes traitées, les agrégats de la période réévaluée
+    sont recalculés jour par jour (nombres de pannes et maxima).
+
+    Retourne un dict: lignes réévaluées par cet appel, durée écoulée et
+    exécution terminée ou non.
+    """
+    model_path = os.path.abspath(model_path)
+    version = model_version or model_version_of(model_path)
+    workers = workers or os.cpu_count() or 1
+    conn = _connect(db_path)
+    ensure_schema(conn)
+    last_id, max_id, done_rows, min_timestamp, finished_at = _load_checkpoint(conn, version, restart)
+    resumed_from = last_id
+    throttle = Throttle(max_rows_per_second, write_duty)
+    feature_config = load_feature_config(model_path)
+    # Modèles étendus: les fenêtres glissantes repartent à chaque exécution (et à chaque reprise)
+    features = StreamingFeatures(feature_config) if feature_config else None
+    if min_timestamp is None:
+        min_timestamp = conn.execute("SELECT min(timestamp) FROM machine_history WHERE id > ? AND id <= ?",
+                                     (last_id, max_id)).fetchone()[0]
+    rows = 0
+    stopped = False
+    started = time.perf_counter()
+    deadline = None if max_seconds is None else started + max_seconds
+
+    def write(ids, probabilities, predictions):
+        nonlocal last_id, done_rows, rows
+        for start in range(0, len(ids), update_batch):
+            batch_ids = ids[start:start + update_batch]
+            updates = zip(probabilities[start:start + update_batch].tolist(),
+                          (predictions[start:start + update_batch] != 0).tolist(),
+                          [version] * len(batch_ids), batch_ids)
+            write_started = time.perf_counter()
+            with conn:
+                conn.executemany(UPDATE_SQL, updates)
+                conn.execute(f"UPDATE {CHECKPOINT_TABLE} SET last_id = ?, rows = rows + ?, min_timestamp = ?, "
+                             f"updated_at = ? WHERE model_version = ?",
+                             (batch_ids[-1], len(batch_ids), min_timestamp, time.time(), version))
+            last_id = batch_ids[-1]
+            done_rows += len(batch_ids)
+            rows += len(batch_ids)
+            throttle.after_write(len(batch_ids), time.perf_counter() - write_started)
+        if progress is not None:
+            progress(done_rows, last_id, max_id)
+
+    if finished_at is None and last_id < max_id:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(model_path, niceness)) as pool:
+            # Au plus 2 blocs en cours par worker: mémoire constante
+            pending = deque()
+            read_id = last_id
+            while True:
+                if (stop_event is not None and stop_event.is_set()) or \
+                        (deadline is not None and time.perf_counter() > deadline):
+                    stopped = True
+                    break
+                chunk = conn.execute(SELECT_CHUNK_SQL, (read_id, max_id, chunk_size)).fetchall()
+                if not chunk:
+                    break
+                read_id = chunk[-1][0]
+                ids = [row[0] for row in chunk]
+                if features is None:
+                    X = np.array([row[1:6] for row in chunk], dtype=np.float64)
+                else:
+                    X = np.array([features.update(row[6] or "default", row[1:6]) for row in chunk])
+                pending.append((ids, pool.submit(score_csv.score_chunk, X)))
+                if len(pending) >= 2 * workers:
+                    ids, future = pending.popleft()
+                    write(ids, *future.result())
+            # Les blocs déjà évalués sont écrits même à l'arrêt: le point de reprise reste contigu
+            while pending:
+                ids, future = pending.popleft()
+                write(ids, *future.result())
+
+    complete = not stopped and finished_at is None
+    if complete:
+        if rebuild and min_timestamp is not None:
+            rebuild_rollup_days(conn, min_timestamp, throttle)
+        with conn:
+            conn.execute(f"UPDATE {CHECKPOINT_TABLE} SET finished_at = ?, last_id = max_id WHERE model_version = ?",
+                         (time.time(), version))
+    conn.close()
+    elapsed = time.perf_counter() - started
+    return {
+        "model_version": version,
+        "rows": rows,
+        "total_rows": done_rows,
+        "resumed_from_id": resumed_from,
+        "max_id": max_id,
+        "elapsed": elapsed,
+        "throttled_seconds": throttle.slept,
+        "complete": complete or finished_at is not None,
+    }
+
+
+def rebuild_rollup_days(conn, start, throttle=None):
+    """Recalcule les agrégats du jour de start jusqu'à maintenant, une transaction par jour.
+
+    Les jours dont la rétention a commencé l'archivage, seuls les intervalles
+    dont toutes les lignes brutes sont encore présentes sont recalculés (les
+    autres gardent leurs agrégats).
+    """
+    day = math.floor(start / DAY) * DAY
+    end = (math.floor(time.time() / DAY) + 1) * DAY
+    archived = _archived_days(conn)
+    while day < end:
+        write_started = time.perf_counter()
+        with conn:
+            if datetime.fromtimestamp(day, timezone.utc).strftime("%Y-%m-%d") in archived:
+                rebuild_complete_buckets(conn, day, day + DAY)
+            else:
+                rebuild_rollups(conn, day, day + DAY)
+        if throttle is not None:
+            throttle.after_write(0, time.perf_counter() - write_started)
+        day += DAY
+
+
+def _archived_days(conn):
+    # Dates UTC inscrites par history_retention dans sa table d'archives
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history_archive'").fetchone()
+    if not exists:
+        return set()
+    return {row[0] for row in conn.execute("SELECT DISTINCT day FROM history_archive")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Réévalue l'historique enregistré avec le modèle courant")
+    parser.add_argument("--db", default=os.environ.get("HISTORY_DB", "history.db"))
+    parser.add_argument("--model", default=os.environ.get("DIAGNOSTIC_MODEL_PATH", "diagnostic_model.pkl"),
+                        help="artefact du modèle (pipeline .pkl ou .npz compilé)")
+    parser.add_argument("--model-version", help="valeur écrite dans model_version (défaut: version de "
+                                                "l'artefact dans le registre, sinon empreinte du fichier)")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="lignes lues et évaluées à la fois")
+    parser.add_argument("--update-batch", type=int, default=5000, help="lignes par transaction d'UPDATE")
+    parser.add_argument("--workers", type=int, default=None, help="processus d'évaluation (défaut: nombre de CPU)")
+    parser.add_argument("--max-rows-per-second", type=float, default=0, help="0 = illimité")
+    parser.add_argument("--write-duty", type=float, default=0.5,
+                        help="part maximale du temps passée à tenir le verrou d'écriture (1 = sans pause)")
+    parser.add_argument("--nice", type=int, default=10, help="priorité (nice) des processus d'évaluation")
+    parser.add_argument("--restart", action="store_true", help="ignore le point de reprise de cette version du modèle")
+    parser.add_argument("--no-rollups", action="store_true", help="ne recalcule pas les agrégats")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    def progress(done, last_id, max_id):
+        logger.info(f"{done} lignes réévaluées (id {last_id}/{max_id})")
+
+    result = rescore_history(args.db, args.model, args.model_version, args.chunk_size, args.update_batch,
+                             args.workers, args.max_rows_per_second, args.write_duty, args.nice, args.restart,
+                             rebuild=not args.no_rollups, progress=progress)
+    rate = result["rows"] / result["elapsed"] if result["elapsed"] else 0.0
+    print(f"{result['rows']} lignes réévaluées avec {result['model_version']} en {result['elapsed']:.2f} s "
+          f"({rate:.0f} lignes/s, {result['throttled_seconds']:.1f} s de pause)"
+          + ("" if result["complete"] else "; interrompu, relancer pour reprendre"))
+
+
+if __name__ == "__main__":
+    main()
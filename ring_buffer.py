@@ -0,0 +1,158 @@
+from collections import deque
+
+import numpy as np
+
+
+class WindowStats:
+    """Agrégats glissants d'une fenêtre de ``size`` lectures, maintenus en O(1).
+
+    Les sommes (et sommes des carrés) sont mises à jour à chaque ajout et
+    retrait; min/max par paramètre utilisent des files monotones (O(1) amorti).
+    """
+
+    def __init__(self, size, n_params):
+        self.size = size
+        self.n_params = n_params
+        self.param_sum = [0.0] * n_params
+        self.param_sumsq = [0.0] * n_params
+        self.probability_sum = 0.0
+        self.fault_count = 0
+        # Files monotones de (numéro de lecture, valeur) par paramètre
+        self._min = [deque() for _ in range(n_params)]
+        self._max = [deque() for _ in range(n_params)]
+
+    def add(self, seq, params, probability, is_fault):
+        param_sum, param_sumsq = self.param_sum, self.param_sumsq
+        for i, value in enumerate(params):
+            param_sum[i] += value
+            param_sumsq[i] += value * value
+            mins = self._min[i]
+            while mins and mins[-1][1] >= value:
+                mins.pop()
+            mins.append((seq, value))
+            maxs = self._max[i]
+            while maxs and maxs[-1][1] <= value:
+                maxs.pop()
+            maxs.append((seq, value))
+        self.probability_sum += probability
+        self.fault_count += is_fault
+
+    def remove(self, seq, params, probability, is_fault):
+        param_sum, param_sumsq = self.param_sum, self.param_sumsq
+        for i, value in enumerate(params):
+            param_sum[i] -= value
+            param_sumsq[i] -= value * value
+            # Retirer des files monotones la lecture sortie de la fenêtre
+            mins = self._min[i]
+            if mins and mins[0][0] <= seq:
+                mins.popleft()
+            maxs = self._max[i]
+            if maxs and maxs[0][0] <= seq:
+                maxs.popleft()
+        self.probability_sum -= probability
+        self.fault_count -= is_fault
+
+    def minimum(self):
+        return [mins[0][1] if mins else None for mins in self._min]
+
+    def maximum(self):
+        return [maxs[0][1] if maxs else None for maxs in self._max]
+
+
+class RingBuffer:
+    """Buffer circulaire de capacité fixe adossé à des tableaux NumPy préalloués.
+
+    Chaque lecture occupe une case des tableaux timestamp, paramètres,
+    probabilité de panne et indicateur de panne. Les statistiques glissantes
+    des fenêtres ``windows`` (moyenne, variance, min/max par paramètre, nombre
+    de pannes, probabilité moyenne) sont maintenues à chaque ajout, si bien que
+    stats() répond en temps constant quelle que soit la capacité.
+    """
+
+    # Resynchronisation périodique des sommes pour éviter la dérive numérique
+    RESYNC_INTERVAL = 100000
+
+    def __init__(self, capacity, windows=(10,), n_params=5):
+        self.capacity = capacity
+        self.n_params = n_params
+        # np.zeros réserve la mémoire sans la toucher: les pages ne sont
+        # réellement allouées qu'au fur et à mesure du remplissage
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.params = np.zeros((capacity, n_params), dtype=np.float64)
+        self.probabilities = np.zeros(capacity, dtype=np.float64)
+        self.faults = np.zeros(capacity, dtype=np.bool_)
+        self.count = 0
+        self.windows = {w: WindowStats(w, n_params) for w in sorted({min(w, capacity) for w in windows})}
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, params, probability, is_fault):
+        seq = self.count
+        index = seq % self.capacity
+        params = [float(p) for p in params]
+        probability = float(probability)
+        is_fault = bool(is_fault)
+
+        for window in self.windows.values():
+            # Retirer la lecture qui sort de la fenêtre (avant écrasement éventuel)
+            old_seq = seq - window.size
+            if old_seq >= 0:
+                old = old_seq % self.capacity
+                window.remove(old_seq, self.params[old].tolist(), float(self.probabilities[old]),
+                              bool(self.faults[old]))
+            window.add(seq, params, probability, is_fault)
+
+        self.timestamps[index] = timestamp
+        self.params[index] = params
+        self.probabilities[index] = probability
+        self.faults[index] = is_fault
+        self.count += 1
+
+        if self.count % self.RESYNC_INTERVAL == 0:
+            self._resync()
+
+    def _indices(self, n):
+        # Indices des n dernières lectures, de la plus ancienne à la plus récente
+        return np.arange(self.count - n, self.count) % self.capacity
+
+    def _resync(self):
+        for window in self.windows.values():
+            indices = self._indices(min(window.size, len(self)))
+            values = self.params[indices]
+            window.param_sum = values.sum(axis=0).tolist()
+            window.param_sumsq = (values * values).sum(axis=0).tolist()
+            window.probability_sum = float(self.probabilities[indices].sum())
+
+    def stats(self, window):
+        """Statistiques glissantes de la fenêtre demandée"""
+        stats = self.windows[window]
+        n = min(window, len(self))
+        if n == 0:
+            return {"count": 0}
+        mean = [total / n for total in stats.param_sum]
+        variance = [max(sumsq / n - m * m, 0.0) for sumsq, m in zip(stats.param_sumsq, mean)]
+        return {
+            "count": n,
+            "mean": mean,
+            "variance": variance,
+            "min": stats.minimum(),
+            "max": stats.maximum(),
+            "fault_count": stats.fault_count,
+            "avg_fault_probability": stats.probability_sum / n
+        }
+
+    def latest(self, n=None):
+        """Les n dernières lectures sous forme de dictionnaires (plus ancienne en premier)"""
+        n = len(self) if n is None else min(n, len(self))
+        return [
+            {
+                "timestamp": float(self.timestamps[i]),
+                "parametres_machine": self.params[i].tolist(),
+                "ml_prediction": {
+                    "fault_probability": float(self.probabilities[i]),
+                    "is_fault": bool(self.faults[i])
+                }
+            }
+            for i in self._indices(n)
+        ]
@@ -0,0 +1,220 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from streaming_features import RollingFeatures, load_feature_config
+
+TIMESTAMP_COLUMN = "Timestamp"
+SENSOR_COLUMNS = ["Vibration (mm/s)", "Temperature (°C)", "Pressure (bar)", "RMS Vibration", "Mean Temp"]
+LABEL_COLUMN = "Fault Label"
+OUTPUT_COLUMNS = ["fault_probability", "predicted_class", "is_fault"]
+
+_service = None
+
+
+def _init_worker(model_path):
+    # Modèle chargé une fois par processus: cet artefact seul, jamais la version
+    # active du registre (DIAGNOSTIC_MODEL_REGISTRY) ni un cache de prédictions
+    global _service
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Modèle introuvable: {model_path}")
+    from ml_service import MLDiagnosticService
+    _service = MLDiagnosticService(model_path)
+    active = _service.active
+    if active is None or os.path.abspath(active.path) != os.path.abspath(model_path):
+        raise RuntimeError(f"Chargement du modèle {model_path} impossible: {_service.status}")
+
+
+def score_chunk(X):
+    # Un predict_proba vectorisé sur tout le bloc
+    fault_probabilities, predictions = _service.score_batch(X)
+    return fault_probabilities, predictions
+
+
+class ChunkReader:
+    """Lit un CSV au format industrial_fault_detection_data, bloc par bloc."""
+
+    def __init__(self, path, chunk_size):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.skipped_rows = 0
+
+    def __iter__(self):
+        with open(self.path, newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            sensor_idx = [header.index(c) if c in header else i + 1 for i, c in enumerate(SENSOR_COLUMNS)]
+            timestamp_idx = header.index(TIMESTAMP_COLUMN) if TIMESTAMP_COLUMN in header else None
+            label_idx = header.index(LABEL_COLUMN) if LABEL_COLUMN in header else None
+
+            timestamps, features, labels = [], [], []
+            for row in reader:
+                try:
+                    values = [float(row[i]) for i in sensor_idx]
+                    label = int(float(row[label_idx])) if label_idx is not None else None
+                except (ValueError, IndexError):
+                    self.skipped_rows += 1
+                    continue
+                timestamps.append(row[timestamp_idx] if timestamp_idx is not None else "")
+                features.append(values)
+                labels.append(label)
+                if len(features) == self.chunk_size:
+                    yield self._chunk(timestamps, features, labels, label_idx)
+                    timestamps, features, labels = [], [], []
+            if features:
+                yield self._chunk(timestamps, features, labels, label_idx)
+
+    @staticmethod
+    def _chunk(timestamps, features, labels, label_idx):
+        return (
+            timestamps,
+            np.array(features, dtype=np.float64),
+            np.array(labels, dtype=np.int64) if label_idx is not None else None
+        )
+
+
+class CsvOutput:
+    def __init__(self, path, has_labels):
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        header = [TIMESTAMP_COLUMN] + SENSOR_COLUMNS + ([LABEL_COLUMN] if has_labels else []) + OUTPUT_COLUMNS
+        self._writer.writerow(header)
+
+    def write(self, timestamps, X, labels, fault_probabilities, predictions):
+        columns = [timestamps, *X.T.tolist()]
+        if labels is not None:
+            columns.append(labels.tolist())
+        columns += [fault_probabilities.tolist(), predictions.tolist(), (predictions != 0).astype(int).tolist()]
+        self._writer.writerows(zip(*columns))
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetOutput:
+    def __init__(self, path, has_labels):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("La sortie Parquet nécessite pyarrow (pip install pyarrow)")
+        self._pa = pa
+        fields = [pa.field(TIMESTAMP_COLUMN, pa.string())]
+        fields += [pa.field(c, pa.float64()) for c in SENSOR_COLUMNS]
+        if has_labels:
+            fields.append(pa.field(LABEL_COLUMN, pa.int64()))
+        fields += [pa.field("fault_probability", pa.float64()), pa.field("predicted_class", pa.int64()),
+                   pa.field("is_fault", pa.bool_())]
+        self._schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, timestamps, X, labels, fault_probabilities, predictions):
+        columns = [timestamps, *X.T]
+        if labels is not None:
+            columns.append(labels)
+        columns += [fault_probabilities, predictions.astype(np.int64), predictions != 0]
+        self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class Metrics:
+    # Matrice de confusion cumulée "panne" (label != 0) contre "normal"
+    def __init__(self):
+        self.tp = self.fp = self.tn = self.fn = 0
+
+    def update(self, labels, predictions):
+        actual = labels != 0
+        predicted = predictions != 0
+        self.tp += int(np.sum(actual & predicted))
+        self.fp += int(np.sum(~actual & predicted))
+        self.tn += int(np.sum(~actual & ~predicted))
+        self.fn += int(np.sum(actual & ~predicted))
+
+    def report(self):
+        total = self.tp + self.fp + self.tn + self.fn
+        accuracy = (self.tp + self.tn) / total if total else 0.0
+        precision = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+        recall = self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+        return accuracy, precision, recall
+
+
+def score_file(input_path, output_path, model_path, chunk_size=50000, workers=None, output_format=None):
+    if not os.path.exists(model_path):
+        # Sinon les workers y entraîneraient et enregistreraient un modèle factice
+        raise FileNotFoundError(f"Modèle introuvable: {model_path}")
+    workers = workers or os.cpu_count() or 1
+    output_format = output_format or ("parquet" if output_path.endswith(".parquet") else "csv")
+    reader = ChunkReader(input_path, chunk_size)
+    # Modèles étendus: mêmes caractéristiques glissantes que l'ingestion en ligne
+    feature_config = load_feature_config(model_path)
+    rolling = RollingFeatures(feature_config) if feature_config else None
+    output = None
+    metrics = None
+    rows = 0
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(model_path,)) as pool:
+        # Au plus 2 blocs en cours par worker: mémoire constante
+        pending = deque()
+
+        def drain_one():
+            nonlocal output, metrics, rows
+            timestamps, X, labels, future = pending.popleft()
+            fault_probabilities, predictions = future.result()
+            if output is None:
+                has_labels = labels is not None
+                output = (ParquetOutput if output_format == "parquet" else CsvOutput)(output_path, has_labels)
+                metrics = Metrics() if has_labels else None
+            output.write(timestamps, X, labels, fault_probabilities, predictions)
+            if metrics is not None:
+                metrics.update(labels, predictions)
+            rows += len(X)
+
+        for timestamps, X, labels in reader:
+            model_input = X if rolling is None else np.array([rolling.update(params) for params in X.tolist()])
+            pending.append((timestamps, X, labels, pool.submit(score_chunk, model_input)))
+            if len(pending) >= 2 * workers:
+                drain_one()
+        while pending:
+            drain_one()
+
+    if output is not None:
+        output.close()
+    elapsed = time.perf_counter() - start
+    return rows, elapsed, metrics, reader.skipped_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Évalue en masse un CSV de capteurs avec le modèle de diagnostic")
+    parser.add_argument("input", help="CSV avec Timestamp, les 5 colonnes capteurs et éventuellement Fault Label")
+    parser.add_argument("output", help="fichier de sortie (.csv ou .parquet)")
+    parser.add_argument("--model", default=os.environ.get("DIAGNOSTIC_MODEL_PATH", "diagnostic_model.pkl"),
+                        help="artefact du modèle (pipeline .pkl ou .npz compilé)")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=None, help="processus d'évaluation (défaut: nombre de CPU)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None)
+    args = parser.parse_args()
+
+    rows, elapsed, metrics, skipped = score_file(
+        args.input, args.output, os.path.abspath(args.model), args.chunk_size, args.workers, args.format
+    )
+    print(f"{rows} lignes évaluées en {elapsed:.2f} s ({rows / elapsed:.0f} lignes/s) -> {args.output}")
+    if skipped:
+        print(f"{skipped} lignes mal formées ignorées")
+    if metrics is not None:
+        accuracy, precision, recall = metrics.report()
+        print(f"Exactitude {accuracy:.4f}  Précision {precision:.4f}  Rappel {recall:.4f}")
+
+
+if __name__ == "__main__":
+    main()
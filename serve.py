@@ -0,0 +1,92 @@
+"""Lancement en production: un processus d'ingestion et N workers web sans état.
+
+Usage: python serve.py [--workers 4] [--threads 8] [--bind 0.0.0.0:5000]
+
+- le processus d'ingestion (APP_ROLE=ingest python app.py) est le seul abonné
+  MQTT; il fait l'inférence, écrit l'historique et publie l'état en direct
+  dans STATE_DB;
+- gunicorn sert app:app avec --workers processus (APP_ROLE=web) qui lisent
+  STATE_DB et les bases d'historique et d'utilisateurs.
+
+Concurrence: chaque worker gthread sert au plus --threads requêtes à la fois,
+soit workers × threads requêtes simultanées. Un flux SSE garderait un thread
+pour toute la durée de la connexion (4 × 8 = 32 tableaux de bord suffiraient
+à bloquer toutes les autres routes): les workers web ne servent donc pas
+/stream (204) et le tableau de bord interroge /data toutes les
+DASHBOARD_POLL_INTERVAL secondes (1 par défaut), une requête courte qui
+répond 304 tant que l'instantané n'a pas changé.
+
+Les bases sont initialisées avant le démarrage des processus. Si l'un des deux
+s'arrête, l'autre est arrêté aussi; Ctrl+C ou SIGTERM arrêtent proprement
+l'ensemble (l'historique en attente est écrit).
+"""
+import argparse
+import importlib.util
+import os
+import signal
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def init_databases():
+    # Import en mode web: aucun thread d'ingestion n'est créé dans le lanceur
+    os.environ["APP_ROLE"] = "web"
+    import app
+
+    app.init_history_db()
+    app.init_users_db()
+    app.state_store.init_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", 4)))
+    parser.add_argument("--threads", type=int, default=8, help="requêtes simultanées par worker")
+    parser.add_argument("--bind", default=os.environ.get("WEB_BIND", "0.0.0.0:5000"))
+    args = parser.parse_args()
+
+    if importlib.util.find_spec("gunicorn") is None:
+        sys.exit("gunicorn est requis pour le mode production: pip install gunicorn")
+
+    init_databases()
+
+    ingest = subprocess.Popen([sys.executable, os.path.join(ROOT, "app.py")],
+                              cwd=ROOT, env=dict(os.environ, APP_ROLE="ingest"))
+    web = subprocess.Popen([sys.executable, "-m", "gunicorn",
+                            "--workers", str(args.workers),
+                            "--worker-class", "gthread",
+                            "--threads", str(args.threads),
+                            "--bind", args.bind,
+                            "app:app"],
+                           cwd=ROOT, env=dict(os.environ, APP_ROLE="web"))
+    processes = {"ingestion": ingest, "web": web}
+
+    def shutdown():
+        for process in processes.values():
+            if process.poll() is None:
+                process.terminate()
+        for process in processes.values():
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            for name, process in processes.items():
+                if process.poll() is not None:
+                    print(f"Processus {name} arrêté (code {process.returncode}), arrêt de l'ensemble")
+                    return process.returncode
+            time.sleep(1)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """État en direct partagé entre le processus d'ingestion et les workers web.
+
+    Une base SQLite locale en WAL: le processus d'ingestion (seul écrivain)
+    y publie l'instantané sérialisé de chaque machine (les octets servis par
+    /data), ses statistiques glissantes et l'état du service; les workers web
+    ne font que des lectures par clé primaire. Les commandes d'administration
+    (rechargement du modèle...) suivent le chemin inverse via control_commands.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def init_db(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS machine_state (
+                    machine_id TEXT PRIMARY KEY,
+                    version INTEGER,
+                    payload BLOB,
+                    etag TEXT,
+                    buffer_stats TEXT,
+                    updated_at REAL
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS service_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    updated_at REAL
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS control_commands (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    command TEXT,
+                    args TEXT,
+                    created_at REAL
+                );
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connection(self):
+        # Une connexion par thread (workers gthread), réutilisée entre les requêtes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    # Lecture (workers web)
+
+    def payload(self, machine_id):
+        """(octets JSON, ETag) du dernier instantané publié, ou None"""
+        return self._connection().execute(
+            "SELECT payload, etag FROM machine_state WHERE machine_id = ?", (machine_id,)
+        ).fetchone()
+
+    def snapshot(self, machine_id):
+        row = self.payload(machine_id)
+        return json.loads(row[0]) if row else None
+
+    def buffer_stats(self, machine_id):
+        """(nombre de lectures, {fenêtre: statistiques}) publiés pour une machine, ou None"""
+        row = self._connection().execute(
+            "SELECT buffer_stats FROM machine_state WHERE machine_id = ?", (machine_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        stats = json.loads(row[0])
+        return stats["total_records"], {int(window): values for window, values in stats["windows"].items()}
+
+    def snapshots(self):
+        rows = self._connection().execute("SELECT payload FROM machine_state").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def status(self):
+        """Dernier état du service publié par le processus d'ingestion ({} s'il n'a pas démarré)"""
+        row = self._connection().execute(
+            "SELECT value, updated_at FROM service_state WHERE key = 'status'"
+        ).fetchone()
+        if row is None:
+            return {}
+        status = json.loads(row[0])
+        status["published_at"] = row[1]
+        return status
+
+    def metrics(self):
+        """Dernières métriques (texte Prometheus) publiées par le processus d'ingestion"""
+        row = self._connection().execute(
+            "SELECT value FROM service_state WHERE key = 'metrics'"
+        ).fetchone()
+        return row[0] if row else ""
+
+    def push_command(self, command, **args):
+        conn = self._connection()
+        with conn:
+            conn.execute("INSERT INTO control_commands (command, args, created_at) VALUES (?, ?, ?)",
+                         (command, json.dumps(args), time.time()))
+
+    # Écriture (processus d'ingestion)
+
+    def publish(self, conn, machines, status=None, metrics=None):
+        """Publie en une transaction les machines modifiées [(id, version, payload, etag, stats)]"""
+        now = time.time()
+        with conn:
+            conn.executemany('''
+                INSERT INTO machine_state (machine_id, version, payload, etag, buffer_stats, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (machine_id) DO UPDATE SET
+                    version = excluded.version, payload = excluded.payload, etag = excluded.etag,
+                    buffer_stats = excluded.buffer_stats, updated_at = excluded.updated_at
+            ''', [(*machine, now) for machine in machines])
+            service = []
+            if status is not None:
+                service.append(("status", json.dumps(status), now))
+            if metrics is not None:
+                service.append(("metrics", metrics, now))
+            conn.executemany('''
+                INSERT INTO service_state (key, value, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+            ''', service)
+
+    def take_commands(self, conn):
+        with conn:
+            rows = conn.execute("SELECT id, command, args FROM control_commands ORDER BY id").fetchall()
+            if rows:
+                conn.execute("DELETE FROM control_commands WHERE id <= ?", (rows[-1][0],))
+        return [(command, json.loads(args)) for _, command, args in rows]
+
+
+class StatePublisher:
+    """Thread du processus d'ingestion qui publie le registre des machines dans le StateStore.
+
+    Toutes les ``interval`` secondes, seules les machines dont la version a
+    changé sont écrites (une transaction pour toutes). L'état du service
+    (``status_fn``) et les métriques (``metrics_fn``, texte Prometheus) sont
+    publiés toutes les ``status_interval`` secondes et les commandes en
+    attente sont passées à ``command_fn``.
+    """
+
+    def __init__(self, store, registry, status_fn=None, command_fn=None, metrics_fn=None,
+                 interval=0.05, status_interval=1.0):
+        self.store = store
+        self.registry = registry
+        self.status_fn = status_fn
+        self.metrics_fn = metrics_fn
+        self.command_fn = command_fn
+        self.interval = interval
+        self.status_interval = status_interval
+        self._published = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.cycles = 0
+        self.published = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="state-publisher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _changed_machines(self):
+        machines = []
+        for state in self.registry.states():
+            version = state.version
+            if self._published.get(state.machine_id) == version:
+                continue
+            body, etag = state.payload()
+            total_records, window_stats = state.buffer_stats()
+            stats = {"total_records": total_records,
+                     "windows": {str(window): values for window, values in window_stats.items()}}
+            machines.append((state.machine_id, version, body, etag, json.dumps(stats)))
+        return machines
+
+    def publish_once(self, conn, with_status=True):
+        machines = self._changed_machines()
+        status = self.status_fn() if with_status and self.status_fn else None
+        metrics = self.metrics_fn() if with_status and self.metrics_fn else None
+        if machines or status is not None or metrics is not None:
+            self.store.publish(conn, machines, status, metrics)
+        for machine_id, version, *_ in machines:
+            self._published[machine_id] = version
+        self.published += len(machines)
+        self.cycles += 1
+
+    def _run(self):
+        conn = sqlite3.connect(self.store.db_path, timeout=5)
+        next_status = 0.0
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                try:
+                    self.publish_once(conn, with_status=now >= next_status)
+                    if now >= next_status:
+                        next_status = now + self.status_interval
+                    for command, args in self.store.take_commands(conn):
+                        if self.command_fn:
+                            self.command_fn(command, args)
+                except Exception as e:
+                    logger.error(f"Erreur de publication de l'état: {e}")
+                self._stop.wait(self.interval)
+            # Dernière publication à l'arrêt
+            self.publish_once(conn)
+        finally:
+            conn.close()
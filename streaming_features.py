@@ -0,0 +1,167 @@
+import json
+import math
+import os
+
+PARAM_NAMES = ["Vibration", "Temperature", "Pressure", "RMS", "Mean Temp"]
+
+
+class FeatureConfig:
+    """Rolling windows (in samples) and EWMA smoothing factors of the extended features"""
+
+    def __init__(self, windows=(10, 100), ewma_alphas=(0.1,)):
+        self.windows = tuple(int(w) for w in windows)
+        self.ewma_alphas = tuple(float(a) for a in ewma_alphas)
+
+    def feature_names(self, param_names=PARAM_NAMES):
+        names = list(param_names)
+        for name in param_names:
+            for window in self.windows:
+                names.extend((f"{name} rms{window}", f"{name} var{window}", f"{name} slope{window}"))
+            for alpha in self.ewma_alphas:
+                names.append(f"{name} ewma{alpha:g}")
+        return names
+
+    def to_dict(self):
+        return {"windows": list(self.windows), "ewma_alphas": list(self.ewma_alphas)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["windows"], data["ewma_alphas"])
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def feature_config_path(model_path):
+    # The feature configuration of an extended model is stored next to it
+    return os.path.splitext(model_path)[0] + ".features.json"
+
+
+def load_feature_config(model_path):
+    """FeatureConfig of an extended model, or None for a model on the raw parameters"""
+    path = feature_config_path(model_path)
+    return FeatureConfig.load(path) if os.path.exists(path) else None
+
+
+class _Window:
+    # Running sums over the last `size` samples; x is the position in the window (0 = oldest)
+    __slots__ = ("size", "sum", "sumsq", "sum_xy")
+
+    def __init__(self, size, n_params):
+        self.size = size
+        self.sum = [0.0] * n_params
+        self.sumsq = [0.0] * n_params
+        self.sum_xy = [0.0] * n_params
+
+
+class RollingFeatures:
+    """Incremental rolling features of one machine's stream, O(1) per sample.
+
+    For each parameter and window: RMS, variance and least-squares slope (per
+    sample); for each smoothing factor: EWMA. The same object is used online
+    (one per machine) and offline over a CSV, so both see identical values.
+    """
+
+    # Periodic exact recomputation of the running sums to bound float drift
+    RESYNC_INTERVAL = 100000
+
+    def __init__(self, config, n_params=5):
+        self.config = config
+        self.n_params = n_params
+        self.capacity = max(config.windows) if config.windows else 1
+        self._history = [[0.0] * n_params for _ in range(self.capacity)]
+        self._windows = [_Window(size, n_params) for size in config.windows]
+        self._ewma = [None] * len(config.ewma_alphas)
+        self.count = 0
+
+    def update(self, params):
+        """Adds a sample and returns the feature vector (raw parameters first)"""
+        params = [float(p) for p in params]
+        count = self.count
+        for window in self._windows:
+            size = window.size
+            w_sum, w_sumsq, w_sum_xy = window.sum, window.sumsq, window.sum_xy
+            if count >= size:
+                # Slide: drop the oldest sample (x=0), shift the others by -1, append at x=size-1
+                old = self._history[(count - size) % self.capacity]
+                for i, value in enumerate(params):
+                    w_sum_xy[i] += (size - 1) * value - (w_sum[i] - old[i])
+                    w_sum[i] += value - old[i]
+                    w_sumsq[i] += value * value - old[i] * old[i]
+            else:
+                for i, value in enumerate(params):
+                    w_sum_xy[i] += count * value
+                    w_sum[i] += value
+                    w_sumsq[i] += value * value
+        self._history[count % self.capacity] = params
+        for j, alpha in enumerate(self.config.ewma_alphas):
+            previous = self._ewma[j]
+            self._ewma[j] = params[:] if previous is None else [
+                alpha * value + (1 - alpha) * prev for value, prev in zip(params, previous)
+            ]
+        self.count = count + 1
+        if self.count % self.RESYNC_INTERVAL == 0:
+            self._resync()
+        return self.features(params)
+
+    def features(self, params):
+        features = list(params)
+        stats = [self._window_stats(window) for window in self._windows]
+        for i in range(self.n_params):
+            for rms, variance, slope in stats:
+                features.extend((rms[i], variance[i], slope[i]))
+            for ewma in self._ewma:
+                features.append(ewma[i])
+        return features
+
+    def _window_stats(self, window):
+        n = min(self.count, window.size)
+        sum_x = n * (n - 1) / 2
+        denominator = n * (n - 1) * (2 * n - 1) / 6 * n - sum_x * sum_x
+        rms, variance, slope = [], [], []
+        for total, sumsq, sum_xy in zip(window.sum, window.sumsq, window.sum_xy):
+            mean = total / n
+            rms.append(math.sqrt(max(sumsq / n, 0.0)))
+            variance.append(max(sumsq / n - mean * mean, 0.0))
+            slope.append((n * sum_xy - sum_x * total) / denominator if denominator else 0.0)
+        return rms, variance, slope
+
+    def _resync(self):
+        for window in self._windows:
+            n = min(self.count, window.size)
+            samples = [self._history[(self.count - n + x) % self.capacity] for x in range(n)]
+            for i in range(self.n_params):
+                window.sum[i] = math.fsum(sample[i] for sample in samples)
+                window.sumsq[i] = math.fsum(sample[i] * sample[i] for sample in samples)
+                window.sum_xy[i] = math.fsum(x * sample[i] for x, sample in enumerate(samples))
+
+
+class StreamingFeatures:
+    """Per-machine RollingFeatures, fed in each machine's arrival order"""
+
+    def __init__(self, config):
+        self.config = config
+        self._machines = {}
+
+    def update(self, machine_id, params):
+        state = self._machines.get(machine_id)
+        if state is None:
+            state = self._machines[machine_id] = RollingFeatures(self.config, len(params))
+        return state.update(params)
+
+
+def compute_features(rows, config):
+    """Feature matrix of an ordered stream of parameter vectors (offline training and scoring)"""
+    state = None
+    features = []
+    for params in rows:
+        if state is None:
+            state = RollingFeatures(config, len(params))
+        features.append(state.update(params))
+    return features
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Modules du projet à la racine du dépôt
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def sensor_rows():
+    """Paramètres (5 colonnes) des 1000 lectures du jeu de données d'exemple"""
+    path = os.path.join(ROOT, "industrial_fault_detection_data_1000.csv")
+    return np.loadtxt(path, delimiter=",", skiprows=1, usecols=range(1, 6), encoding="utf-8")
+
+
+@pytest.fixture
+def history_db(tmp_path):
+    """Base d'historique vide, créée par app.init_history_db"""
+    import app
+
+    path = str(tmp_path / "history.db")
+    previous, app.HISTORY_DB = app.HISTORY_DB, path
+    try:
+        app.init_history_db()
+    finally:
+        app.HISTORY_DB = previous
+    return path
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from async_ingest import AsyncMqttIngestor
+from reading_spool import ReadingSpool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+from bench_mqtt_core import Broker  # noqa: E402
+
+
+@pytest.fixture
+def broker():
+    """Substitut de broker MQTT 3.1.1 du benchmark, dans sa propre boucle"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    args = SimpleNamespace(port=0, machines=3, max_queued=100000, backlog=100000, broker_inflight=1000)
+    broker = Broker(args)
+    asyncio.run_coroutine_threadsafe(broker.listen(), loop).result(5)
+    broker.port = broker.server.sockets[0].getsockname()[1]
+    broker.loop = loop
+    yield broker
+    loop.call_soon_threadsafe(broker.server.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+
+def publish(broker, seqs):
+    asyncio.run_coroutine_threadsafe(broker.subscribed.wait(), broker.loop).result(10)
+    for seq in seqs:
+        broker.loop.call_soon_threadsafe(broker.publish, seq)
+
+
+def unacked(broker, client_id):
+    session = broker.sessions.get(client_id)
+    return None if session is None else len(session.queue) + len(session.inflight)
+
+
+def decode(msg):
+    data = json.loads(msg.payload)
+    return msg.topic.rsplit("/", 1)[-1], data["parametres_machine"], data["timestamp_epoch"], None
+
+
+def predict(X):
+    return [{"fault_probability": 0.0, "is_fault": False, "model_status": "Active"} for _ in X]
+
+
+def ingestor(broker, sink, predict_fn=predict, client_id="test-client", **kwargs):
+    return AsyncMqttIngestor("127.0.0.1", broker.port, ["diagnostic_machine/#"], decode, predict_fn, sink,
+                             client_id, min_reconnect_delay=0.05, **kwargs).start()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "délai dépassé"
+        time.sleep(0.01)
+
+
+def test_messages_acked_after_sink(broker):
+    seen = []
+    core = ingestor(broker, lambda machine_id, params, timestamp, prediction, spool_seq: seen.append(timestamp))
+    try:
+        publish(broker, range(500))
+        wait_for(lambda: len(seen) == 500 and unacked(broker, "test-client") == 0)
+    finally:
+        core.stop()
+    assert sorted(seen) == list(range(500))
+    assert core.acked == 500 and core.inflight == 0
+
+
+def test_unprocessed_messages_redelivered_to_next_session(broker):
+    release = threading.Event()
+
+    def blocked(X):
+        # Inférence bloquée: rien n'est traité ni acquitté avant l'arrêt
+        release.wait(10)
+        return predict(X)
+
+    core = ingestor(broker, lambda *args: None, predict_fn=blocked, max_inflight=50)
+    try:
+        publish(broker, range(200))
+        wait_for(lambda: core.inflight == 50)
+        # Lecture suspendue: le broker garde le reste
+        time.sleep(0.2)
+        assert core.inflight == 50 and core.read_pauses >= 1
+    finally:
+        core.stop(timeout=0.2)
+        release.set()
+    assert core.acked == 0 and unacked(broker, "test-client") == 200
+
+    # Session persistante: le client suivant reçoit tout
+    seen = []
+    core = ingestor(broker, lambda machine_id, params, timestamp, prediction, spool_seq: seen.append(timestamp))
+    try:
+        wait_for(lambda: unacked(broker, "test-client") == 0)
+    finally:
+        core.stop()
+    assert sorted(seen) == list(range(200))
+
+
+def test_failed_inference_not_acked(broker):
+    calls = []
+
+    def flaky(X):
+        # Les 4 premiers appels échouent: un lot épuise ses essais (1 + 1 réessai)
+        calls.append(len(X))
+        if len(calls) <= 4:
+            raise RuntimeError("modèle indisponible")
+        return predict(X)
+
+    seen = []
+    core = ingestor(broker, lambda machine_id, params, timestamp, prediction, spool_seq: seen.append(timestamp),
+                    predict_fn=flaky, retry_delays=(0.01,))
+    try:
+        publish(broker, range(300))
+        wait_for(lambda: len(set(seen)) == 300 and unacked(broker, "test-client") == 0)
+    finally:
+        core.stop()
+    # Redélivrés par le broker après la reconnexion, jamais perdus
+    assert sorted(set(seen)) == list(range(300))
+    assert core.failed > 0 and core.redelivery_reconnects >= 1
+
+
+def test_journaled_readings_acked_once_synced(broker, tmp_path):
+    spool = ReadingSpool(str(tmp_path / "readings.spool"), sync_interval=0.05).start()
+
+    def journaled(msg):
+        machine_id, params, timestamp, _ = decode(msg)
+        return machine_id, params, timestamp, spool.append(machine_id, params, timestamp)
+
+    def failing(X):
+        raise RuntimeError("modèle indisponible")
+
+    core = AsyncMqttIngestor("127.0.0.1", broker.port, ["diagnostic_machine/#"], journaled, failing,
+                             lambda *args: None, "test-client", min_reconnect_delay=0.05,
+                             retry_delays=(0.01,), journal=spool).start()
+    try:
+        publish(broker, range(300))
+        wait_for(lambda: core.failed == 300 and unacked(broker, "test-client") == 0)
+    finally:
+        core.stop()
+    # Acquittées sans résultat: rejouées depuis le journal, pas redélivrées
+    assert core.acked == 300 and core.redelivery_reconnects == 0
+    assert spool.pending() == 300 and spool.synced_seq >= spool.checkpoint_seq() + 300
+
+    seen = []
+    core = ingestor(broker, lambda *args: seen.append(args))
+    try:
+        time.sleep(0.3)
+    finally:
+        core.stop()
+        spool.stop()
+    assert seen == []
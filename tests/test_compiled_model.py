@@ -0,0 +1,34 @@
+import os
+
+import joblib
+import numpy as np
+import pytest
+
+from compiled_model import CompiledForest, compile_pipeline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    return joblib.load(os.path.join(ROOT, "diagnostic_model.pkl"))
+
+
+def test_predict_proba_matches_pipeline(pipeline, sensor_rows):
+    compiled = compile_pipeline(pipeline)
+    rng = np.random.default_rng(0)
+    low, high = sensor_rows.min(axis=0), sensor_rows.max(axis=0)
+    X = np.vstack([sensor_rows, rng.uniform(low, high, size=(2000, sensor_rows.shape[1]))])
+    np.testing.assert_allclose(compiled.predict_proba(X), pipeline.predict_proba(X))
+    np.testing.assert_array_equal(compiled.predict(X), pipeline.predict(X))
+    assert list(compiled.classes_) == list(pipeline.classes_)
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_saved_artifact_round_trip(pipeline, sensor_rows, tmp_path, mmap):
+    path = str(tmp_path / "model.npz")
+    compile_pipeline(pipeline).save(path)
+    loaded = CompiledForest.load(path, mmap=mmap)
+    np.testing.assert_allclose(loaded.predict_proba(sensor_rows), pipeline.predict_proba(sensor_rows))
+    # A single row, as passed by predict_fault
+    np.testing.assert_allclose(loaded.predict_proba(sensor_rows[0]), pipeline.predict_proba(sensor_rows[:1]))
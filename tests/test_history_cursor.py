@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+from app import make_history_cursor, parse_history_cursor, query_history
+
+INSERT_SQL = '''
+    INSERT INTO machine_history (
+        timestamp, vibration, temperature, pressure, rms, mean_temp,
+        fault_probability, is_fault, model_status
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+@pytest.fixture
+def history(history_db):
+    # Trois lectures par seconde (horodatages en double), une panne sur quatre
+    rows = [(1_700_000_000.0 + i // 3 + 0.1, i, 20, 3, 1, 20, (i % 4) / 4, i % 4 == 3, "Active")
+            for i in range(300)]
+    conn = sqlite3.connect(history_db)
+    with conn:
+        conn.executemany(INSERT_SQL, rows)
+    yield conn
+    conn.close()
+
+
+def pages(conn, limit, **filters):
+    before = None
+    while True:
+        page = query_history(conn.cursor(), limit, before=before, **filters)
+        yield page
+        if len(page) < limit:
+            return
+        before = parse_history_cursor(make_history_cursor(page[-1]))
+
+
+def test_cursor_walks_every_row_once(history):
+    walked = [row for page in pages(history, 7) for row in page]
+    ordered = history.execute("SELECT id FROM machine_history ORDER BY timestamp DESC, id DESC").fetchall()
+    assert [row[0] for row in walked] == [row_id for row_id, in ordered]
+    assert all(len(page) == 7 for page in list(pages(history, 7))[:-1])
+
+
+def test_cursor_with_filters(history):
+    start, end = 1_700_000_010.0, 1_700_000_060.0
+    walked = [row for page in pages(history, 5, fault_only=True, start=start, end=end) for row in page]
+    expected = history.execute('''
+        SELECT id FROM machine_history WHERE is_fault = 1 AND timestamp >= ? AND timestamp <= ?
+        ORDER BY timestamp DESC, id DESC
+    ''', (start, end)).fetchall()
+    assert [row[0] for row in walked] == [row_id for row_id, in expected]
+    assert walked and all(row[8] for row in walked)
+
+    likely = [row for page in pages(history, 50, min_probability=0.5) for row in page]
+    assert len(likely) == 150 and all(row[7] >= 0.5 for row in likely)
+
+
+def test_cursor_round_trip():
+    row = (42, 1_700_000_000.123456789)
+    assert parse_history_cursor(make_history_cursor(row)) == (1_700_000_000.123456789, 42)
+    # Anciennes lignes à horodatage texte
+    assert parse_history_cursor("2023-03-10 00:00:00,7") == ("2023-03-10 00:00:00", 7)
+    assert parse_history_cursor("") is None
+
+
+def test_queries_use_timestamp_indexes(history):
+    plan = " ".join(str(step) for step in history.execute('''
+        EXPLAIN QUERY PLAN SELECT id FROM machine_history
+        WHERE is_fault = 1 AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT 100
+    ''', (1_700_000_050.0, 10)))
+    assert "idx_machine_history_fault_timestamp" in plan
@@ -0,0 +1,125 @@
+import csv
+import gzip
+import random
+import sqlite3
+import threading
+import time
+
+from history_retention import ARCHIVE_COLUMNS, DAY, HistoryRetention
+from history_rollup import RollupAggregator, rollup_table
+from history_writer import INSERT_HISTORY_SQL, HistoryWriter
+
+NOW = 1_700_000_000 // DAY * DAY + 12 * 3600
+
+
+def history_row(rng, timestamp):
+    return (timestamp, rng.randint(1, 100), rng.randint(1, 100), rng.randint(1, 100), rng.randint(1, 100),
+            rng.randint(1, 100), rng.random(), rng.random() > 0.8, "Active", f"machine-{rng.randrange(3)}")
+
+
+def history_rows(start, days, per_day, seed=0):
+    rng = random.Random(seed)
+    return [history_row(rng, start + i * DAY / per_day + rng.random()) for i in range(days * per_day)]
+
+
+def daily_counts(conn):
+    return dict(conn.execute(f"SELECT bucket, sum(count) FROM {rollup_table('1d')} GROUP BY bucket"))
+
+
+def test_archive_and_delete_cycle(history_db, tmp_path):
+    first_day = NOW // DAY * DAY - 6 * DAY
+    rows = history_rows(first_day, 7, 300)
+    conn = sqlite3.connect(history_db)
+    with conn:
+        conn.executemany(INSERT_HISTORY_SQL, rows)
+        # Agrégats tenus par HistoryWriter, sauf pour le premier jour (recalculés par la compaction)
+        RollupAggregator().apply(conn, [row for row in rows if row[0] >= first_day + DAY])
+    retention = HistoryRetention(history_db, 2, archive_dir=str(tmp_path / "archive"), delete_batch_size=100,
+                                 batch_pause=0)
+    cutoff = (NOW - 2 * DAY) // DAY * DAY
+    expired = [row for row in rows if row[0] < cutoff]
+
+    summary = retention.run_once(now=NOW)
+
+    assert summary["days"] == 4
+    assert summary["archived_rows"] == summary["deleted_rows"] == len(expired)
+    assert summary["vacuumed_pages"] > 0
+    remaining = conn.execute("SELECT count(*), min(timestamp) FROM machine_history").fetchone()
+    assert remaining[0] == len(rows) - len(expired)
+    assert remaining[1] >= cutoff
+    # Les agrégats journaliers couvrent toujours les jours supprimés
+    assert daily_counts(conn) == {day: 300 for day in range(first_day, first_day + 7 * DAY, DAY)}
+
+    archived = []
+    for day, path, count in conn.execute("SELECT day, path, rows FROM history_archive ORDER BY day"):
+        with gzip.open(path, "rt", newline="") as f:
+            reader = csv.reader(f)
+            assert tuple(next(reader)) == ARCHIVE_COLUMNS
+            lines = list(reader)
+        assert len(lines) == count
+        archived.extend(lines)
+    assert len(archived) == len(expired)
+    timestamp = ARCHIVE_COLUMNS.index("timestamp")
+    machine = ARCHIVE_COLUMNS.index("machine_id")
+    assert sorted((float(line[timestamp]), line[machine]) for line in archived) == \
+        sorted((row[0], row[9]) for row in expired)
+
+    # Cycle suivant: plus rien d'expiré
+    assert retention.run_once(now=NOW)["days"] == 0
+    assert conn.execute("SELECT count(*) FROM history_archive").fetchone()[0] == 4
+    conn.close()
+
+
+def test_cycle_during_ingestion(history_db, tmp_path):
+    first_day = NOW // DAY * DAY - 6 * DAY
+    rows = history_rows(first_day, 2, 150000)
+    conn = sqlite3.connect(history_db)
+    with conn:
+        conn.executemany(INSERT_HISTORY_SQL, rows)
+        RollupAggregator().apply(conn, rows)
+    # Référence sur cette machine (et sa charge): suppression d'un jour d'un seul bloc, annulée
+    started = time.perf_counter()
+    conn.execute("BEGIN")
+    conn.execute("DELETE FROM machine_history WHERE timestamp < ?", (first_day + DAY,))
+    single_delete_ms = (time.perf_counter() - started) * 1000
+    conn.rollback()
+
+    # Ingestion continue (~2000 lignes/s) pendant tout le cycle
+    writer = HistoryWriter(history_db, batch_size=50, flush_interval=0.01, rollups=RollupAggregator()).start()
+    stop = threading.Event()
+    fed = []
+
+    def feed():
+        rng = random.Random(1)
+        while not stop.is_set():
+            for _ in range(20):
+                row = history_row(rng, NOW - rng.random() * 3600)
+                if writer.write(row):
+                    fed.append(row)
+            time.sleep(0.01)
+
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    time.sleep(0.2)
+    retention = HistoryRetention(history_db, 2, archive_dir=str(tmp_path / "archive"), delete_batch_size=2000,
+                                 batch_pause=0.005)
+    try:
+        started_batches = writer.batches
+        summary = retention.run_once(now=NOW)
+        during = writer.batches - started_batches
+    finally:
+        stop.set()
+        feeder.join()
+    assert writer.flush(10)
+    writer.stop()
+
+    assert summary["archived_rows"] == summary["deleted_rows"] == len(rows)
+    assert during > 0
+    # Un lot de l'écriture n'attend jamais plus d'une transaction de suppression
+    # (max_transaction_time=50 ms); une suppression du jour d'un seul bloc le
+    # retarderait de single_delete_ms (300 ms environ sur cette base)
+    latency = writer.batch_time.summary()
+    assert latency["max_ms"] < single_delete_ms / 2, (latency, single_delete_ms)
+    assert (writer.dropped, writer.failed, writer.written) == (0, 0, len(fed))
+    assert conn.execute("SELECT count(*) FROM machine_history").fetchone()[0] == len(fed)
+    conn.close()
@@ -0,0 +1,112 @@
+import random
+import sqlite3
+
+import pytest
+
+from history_rollup import (RESOLUTIONS, RollupAggregator, query_rollup, rebuild_complete_buckets, rebuild_rollups,
+                            rollup_table)
+from history_writer import HistoryWriter
+
+START = 1_700_000_000 // 86400 * 86400
+INSERT_SQL = '''
+    INSERT INTO machine_history (
+        timestamp, vibration, temperature, pressure, rms, mean_temp,
+        fault_probability, is_fault, model_status, machine_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def history_rows(n, span, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        probability = rng.random()
+        rows.append((START + i * span / n + rng.random(), rng.randint(1, 100), rng.randint(1, 100),
+                     rng.randint(1, 100), rng.randint(1, 100), rng.randint(1, 100), probability,
+                     probability > 0.8, "Active", f"machine-{rng.randrange(3)}"))
+    return rows
+
+
+def rollups(conn):
+    return {resolution: conn.execute(f"SELECT * FROM {rollup_table(resolution)} ORDER BY machine_id, bucket")
+            .fetchall() for resolution, _ in RESOLUTIONS}
+
+
+@pytest.fixture
+def conn(history_db):
+    conn = sqlite3.connect(history_db)
+    yield conn
+    conn.close()
+
+
+def test_incremental_rollups_match_rebuild(history_db, conn):
+    rows = history_rows(5000, 3 * 86400)
+    # Lots courts: chaque bucket est fusionné sur plusieurs transactions
+    writer = HistoryWriter(history_db, batch_size=37, rollups=RollupAggregator())
+    for row in rows:
+        writer.write(row)
+    writer.start()
+    assert writer.flush(30)
+    writer.stop()
+    incremental = rollups(conn)
+    assert sum(row[2] for row in incremental["1d"]) == len(rows)
+
+    with conn:
+        rebuild_rollups(conn)
+    assert rollups(conn) == incremental
+
+
+def test_rebuild_range_keeps_partial_buckets(conn):
+    rows = history_rows(2000, 6 * 3600)
+    with conn:
+        conn.executemany(INSERT_SQL, rows)
+        rebuild_rollups(conn)
+    expected = rollups(conn)
+    table = rollup_table("1h")
+    with conn:
+        conn.execute(f"UPDATE {table} SET count = 0")
+        # Seules les heures 1 et 2 sont entièrement comprises dans l'intervalle
+        rebuild_rollups(conn, START + 1800, START + 3 * 3600 + 1800)
+    counts = dict(conn.execute(f"SELECT bucket, sum(count) FROM {table} GROUP BY bucket"))
+    hourly = {bucket: sum(row[2] for row in expected["1h"] if row[1] == bucket) for bucket in counts}
+    assert counts == {bucket: hourly[bucket] if START + 3600 <= bucket < START + 3 * 3600 else 0
+                      for bucket in counts}
+
+
+def test_rebuild_complete_buckets_keeps_pruned_ones(conn):
+    rows = history_rows(2000, 86400)
+    with conn:
+        conn.executemany(INSERT_SQL, rows)
+        rebuild_rollups(conn)
+    table = rollup_table("1h")
+    before = dict(((machine_id, bucket), (count, faults)) for machine_id, bucket, count, faults in conn.execute(
+        f"SELECT machine_id, bucket, count, fault_count FROM {table}"))
+    pruned = ("machine-0", START + 5 * 3600)
+    with conn:
+        # Rétention: une partie des lignes brutes d'une heure déjà supprimée
+        conn.execute("DELETE FROM machine_history WHERE id IN (SELECT id FROM machine_history "
+                     "WHERE machine_id = ? AND timestamp >= ? AND timestamp < ? LIMIT 5)",
+                     (pruned[0], pruned[1], pruned[1] + 3600))
+        # Re-scoring: toutes les lignes restantes deviennent des pannes
+        conn.execute("UPDATE machine_history SET is_fault = 1")
+        rebuild_complete_buckets(conn, START, START + 86400)
+    after = dict(((machine_id, bucket), (count, faults)) for machine_id, bucket, count, faults in conn.execute(
+        f"SELECT machine_id, bucket, count, fault_count FROM {table}"))
+    assert after[pruned] == before[pruned]
+    assert all(after[key] == (count, count) for key, (count, _) in before.items() if key != pruned)
+
+
+def test_downsampled_series(conn):
+    rows = history_rows(3000, 2 * 86400)
+    with conn:
+        RollupAggregator().apply(conn, rows)
+    end = START + 2 * 86400
+    for max_points in (10, 100, 1000):
+        resolution, step, points = query_rollup(conn.cursor(), "machine-1", START, end, max_points)
+        assert len(points) <= max_points
+        machine = [row for row in rows if row[9] == "machine-1"]
+        assert sum(point["count"] for point in points) == len(machine)
+        assert sum(point["fault_count"] for point in points) == sum(row[7] for row in machine)
+        first = [row for row in machine if row[0] < START + step]
+        assert points[0]["max"][0] == max(row[1] for row in first)
+        assert points[0]["mean"][1] == pytest.approx(sum(row[2] for row in first) / len(first))
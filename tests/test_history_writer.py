@@ -0,0 +1,60 @@
+import sqlite3
+
+from history_writer import HistoryWriter
+
+
+def history_row(i):
+    return (1_700_000_000.0 + i, i, 20, 3, 1, 20, 0.25, False, "Active", f"machine-{i % 3}")
+
+
+def stored_vibrations(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [vibration for vibration, in conn.execute("SELECT vibration FROM machine_history ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def test_rows_written_in_batches(history_db):
+    writer = HistoryWriter(history_db, batch_size=100, flush_interval=0.05)
+    # Lignes en file avant le démarrage: lots complets
+    for i in range(1000):
+        assert writer.write(history_row(i))
+    writer.start()
+    assert writer.flush(10)
+    writer.stop()
+    assert (writer.written, writer.batches, writer.dropped, writer.failed) == (1000, 10, 0, 0)
+    assert stored_vibrations(history_db) == list(range(1000))
+
+
+def test_partial_batch_committed_after_flush_interval(history_db):
+    writer = HistoryWriter(history_db, batch_size=500, flush_interval=0.05).start()
+    for i in range(3):
+        writer.write(history_row(i))
+    assert writer.flush(5)
+    assert stored_vibrations(history_db) == [0, 1, 2]
+    assert writer.batches == 1
+    writer.stop()
+
+
+def test_full_queue_drops_rows(history_db):
+    writer = HistoryWriter(history_db, max_queue_size=5, put_timeout=0.01)
+    accepted = [writer.write(history_row(i)) for i in range(7)]
+    assert accepted == [True] * 5 + [False] * 2
+    assert writer.dropped == 2
+    # L'arrêt écrit les lignes restées en file
+    writer.start()
+    writer.stop()
+    assert stored_vibrations(history_db) == list(range(5))
+
+
+def test_failed_batch_does_not_block_flush(history_db):
+    writer = HistoryWriter(history_db, batch_size=10, flush_interval=0.05)
+    writer.write(history_row(0)[:5])
+    writer.start()
+    assert writer.flush(5)
+    writer.write(history_row(1))
+    assert writer.flush(5)
+    writer.stop()
+    assert (writer.failed, writer.written) == (1, 1)
+    assert stored_vibrations(history_db) == [1]
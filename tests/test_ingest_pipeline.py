@@ -0,0 +1,24 @@
+import threading
+
+from ingest_pipeline import IngestPipeline
+from streaming_features import FeatureConfig, StreamingFeatures
+
+
+def test_dropped_readings_not_in_rolling_features():
+    release = threading.Event()
+
+    def blocked(X):
+        release.wait(10)
+        return [{"fault_probability": 0.0, "is_fault": False, "model_status": "Active"} for _ in X]
+
+    features = StreamingFeatures(FeatureConfig(windows=(10,), ewma_alphas=()))
+    pipeline = IngestPipeline(blocked, lambda *args: None, workers=1, max_batch_size=1, max_queue_size=5,
+                              features=features)
+    try:
+        results = [pipeline.submit("machine-0", [float(i)] * 5, i) for i in range(50)]
+    finally:
+        release.set()
+        pipeline.stop()
+    # Seules les lectures mises en file comptent dans les fenêtres glissantes
+    assert pipeline.dropped == results.count(False) > 0
+    assert features._machines["machine-0"].count == pipeline.submitted == results.count(True)
@@ -0,0 +1,92 @@
+import os
+import shutil
+import threading
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+import ml_service
+from ml_service import MLDiagnosticService
+from prediction_cache import PredictionCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def other_model(X):
+    model = Pipeline([("scaler", StandardScaler()),
+                      ("classifier", RandomForestClassifier(n_estimators=7, random_state=3))])
+    return model.fit(X, (X[:, 0] > np.median(X[:, 0])).astype(int))
+
+
+def run_reloads(service, path, artifacts, X, expected, swaps=20, scorers=3):
+    errors, mixed, batches = [], [], [0]
+    stop = threading.Event()
+
+    def score():
+        rng = np.random.default_rng(threading.get_ident() % 2**32)
+        while not stop.is_set():
+            rows = rng.choice(len(X), size=32)
+            try:
+                probabilities, _ = service.score_batch(X[rows])
+            except Exception as e:
+                errors.append(e)
+                return
+            # The whole batch comes from one model, never a mix of both
+            if not any(np.allclose(probabilities, p[rows]) for p in expected):
+                mixed.append(rows)
+            batches[0] += 1
+
+    threads = [threading.Thread(target=score) for _ in range(scorers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for i in range(swaps):
+            shutil.copy(artifacts[(i + 1) % 2], path + ".tmp")
+            os.replace(path + ".tmp", path)
+            assert service.reload() is not None
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return errors, mixed, batches[0]
+
+
+def test_reload_under_concurrent_scoring(tmp_path, sensor_rows):
+    X = sensor_rows
+    first = os.path.join(ROOT, "diagnostic_model.pkl")
+    second = str(tmp_path / "other.pkl")
+    joblib.dump(other_model(X), second)
+    expected = [joblib.load(artifact).predict_proba(X)[:, 1] for artifact in (first, second)]
+    assert not np.allclose(expected[0], expected[1])
+
+    for cache in (None, PredictionCache(100000, 1e-9)):
+        path = str(tmp_path / "model.pkl")
+        shutil.copy(first, path)
+        service = MLDiagnosticService(path, cache=cache)
+        errors, mixed, batches = run_reloads(service, path, (first, second), X, expected)
+        assert not errors
+        assert not mixed, f"{len(mixed)} of {batches} batches mixed both models"
+        assert service.reloads == 20
+
+
+def test_failed_load_not_ready_until_retried(tmp_path, monkeypatch):
+    path = str(tmp_path / "model.pkl")
+    with open(path, "wb") as f:
+        f.write(b"not a model")
+    monkeypatch.setattr(ml_service, "MODEL_LOAD_RETRY_INTERVAL", 0.2)
+    service = MLDiagnosticService(path, lazy=True)
+
+    assert not service.ensure_loaded()
+    assert not service.is_ready() and service.load_error and service.model is None
+    # Replaced by a valid artifact: loaded by the next attempt once the retry delay has passed
+    shutil.copy(os.path.join(ROOT, "diagnostic_model.pkl"), path)
+    assert not service.ensure_loaded()
+    service.warm_up()
+    deadline = time.monotonic() + 5
+    while not service.is_ready() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert service.is_ready() and service.load_error is None and service.status == "Active"
@@ -0,0 +1,53 @@
+import joblib
+import numpy as np
+import pytest
+
+from ml_service import MLDiagnosticService
+from prediction_cache import PredictionCache
+from streaming_features import FeatureConfig, compute_features, feature_config_path
+from train_feature_model import train
+
+
+def stream(n, seed=0):
+    rng = np.random.default_rng(seed)
+    params = rng.uniform(0, 100, size=(n, 5))
+    labels = (params[:, 0] + params[:, 1] > 100).astype(int)
+    return params.tolist(), labels
+
+
+@pytest.fixture
+def feature_model(tmp_path):
+    config = FeatureConfig([5], [0.1])
+    params, labels = stream(400)
+    path = str(tmp_path / "model.pkl")
+    joblib.dump(train(np.array(compute_features(params, config)), labels, n_estimators=5), path)
+    config.save(feature_config_path(path))
+    return path, config
+
+
+def test_steps_follow_input_width():
+    cache = PredictionCache(resolution=[0.5, 1, 0.1, 0.5, 1])
+    assert cache.steps(5).tolist() == [0.5, 1, 0.1, 0.5, 1]
+    assert cache.steps(8).tolist() == [0.5, 1, 0.1, 0.5, 1, 0.1, 0.1, 0.1]
+    assert PredictionCache(resolution=[1, 2], default_resolution=4).steps(3).tolist() == [1, 2, 4]
+    assert PredictionCache(resolution=2.0).steps(20) == 2.0
+    with pytest.raises(ValueError):
+        cache.steps(3)
+
+
+def test_extended_model_scores_through_cache(feature_model):
+    path, config = feature_model
+    params, _ = stream(200, seed=1)
+    X = np.array(compute_features(params, config))
+    assert X.shape[1] > 5
+
+    plain = MLDiagnosticService(path)
+    cached = MLDiagnosticService(path, cache=PredictionCache(1000, [0.5, 1, 0.1, 0.5, 1], default_resolution=1e-9))
+    assert cached.feature_config is not None
+    expected = plain.predict_batch(X)
+    assert cached.predict_batch(X) == expected
+    # Second pass served from the cache, same predictions
+    misses = cached.cache.misses
+    assert cached.predict_batch(X) == expected
+    assert cached.cache.misses == misses
+    assert cached.cache.hits >= len(X)
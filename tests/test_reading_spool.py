@@ -0,0 +1,101 @@
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+from history_writer import HistoryWriter
+from reading_spool import ReadingSpool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMESTAMP = 1_700_000_000.0
+
+# Processus tué (SIGKILL) après avoir:
+# - écrit et commité les `committed` premières lectures par HistoryWriter;
+# - inséré les `unsignaled` suivantes en base sans que le journal le sache
+#   (arrêt entre le commit SQLite et l'écriture du point de reprise);
+# - seulement journalisé les autres.
+# Les lectures vont par paires de même machine et même horodatage.
+CRASHING_WRITER = '''
+import os, signal, sqlite3, sys
+from history_writer import INSERT_HISTORY_SQL, INSERT_SPOOL_COMMIT_SQL, SPOOL_COMMITS_TABLE_SQL, HistoryWriter
+from reading_spool import ReadingSpool
+
+spool_path, db_path, base = sys.argv[1], sys.argv[2], float(sys.argv[3])
+total, committed, unsignaled = map(int, sys.argv[4:])
+spool = ReadingSpool(spool_path).start()
+writer = HistoryWriter(db_path, spool=spool, replay_interval=3600).start()
+conn = sqlite3.connect(db_path)
+with conn:
+    conn.execute(SPOOL_COMMITS_TABLE_SQL)
+for i in range(total):
+    machine_id, timestamp = f"machine-{i // 2 % 3}", base + i // 2
+    params = [float(i), 1.0, 2.0, 3.0, 4.0]
+    seq = spool.append(machine_id, params, timestamp)
+    row = (timestamp, *params, 0.1, False, "Active", machine_id, seq)
+    if i < committed:
+        writer.write(row)
+    elif i < committed + unsignaled:
+        with conn:
+            conn.execute(INSERT_HISTORY_SQL, row[:10])
+            conn.execute(INSERT_SPOOL_COMMIT_SQL, (seq,))
+writer.flush(30)
+os.kill(os.getpid(), signal.SIGKILL)
+'''
+
+
+def build_rows(records):
+    return [(timestamp, *params, 0.1, False, "Active", machine_id, seq)
+            for machine_id, params, timestamp, seq in records]
+
+
+def test_recovery_after_kill(history_db, tmp_path):
+    spool_path = str(tmp_path / "readings.spool")
+    total, committed, unsignaled = 400, 100, 50
+    process = subprocess.run([sys.executable, "-c", CRASHING_WRITER, spool_path, history_db, str(TIMESTAMP),
+                              str(total), str(committed), str(unsignaled)], cwd=ROOT)
+    assert process.returncode == -signal.SIGKILL
+
+    spool = ReadingSpool(spool_path, build_rows=build_rows, sync_interval=0, replay_after=0).start()
+    assert spool.recovered == total - committed
+    writer = HistoryWriter(history_db, spool=spool, replay_interval=0.05).start()
+    deadline = time.monotonic() + 30
+    while spool.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.stop()
+    spool.stop()
+
+    assert spool.pending() == 0
+    assert writer.replayed == total - committed - unsignaled
+    conn = sqlite3.connect(history_db)
+    # Chaque lecture exactement une fois, les deux lectures de chaque paire comprises
+    assert sorted(vibration for vibration, in conn.execute("SELECT vibration FROM machine_history")) == \
+        list(range(total))
+    pairs = conn.execute("SELECT count(*) FROM machine_history GROUP BY machine_id, timestamp").fetchall()
+    assert pairs == [(2,)] * (total // 2)
+    conn.close()
+
+    # Rien à rejouer à la réouverture suivante
+    assert ReadingSpool(spool_path, sync_interval=0).start().recovered == 0
+
+
+def test_queued_rows_not_replayed(history_db, tmp_path):
+    spool = ReadingSpool(str(tmp_path / "readings.spool"), build_rows=build_rows, sync_interval=0,
+                         replay_after=0).start()
+    writer = HistoryWriter(history_db, batch_size=10, spool=spool, replay_interval=0)
+    # Lectures en attente de reprise alors que leurs lignes sont encore en file
+    for i in range(100):
+        params = [float(i), 1.0, 2.0, 3.0, 4.0]
+        seq = spool.append("machine-0", params, TIMESTAMP + i)
+        writer.write((TIMESTAMP + i, *params, 0.1, False, "Active", "machine-0", seq))
+    writer.start()
+    assert writer.flush(10)
+    writer.stop()
+    spool.stop()
+
+    assert writer.replayed == 0 and spool.pending() == 0
+    conn = sqlite3.connect(history_db)
+    assert sorted(vibration for vibration, in conn.execute("SELECT vibration FROM machine_history")) == \
+        list(range(100))
+    conn.close()
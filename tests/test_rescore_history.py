@@ -0,0 +1,44 @@
+import os
+import sqlite3
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from history_writer import INSERT_HISTORY_SQL
+from model_registry import ModelRegistry
+from rescore_history import model_version_of, rescore_history
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_rescore_uses_requested_model_not_registry(history_db, tmp_path, sensor_rows, monkeypatch):
+    X = sensor_rows[:300]
+    conn = sqlite3.connect(history_db)
+    with conn:
+        conn.executemany(INSERT_HISTORY_SQL, [(1_700_000_000.0 + i, *row, 0.0, False, "Active", "machine-0")
+                                              for i, row in enumerate(X.tolist())])
+    conn.close()
+
+    # Version active du registre: un autre modèle, qui ne doit pas servir
+    other = Pipeline([("scaler", StandardScaler()),
+                      ("classifier", RandomForestClassifier(n_estimators=7, random_state=3))])
+    other.fit(X, (X[:, 0] > np.median(X[:, 0])).astype(int))
+    other_path = str(tmp_path / "other.pkl")
+    joblib.dump(other, other_path)
+    registry_root = str(tmp_path / "models")
+    ModelRegistry(registry_root).register(other_path, activate=True)
+    monkeypatch.setenv("DIAGNOSTIC_MODEL_REGISTRY", registry_root)
+
+    model_path = os.path.join(ROOT, "diagnostic_model.pkl")
+    result = rescore_history(history_db, model_path, workers=1, niceness=0, rebuild=False)
+    assert result["complete"] and result["rows"] == len(X)
+
+    expected = joblib.load(model_path).predict_proba(X)[:, 1]
+    conn = sqlite3.connect(history_db)
+    stored = conn.execute("SELECT fault_probability, model_version FROM machine_history ORDER BY id").fetchall()
+    conn.close()
+    assert np.allclose([probability for probability, _ in stored], expected)
+    assert {version for _, version in stored} == {model_version_of(model_path)}